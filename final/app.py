@@ -1,40 +1,242 @@
 import streamlit as st
 from assessment_tool import ImageOCRAnalyzer, AssessmentTool
+from grade_cache import GradeCache
+from gradebook import Gradebook
+from grades import format_marks
+from questions import parse_total_marks
+from rubrics import RubricStore
+from job_runner import JobRunner, DONE, FAILED, grade_script
+from workspace import SessionWorkspace, QuotaExceeded
 import os
 import time
+import uuid
+
+# Seconds between progress polls while a grading job is running
+POLL_INTERVAL = 1.0
+
+
+@st.cache_resource
+def get_job_runner():
+    """
+    Worker pool shared by every session of this Streamlit server.
+    """
+    return JobRunner(max_workers=int(os.environ.get("GRADING_WORKERS", "4")))
+
+
+@st.cache_resource
+def get_grade_cache():
+    """
+    Grade cache shared by every session, so re-running a script or
+    grading a duplicate answer does not call the grader again.
+    """
+    return GradeCache(os.environ.get("GRADE_CACHE_PATH", "./uploads/grade_cache.db"))
+
+
+@st.cache_resource
+def get_gradebook():
+    """
+    Gradebook every graded script is appended to, for the analytics view.
+    """
+    return Gradebook(os.environ.get("GRADEBOOK_PATH", "./uploads/gradebook"))
+
 
 # Initialize the OCR analyzer and assessment tool
 ocr_analyzer = ImageOCRAnalyzer()
-assessment_tool = AssessmentTool(ocr_analyzer)
+# Uploaded image marking schemes are OCR'd once and kept here by content hash
+rubric_store = RubricStore(ocr_analyzer, cache_dir=os.environ.get("RUBRIC_CACHE_DIR", "./uploads/rubrics"))
+assessment_tool = AssessmentTool(ocr_analyzer, grade_cache=get_grade_cache(), rubric_store=rubric_store)
 
 
-# Streamlit App
-def main():
-    st.set_page_config(
-        page_title="Automated Grading System",
-        page_icon=":books:",
-        layout="wide",
-    )
+def get_session_id():
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
 
-    # Sidebar for uploads
-    with st.sidebar:
-        st.title("Upload Files")
-        st.info("Upload the necessary files to begin the grading process.")
 
-        # File upload for student answer sheet
-        uploaded_student_file = st.file_uploader(
-            "Upload Student Answer Sheet (PDF/Images)",
-            type=["pdf", "jpeg", "jpg", "png"],
-            accept_multiple_files=True,
-        )
+def get_workspace():
+    """
+    Return this session's scratch workspace, creating it on first use and
+    sweeping workspaces abandoned by closed sessions.
+    """
+    if "workspace" not in st.session_state:
+        SessionWorkspace.sweep_stale()
+        st.session_state.workspace = SessionWorkspace(session_id=get_session_id())
+    workspace = st.session_state.workspace
+    workspace.touch()
+    return workspace
 
-        # File upload for marking scheme (DOCX)
-        uploaded_marking_scheme = st.file_uploader(
-            "Upload Marking Scheme (DOCX)", type=["docx"]
+
+def prepare_pages(uploaded_student_file, workspace):
+    """
+    Turn the uploads into page images: PDFs are streamed into the session
+    workspace and rendered there, images are decoded straight from memory.
+    Both count against the workspace quota.
+    """
+    student_image_paths = []
+    for uploaded_file in uploaded_student_file:
+        file_name = uploaded_file.name
+
+        # Check if the file is a PDF
+        if file_name.lower().endswith(".pdf"):
+            try:
+                pdf_path = workspace.save_upload(uploaded_file)
+                pdf_image_paths = ocr_analyzer.process_pdf(
+                    pdf_path, output_dir=workspace.pages_dir(file_name)
+                )
+                workspace.account(pdf_image_paths)
+                student_image_paths.extend(pdf_image_paths)
+            except QuotaExceeded:
+                raise
+            except Exception as e:
+                st.error(f"Error processing PDF {file_name}: {e}")
+        else:
+            # Decode images straight from the upload buffer, no disk round
+            # trip; the decoded pixels still count against the quota
+            image = ocr_analyzer.decode_image_bytes(uploaded_file.getbuffer())
+            workspace.account_image(image)
+            student_image_paths.append(image)
+    return student_image_paths
+
+
+def render_result(result):
+    st.success("Student responses extracted successfully.")
+    st.text_area("Extracted Student Response", result["student_response"], height=200)
+    st.success("Marking scheme extracted successfully.")
+    st.text_area("Marking Scheme", result["marking_scheme"], height=200)
+    st.success("Assessment completed.")
+    assessment_result = result["assessment_result"]
+    st.text_area("Assessment Result", assessment_result, height=200)
+    if result.get("grade"):
+        st.table(result["grade"]["questions"])
+
+    # Marks obtained and percentage, from the validated grade
+    try:
+        grade = result.get("grade")
+        if grade is not None:
+            numerator, denominator = grade["total_marks"], grade["max_total_marks"]
+        else:
+            numerator, denominator = parse_total_marks(assessment_result)
+        if numerator is None or not denominator:
+            raise ValueError("no total marks")
+        percentage = (numerator / denominator) * 100
+        numerator, denominator = format_marks(numerator), format_marks(denominator)
+
+        # Circular Progress Bar with Marks
+        progress_html = f"""
+        <div style="display: flex; justify-content: center; align-items: center; height: 200px;">
+            <div style="
+                position: relative;
+                width: 150px;
+                height: 150px;
+                border-radius: 50%;
+                background: conic-gradient(
+                    #4CAF50 {percentage * 3.6}deg,
+                    #ddd {percentage * 3.6}deg
+                );
+                display: flex;
+                justify-content: center;
+                align-items: center;
+                font-size: 24px;
+                font-weight: bold;
+                color: #333;
+            ">
+                <div style="
+                    position: absolute;
+                    width: 130px;
+                    height: 130px;
+                    background: white;
+                    border-radius: 50%;
+                    display: flex;
+                    justify-content: center;
+                    align-items: center;
+                ">
+                    {numerator}/{denominator}
+                </div>
+            </div>
+        </div>
+        """
+        st.markdown(progress_html, unsafe_allow_html=True)
+    except ValueError:
+        st.error("Failed to extract the marks or calculate percentage.")
+
+
+def show_job(job_runner):
+    """
+    Show the state of this session's grading job. While it runs, sleep and
+    rerun so the page keeps polling without blocking on the work itself.
+    """
+    job_id = st.session_state.get("job_id")
+    if not job_id:
+        return
+    job = job_runner.get(job_id)
+    if job is None:
+        st.warning("The previous grading job has expired. Please grade again.")
+        del st.session_state["job_id"]
+        return
+
+    state = job.snapshot()
+    if state["status"] == DONE:
+        render_result(state["result"])
+        return
+    if state["status"] == FAILED:
+        st.error(f"An error occurred: {state['error']}")
+        return
+
+    progress = state["progress"]
+    if progress["stage"] == "queued":
+        st.info(f"Waiting for a free grader ({job_runner.queue_depth()} job(s) queued)...")
+    elif progress["stage"] == "rubric":
+        st.info("Reading the marking scheme...")
+    elif progress["stage"] == "ocr":
+        pages_total = max(progress["pages_total"], 1)
+        st.progress(
+            progress["pages_done"] / pages_total,
+            text=f"Extracting student responses: page {progress['pages_done']}/{progress['pages_total']}",
         )
+    else:
+        # The whole script is graded in one call: no partial progress to show
+        if progress["questions"]:
+            st.info(f"Grading the responses: {progress['questions']} question(s) in one pass...")
+        else:
+            st.info("Grading the responses...")
+    time.sleep(POLL_INTERVAL)
+    st.rerun()
 
-    # Main Section
-    st.title(":books: Automated Grading System")
+
+def show_analytics(gradebook):
+    """
+    Per-question cohort statistics of one exam from the gradebook.
+    """
+    exams = gradebook.exams()
+    if not exams:
+        st.info("No graded scripts yet. Grades appear here once scripts are graded.")
+        return
+    exam = st.selectbox("Exam", exams)
+    view = gradebook.view(exam)
+    summary = view.summary()
+    columns = st.columns(3)
+    columns[0].metric("Students", summary["students"])
+    columns[1].metric("Questions", summary["questions"])
+    if summary["mean_share"] is not None:
+        columns[2].metric("Mean score", f"{summary['mean_share']:.0%}")
+
+    st.markdown("**Questions** (difficulty is the mean share of the marks; discrimination below 0.2 is weak)")
+    stats = view.question_stats()
+    st.dataframe(stats, use_container_width=True)
+
+    question = st.selectbox("Score distribution of question", [row["question"] for row in stats])
+    counts, edges = view.distribution(question)
+    st.bar_chart({f"{low:.0%}-{high:.0%}": int(count) for count, low, high in zip(counts, edges, edges[1:])})
+
+    outliers = view.outlier_students()
+    st.markdown("**Outlier students** (total score far from the cohort's)")
+    if outliers:
+        st.table(outliers)
+    else:
+        st.write("None.")
+
+
+def grade_view(uploaded_student_file, uploaded_marking_scheme, student_id, exam):
     st.subheader("A simple tool for grading student responses using OCR.")
     st.markdown(
         """
@@ -44,124 +246,87 @@ def main():
         """
     )
 
+    job_runner = get_job_runner()
+    session_id = get_session_id()
+    grading_in_progress = job_runner.active_job(session_id) is not None
+
     # Grading button
-    if st.button("Grade Student Responses"):
+    if st.button("Grade Student Responses", disabled=grading_in_progress):
         if not uploaded_student_file or not uploaded_marking_scheme:
             st.error(
                 "Please upload both the student answer sheet and a marking scheme."
             )
             return
 
+        workspace = get_workspace()
         try:
-            student_image_paths = []
-            if isinstance(uploaded_student_file, list):  # Multiple files uploaded
-                
-                for uploaded_file in uploaded_student_file:
-                    file_name = uploaded_file.name
-                    image_path = f"./uploads/{file_name}"
-                    
-            # Save the uploaded file
-            with open(image_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
-        
-            # Check if the file is a PDF
-            if file_name.lower().endswith(".pdf"):
-                
-                try:
-                    # Process PDF and append resulting image paths
-                    pdf_image_paths = ocr_analyzer.process_pdf(image_path)
-                    student_image_paths.extend(pdf_image_paths)
-                    
-                except Exception as e:
-                    st.error(f"Error processing PDF {file_name}: {e}")
-            else:
-                # Assume it's an image and append its path
-                student_image_paths.append(image_path)
-                
-
-            # Save marking scheme to disk
-            marking_scheme_path = f"./uploads/{uploaded_marking_scheme.name}"
-            with open(marking_scheme_path, "wb") as f:
-                f.write(uploaded_marking_scheme.getvalue())
-
-            # Step 1: Extract the student's response
-            st.info("Extracting student responses from images...")
-            with st.spinner("Processing student answer sheet..."):
-                student_response = assessment_tool.extract_student_response(
-                    student_image_paths
-                )
-            st.success("Student responses extracted successfully.")
-            st.text_area("Extracted Student Response", student_response, height=200)
-
-            # Step 2: Extract the marking scheme
-            st.info("Extracting marking scheme from uploaded file...")
-            with st.spinner("Processing marking scheme..."):
-                marking_scheme = assessment_tool.extract_marking_scheme_from_docx(
-                    marking_scheme_path
-                )
-            st.success("Marking scheme extracted successfully.")
-            st.text_area("Marking Scheme", marking_scheme, height=200)
-
-            # Step 3: Assess the student's response
-            st.info("Assessing student responses...")
-            with st.spinner("Grading the responses..."):
-                assessment_result = assessment_tool.assess_student_response(
-                    student_response, marking_scheme
-                )
-            st.success("Assessment completed.")
-            st.text_area("Assessment Result", assessment_result, height=200)
-
-            # Extract only marks obtained and calculate percentage
-            try:
-                raw_marks = assessment_result.split(":")[-1].strip()  # Extract the marks part
-                if "/" in raw_marks:
-                    numerator, denominator = map(int, raw_marks.split("/"))
-                    percentage = (numerator / denominator) * 100
-                else:
-                    numerator = int(raw_marks)
-                    denominator = 20  # Assume max marks are 20 if not provided
-                    percentage = (numerator / denominator) * 100
-
-                # Circular Progress Bar with Marks
-                progress_html = f"""
-                <div style="display: flex; justify-content: center; align-items: center; height: 200px;">
-                    <div style="
-                        position: relative;
-                        width: 150px;
-                        height: 150px;
-                        border-radius: 50%;
-                        background: conic-gradient(
-                            #4CAF50 {percentage * 3.6}deg,
-                            #ddd {percentage * 3.6}deg
-                        );
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        font-size: 24px;
-                        font-weight: bold;
-                        color: #333;
-                    ">
-                        <div style="
-                            position: absolute;
-                            width: 130px;
-                            height: 130px;
-                            background: white;
-                            border-radius: 50%;
-                            display: flex;
-                            justify-content: center;
-                            align-items: center;
-                        ">
-                            {numerator}/{denominator}
-                        </div>
-                    </div>
-                </div>
-                """
-                st.markdown(progress_html, unsafe_allow_html=True)
-            except ValueError:
-                st.error("Failed to extract the marks or calculate percentage.")
+            student_image_paths = prepare_pages(uploaded_student_file, workspace)
 
+            # Hand the slow OCR and grading work to the shared worker pool,
+            # including reading the marking scheme: an image scheme needs an
+            # OCR call the first time it is uploaded
+            st.session_state.job_id = job_runner.submit(
+                session_id,
+                grade_script,
+                assessment_tool,
+                student_image_paths,
+                uploaded_marking_scheme,
+                workspace,
+                gradebook=get_gradebook(),
+                student_id=student_id or None,
+                exam=exam or None,
+            )
+        except QuotaExceeded as e:
+            workspace.clear()
+            st.error(str(e))
+            return
         except Exception as e:
+            workspace.clear()
             st.error(f"An error occurred: {e}")
+            return
+
+    show_job(job_runner)
+
+
+# Streamlit App
+def main():
+    st.set_page_config(
+        page_title="Automated Grading System",
+        page_icon=":books:",
+        layout="wide",
+    )
+
+    # Sidebar for uploads
+    with st.sidebar:
+        st.title("Upload Files")
+        st.info("Upload the necessary files to begin the grading process.")
+
+        # File upload for student answer sheet
+        uploaded_student_file = st.file_uploader(
+            "Upload Student Answer Sheet (PDF/Images)",
+            type=["pdf", "jpeg", "jpg", "png"],
+            accept_multiple_files=True,
+        )
+
+        # File upload for marking scheme (DOCX or image)
+        uploaded_marking_scheme = st.file_uploader(
+            "Upload Marking Scheme (DOCX/Image)", type=["docx", "jpeg", "jpg", "png"]
+        )
+
+        # Grades are recorded in the gradebook under this student and exam
+        student_id = st.text_input("Student ID (optional)").strip()
+        exam = st.text_input(
+            "Exam",
+            value=os.path.splitext(uploaded_marking_scheme.name)[0] if uploaded_marking_scheme else "",
+        ).strip()
+
+    # Main Section
+    st.title(":books: Automated Grading System")
+    grade_tab, analytics_tab = st.tabs(["Grade", "Analytics"])
+    with analytics_tab:
+        show_analytics(get_gradebook())
+    with grade_tab:
+        grade_view(uploaded_student_file, uploaded_marking_scheme, student_id, exam)
 
 
 if __name__ == "__main__":
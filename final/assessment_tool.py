@@ -1,19 +1,84 @@
 import os
 import base64
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from groq import Groq
 import cv2
 import numpy as np
-import docx  # For extracting marking scheme from .docx f
 import fitz  # PyMuPDF
 
+from grade_cache import SCRIPT
+from grades import GradeParseError, ScriptGrade, parse_script_grade
+from keypoints import compile_rubric, key_point_summary
+from page_store import is_page_ref, resolve as resolve_page
+from prompts import REGISTRY, UsageLog, estimate_tokens
+from questions import UNKNOWN_QUESTION, question_marks, rubric_for_question
+from results import PageResult, combined_text
+from rubrics import RubricStore, docx_text
+
 GROQ_API_KEY = "xyz"
+# JSON mode: the API only returns syntactically valid JSON objects
+JSON_RESPONSE = {"type": "json_object"}
+# Re-requests of the questions a JSON grade left out or got invalid
+GRADE_RETRIES = 2
+
+
+def build_messages(prompt, image_base64=None):
+    """
+    Build the chat messages for a prompt, optionally with an attached image.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    if image_base64:
+        image_url = f"data:image/jpeg;base64,{image_base64}"
+        messages[0]["content"] = [
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": image_url}},
+        ]
+    return messages
+
+
+def page_label(image_path, index):
+    """
+    Human-readable name of a page that may be a path or an in-memory image.
+    """
+    return image_path if isinstance(image_path, str) else f"page {index + 1}"
+
 
 class ImageOCRAnalyzer:
-    def __init__(self, model_name="llama-3.2-90b-vision-preview"):
+    def __init__(
+        self,
+        model_name="llama-3.2-90b-vision-preview",
+        base_url=None,
+        api_key=None,
+        limiter=None,
+        preprocessor=None,
+        geometry=None,
+    ):
+        """
+        base_url points the client at any Groq/OpenAI-compatible endpoint,
+        e.g. the local stand-in in stub_server.py. When omitted the Groq
+        client falls back to the GROQ_BASE_URL environment variable and then
+        to the hosted API. limiter (see concurrency.AdaptiveLimiter) bounds
+        and adapts the number of API calls in flight. Token usage of every
+        call is collected in self.usage (see prompts.UsageLog). preprocessor
+        (see preprocessing.AdaptivePreprocessor) makes preprocess_image run
+        the filters each page needs instead of passing it through. geometry
+        (see geometry.GeometryNormalizer) straightens and crops photographed
+        pages before they are preprocessed or sent to the model.
+        """
         self.model_name = model_name
+        self.limiter = limiter
+        self.preprocessor = preprocessor
+        self.geometry = geometry
+        self.usage = UsageLog()
+        # With a limiter, 429s must reach it rather than be retried inside
+        # the client; the limiter retries them after cutting its limit
+        client_options = {"max_retries": 0} if limiter is not None else {}
         self.client = Groq(
-            api_key=GROQ_API_KEY
+            api_key=api_key or GROQ_API_KEY, base_url=base_url, **client_options
         )  # Replace with your actual API client initialization
 
     def preprocess_image(self, image_path, output_path):
@@ -21,15 +86,23 @@ class ImageOCRAnalyzer:
         Preprocess an image to enhance quality for OCR.
         """
         try:
-            if not os.path.exists(image_path):
-                raise FileNotFoundError(f"Image file not found: {image_path}")
+            if is_page_ref(image_path):
+                image = self.load_image(image_path)
+            else:
+                if not os.path.exists(image_path):
+                    raise FileNotFoundError(f"Image file not found: {image_path}")
 
-            # Load the image in color
-            image = cv2.imread(image_path)
+                # Load the image in color
+                image = cv2.imread(image_path)
             if image is None:
                 raise ValueError(f"Failed to load image for preprocessing: {image_path}")
 
-            # Save the preprocessed image (no grayscale applied)
+            if self.geometry is not None:
+                image, _ = self.geometry.normalize(image)
+            if self.preprocessor is not None:
+                image, _ = self.preprocessor.process(image, label=image_path)
+
+            # Save the preprocessed image (no grayscale applied without a preprocessor)
             cv2.imwrite(output_path, image)
             return output_path
         except Exception as e:
@@ -37,7 +110,9 @@ class ImageOCRAnalyzer:
 
     def process_pdf(self, pdf_path, output_dir="./uploads"):
         """
-        Convert a PDF into images and return the image paths.
+        Convert a PDF into images and return the image paths. Pass a
+        per-session output_dir (see workspace.py) when several users may
+        process PDFs at the same time.
         """
         # Ensure absolute path
         output_dir = os.path.abspath(output_dir)
@@ -73,163 +148,347 @@ class ImageOCRAnalyzer:
         except Exception as e:
             raise Exception(f"Error processing PDF '{pdf_path}': {e}")
 
+    def decode_image_bytes(self, image_bytes):
+        """
+        Decode an uploaded image straight from memory, without writing it to disk.
+        """
+        buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Failed to decode uploaded image")
+        return image
+
+    def load_image(self, image_path):
+        """
+        Decode a file path or encoded image bytes into an image array.
+        Pages in a page store are returned as read-only views, not copies.
+        """
+        if is_page_ref(image_path):
+            page_store, key = resolve_page(image_path)
+            return page_store.array(key)
+        if isinstance(image_path, (bytes, bytearray, memoryview)):
+            return self.decode_image_bytes(bytes(image_path))
+        image = cv2.imread(image_path)
+        if image is None:
+            raise Exception(f"File not found: {image_path}")
+        return image
+
     def encode_image(self, image_path):
         """
-        Encode an image to base64 format.
+        Encode an image to base64 format. Accepts a file path, raw encoded
+        image bytes or an image already decoded into a numpy array. Pages
+        in a page store are sent as stored; they were normalized when added.
         """
+        if is_page_ref(image_path):
+            page_store, key = resolve_page(image_path)
+            return base64.b64encode(page_store.payload(key)).decode("utf-8")
+        if self.geometry is not None:
+            image = image_path if isinstance(image_path, np.ndarray) else self.load_image(image_path)
+            normalized, info = self.geometry.normalize(image)
+            if info["warped"]:
+                image_path = normalized
+        if isinstance(image_path, (bytes, bytearray, memoryview)):
+            return base64.b64encode(image_path).decode("utf-8")
+        if isinstance(image_path, np.ndarray):
+            ok, encoded = cv2.imencode(".jpg", image_path)
+            if not ok:
+                raise Exception("Failed to encode in-memory image")
+            return base64.b64encode(encoded.tobytes()).decode("utf-8")
         try:
             with open(image_path, "rb") as image_file:
                 return base64.b64encode(image_file.read()).decode("utf-8")
         except FileNotFoundError:
             raise Exception(f"File not found: {image_path}")
 
-    def perform_ocr(self, image_base64=None, prompt="", **kwargs):
+    def perform_ocr(self, image_base64=None, prompt="", template=None, **kwargs):
         """
         Perform OCR and process the image using the provided prompt.
+        template is the id of the prompt template the prompt was rendered
+        from, used to attribute token usage.
         """
-        messages = [{"role": "user", "content": prompt}]
-        if image_base64:
-            image_url = f"data:image/jpeg;base64,{image_base64}"
-            messages[0]["content"] = [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": image_url}},
-            ]
+        messages = build_messages(prompt, image_base64)
 
-        try:
-            completion = self.client.chat.completions.create(
+        def create():
+            return self.client.chat.completions.create(
                 model=self.model_name, messages=messages, **kwargs
             )
+
+        try:
+            start = time.perf_counter()
+            if self.limiter is not None:
+                # Image OCR and text grading have very different latencies
+                completion = self.limiter.call(create, kind="image" if image_base64 else "text")
+            else:
+                completion = create()
+            self.usage.record(
+                template,
+                getattr(completion, "usage", None),
+                estimate_tokens(prompt, images=1 if image_base64 else 0),
+                time.perf_counter() - start,
+            )
             return completion.choices[0].message
         except Exception as e:
             raise Exception(f"Failed to perform OCR: {e}")
 
 class AssessmentTool:
-    def __init__(self, ocr_analyzer):
+    def __init__(
+        self,
+        ocr_analyzer,
+        max_workers=1,
+        ocr_template=None,
+        grade_cache=None,
+        key_points=False,
+        rubric_store=None,
+        packer=None,
+        local_ocr=None,
+    ):
+        """
+        With max_workers > 1 the pages of a script are OCR'd concurrently;
+        pair it with an analyzer limiter so the provider sets the pace.
+        ocr_template picks the OCR prompt version (e.g. "ocr@2"); the
+        registry default is used when omitted. grade_cache (see
+        grade_cache.GradeCache) reuses earlier grades of the same answer.
+        With key_points, per-question grading matches the rubric's key
+        points locally first (see keypoints.py) and tells the model which
+        ones are present. rubric_store (see rubrics.RubricStore) keeps
+        compiled marking schemes; by default image schemes are kept in
+        rubrics.DEFAULT_CACHE_DIR. packer (see packing.RegionPacker) tiles pages with
+        short answers into shared OCR requests. local_ocr (see
+        local_ocr.LocalOCR) reads pages with local Tesseract engines
+        instead of the vision model.
+        """
         self.ocr_analyzer = ocr_analyzer
+        self.max_workers = max_workers
+        self.ocr_template = REGISTRY.get(ocr_template or "ocr")
+        self.grade_cache = grade_cache
+        self.key_points = key_points
+        self.rubric_store = rubric_store or RubricStore(ocr_analyzer)
+        self.packer = packer
+        self.local_ocr = local_ocr
 
-    def extract_student_response(self, student_image_paths):
+    def extract_student_response(self, student_image_paths, on_page=None):
         """
-        Extract the student's response from multiple images.
+        Extract the student's response from multiple images, given as file
+        paths, encoded image bytes or in-memory image arrays. on_page(pages_done, pages_total) is
+        called after each page, e.g. to report progress.
         """
-        all_responses = []
-        for image_path in student_image_paths:
+        return combined_text(self.extract_pages(student_image_paths, on_page))
+
+    def extract_pages(self, student_image_paths, on_page=None, student_id=None):
+        """
+        OCR the pages of a script into results.PageResult records, in page
+        order, with each page's text or error and OCR time.
+        """
+        total = len(student_image_paths)
+        pages = [
+            PageResult(student_id, index + 1, page_label(image_path, index))
+            for index, image_path in enumerate(student_image_paths)
+        ]
+
+        if self.packer is not None and self.local_ocr is None:
+            start = time.perf_counter()
+            results = self.extract_page_responses(student_image_paths, on_page)
+            # Packed pages share their requests, so they share the time too
+            seconds = (time.perf_counter() - start) / max(total, 1)
+            for page, result in zip(pages, results):
+                if isinstance(result, Exception):
+                    page.error = str(result)
+                else:
+                    page.text = result
+                page.ocr_seconds = seconds
+            return pages
+
+        pages_done = 0
+        progress_lock = threading.Lock()
+
+        def extract(index):
+            nonlocal pages_done
+            page = pages[index]
+            start = time.perf_counter()
             try:
-                # Skip preprocessing for images extracted from PDF
-                # Directly encode and process the image
-                encoded_image = self.ocr_analyzer.encode_image(image_path)
-
-                # Prompt for OCR
-                prompt = (
-                    "You are a highly accurate OCR assistant specialized in analyzing text from both handwritten and printed content in images. "
-                    "Your task is to extract all visible text from the provided image, including detailed formatting, and organize it into a structured format as follows:"
-                    "1. Clearly identify the **Question Number** (if present) in the image (e.g., Q1a)."
-                    "2. Extract and structure the **Answer** text verbatim, maintaining its logical order. If the image includes lists, bullet points, or numbered items, ensure they are preserved in the response."
-                    "3. If the content is unclear or illegible, mark it as [unclear] in the relevant section, and do not attempt to guess the text."
-                    "If some parts are unclear, mark them as [unclear]. Provide the extracted text verbatim.\n\n"
-                    "Here are examples to guide you:\n\n"
-                    "Example 1:\n"
-                    "Input Image Content:\n"
-                    "DevOps refers to a mindset of software teams to deliver a product through integration, collaboration, "
-                    "and communication between development and operations teams.\n"
-                    "Benefits:\n"
-                    "1. Fast Time to Market: Due to rapid and frequent merging of code and features, the product is delivered at a faster rate through 'continuous/incremental improvement'.\n"
-                    "2. Automated Testing Improves Reliability: Automated testing at each step ensures the quality of code is reliable and increases the chance of 'early bug detection'.\n\n"
-                    "Extracted Response:\n"
-                    "Question Number: Q1a\n"
-                    "Answer: DevOps refers to a mindset of software teams to deliver a product through integration, collaboration, and communication between development and operations teams.\n"
-                    "Benefits:\n"
-                    "1. Fast Time to Market: Due to rapid and frequent merging of code and features, the product is delivered at a faster rate through 'continuous/incremental improvement'.\n"
-                    "2. Automated Testing Improves Reliability: Automated testing at each step ensures the quality of code is reliable and increases the chance of 'early bug detection'.\n\n"
-                    "Input Image Content:\n"
-                    "3. End-to-End Product Responsibility/Ownership: Due to the DevOps cycle, both the development and operations teams are tightly integrated and have a higher level of ownership towards the product.\n"
-                    "4. Eliminating Manual Tasks: Manual tasks of building and deployment are automated, increasing team efficiency by eliminating 'repetitive tasks'.\n"
-                    "5. Prevent Large Scale Issues at Production: Continuous testing and deployment of features help identify and resolve potential problems early.\n"
-                    "6. Feedback Loops: Monitoring team and user responses improve the UX through continuous feedback.\n\n"
-                    "Extracted Response:\n"
-                    "Question Number: Q1a (continued)\n"
-                    "Answer:\n"
-                    "3. End-to-End Product Responsibility/Ownership: Due to the DevOps cycle, both the development and operations teams are tightly integrated and have a higher level of ownership towards the product.\n"
-                    "4. Eliminating Manual Tasks: Manual tasks of building and deployment are automated, increasing team efficiency by eliminating 'repetitive tasks'.\n"
-                    "5. Prevent Large Scale Issues at Production: Continuous testing and deployment of features help identify and resolve potential problems early.\n"
-                    "6. Feedback Loops: Monitoring team and user responses improve the UX through continuous feedback.\n\n"
-                    "Now, analyze the provided image and ensure maximum accuracy."
-                    "Example 2:\n"
-                    "Input Image Content:\n"
-                    "1. FAST Delivery"
-                    "Since development & ops team work continuously all collaboratively, it allows for faster development of features through continuous integration and deployment."
-                    "2. Quality Product"
-                    "Test is carried out in each stage of DevOps resulting in a quality product free of any bugs."
-                    "3. Customer Trust"
-                    "Customers are involved throughout the lifecycle with giving continuous feedback of the software & viewing changes which creates a sense of satisfaction."
-                    "4. Mean Value Product"
-                    "The product produced is of value and to the point of what was required."
-                    "5. Collaboration"
-                    "The developers and operations team work together throughout, communicating back and forth, breaking the practices of silos. Work of each team is visible to others."
-                    "6. Seamless Integration"
-                    "Since there is clear communication & each work of each team is visible to each other, the product is delivered without any conflicts."
-                    "Extracted Response:"
-                    "Question Number: Q1a"
-                    "Answer:"
-                    "1. FAST Delivery"
-                    "Since development & ops team work continuously all collaboratively, it allows for faster development of features through continuous integration and deployment."
-                    "2. Quality Product"
-                    "Test is carried out in each stage of DevOps resulting in a quality product free of any bugs."
-                    "3. Customer Trust"
-                    "Customers are involved throughout the lifecycle with giving continuous feedback of the software & viewing changes which creates a sense of satisfaction."
-                    "4. Mean Value Product"
-                    "The product produced is of value and to the point of what was required."
-                    "5. Collaboration"
-                    "The developers and operations team work together throughout, communicating back and forth, breaking the practices of silos. Work of each team is visible to others."
-                    "6. Seamless Integration"
-                    "Since there is clear communication & each work of each team is visible to each other, the product is delivered without any conflicts."
-                    ### Instructions for New Input:
-                    "Now, analyze the provided image and:  "
-                    "- Identify the **Question Number** if available.  "
-                    "- Extract the **Answer** text verbatim, preserving structure and formatting.  "
-                    "- Use [unclear] where content is illegible or ambiguous. "
-                    "- Ensure the output is clear, logical, and follows the examples above."
-                )
+                page.text = self.extract_page_response(student_image_paths[index])
+            except Exception as e:
+                page.error = str(e)
+            page.ocr_seconds = time.perf_counter() - start
+            if on_page:
+                with progress_lock:
+                    pages_done += 1
+                    on_page(pages_done, total)
 
-                # Perform OCR
-                result = self.ocr_analyzer.perform_ocr(
-                    image_base64=encoded_image, prompt=prompt
-                )
-                all_responses.append(result.content)
+        if self.max_workers > 1 and total > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, total)) as executor:
+                list(executor.map(extract, range(total)))
+        else:
+            for index in range(total):
+                extract(index)
+        return pages
+
+    def extract_page_response(self, image_path):
+        """
+        Extract the student's response from a single page image.
+        """
+        if self.local_ocr is not None:
+            # Decoded once and handed over as an array, never re-encoded
+            image = image_path if isinstance(image_path, np.ndarray) else self.ocr_analyzer.load_image(image_path)
+            return self.local_ocr.recognize(image, label=image_path if isinstance(image_path, str) else None)
 
+        # Skip preprocessing for images extracted from PDF
+        # Directly encode and process the image
+        encoded_image = self.ocr_analyzer.encode_image(image_path)
+
+        # Perform OCR
+        result = self.ocr_analyzer.perform_ocr(
+            image_base64=encoded_image,
+            prompt=self.ocr_template.render(),
+            template=self.ocr_template.template_id,
+        )
+        return result.content
+
+    def extract_page_responses(self, image_paths, on_page=None):
+        """
+        Extract the responses of several pages, packed into shared requests
+        when a packer is set. Returns one entry per page: its text, or the
+        exception it failed with.
+        """
+        if self.packer is not None and self.local_ocr is None:
+            return self.packer.extract(self, image_paths, on_page)
+        results = []
+        for index, image_path in enumerate(image_paths):
+            try:
+                results.append(self.extract_page_response(image_path))
             except Exception as e:
-                all_responses.append(f"[Error processing {image_path}: {e}]")
-        return "\n".join(all_responses)
+                results.append(e)
+            if on_page:
+                on_page(index + 1, len(image_paths))
+        return results
 
     def extract_marking_scheme_from_docx(self, docx_path):
         """
         Extract the marking scheme from a .docx file.
         """
-        try:
-            doc = docx.Document(docx_path)
-            marking_scheme = []
-            for para in doc.paragraphs:
-                text = para.text.strip()
-                if text:
-                    marking_scheme.append(text)
-            return "\n".join(marking_scheme)
-        except Exception as e:
-            raise Exception(f"Failed to extract marking scheme from DOCX: {e}")
+        return docx_text(docx_path)
+
+    def load_marking_scheme(self, source):
+        """
+        Compile a marking scheme from a .docx or an image (path, bytes or
+        upload). Image schemes are OCR'd once and then loaded from the
+        rubric store.
+        """
+        return self.rubric_store.load(source)
+
+    def extract_marking_scheme(self, source):
+        """
+        Extract the marking scheme text from a .docx or an image.
+        """
+        return self.load_marking_scheme(source).text
 
     def assess_student_response(self, student_response, marking_scheme):
         """
-        Assess the student's response using the marking scheme.
+        Assess the student's response using the marking scheme. Returns
+        the grade as "Question X: ... Awarded Marks: N" lines and a
+        "Total Marks: Y/Z" line; grade_student_response returns it typed.
         """
-        prompt = (
-            "You are an evaluator tasked with assessing a student's answers using a provided marking scheme. Evaluate each question by comparing the student's response to the correct answer in the marking scheme. Follow these guidelines for grading:"
-            "Evaluate each question, comparing the student's response to the correct answer in the marking scheme. Be lenient with evaluation"
-            "Award marks for correct answers and provide a total score. Structure your response as:\n"
-            "Question 1: Correct/Incorrect - Awarded Marks: X\n"
-            "...\nTotal Marks: Y\n\n"
-            "Marking Scheme:\n{marking_scheme}\n\nStudent Response:\n{student_response}"
-        ).format(marking_scheme=marking_scheme, student_response=student_response)
+        return self.grade_student_response(student_response, marking_scheme).text
 
+    def grade_student_response(self, student_response, marking_scheme):
+        """
+        Grade a whole script into a grades.ScriptGrade. The model replies
+        in a strict JSON schema; questions its reply leaves out or gets
+        invalid are re-requested on their own, up to GRADE_RETRIES times,
+        instead of regrading the script. Raises GradeParseError when some
+        still cannot be graded.
+        """
+        template = REGISTRY.get("grade_script")
+        cache_key = (SCRIPT, marking_scheme, student_response, self.ocr_analyzer.model_name, template.template_id)
+        if self.grade_cache is not None:
+            cached = self.grade_cache.get(*cache_key)
+            if cached is not None:
+                return ScriptGrade.from_dict(json.loads(cached))
+
+        prompt = template.render(marking_scheme=marking_scheme, student_response=student_response)
         try:
-            result = self.ocr_analyzer.perform_ocr(prompt=prompt)
-            return result.content
+            result = self.ocr_analyzer.perform_ocr(
+                prompt=prompt, template=template.template_id, response_format=JSON_RESPONSE
+            )
         except Exception as e:
             raise Exception(f"Failed to assess student response: {e}")
+        grade = parse_script_grade(result.content, marking_scheme)
+
+        retry_template = REGISTRY.get("grade_questions")
+        for _ in range(GRADE_RETRIES):
+            if grade.valid:
+                break
+            if UNKNOWN_QUESTION in grade.failed:
+                # Nothing in the reply could be used: ask for the whole grade again
+                retry_prompt = prompt
+                retry_id = template.template_id
+            else:
+                retry_prompt = retry_template.render(
+                    question_ids=", ".join(grade.failed),
+                    marking_scheme=marking_scheme,
+                    student_response=student_response,
+                )
+                retry_id = retry_template.template_id
+            try:
+                result = self.ocr_analyzer.perform_ocr(
+                    prompt=retry_prompt, template=retry_id, response_format=JSON_RESPONSE
+                )
+            except Exception as e:
+                raise Exception(f"Failed to assess student response: {e}")
+            retry = parse_script_grade(result.content, marking_scheme)
+            grade = retry if UNKNOWN_QUESTION in grade.failed else grade.merge(retry)
+        if not grade.valid:
+            failed = "; ".join(f"{question_id}: {reason}" for question_id, reason in grade.failed.items())
+            raise GradeParseError(f"Could not grade every question ({failed})")
+
+        if self.grade_cache is not None:
+            self.grade_cache.put(*cache_key, grade.to_json())
+        return grade
+
+    def assess_question(self, question_id, marking_scheme, answer):
+        """
+        Assess a single question of a student's response. Lets grading be
+        split into independent per-question tasks.
+        """
+        coverage = compile_rubric(marking_scheme).score(question_id, answer) if self.key_points else None
+        if coverage is not None:
+            template = REGISTRY.get("grade_question@2")
+            prompt = template.render(
+                question_id=question_id,
+                marking_scheme=marking_scheme,
+                answer=answer,
+                key_points=key_point_summary(coverage),
+            )
+        else:
+            template = REGISTRY.get("grade_question")
+            prompt = template.render(question_id=question_id, marking_scheme=marking_scheme, answer=answer)
+
+        return self.cached_grade(
+            question_id,
+            rubric_for_question(marking_scheme, question_id),
+            answer,
+            template,
+            prompt,
+            f"Failed to assess question {question_id}",
+        )
+
+    def cached_grade(self, question_id, rubric_text, answer, template, prompt, error_message):
+        """
+        Return the grade for a rendered grading prompt, from the grade cache
+        when this answer was already graded against the same rubric item,
+        model and prompt version. Only replies that award the question
+        marks are cached, so a refusal or garbled reply is not replayed.
+        """
+        cache_key = (question_id, rubric_text, answer, self.ocr_analyzer.model_name, template.template_id)
+        if self.grade_cache is not None:
+            cached = self.grade_cache.get(*cache_key)
+            if cached is not None:
+                return cached
+
+        try:
+            result = self.ocr_analyzer.perform_ocr(prompt=prompt, template=template.template_id)
+        except Exception as e:
+            raise Exception(f"{error_message}: {e}")
+        if self.grade_cache is not None and question_marks(result.content, question_id) is not None:
+            self.grade_cache.put(*cache_key, result.content)
+        return result.content
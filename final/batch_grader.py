@@ -0,0 +1,412 @@
+"""
+Resumable batch grading of a cohort of answer scripts.
+
+Every page OCR and every grade is checkpointed in a JobStore, so rerunning
+the same command after a crash, rate limit or laptop sleep resumes from the
+last completed API call instead of starting over.
+
+Usage:
+    python batch_grader.py --db grading.db --job mid2 \\
+        --marking-scheme ../mid2/solution.docx --scripts-dir ./scripts
+    python job_store.py grading.db mid2   # progress, safe while a run is active
+
+    # After fixing the marking scheme, regrade only the questions it changed
+    python batch_grader.py --db grading.db --job mid2 --marking-scheme ../mid2/solution.docx --regrade
+
+Each PDF in --scripts-dir is one student, as is each sub-directory of page
+images. Loose images are one single-page student each.
+
+With --cluster, scripts are graded per question instead: all students are
+OCR'd first, then identical (and with --semantic, near-identical) answers to
+each question are grouped and only one answer per group is sent to the
+grader. Its marks are copied to the rest of the group and every copy is
+recorded in the job's grade audit trail.
+"""
+import argparse
+import json
+import os
+import time
+
+from assessment_tool import ImageOCRAnalyzer, AssessmentTool
+from clustering import DEFAULT_THRESHOLD, AnswerEmbedder, cluster_answers
+from grade_cache import GradeCache
+from gradebook import Gradebook
+from job_store import JobStore, PENDING, OCR_DONE, FAILED, GRADED
+from local_ocr import ENGINES, LocalOCR
+from packed_grading import DEFAULT_BATCH_SIZE, AnswerPacker
+from packing import RegionPacker
+from page_store import PageStore
+from questions import split_student_response, question_marks, rubric_for_question
+from results import export_job, output_paths
+
+IMAGE_EXTENSIONS = (".jpeg", ".jpg", ".png")
+
+
+class BatchGrader:
+    def __init__(
+        self,
+        assessment_tool,
+        job_store,
+        pages_dir="./uploads/pages",
+        cluster=False,
+        embedder=None,
+        threshold=DEFAULT_THRESHOLD,
+        page_store=None,
+        answer_packer=None,
+    ):
+        """
+        cluster switches to per-question grading of answer clusters; an
+        embedder (clustering.AnswerEmbedder) additionally merges answers
+        that are at least threshold similar. With a page_store
+        (page_store.PageStore) pages are rendered into it instead of into
+        page_N.png files under pages_dir. An answer_packer
+        (packed_grading.AnswerPacker) grades the short answers of a
+        question many to a request; it applies to per-question grading.
+        """
+        self.assessment_tool = assessment_tool
+        self.job_store = job_store
+        self.pages_dir = pages_dir
+        self.cluster = cluster
+        self.embedder = embedder
+        self.threshold = threshold
+        self.page_store = page_store
+        self.answer_packer = answer_packer
+        self.cluster_stats = {"answers": 0, "clusters": 0, "grading_calls": 0, "failed": 0}
+
+    def register_scripts(self, job_id, scripts):
+        """
+        Register {student_id: source} where source is a PDF path or a list of
+        page image paths. PDFs are only rendered for students not registered
+        yet, so a resumed run never re-renders.
+        """
+        for student_id, source in scripts.items():
+            if self.job_store.has_student(job_id, student_id):
+                continue
+            if self.page_store is not None:
+                page_paths = self.store_pages(job_id, student_id, source)
+            elif isinstance(source, str) and source.lower().endswith(".pdf"):
+                page_paths = self.assessment_tool.ocr_analyzer.process_pdf(
+                    source, output_dir=os.path.join(self.pages_dir, job_id, student_id)
+                )
+            else:
+                page_paths = list(source)
+            self.job_store.add_student(job_id, student_id, page_paths)
+
+    def store_pages(self, job_id, student_id, source):
+        """
+        Add a student's pages to the page store, straightened first when
+        the analyzer has a geometry stage, and return their references.
+        """
+        geometry = getattr(self.assessment_tool.ocr_analyzer, "geometry", None)
+        transform = (lambda image: geometry.normalize(image)[0]) if geometry is not None else None
+        prefix = f"{job_id}/{student_id}"
+        if isinstance(source, str) and source.lower().endswith(".pdf"):
+            return self.page_store.put_pdf(prefix, source, transform=transform)
+        return [
+            self.page_store.put_image_file(f"{prefix}/page_{number}", path, transform=transform)
+            for number, path in enumerate(source, start=1)
+        ]
+
+    def ocr_student(self, job_id, student_id):
+        """
+        OCR the pages that have not completed yet. Returns True once every
+        page of the student has OCR text.
+        """
+        complete = True
+        pages = self.job_store.pages(job_id, student_id, states=[PENDING, FAILED])
+        if self.assessment_tool.packer is not None:
+            # Packed pages complete together, so they are checkpointed
+            # together; their shared calls are not timed per page
+            results = [
+                (result, None)
+                for result in self.assessment_tool.extract_page_responses([page["source_path"] for page in pages])
+            ]
+        else:
+            results = (self.extract_page(page["source_path"]) for page in pages)
+        for page, (result, seconds) in zip(pages, results):
+            if isinstance(result, Exception):
+                self.job_store.record_page_failure(job_id, student_id, page["page_number"], result)
+                complete = False
+                continue
+            self.job_store.record_ocr(job_id, student_id, page["page_number"], result, seconds)
+        return complete
+
+    def extract_page(self, source_path):
+        """
+        (OCR text or the exception raised, seconds taken) for one page.
+        """
+        started = time.perf_counter()
+        try:
+            result = self.assessment_tool.extract_page_response(source_path)
+        except Exception as e:
+            result = e
+        return result, time.perf_counter() - started
+
+    def grade_student(self, job_id, student_id, marking_scheme):
+        student_response = self.job_store.student_response(job_id, student_id)
+        self.job_store.record_questions(
+            job_id, student_id, split_student_response(student_response)
+        )
+        try:
+            grade = self.assessment_tool.grade_student_response(student_response, marking_scheme)
+        except Exception as e:
+            self.job_store.record_student_failure(job_id, student_id, e)
+            return False
+        self.job_store.record_grade(job_id, student_id, grade.text, grade.marks, grade.total, grade.out_of)
+        return True
+
+    def split_student(self, job_id, student_id):
+        answers = split_student_response(self.job_store.student_response(job_id, student_id))
+        self.job_store.record_questions(job_id, student_id, answers)
+        if not answers:
+            self.job_store.finalize_student(job_id, student_id)
+
+    def grade_clusters(self, job_id, marking_scheme):
+        """
+        Grade every ungraded answer of the job, one grading call per answer
+        cluster. A failed call leaves its whole cluster ungraded for the
+        next run.
+        """
+        for question_id, answers in self.job_store.ungraded_answers(job_id).items():
+            clusters = cluster_answers(answers, self.embedder, self.threshold)
+            self.cluster_stats["answers"] += len(answers)
+            self.cluster_stats["clusters"] += len(clusters)
+            if self.answer_packer is not None:
+                calls = self.answer_packer.report()["calls"]
+                # Packed answers share their calls, so they are not timed each
+                results = [
+                    (result, None)
+                    for result in self.answer_packer.grade(
+                        question_id, marking_scheme, [cluster.representative_text for cluster in clusters]
+                    )
+                ]
+                self.cluster_stats["grading_calls"] += self.answer_packer.report()["calls"] - calls
+            else:
+                results = (self.grade_answer(question_id, marking_scheme, cluster) for cluster in clusters)
+            for cluster, (assessment_result, seconds) in zip(clusters, results):
+                if isinstance(assessment_result, Exception):
+                    self.cluster_stats["failed"] += 1
+                    self.job_store.record_student_failure(job_id, cluster.representative, assessment_result)
+                    continue
+                marks = question_marks(assessment_result, question_id)
+                if marks is None:
+                    # A reply without marks is not a zero; leave the cluster for the next run
+                    self.cluster_stats["failed"] += 1
+                    self.job_store.record_student_failure(
+                        job_id, cluster.representative, f"No marks for question {question_id} in: {assessment_result[:200]}"
+                    )
+                    continue
+                self.job_store.record_cluster_grade(
+                    job_id,
+                    question_id,
+                    cluster.representative,
+                    marks,
+                    assessment_result,
+                    cluster.members,
+                    seconds,
+                )
+
+    def grade_answer(self, question_id, marking_scheme, cluster):
+        """
+        (grader output or the exception raised, seconds taken) for a
+        cluster's representative answer.
+        """
+        self.cluster_stats["grading_calls"] += 1
+        started = time.perf_counter()
+        try:
+            result = self.assessment_tool.assess_question(question_id, marking_scheme, cluster.representative_text)
+        except Exception as e:
+            result = e
+        return result, time.perf_counter() - started
+
+    def run_clustered(self, job_id, marking_scheme, on_progress=None):
+        for student_id in self.job_store.students(job_id, states=[PENDING]):
+            if self.ocr_student(job_id, student_id) and self.job_store.claim_ocr_complete(job_id, student_id):
+                self.split_student(job_id, student_id)
+            if on_progress:
+                on_progress(student_id, self.job_store.progress(job_id))
+
+        ocr_done = self.job_store.students(job_id, states=[OCR_DONE])
+        for student_id in ocr_done:
+            # A run interrupted between OCR and splitting left no questions
+            if not self.job_store.questions(job_id, student_id):
+                self.split_student(job_id, student_id)
+
+        self.grade_clusters(job_id, marking_scheme)
+        for student_id in ocr_done:
+            self.job_store.finalize_student(job_id, student_id)
+        return self.job_store.progress(job_id)
+
+    def regrade(self, job_id, marking_scheme):
+        """
+        Regrade a job against an edited marking scheme. Only questions whose
+        rubric item changed are graded again, from the stored OCR text; all
+        other marks are kept. Returns {"version", "changed", "reopened",
+        "rescripted"} describing what was redone.
+
+        Safe to rerun after an interruption: the new scheme is stored before
+        any grading, and a rerun finishes whatever was left ungraded.
+        """
+        previous = self.job_store.marking_scheme(job_id)
+        if previous is None:
+            raise ValueError(f"Unknown job '{job_id}'")
+
+        changed = []
+        version = None
+        if marking_scheme != previous:
+            changed = [
+                question_id
+                for question_id in self.job_store.question_ids(job_id)
+                if rubric_for_question(previous, question_id) != rubric_for_question(marking_scheme, question_id)
+            ]
+            version = self.job_store.update_marking_scheme(job_id, marking_scheme)
+        reopened, unsplit = self.job_store.reopen_questions(job_id, changed)
+
+        # Whole-script grades that cannot be redone question by question
+        for student_id in unsplit:
+            self.grade_student(job_id, student_id, marking_scheme)
+
+        ocr_done = self.job_store.students(job_id, states=[OCR_DONE])
+        self.grade_clusters(job_id, marking_scheme)
+        for student_id in ocr_done:
+            self.job_store.finalize_student(job_id, student_id)
+        return {"version": version, "changed": changed, "reopened": reopened, "rescripted": unsplit}
+
+    def run(self, job_id, scripts, marking_scheme, on_progress=None):
+        """
+        Grade every registered student that is not graded yet. The marking
+        scheme stored with the job wins over the one passed in, so a resumed
+        job is always graded consistently.
+        """
+        marking_scheme = self.job_store.create_job(job_id, marking_scheme)
+        self.register_scripts(job_id, scripts)
+        if self.cluster:
+            return self.run_clustered(job_id, marking_scheme, on_progress)
+
+        for student_id in self.job_store.students(job_id, states=[PENDING, OCR_DONE]):
+            if self.ocr_student(job_id, student_id):
+                self.grade_student(job_id, student_id, marking_scheme)
+            if on_progress:
+                on_progress(student_id, self.job_store.progress(job_id))
+        return self.job_store.progress(job_id)
+
+
+def discover_scripts(scripts_dir):
+    """
+    Map student ids to their script sources inside a directory.
+    """
+    scripts = {}
+    for name in sorted(os.listdir(scripts_dir)):
+        path = os.path.join(scripts_dir, name)
+        student_id, extension = os.path.splitext(name)
+        if os.path.isdir(path):
+            pages = [
+                os.path.join(path, page)
+                for page in sorted(os.listdir(path))
+                if page.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+            if pages:
+                scripts[name] = pages
+        elif extension.lower() == ".pdf":
+            scripts[student_id] = path
+        elif extension.lower() in IMAGE_EXTENSIONS:
+            scripts[student_id] = [path]
+    return scripts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable batch grading")
+    parser.add_argument("--db", default="./uploads/grading.db")
+    parser.add_argument("--job", required=True, help="job id; reuse it to resume")
+    parser.add_argument("--marking-scheme", required=True, help="marking scheme .docx or image")
+    parser.add_argument("--scripts-dir", help="required unless --regrade")
+    parser.add_argument("--regrade", action="store_true", help="regrade questions changed in --marking-scheme")
+    parser.add_argument("--base-url", help="Groq/OpenAI-compatible endpoint")
+    parser.add_argument("--grade-cache", help="grade cache database shared across runs")
+    parser.add_argument("--cluster", action="store_true", help="grade each group of identical answers once")
+    parser.add_argument("--semantic", action="store_true", help="also group near-identical answers (SBERT)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="--semantic similarity cutoff")
+    parser.add_argument("--page-store", action="store_true", help="keep pages in one memory-mapped store per job")
+    parser.add_argument("--key-points", action="store_true", help="tell the grader which rubric key points were found")
+    parser.add_argument("--export", help="write page and question results to this .parquet or .jsonl path")
+    parser.add_argument("--gradebook", help="gradebook directory to append the job's grades to, for analytics")
+    parser.add_argument(
+        "--local-ocr",
+        nargs="?",
+        const="tesserocr",
+        choices=sorted(ENGINES),
+        help="read pages with local Tesseract engines instead of the vision model",
+    )
+    parser.add_argument("--pack", action="store_true", help="OCR short-answer pages several to a request")
+    parser.add_argument(
+        "--pack-answers",
+        type=int,
+        nargs="?",
+        const=DEFAULT_BATCH_SIZE,
+        help="grade up to N students' short answers to a question per request (implies --cluster)",
+    )
+    args = parser.parse_args()
+
+    ocr_analyzer = ImageOCRAnalyzer(base_url=args.base_url)
+    grade_cache = GradeCache(args.grade_cache) if args.grade_cache else None
+    assessment_tool = AssessmentTool(
+        ocr_analyzer,
+        grade_cache=grade_cache,
+        key_points=args.key_points,
+        packer=RegionPacker() if args.pack else None,
+        local_ocr=LocalOCR(args.local_ocr) if args.local_ocr else None,
+    )
+    job_store = JobStore(args.db)
+    grader = BatchGrader(
+        assessment_tool,
+        job_store,
+        pages_dir=os.path.join(os.path.dirname(args.db), "pages"),
+        cluster=args.cluster or args.semantic or bool(args.pack_answers),
+        embedder=AnswerEmbedder() if args.semantic else None,
+        threshold=args.threshold,
+        page_store=PageStore(os.path.join(os.path.dirname(args.db), "pages", f"{args.job}.pages"))
+        if args.page_store
+        else None,
+        answer_packer=AnswerPacker(assessment_tool, batch_size=args.pack_answers) if args.pack_answers else None,
+    )
+
+    marking_scheme = assessment_tool.extract_marking_scheme(args.marking_scheme)
+    if args.regrade:
+        print(json.dumps(grader.regrade(args.job, marking_scheme), indent=2))
+        print(json.dumps(job_store.progress(args.job), indent=2))
+        if args.gradebook:
+            count = Gradebook(args.gradebook).append_job(job_store, args.job)
+            print(f"Appended {count} regraded questions to {args.gradebook}")
+        return
+    if not args.scripts_dir:
+        parser.error("--scripts-dir is required")
+    scripts = discover_scripts(args.scripts_dir)
+
+    def report(student_id, progress):
+        graded = progress["students"].get(GRADED, 0)
+        print(f"{student_id}: {graded}/{len(scripts)} students graded")
+
+    progress = grader.run(args.job, scripts, marking_scheme, on_progress=report)
+    print(json.dumps(progress, indent=2))
+    if args.export:
+        pages, questions = export_job(job_store, args.job)
+        for table, path in zip((pages, questions), output_paths(args.export)):
+            table.write(path)
+            print(f"Exported {len(table)} rows to {path}")
+    if args.gradebook:
+        count = Gradebook(args.gradebook).append_job(job_store, args.job)
+        print(f"Appended {count} graded questions to {args.gradebook}")
+    if grader.cluster:
+        print("Clustering:", json.dumps(grader.cluster_stats))
+    if grade_cache:
+        print("Grade cache:", json.dumps(grade_cache.stats()))
+    if assessment_tool.local_ocr:
+        print("Local OCR:", json.dumps(assessment_tool.local_ocr.report()))
+    if assessment_tool.packer:
+        print("Packing:", json.dumps(assessment_tool.packer.report()))
+    if grader.answer_packer:
+        print("Packed grading:", json.dumps(grader.answer_packer.report()))
+
+
+if __name__ == "__main__":
+    main()
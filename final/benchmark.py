@@ -0,0 +1,251 @@
+"""
+Benchmark the full grading pipeline over the bundled sample scripts.
+
+Each sample image is treated as a one-page script and each PDF is rendered to
+pages first. Every script is OCR'd page by page and then graded against the
+sample marking scheme. The run reports pages/sec, p50/p95 latency and peak
+RSS, and can be written to JSON and compared against a previous run.
+
+Usage:
+    # Against an in-process stand-in server (no API quota used)
+    python benchmark.py --stub --latency uniform:0.2,0.6 --rate-429 0.02
+    # Many scripts at once, with the AIMD limiter finding the sustainable concurrency
+    python benchmark.py --stub --workers 32 --adaptive --repeat 5 --rate-429 0.05
+    # Against any compatible endpoint
+    python benchmark.py --base-url http://127.0.0.1:8765 --output run.json --compare prev.json
+    # Record once, then replay deterministically at local-CPU speed
+    python benchmark.py --stub --cassette run.cassette.json --cassette-mode record
+    python benchmark.py --cassette run.cassette.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from assessment_tool import ImageOCRAnalyzer, AssessmentTool
+from cassette import CASSETTE_MODES, CassetteOCRAnalyzer
+from concurrency import AdaptiveLimiter
+from geometry import GeometryNormalizer
+from stub_server import StubServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_DIRS = ["test_files", "mid2", os.path.join("final", "uploads")]
+MARKING_SCHEME_PATH = os.path.join(REPO_ROOT, "mid2", "solution.docx")
+IMAGE_EXTENSIONS = (".jpeg", ".jpg", ".png")
+
+
+def collect_samples(sample_dirs=SAMPLE_DIRS):
+    """
+    Return the sample image and PDF paths, in a stable order.
+    """
+    samples = []
+    for sample_dir in sample_dirs:
+        directory = os.path.join(REPO_ROOT, sample_dir)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("~$"):
+                # Word lock files
+                continue
+            if name.lower().endswith(IMAGE_EXTENSIONS + (".pdf",)):
+                samples.append(os.path.join(directory, name))
+    return samples
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def run_script(assessment_tool, sample_path, marking_scheme, work_dir):
+    """
+    OCR and grade one sample, returning (page_latencies, grade_latency, errors).
+    """
+    if sample_path.lower().endswith(".pdf"):
+        name = os.path.splitext(os.path.basename(sample_path))[0]
+        page_paths = assessment_tool.ocr_analyzer.process_pdf(
+            sample_path, output_dir=os.path.join(work_dir, f"{name}_{threading.get_ident()}")
+        )
+    else:
+        page_paths = [sample_path]
+
+    page_latencies = []
+    page_texts = []
+    errors = 0
+    for page_path in page_paths:
+        page_start = time.perf_counter()
+        try:
+            page_texts.append(assessment_tool.extract_page_response(page_path))
+        except Exception as e:
+            errors += 1
+            page_texts.append(f"[Error processing {page_path}: {e}]")
+        page_latencies.append(time.perf_counter() - page_start)
+
+    grade_start = time.perf_counter()
+    try:
+        assessment_tool.assess_student_response("\n".join(page_texts), marking_scheme)
+    except Exception:
+        errors += 1
+    return page_latencies, time.perf_counter() - grade_start, errors
+
+
+def run_benchmark(assessment_tool, samples, marking_scheme, work_dir, repeat=1, workers=1):
+    """
+    Run the pipeline over every sample, grading up to `workers` scripts at
+    once, and return the collected metrics.
+    """
+    page_latencies = []
+    grade_latencies = []
+    errors = 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_script, assessment_tool, sample_path, marking_scheme, work_dir)
+            for _ in range(repeat)
+            for sample_path in samples
+        ]
+        for future in futures:
+            script_page_latencies, grade_latency, script_errors = future.result()
+            page_latencies.extend(script_page_latencies)
+            grade_latencies.append(grade_latency)
+            errors += script_errors
+    elapsed = time.perf_counter() - start
+    pages = len(page_latencies)
+
+    return {
+        "scripts": len(grade_latencies),
+        "pages": pages,
+        "errors": errors,
+        "elapsed_sec": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 3) if elapsed else 0.0,
+        "page_latency_p50": round(percentile(page_latencies, 50), 4),
+        "page_latency_p95": round(percentile(page_latencies, 95), 4),
+        "grade_latency_p50": round(percentile(grade_latencies, 50), 4),
+        "grade_latency_p95": round(percentile(grade_latencies, 95), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def compare_runs(current, previous):
+    """
+    Print the relative change of each metric against a previous run.
+    """
+    print("\nComparison with previous run:")
+    for key, value in current.items():
+        if key not in previous or not isinstance(value, (int, float)):
+            continue
+        before = previous[key]
+        change = ((value - before) / before * 100) if before else 0.0
+        print(f"  {key:<20} {before:>10} -> {value:<10} ({change:+.1f}%)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Grading pipeline benchmark")
+    parser.add_argument("--base-url", help="Groq/OpenAI-compatible endpoint to benchmark against")
+    parser.add_argument("--stub", action="store_true", help="start an in-process stand-in server")
+    parser.add_argument("--latency", default="fixed:0", help="stub latency distribution")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="stub 429 injection rate")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="stub 5xx injection rate")
+    parser.add_argument("--responses", help="stub canned/recorded responses file")
+    parser.add_argument("--seed", type=int, default=0, help="stub random seed")
+    parser.add_argument("--cassette", help="record/replay perform_ocr calls with this cassette")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default="replay")
+    parser.add_argument("--model", default="llama-3.2-90b-vision-preview")
+    parser.add_argument("--ocr-template", help="OCR prompt template id, e.g. ocr@2")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the sample set")
+    parser.add_argument("--workers", type=int, default=1, help="scripts graded concurrently")
+    parser.add_argument("--adaptive", action="store_true", help="AIMD-limit API calls in flight")
+    parser.add_argument("--geometry", action="store_true", help="straighten and crop page photos before upload")
+    parser.add_argument("--output", help="write metrics to this JSON file")
+    parser.add_argument("--compare", help="previous metrics JSON to compare against")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    server = None
+    base_url = args.base_url
+    if args.stub:
+        server = StubServer(
+            latency=args.latency,
+            rate_429=args.rate_429,
+            rate_5xx=args.rate_5xx,
+            responses_path=args.responses,
+            seed=args.seed,
+        ).start()
+        base_url = server.base_url
+
+    try:
+        limiter = AdaptiveLimiter(max_limit=args.workers) if args.adaptive else None
+        ocr_analyzer = ImageOCRAnalyzer(
+            model_name=args.model,
+            base_url=base_url,
+            limiter=limiter,
+            geometry=GeometryNormalizer() if args.geometry else None,
+        )
+        if args.cassette:
+            ocr_analyzer = CassetteOCRAnalyzer(
+                ocr_analyzer, args.cassette, mode=args.cassette_mode
+            )
+        assessment_tool = AssessmentTool(ocr_analyzer, ocr_template=args.ocr_template)
+        marking_scheme = assessment_tool.extract_marking_scheme_from_docx(MARKING_SCHEME_PATH)
+        samples = collect_samples()
+        print(f"Benchmarking {len(samples)} samples against {base_url or 'the hosted API'}...")
+
+        with tempfile.TemporaryDirectory(prefix="grading-bench-") as work_dir:
+            metrics = run_benchmark(
+                assessment_tool,
+                samples,
+                marking_scheme,
+                work_dir,
+                repeat=args.repeat,
+                workers=args.workers,
+            )
+        metrics["token_usage"] = ocr_analyzer.usage.report()
+        if limiter:
+            metrics["limiter"] = limiter.metrics()
+        if server:
+            metrics["stub_stats"] = dict(server.backend.stats)
+        if args.cassette:
+            metrics["cassette_stats"] = dict(ocr_analyzer.stats)
+            ocr_analyzer.save()
+    finally:
+        if server:
+            server.stop()
+
+    print(json.dumps(metrics, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_runs(metrics, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Record/replay harness for perform_ocr calls.
+
+In record mode every request/response pair is captured into a cassette file,
+keyed by request hash. In replay mode the cassette is served back instantly,
+so the pipeline runs deterministically at local-CPU speed for profiling and
+regression checks. Each entry keeps the call's token usage, which replay
+returns and adds to the wrapped analyzer's UsageLog, so token reports of a
+replayed run match the recorded one. Cassettes use the same format the
+stub server loads, so a recorded cassette can also be served over HTTP
+with `python stub_server.py --responses cassette.json`.
+"""
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from assessment_tool import build_messages
+from prompts import estimate_tokens
+from stub_server import request_key
+
+CASSETTE_MODES = ("record", "replay", "auto")
+
+
+class CassetteMessage:
+    """
+    Stand-in for the message object returned by the chat completions client.
+    usage is the recorded call's token usage (prompt_tokens,
+    completion_tokens), or None when the endpoint did not report it.
+    """
+
+    def __init__(self, content, role="assistant", usage=None):
+        self.content = content
+        self.role = role
+        self.usage = usage
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+class CassetteOCRAnalyzer:
+    """
+    Wrap an ImageOCRAnalyzer and record or replay its perform_ocr calls.
+
+    Modes:
+        record  call through to the wrapped analyzer and store every response
+        replay  serve responses from the cassette, failing on unknown requests
+        auto    replay when the request is known, otherwise record it
+
+    All other analyzer methods (encode_image, process_pdf, ...) are delegated
+    to the wrapped analyzer, so the wrapper drops in wherever an analyzer is
+    expected:
+
+        with CassetteOCRAnalyzer(ImageOCRAnalyzer(), "run.json", mode="replay") as analyzer:
+            assessment_tool = AssessmentTool(analyzer)
+    """
+
+    def __init__(self, ocr_analyzer, cassette_path, mode="replay"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of {CASSETTE_MODES}")
+        self.ocr_analyzer = ocr_analyzer
+        self.cassette_path = cassette_path
+        self.mode = mode
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+
+        if os.path.exists(cassette_path):
+            self.load()
+        elif mode == "replay":
+            raise FileNotFoundError(f"Cassette not found: {cassette_path}")
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the wrapper itself
+        if name == "ocr_analyzer":
+            raise AttributeError(name)
+        return getattr(self.ocr_analyzer, name)
+
+    def load(self):
+        try:
+            with open(self.cassette_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise Exception(f"Failed to load cassette '{self.cassette_path}': {e}")
+        self.entries = data.get("responses", {})
+
+    def save(self):
+        """
+        Write the cassette atomically, so an interrupted run never leaves a
+        truncated file behind.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {
+                "version": 1,
+                "model": self.ocr_analyzer.model_name,
+                "responses": self.entries,
+            }
+            temp_path = f"{self.cassette_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.cassette_path)
+            self.dirty = False
+
+    def perform_ocr(self, image_base64=None, prompt="", template=None, **kwargs):
+        """
+        Replay or record a perform_ocr call. The template id only labels the
+        call and is not part of the request key.
+        """
+        messages = build_messages(prompt, image_base64)
+        key = request_key(self.ocr_analyzer.model_name, messages, kwargs)
+
+        usage_log = getattr(self.ocr_analyzer, "usage", None)
+        if self.mode != "record":
+            with self.lock:
+                entry = self.entries.get(key)
+                self.stats["hits" if entry is not None else "misses"] += 1
+            if entry is not None:
+                usage = SimpleNamespace(**entry["usage"]) if entry.get("usage") else None
+                if usage_log is not None:
+                    # Replayed calls count towards the token report as recorded
+                    usage_log.record(
+                        template, usage, estimate_tokens(prompt, images=1 if image_base64 else 0), 0.0
+                    )
+                return CassetteMessage(entry["content"], usage=usage)
+            if self.mode == "replay":
+                raise CassetteMiss(
+                    f"No recorded response for request {key[:12]} in {self.cassette_path}"
+                )
+
+        previous = usage_log.last() if usage_log is not None else None
+        start = time.perf_counter()
+        result = self.ocr_analyzer.perform_ocr(
+            image_base64=image_base64, prompt=prompt, template=template, **kwargs
+        )
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.entries[key] = {
+                "content": result.content,
+                "has_image": bool(image_base64),
+                "template": template,
+                "prompt_preview": prompt[:80],
+                "latency": round(latency, 4),
+                "usage": self.call_usage(result, usage_log, previous),
+            }
+            self.dirty = True
+            self.stats["recorded"] += 1
+        return result
+
+    @staticmethod
+    def call_usage(result, usage_log, previous):
+        """
+        Token usage of the call that returned result: from the result
+        itself when it carries usage, else from the entry the wrapped
+        analyzer's UsageLog recorded for it on this thread. None when the
+        endpoint did not report usage.
+        """
+        usage = getattr(result, "usage", None)
+        if usage is not None:
+            return {
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None),
+            }
+        entry = usage_log.last() if usage_log is not None else None
+        if entry is None or entry is previous or not entry["reported"]:
+            return None
+        return {"prompt_tokens": entry["prompt_tokens"], "completion_tokens": entry["completion_tokens"]}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
@@ -0,0 +1,158 @@
+"""
+Group near-identical answers to the same question so each group is graded once.
+
+Answers are first bucketed by a hash of their text with only case and
+whitespace folded, which catches verbatim copies for free. Punctuation is
+kept: signs, operators and decimal points change what an answer says
+("x = -1" is not "x = 1").
+With an embedder, the buckets are then merged by SBERT cosine similarity
+(the same mean-pooled MiniLM embeddings as text_match_algos.semantic_similarity)
+when they are at least `threshold` similar to a cluster's representative.
+Members are only ever compared with the representative, never with each
+other, so clusters cannot drift through chains of small differences.
+"""
+import hashlib
+import re
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_THRESHOLD = 0.95
+
+EXACT = "exact"
+SEMANTIC = "semantic"
+REPRESENTATIVE = "representative"
+
+
+def normalize_answer(text):
+    """
+    Lowercase, drop punctuation and collapse whitespace: the words of an
+    answer, for word-level matching. Too lossy to decide two answers are
+    the same; use canonical_answer for that.
+    """
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def canonical_answer(text):
+    """
+    Fold case and whitespace only, so answers that are the same but for
+    capitals and spacing compare equal while every sign, operator and
+    decimal point still counts.
+    """
+    return " ".join(text.casefold().split())
+
+
+def answer_hash(text):
+    return hashlib.sha256(canonical_answer(text).encode("utf-8")).hexdigest()
+
+
+class AnswerEmbedder:
+    """
+    Sentence embeddings for answers. The model is loaded on first use and
+    answers are encoded in batches.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, batch_size=32):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.tokenizer = None
+        self.model = None
+
+    def load(self):
+        if self.model is not None:
+            return
+        try:
+            from transformers import AutoTokenizer, AutoModel
+        except ImportError:
+            raise Exception(
+                "The transformers and torch packages are required for semantic clustering "
+                "(pip install transformers torch)"
+            )
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.model = AutoModel.from_pretrained(self.model_name)
+        self.model.eval()
+
+    def encode(self, texts):
+        """
+        Return L2-normalized embeddings, one row per text.
+        """
+        import torch
+
+        self.load()
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + self.batch_size], return_tensors="pt", padding=True, truncation=True
+            )
+            with torch.no_grad():
+                hidden = self.model(**tokens).last_hidden_state
+            # Mean over real tokens only; padding would dilute short answers
+            mask = tokens["attention_mask"].unsqueeze(-1).type_as(hidden)
+            embeddings = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            batches.append(torch.nn.functional.normalize(embeddings, dim=1))
+        return torch.cat(batches)
+
+    def similarity_matrix(self, texts):
+        """
+        Pairwise cosine similarities of texts as a nested list.
+        """
+        embeddings = self.encode(texts)
+        return (embeddings @ embeddings.T).tolist()
+
+
+class AnswerCluster:
+    def __init__(self, representative, representative_text):
+        self.representative = representative
+        self.representative_text = representative_text
+        # key -> (method, similarity to the representative)
+        self.members = {representative: (REPRESENTATIVE, 1.0)}
+
+    def add(self, key, method, similarity):
+        self.members[key] = (method, similarity)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __repr__(self):
+        return f"AnswerCluster({self.representative}, {len(self)} answers)"
+
+
+def cluster_answers(answers, embedder=None, threshold=DEFAULT_THRESHOLD):
+    """
+    Cluster {key: answer_text} and return a list of AnswerCluster, largest
+    first. Without an embedder only exact (case- and whitespace-folded) duplicates are
+    grouped. Empty answers are never merged with anything.
+    """
+    buckets = {}
+    for key, text in answers.items():
+        bucket_key = answer_hash(text) if canonical_answer(text) else f"empty:{key}"
+        buckets.setdefault(bucket_key, []).append(key)
+
+    # Largest buckets first, so the most common wording represents a cluster
+    ordered = sorted(buckets.values(), key=lambda keys: (-len(keys), str(keys[0])))
+    bucket_clusters = []
+    for keys in ordered:
+        cluster = AnswerCluster(keys[0], answers[keys[0]])
+        for key in keys[1:]:
+            cluster.add(key, EXACT, 1.0)
+        bucket_clusters.append(cluster)
+
+    if embedder is None or len(bucket_clusters) < 2:
+        return bucket_clusters
+
+    similarities = embedder.similarity_matrix([cluster.representative_text for cluster in bucket_clusters])
+    clusters = []
+    # (bucket index, cluster) of every cluster open to semantic merges
+    leaders = []
+    for index, bucket in enumerate(bucket_clusters):
+        if not normalize_answer(bucket.representative_text):
+            clusters.append(bucket)
+            continue
+        best = max(leaders, key=lambda leader: similarities[index][leader[0]], default=None)
+        if best is not None and similarities[index][best[0]] >= threshold:
+            similarity = round(similarities[index][best[0]], 4)
+            for key in bucket.members:
+                best[1].add(key, SEMANTIC, similarity)
+            continue
+        leaders.append((index, bucket))
+        clusters.append(bucket)
+    return clusters
@@ -0,0 +1,389 @@
+"""
+Flag copied answers across a cohort with MinHash signatures and LSH banding.
+
+Comparing every pair of answers is quadratic in the cohort size. Instead,
+each student's answer to a question is reduced to a MinHash signature of
+its word shingles, and the signatures are cut into bands: two answers
+become a candidate pair only if at least one band hashes identically,
+which is likely when their shingle sets have high Jaccard similarity and
+unlikely otherwise. Only candidate pairs are then verified with the exact
+metrics from text_match_algos (word Jaccard and normalized Levenshtein
+similarity), so the work grows roughly linearly with the number of answers.
+
+Usage:
+    python collusion.py --db ./uploads/grading.db --job mid2 --output collusion.json
+    python collusion.py --synthetic 5000     # timing run on generated answers
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from clustering import normalize_answer
+from normalization import NormalizedText, jaccard_similarity
+from questions import UNKNOWN_QUESTION
+
+try:
+    from Levenshtein import distance as levenshtein_distance
+except ImportError:
+    levenshtein_distance = None
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_SHINGLE_SIZE = 3
+# Answers shorter than this are too generic to call copied
+DEFAULT_MIN_WORDS = 12
+DEFAULT_JACCARD_THRESHOLD = 0.5
+DEFAULT_LEVENSHTEIN_THRESHOLD = 0.8
+
+# Largest prime below 2**32: permuted hashes stay 32-bit
+HASH_PRIME = (1 << 32) - 5
+MAX_HASH = (1 << 32) - 1
+# Odd multipliers that combine the word hashes of a shingle
+SHINGLE_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)
+# Shingles permuted at once; bounds the (num_perm x shingles) work array
+SIGNATURE_CHUNK = 1 << 15
+
+
+def shingles(text, size=DEFAULT_SHINGLE_SIZE):
+    """
+    Set of word shingles (runs of `size` consecutive words) of normalized text.
+    """
+    return word_shingles(normalize_answer(text).split(), size)
+
+
+def word_shingles(words, size=DEFAULT_SHINGLE_SIZE):
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def edit_distance(a, b):
+    if levenshtein_distance is not None:
+        return levenshtein_distance(a, b)
+    # Bit-parallel Levenshtein (Myers/Hyyro) on Python integers when
+    # python-Levenshtein is not installed: one pass over b, a handful of
+    # big-integer operations per character
+    if not a:
+        return len(b)
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    peq = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    pv, mv, score = full, 0, len(a)
+    for char in b:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+
+def levenshtein_similarity(correct, student):
+    """
+    1 - edit distance / length of the longer text, as in text_match_algos.
+    """
+    max_len = max(len(correct), len(student))
+    return 1 - edit_distance(correct, student) / max_len if max_len else 1.0
+
+
+class MinHasher:
+    """
+    MinHash signatures using num_perm universal hash functions
+    (a * x + b) mod p over 32-bit hashes of the shingles. a, b and p are
+    all below 2**32, so a * x + b stays below 2**64 and the uint64
+    arithmetic never wraps.
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, HASH_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, HASH_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set),
+            dtype=np.uint64,
+            count=len(shingle_set),
+        )
+        return self.signatures([hashes])[0]
+
+    def signatures(self, hash_arrays):
+        """
+        Signatures of many shingle sets at once, one row per set. Each set
+        is given as a non-empty array of its 32-bit shingle hashes; the
+        hashes of all sets are permuted together and reduced per set.
+        """
+        lengths = np.array([len(hashes) for hashes in hash_arrays], dtype=np.int64)
+        if not len(lengths):
+            return np.empty((0, self.num_perm), dtype=np.uint64)
+        if not lengths.all():
+            raise ValueError("Cannot sign an empty shingle set")
+        hashes = np.concatenate(hash_arrays).astype(np.uint64)
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        result = np.empty((len(lengths), self.num_perm), dtype=np.uint64)
+
+        first = 0
+        while first < len(lengths):
+            # Whole sets per chunk, at least one
+            last = max(int(np.searchsorted(ends, starts[first] + SIGNATURE_CHUNK, side="right")), first + 1)
+            chunk = hashes[starts[first]:ends[last - 1]]
+            permuted = np.outer(self.a, chunk)
+            permuted += self.b[:, None]
+            permuted %= np.uint64(HASH_PRIME)
+            result[first:last] = np.minimum.reduceat(permuted, starts[first:last] - starts[first], axis=1).T
+            first = last
+        return result
+
+
+def shingle_hashes(word_hashes, size=DEFAULT_SHINGLE_SIZE):
+    """
+    32-bit hashes of the word shingles of one answer, combined from the
+    hashes of its words. The answer must have at least `size` words.
+    """
+    combined = np.zeros(len(word_hashes) - size + 1, dtype=np.uint64)
+    for offset in range(size):
+        # Wraps around 2**64 on purpose; the high half is folded in below
+        multiplier = np.uint64(SHINGLE_MULTIPLIERS[offset % len(SHINGLE_MULTIPLIERS)])
+        combined = combined * multiplier + word_hashes[offset:len(word_hashes) - size + 1 + offset]
+    return (combined ^ (combined >> np.uint64(32))) & np.uint64(MAX_HASH)
+
+
+class LSHIndex:
+    """
+    Banded LSH over MinHash signatures. With b bands of r rows, pairs with
+    Jaccard similarity s collide in some band with probability
+    1 - (1 - s**r)**b; the default 32 x 4 catches pairs above ~0.5 almost
+    always and pairs below ~0.2 rarely.
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.keys = []
+        self.signatures = []
+
+    def add(self, key, signature):
+        self.add_many([key], np.asarray(signature)[None, :])
+
+    def add_many(self, keys, signatures):
+        """
+        Add one key per row of a (len(keys) x num_perm) signature matrix.
+        """
+        self.keys.extend(keys)
+        self.signatures.append(np.asarray(signatures, dtype=np.uint64).reshape(len(keys), self.num_perm))
+
+    def candidate_pairs(self):
+        if not self.keys:
+            return set()
+        signatures = np.concatenate(self.signatures)
+        pairs = set()
+        for band in range(self.bands):
+            # Each band's rows as one opaque value, so np.unique groups
+            # identical bands across all signatures in one sort
+            chunk = np.ascontiguousarray(signatures[:, band * self.rows:(band + 1) * self.rows])
+            _, bucket, counts = np.unique(
+                chunk.view(np.dtype((np.void, chunk.itemsize * self.rows))).ravel(),
+                return_inverse=True,
+                return_counts=True,
+            )
+            shared = counts[bucket] > 1
+            if not shared.any():
+                continue
+            members = np.flatnonzero(shared)
+            members = members[np.argsort(bucket[members], kind="stable")]
+            boundaries = np.flatnonzero(np.diff(bucket[members])) + 1
+            for group in np.split(members, boundaries):
+                keys = [self.keys[i] for i in group]
+                for i, first in enumerate(keys):
+                    for second in keys[i + 1:]:
+                        pairs.add((first, second) if first < second else (second, first))
+        return pairs
+
+
+def find_copied_answers(
+    answers,
+    num_perm=DEFAULT_NUM_PERM,
+    bands=DEFAULT_BANDS,
+    shingle_size=DEFAULT_SHINGLE_SIZE,
+    min_words=DEFAULT_MIN_WORDS,
+    jaccard_threshold=DEFAULT_JACCARD_THRESHOLD,
+    levenshtein_threshold=DEFAULT_LEVENSHTEIN_THRESHOLD,
+):
+    """
+    Find suspiciously similar answers to the same question.
+
+    answers is {question_id: {student_id: answer_text}}. Returns
+    (flagged, stats) where flagged is a list of dicts, one per verified
+    pair, most similar first. A pair is flagged when either metric clears
+    its threshold.
+    """
+    hasher = MinHasher(num_perm)
+    # Shingles need shingle_size words, and an empty answer has none
+    min_words = max(min_words, shingle_size, 1)
+    word_hashes = {}
+    flagged = []
+    stats = {"answers": 0, "skipped_short": 0, "candidates": 0, "flagged": 0}
+
+    for question_id, by_student in answers.items():
+        if question_id == UNKNOWN_QUESTION:
+            continue
+        normalized = {}
+        hash_arrays = []
+        for student_id, text in by_student.items():
+            stats["answers"] += 1
+            words = normalize_answer(text or "").split()
+            if len(words) < min_words:
+                stats["skipped_short"] += 1
+                continue
+            normalized[student_id] = NormalizedText(tuple(words))
+            for word in words:
+                if word not in word_hashes:
+                    word_hashes[word] = zlib.crc32(word.encode("utf-8"))
+            hash_arrays.append(
+                shingle_hashes(np.array([word_hashes[word] for word in words], dtype=np.uint64), shingle_size)
+            )
+        index = LSHIndex(num_perm, bands)
+        index.add_many(list(normalized), hasher.signatures(hash_arrays))
+
+        for first, second in sorted(index.candidate_pairs()):
+            stats["candidates"] += 1
+            jaccard = jaccard_similarity(normalized[first], normalized[second])
+            levenshtein = levenshtein_similarity(normalized[first].text, normalized[second].text)
+            if jaccard >= jaccard_threshold or levenshtein >= levenshtein_threshold:
+                flagged.append(
+                    {
+                        "question_id": question_id,
+                        "students": [first, second],
+                        "jaccard": round(jaccard, 4),
+                        "levenshtein": round(levenshtein, 4),
+                    }
+                )
+
+    flagged.sort(key=lambda pair: (-max(pair["jaccard"], pair["levenshtein"]), pair["question_id"]))
+    stats["flagged"] = len(flagged)
+    return flagged, stats
+
+
+def group_students(flagged):
+    """
+    Merge flagged pairs into groups of students linked by copied answers,
+    with the questions each group shares. Largest groups first.
+    """
+    parent = {}
+
+    def find(student_id):
+        parent.setdefault(student_id, student_id)
+        while parent[student_id] != student_id:
+            parent[student_id] = parent[parent[student_id]]
+            student_id = parent[student_id]
+        return student_id
+
+    for pair in flagged:
+        first, second = (find(student_id) for student_id in pair["students"])
+        if first != second:
+            parent[second] = first
+
+    groups = defaultdict(lambda: {"students": set(), "questions": set()})
+    for pair in flagged:
+        group = groups[find(pair["students"][0])]
+        group["students"].update(pair["students"])
+        group["questions"].add(pair["question_id"])
+    return sorted(
+        (
+            {"students": sorted(group["students"]), "questions": sorted(group["questions"])}
+            for group in groups.values()
+        ),
+        key=lambda group: (-len(group["students"]), group["students"]),
+    )
+
+
+def build_report(answers, **kwargs):
+    started = time.perf_counter()
+    flagged, stats = find_copied_answers(answers, **kwargs)
+    stats["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return {"stats": stats, "groups": group_students(flagged), "pairs": flagged}
+
+
+def synthetic_answers(students, questions=5, copy_rate=0.05, seed=0):
+    """
+    Generate a cohort of random answers in which a fraction of students
+    copy, with small edits, another student's answer.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(2000)]
+    answers = {}
+    for question in range(1, questions + 1):
+        by_student = {}
+        for student in range(students):
+            student_id = f"s{student:05d}"
+            if by_student and rng.random() < copy_rate:
+                words = rng.choice(list(by_student.values())).split()
+                for _ in range(3):
+                    words[rng.randrange(len(words))] = rng.choice(vocabulary)
+            else:
+                words = rng.choices(vocabulary, k=rng.randint(40, 120))
+            by_student[student_id] = " ".join(words)
+        answers[str(question)] = by_student
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect copied answers across a cohort")
+    parser.add_argument("--db", help="JobStore database with OCR'd answers")
+    parser.add_argument("--job", help="job id")
+    parser.add_argument("--synthetic", type=int, help="run on this many generated students instead")
+    parser.add_argument("--bands", type=int, default=DEFAULT_BANDS)
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM)
+    parser.add_argument("--min-words", type=int, default=DEFAULT_MIN_WORDS)
+    parser.add_argument("--jaccard", type=float, default=DEFAULT_JACCARD_THRESHOLD)
+    parser.add_argument("--levenshtein", type=float, default=DEFAULT_LEVENSHTEIN_THRESHOLD)
+    parser.add_argument("--output", help="write the full report to this JSON file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        answers = synthetic_answers(args.synthetic)
+    elif args.db and args.job:
+        from job_store import JobStore
+
+        answers = JobStore(args.db).answers(args.job)
+    else:
+        parser.error("either --db and --job, or --synthetic is required")
+
+    report = build_report(
+        answers,
+        num_perm=args.num_perm,
+        bands=args.bands,
+        min_words=args.min_words,
+        jaccard_threshold=args.jaccard,
+        levenshtein_threshold=args.levenshtein,
+    )
+    print(json.dumps(report["stats"], indent=2))
+    for group in report["groups"][:20]:
+        print(f"{', '.join(group['students'])}: questions {', '.join(group['questions'])}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Adaptive concurrency control for calls to the OCR/grading API.
+
+AdaptiveLimiter is an AIMD (additive increase, multiplicative decrease)
+limiter on the number of requests in flight. After every round of requests
+(one round = as many completions as the current limit) it compares the
+window's p95 latency with a slowly tracked baseline: while latency is
+stable the limit grows by one, and when latency spikes or the provider
+answers 429 the limit is cut multiplicatively. Throughput settles near the
+provider's real capacity without per-model tuning.
+
+Latencies are tracked per kind of call (e.g. "image" OCR and "text"
+grading), each with its own window and baseline, so a mix of slow and fast
+calls does not read as a spike. A decrease clears the windows, since their
+samples were taken at the old limit, and moves the baseline halfway to the
+p95 that triggered it: a lasting latency shift is absorbed after a cut or
+two instead of pinning the limit at min_limit.
+
+The limiter must see 429s to react to them, so the API client should not
+retry them itself (see ImageOCRAnalyzer, which builds its client with
+max_retries=0 when a limiter is attached). call() retries rate-limited
+calls instead, with backoff, after the limit has been cut.
+"""
+import threading
+import time
+from collections import deque
+
+DEFAULT_KIND = "default"
+# Retries of a rate-limited call, and the first backoff (doubling each time)
+RATE_LIMIT_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+
+def is_rate_limited(error):
+    """
+    True for a 429 from the Groq/OpenAI clients (or anything shaped like it).
+    """
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error, attempt):
+    """
+    Seconds to wait before retrying a rate-limited call: the provider's
+    Retry-After header when it sent one, otherwise exponential backoff.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return RETRY_BACKOFF * 2**attempt
+
+
+def window_p95(latencies):
+    ordered = sorted(latencies)
+    return ordered[max(0, int(round(0.95 * len(ordered))) - 1)]
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial_limit=4,
+        min_limit=1,
+        max_limit=64,
+        increase=1,
+        decrease=0.5,
+        latency_tolerance=1.5,
+        window=50,
+        cooldown=1.0,
+        rate_limit_retries=RATE_LIMIT_RETRIES,
+    ):
+        """
+        latency_tolerance is how far the window p95 may rise above the
+        baseline before it counts as a spike; cooldown keeps a burst of
+        429s from the same round from cutting the limit repeatedly.
+        rate_limit_retries is how often call() retries a 429.
+        """
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.rate_limit_retries = rate_limit_retries
+
+        self.in_flight = 0
+        self.window = window
+        # kind -> recent latencies, and kind -> tracked p95 baseline
+        self.latencies = {}
+        self.baselines = {}
+        self.completed_since_decision = 0
+        # Only grow the limit if callers actually used all of it
+        self.saturated = False
+        self.last_decrease = 0.0
+        self.counters = {"requests": 0, "rate_limited": 0, "errors": 0, "increases": 0, "decreases": 0, "retries": 0}
+        self.decisions = deque(maxlen=100)
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+            self.counters["requests"] += 1
+            if self.in_flight >= self.limit:
+                self.saturated = True
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def call(self, fn, kind=DEFAULT_KIND):
+        """
+        Run fn() inside a concurrency slot and feed its outcome back into
+        the limit. kind groups calls with comparable latency. A 429 is
+        retried after the limit has been cut.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            start = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                rate_limited = is_rate_limited(e)
+                self.record(time.perf_counter() - start, rate_limited=rate_limited, error=True, kind=kind)
+                if not rate_limited or attempt >= self.rate_limit_retries:
+                    raise
+                error = e
+            else:
+                self.record(time.perf_counter() - start, kind=kind)
+                return result
+            finally:
+                self.release()
+            with self.condition:
+                self.counters["retries"] += 1
+            time.sleep(retry_after(error, attempt))
+            attempt += 1
+
+    def decide(self, action, reason, new_limit):
+        """
+        Apply a limit change and log it. Must be called with the condition held.
+        """
+        old_limit = self.limit
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+        self.completed_since_decision = 0
+        self.saturated = False
+        if self.limit != old_limit:
+            self.counters["increases" if self.limit > old_limit else "decreases"] += 1
+            self.decisions.append(
+                {"time": time.time(), "action": action, "reason": reason, "from": old_limit, "to": self.limit}
+            )
+            self.condition.notify_all()
+
+    def record(self, latency, rate_limited=False, error=False, kind=DEFAULT_KIND):
+        with self.condition:
+            now = time.monotonic()
+            if rate_limited:
+                self.counters["rate_limited"] += 1
+                if now - self.last_decrease >= self.cooldown:
+                    self.last_decrease = now
+                    self.decide("decrease", "429", int(self.limit * self.decrease))
+                return
+            if error:
+                # Other failures say nothing about capacity
+                self.counters["errors"] += 1
+                return
+
+            self.latencies.setdefault(kind, deque(maxlen=self.window)).append(latency)
+            self.completed_since_decision += 1
+            if self.completed_since_decision < self.limit:
+                return
+
+            spikes = []
+            for window_kind, latencies in self.latencies.items():
+                if not latencies:
+                    continue
+                p95 = window_p95(latencies)
+                baseline = self.baselines.setdefault(window_kind, p95)
+                if p95 > baseline * self.latency_tolerance:
+                    spikes.append((window_kind, p95, baseline))
+                else:
+                    # Track the baseline slowly so gradual drift is accepted
+                    self.baselines[window_kind] = 0.9 * baseline + 0.1 * p95
+
+            if spikes:
+                if now - self.last_decrease >= self.cooldown:
+                    self.last_decrease = now
+                    reason = ", ".join(
+                        f"{window_kind} p95 {p95:.3f}s above baseline {baseline:.3f}s"
+                        for window_kind, p95, baseline in spikes
+                    )
+                    for window_kind, p95, baseline in spikes:
+                        # Re-baseline, so a lasting shift stops reading as a spike
+                        self.baselines[window_kind] = baseline + 0.5 * (p95 - baseline)
+                    for latencies in self.latencies.values():
+                        # Samples from the old limit say nothing about the new one
+                        latencies.clear()
+                    self.decide("decrease", reason, int(self.limit * self.decrease))
+            elif self.saturated:
+                self.decide("increase", "latency stable", self.limit + self.increase)
+            else:
+                self.completed_since_decision = 0
+
+    def metrics(self):
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "p95": {
+                    kind: round(window_p95(latencies), 4) for kind, latencies in self.latencies.items() if latencies
+                },
+                "baseline_p95": {kind: round(baseline, 4) for kind, baseline in self.baselines.items()},
+                **self.counters,
+                "recent_decisions": list(self.decisions)[-10:],
+            }
@@ -0,0 +1,359 @@
+"""
+Page geometry normalization for phone-captured answer sheets.
+
+Phone photos (test_files/sample3.jpeg, mid2/Testq*.jpg) show the sheet at
+an angle, in perspective and surrounded by desk or fabric, which degrades
+OCR and makes every page payload larger than it needs to be. This stage:
+1. builds a pyramid of the page with cv2.pyrDown down to PROBE_SIZE;
+2. finds the sheet's quadrilateral on the coarsest level (the largest
+   bright, low-saturation region, reduced to four corners);
+3. estimates the remaining skew of the rectified sheet on that level and,
+   when it rotates the sheet, crops the rotated canvas back to the box
+   around the writing;
+4. composes everything into a single homography and applies it once, at
+   full resolution, cropping to the sheet.
+
+A "sheet" that hugs the photo's corners is the photo itself (the page
+filled the frame) and is ignored rather than stretched to fill it, so the
+output is never larger than the sheet it shows.
+
+Detection runs against a per-image time budget: a step that would start
+after the budget is spent is skipped and the transform found so far is
+used, so a pathological page costs at most the budget plus one warp.
+
+Usage:
+    python geometry.py ../test_files/sample*.jpeg ../mid2/Testq*.jpg --benchmark
+    python geometry.py ../mid2/Testq3.jpg --output-dir ./normalized
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from preprocessing import PROBE_SIZE, estimate_skew
+
+DEFAULT_BUDGET_MS = 150.0
+# The sheet must cover at least this share of the photo to be trusted
+MIN_PAGE_AREA = 0.3
+# A quad whose corners all lie within this share of the frame's width and
+# height from the frame's own corners is the frame, not a sheet
+FRAME_MARGIN = 0.08
+# Pixels of paper kept around the writing when cropping a rotated sheet
+CONTENT_PADDING = 4
+# Skip the warp when the sheet already fills the frame and is level
+MIN_CROP = 0.03
+# Below a degree the rotation costs more payload than it gains OCR accuracy
+SKEW_THRESHOLD = 1.0
+
+
+def build_pyramid(image, size=PROBE_SIZE):
+    """
+    Levels from full resolution down to the first one at most `size`
+    pixels on its longer side. Each level halves the previous one.
+    """
+    levels = [image]
+    while max(levels[-1].shape[:2]) > size:
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels
+
+
+def order_corners(points):
+    """
+    Order four points as top-left, top-right, bottom-right, bottom-left.
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array(
+        [points[np.argmin(sums)], points[np.argmin(diffs)], points[np.argmax(sums)], points[np.argmax(diffs)]],
+        dtype=np.float32,
+    )
+
+
+def paper_mask(small):
+    """
+    Bright, unsaturated pixels (the sheet), with its writing and ruling
+    closed over.
+    """
+    if small.ndim == 3:
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        # Paper is bright and close to grey; ink, fabric and wood are not
+        score = cv2.subtract(hsv[:, :, 2], hsv[:, :, 1])
+    else:
+        score = small
+    score = cv2.GaussianBlur(score, (5, 5), 0)
+    _, mask = cv2.threshold(score, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+
+def hugs_frame(quad, size):
+    """
+    Whether every corner of quad lies near the matching corner of a size
+    (w, h) frame.
+    """
+    width, height = size
+    frame = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    offsets = np.abs(quad - frame) / np.array([width, height], dtype=np.float32)
+    return bool((offsets <= FRAME_MARGIN).all())
+
+
+def content_box(image, size):
+    """
+    (x, y, w, h) of the writing on a rotated page: the ink's bounding box,
+    padded by CONTENT_PADDING, within the size (w, h) box centred on the
+    canvas that the page had before it was rotated.
+    """
+    width, height = size
+    left = max((image.shape[1] - width) // 2, 0)
+    top = max((image.shape[0] - height) // 2, 0)
+    right, bottom = min(left + width, image.shape[1]), min(top + height, image.shape[0])
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    _, ink = cv2.threshold(gray[top:bottom, left:right], 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    points = cv2.findNonZero(ink)
+    if points is not None:
+        x, y, w, h = cv2.boundingRect(points)
+        right = min(left + x + w + CONTENT_PADDING, right)
+        bottom = min(top + y + h + CONTENT_PADDING, bottom)
+        left, top = max(left + x - CONTENT_PADDING, left), max(top + y - CONTENT_PADDING, top)
+    return left, top, right - left, bottom - top
+
+
+def find_page_quad(small):
+    """
+    Corners of the sheet in `small`, ordered as in order_corners, or None
+    when no convincing sheet is found or the sheet already fills the frame.
+    """
+    mask = paper_mask(small)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    hull = cv2.convexHull(max(contours, key=cv2.contourArea))
+    image_area = small.shape[0] * small.shape[1]
+    if cv2.contourArea(hull) < MIN_PAGE_AREA * image_area:
+        return None
+
+    perimeter = cv2.arcLength(hull, True)
+    for epsilon in (0.02, 0.03, 0.05, 0.08):
+        approx = cv2.approxPolyDP(hull, epsilon * perimeter, True)
+        if len(approx) == 4:
+            break
+    else:
+        # A sheet cut off by the frame has more than four sides; the
+        # smallest enclosing rectangle still rectifies its rotation
+        approx = cv2.boxPoints(cv2.minAreaRect(hull))
+    quad = order_corners(approx)
+    if not cv2.isContourConvex(quad.reshape(-1, 1, 2)) or cv2.contourArea(quad) < MIN_PAGE_AREA * image_area:
+        return None
+    if hugs_frame(quad, (small.shape[1], small.shape[0])):
+        return None
+    return quad
+
+
+def page_size(quad):
+    """
+    Output width and height of a rectified quad: its longer opposite sides.
+    """
+    top_left, top_right, bottom_right, bottom_left = quad
+    width = max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left))
+    height = max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right))
+    return max(int(round(width)), 1), max(int(round(height)), 1)
+
+
+def rectify_transform(quad, size):
+    width, height = size
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    return cv2.getPerspectiveTransform(quad, target)
+
+
+def rotation_transform(angle, size):
+    """
+    3x3 rotation by angle degrees about the centre of a size (w, h) image,
+    shifted onto a canvas large enough to keep every corner, plus the
+    canvas size. Writing often runs to the edge of a photographed sheet,
+    so nothing is cropped away here; normalize crops the canvas back to
+    the writing afterwards.
+    """
+    width, height = size
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width = int(round(height * sin + width * cos))
+    new_height = int(round(height * cos + width * sin))
+    matrix[0, 2] += (new_width - width) / 2
+    matrix[1, 2] += (new_height - height) / 2
+    return np.vstack([matrix, [0, 0, 1]]), (new_width, new_height)
+
+
+class GeometryNormalizer:
+    """
+    Detect the sheet and its skew on a low-resolution level and warp the
+    full-resolution image once.
+    """
+
+    def __init__(self, budget_ms=DEFAULT_BUDGET_MS, probe_size=PROBE_SIZE):
+        self.budget_ms = budget_ms
+        self.probe_size = probe_size
+
+    def normalize(self, image):
+        """
+        Return (normalized image, info). info records what was detected,
+        the timings and whether the budget cut detection short.
+        """
+        started = time.perf_counter()
+
+        def elapsed_ms():
+            return (time.perf_counter() - started) * 1000
+
+        info = {"quad": None, "skew": 0.0, "warped": False, "budget_exceeded": False}
+        levels = build_pyramid(image, self.probe_size)
+        small = levels[-1]
+        scale = image.shape[1] / small.shape[1]
+        height, width = small.shape[:2]
+
+        transform = np.eye(3)
+        size = (width, height)
+        quad = find_page_quad(small)
+        if quad is not None:
+            size = page_size(quad)
+            transform = rectify_transform(quad, size)
+            info["quad"] = (quad * scale).round(1).tolist()
+
+        if elapsed_ms() > self.budget_ms:
+            info["budget_exceeded"] = True
+        else:
+            rectified = cv2.warpPerspective(small, transform, size, borderMode=cv2.BORDER_REPLICATE)
+            gray = cv2.cvtColor(rectified, cv2.COLOR_BGR2GRAY) if rectified.ndim == 3 else rectified
+            skew = estimate_skew(gray)
+            if abs(skew) >= SKEW_THRESHOLD:
+                unrotated = size
+                rotation, size = rotation_transform(skew, size)
+                transform = rotation @ transform
+                info["skew"] = skew
+                # The widened canvas is mostly fill: crop it back to the
+                # sheet's own box, which only loses the tips of its corners,
+                # and further to the writing when the margins are blank
+                rotated = cv2.warpPerspective(
+                    small, transform, size, borderMode=cv2.BORDER_CONSTANT, borderValue=(255,) * 3,
+                )
+                x, y, box_width, box_height = content_box(rotated, unrotated)
+                transform = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=np.float64) @ transform
+                size = (box_width, box_height)
+        info["detect_ms"] = round(elapsed_ms(), 1)
+
+        cropped = quad is not None and size[0] * size[1] < (1 - MIN_CROP) * width * height
+        if not cropped and info["skew"] == 0.0:
+            info["total_ms"] = info["detect_ms"]
+            return image, info
+
+        # Scale the low-resolution transform up to full resolution:
+        # full -> small, transform, small -> full
+        down = np.diag([1 / scale, 1 / scale, 1.0])
+        up = np.diag([scale, scale, 1.0])
+        full_transform = up @ transform @ down
+        full_size = (int(round(size[0] * scale)), int(round(size[1] * scale)))
+        warp_started = time.perf_counter()
+        # Corners uncovered by the rotation are filled with paper white
+        fill = (255,) * image.shape[2] if image.ndim == 3 else 255
+        normalized = cv2.warpPerspective(
+            image, full_transform, full_size, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT,
+            borderValue=fill,
+        )
+        info["warped"] = True
+        info["warp_ms"] = round((time.perf_counter() - warp_started) * 1000, 1)
+        info["total_ms"] = round(elapsed_ms(), 1)
+        return normalized, info
+
+
+def full_resolution_detection(image):
+    """
+    The same detection without the pyramid, as the benchmark baseline.
+    """
+    started = time.perf_counter()
+    quad = find_page_quad(image)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    estimate_skew(gray)
+    return quad, (time.perf_counter() - started) * 1000
+
+
+def jpeg_size(image):
+    ok, encoded = cv2.imencode(".jpg", image)
+    return len(encoded) if ok else None
+
+
+def run_benchmark(paths, budget_ms, output_dir=None):
+    normalizer = GeometryNormalizer(budget_ms=budget_ms)
+    rows = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            rows.append({"image": path, "error": "could not be read"})
+            continue
+        normalized, info = normalizer.normalize(image)
+        _, baseline_ms = full_resolution_detection(image)
+        rows.append(
+            {
+                "image": os.path.basename(path),
+                "size": f"{image.shape[1]}x{image.shape[0]}",
+                "normalized_size": f"{normalized.shape[1]}x{normalized.shape[0]}",
+                "page_found": info["quad"] is not None,
+                "skew": info["skew"],
+                "detect_ms": info["detect_ms"],
+                "total_ms": info["total_ms"],
+                "full_resolution_detect_ms": round(baseline_ms, 1),
+                "within_budget": not info["budget_exceeded"],
+            }
+        )
+        jpeg_bytes, normalized_jpeg_bytes = jpeg_size(image), jpeg_size(normalized)
+        rows[-1].update(
+            {
+                "jpeg_bytes": jpeg_bytes,
+                "normalized_jpeg_bytes": normalized_jpeg_bytes,
+                "payload_ratio": round(normalized_jpeg_bytes / jpeg_bytes, 3),
+            }
+        )
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            cv2.imwrite(os.path.join(output_dir, os.path.basename(path)), normalized)
+    return rows
+
+
+if __name__ == "__main__":
+    import json
+
+    parser = argparse.ArgumentParser(description="Deskew and perspective-correct page photos")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--benchmark", action="store_true", help="also time detection at full resolution")
+    parser.add_argument("--output-dir", help="write the normalized pages here")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        rows = run_benchmark(args.images, args.budget_ms, args.output_dir)
+        for row in rows:
+            print(json.dumps(row))
+        timed = [row for row in rows if "total_ms" in row]
+        if timed:
+            jpeg_bytes = sum(row["jpeg_bytes"] for row in timed)
+            normalized_jpeg_bytes = sum(row["normalized_jpeg_bytes"] for row in timed)
+            print(json.dumps({
+                "images": len(timed),
+                "mean_total_ms": round(sum(row["total_ms"] for row in timed) / len(timed), 1),
+                "mean_full_resolution_detect_ms": round(
+                    sum(row["full_resolution_detect_ms"] for row in timed) / len(timed), 1
+                ),
+                "jpeg_bytes": jpeg_bytes,
+                "normalized_jpeg_bytes": normalized_jpeg_bytes,
+                "payload_ratio": round(normalized_jpeg_bytes / jpeg_bytes, 3),
+                "larger_than_input": sum(row["payload_ratio"] > 1 for row in timed),
+            }, indent=2))
+    else:
+        normalizer = GeometryNormalizer(budget_ms=args.budget_ms)
+        for path in args.images:
+            normalized, info = normalizer.normalize(cv2.imread(path))
+            print(path, json.dumps(info))
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+                cv2.imwrite(os.path.join(args.output_dir, os.path.basename(path)), normalized)
@@ -0,0 +1,238 @@
+"""
+Persistent cache of grading results.
+
+A graded answer is keyed by everything that can change its grade: the
+content hash of the rubric item it was graded against, the hash of the
+answer text with case and whitespace folded (see
+clustering.canonical_answer; signs and operators still count), the model
+and the prompt template version. The
+same answer to the same rubric item is therefore graded once, whichever
+student wrote it and however often the page is re-run, while editing a
+rubric item, switching model or changing the prompt all miss the cache.
+
+Entries expire after a TTL and the least recently used entries are
+evicted beyond max_entries. Entries for rubric items that no longer exist
+in their current form can be dropped with invalidate_stale().
+
+Usage:
+    python grade_cache.py ./uploads/grade_cache.db stats
+    python grade_cache.py ./uploads/grade_cache.db invalidate --question 1a
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from clustering import canonical_answer
+from questions import rubric_for_question
+
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 100_000
+# Eviction scans the table, so it runs once per this many stores
+EVICT_EVERY = 100
+# Whole-script grades are cached under this question id
+SCRIPT = "*"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grades (
+    cache_key TEXT PRIMARY KEY,
+    question_id TEXT NOT NULL,
+    rubric_hash TEXT NOT NULL,
+    answer_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS grades_last_used ON grades (last_used);
+CREATE INDEX IF NOT EXISTS grades_rubric ON grades (question_id, rubric_hash);
+"""
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class GradeCache:
+    """
+    SQLite-backed grade cache, safe to share between threads (each thread
+    gets its own connection) and between processes.
+    """
+
+    def __init__(self, db_path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = os.path.abspath(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.metrics[name] += n
+
+    @staticmethod
+    def key_parts(question_id, rubric_text, answer_text, model, prompt_version):
+        return {
+            "question_id": question_id,
+            "rubric_hash": content_hash(rubric_text),
+            "answer_hash": content_hash(canonical_answer(answer_text)),
+            "model": model,
+            "prompt_version": prompt_version,
+        }
+
+    @staticmethod
+    def cache_key(parts):
+        return content_hash(json.dumps(parts, sort_keys=True))
+
+    def get(self, question_id, rubric_text, answer_text, model, prompt_version):
+        """
+        Return the cached grading result, or None on a miss.
+        """
+        key = self.cache_key(self.key_parts(question_id, rubric_text, answer_text, model, prompt_version))
+        now = time.time()
+        with self.connection() as conn:
+            row = conn.execute("SELECT result, created_at FROM grades WHERE cache_key = ?", (key,)).fetchone()
+            if row is None:
+                self.count("misses")
+                return None
+            if row["created_at"] < now - self.ttl:
+                conn.execute("DELETE FROM grades WHERE cache_key = ?", (key,))
+                self.count("expired")
+                self.count("misses")
+                return None
+            conn.execute(
+                "UPDATE grades SET last_used = ?, hits = hits + 1 WHERE cache_key = ?", (now, key)
+            )
+        self.count("hits")
+        return row["result"]
+
+    def put(self, question_id, rubric_text, answer_text, model, prompt_version, result):
+        parts = self.key_parts(question_id, rubric_text, answer_text, model, prompt_version)
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO grades (cache_key, question_id, rubric_hash, answer_hash, model, "
+                "prompt_version, result, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.cache_key(parts), parts["question_id"], parts["rubric_hash"], parts["answer_hash"],
+                    parts["model"], parts["prompt_version"], result, now, now,
+                ),
+            )
+        self.count("stores")
+        if self.metrics["stores"] % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Drop expired entries, then the least recently used ones beyond
+        max_entries.
+        """
+        with self.connection() as conn:
+            evicted = conn.execute(
+                "DELETE FROM grades WHERE created_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+            excess = conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0] - self.max_entries
+            if excess > 0:
+                evicted += conn.execute(
+                    "DELETE FROM grades WHERE cache_key IN "
+                    "(SELECT cache_key FROM grades ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                ).rowcount
+        if evicted:
+            self.count("evictions", evicted)
+        return evicted
+
+    def invalidate(self, question_id=None, rubric_text=None):
+        """
+        Drop the entries of one question, of one version of a rubric item,
+        or everything when called without arguments.
+        """
+        query = "DELETE FROM grades WHERE 1 = 1"
+        params = []
+        if question_id is not None:
+            query += " AND question_id = ?"
+            params.append(question_id)
+        if rubric_text is not None:
+            query += " AND rubric_hash = ?"
+            params.append(content_hash(rubric_text))
+        with self.connection() as conn:
+            removed = conn.execute(query, params).rowcount
+        self.count("invalidations", removed)
+        return removed
+
+    def invalidate_stale(self, marking_scheme):
+        """
+        Drop entries of the questions in marking_scheme that were graded
+        against a different version of their rubric item. Call after
+        editing a marking scheme; entries of unchanged items are kept.
+        Question ids are not scoped by exam, so on a cache shared between
+        exams prefer invalidate(question_id, rubric_text=old_section).
+        """
+        removed = 0
+        with self.connection() as conn:
+            question_ids = [
+                row["question_id"]
+                for row in conn.execute("SELECT DISTINCT question_id FROM grades WHERE question_id != ?", (SCRIPT,))
+            ]
+            for question_id in question_ids:
+                rubric_text = rubric_for_question(marking_scheme, question_id)
+                if rubric_text == marking_scheme:
+                    # Not a question of this scheme
+                    continue
+                removed += conn.execute(
+                    "DELETE FROM grades WHERE question_id = ? AND rubric_hash != ?",
+                    (question_id, content_hash(rubric_text)),
+                ).rowcount
+        self.count("invalidations", removed)
+        return removed
+
+    def stats(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = round(metrics["hits"] / lookups, 4) if lookups else None
+        row = self.connection().execute(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS lifetime_hits FROM grades"
+        ).fetchone()
+        metrics["entries"] = row["entries"]
+        metrics["lifetime_hits"] = row["lifetime_hits"]
+        return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the grade cache")
+    parser.add_argument("db_path")
+    parser.add_argument("command", choices=["stats", "invalidate", "evict"])
+    parser.add_argument("--question", help="question id to invalidate, e.g. 1a")
+    parser.add_argument("--marking-scheme", help="text file of the current scheme; drops stale rubric versions")
+    args = parser.parse_args()
+
+    cache = GradeCache(args.db_path)
+    if args.command == "invalidate":
+        if args.marking_scheme:
+            with open(args.marking_scheme, "r", encoding="utf-8") as f:
+                print(f"Removed {cache.invalidate_stale(f.read())} stale entries")
+        else:
+            print(f"Removed {cache.invalidate(question_id=args.question)} entries")
+    elif args.command == "evict":
+        print(f"Evicted {cache.evict()} entries")
+    print(json.dumps(cache.stats(), indent=2))
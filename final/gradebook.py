@@ -0,0 +1,528 @@
+"""
+Persistent, columnar gradebook with per-question cohort analytics.
+
+Every graded script is appended to an on-disk store: one row per graded
+question, with the exam, student, question, score, max marks, OCR
+confidence and timings. Each column is an append-only file of fixed-width
+values (<dir>/<column>.col). Exam, student and question names are
+dictionary-coded into int32 codes, listed once in <dir>/strings.jsonl.
+Reading a column is a single np.fromfile. Queries run vectorized over the
+whole column (bincount, unique, histogram), so they stay well under a
+second on tens of thousands of rows.
+
+Appends take an exclusive lock on <dir>/.lock, so the Streamlit server,
+batch runs and workers can share a gradebook. A row is complete once it
+is written to every column. An append interrupted halfway is cut back to
+the shortest column, both on read and before the next append.
+
+Regrading a student appends new rows; queries use the latest grade of
+each (exam, student, question).
+
+Usage:
+    python gradebook.py ./uploads/gradebook stats --exam mid2
+    python gradebook.py ./uploads/gradebook outliers --exam mid2
+    python gradebook.py ./uploads/gradebook import --db grading.db --job mid2
+    python gradebook.py /tmp/gradebook-bench benchmark --rows 50000
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from questions import split_student_response
+from results import question_results
+
+COLUMNS = (
+    ("exam", np.int32),
+    ("student", np.int32),
+    ("question", np.int32),
+    ("score", np.float64),
+    ("max_marks", np.float64),
+    # Share of the answer's words that were legible to OCR
+    ("ocr_confidence", np.float32),
+    # OCR and grading time of the whole script the row belongs to
+    ("ocr_seconds", np.float32),
+    ("grade_seconds", np.float32),
+    ("graded_at", np.float64),
+)
+CODED = ("exam", "student", "question")
+# Robust z-score beyond which a student's total is reported as an outlier
+OUTLIER_THRESHOLD = 3.5
+UNCLEAR_RE = re.compile(r"\[unclear\]", re.IGNORECASE)
+
+
+def exam_id(marking_scheme):
+    """
+    Default exam name: a short hash of the marking scheme text.
+    """
+    return "exam-" + hashlib.sha256(marking_scheme.encode("utf-8")).hexdigest()[:12]
+
+
+def ocr_confidence(text):
+    """
+    Share of an answer's words the OCR could read, counting every
+    [unclear] marker as one illegible word. NaN for an empty answer.
+    """
+    unclear = len(UNCLEAR_RE.findall(text or ""))
+    words = len(UNCLEAR_RE.sub(" ", text or "").split())
+    if words + unclear == 0:
+        return float("nan")
+    return words / (words + unclear)
+
+
+def answer_for(answers, question_id):
+    """
+    The answer a grade of question_id refers to: its own, or that of the
+    question it is a part of.
+    """
+    if question_id in answers:
+        return answers[question_id]
+    return answers.get(question_id.rstrip("abcdefghijklmnopqrstuvwxyz"))
+
+
+class Gradebook:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.strings = []
+        self.codes = {}
+        self.strings_size = 0
+        # (column file sizes) -> loaded columns, reused until something is appended
+        self.cached = None
+
+    def column_path(self, name):
+        return os.path.join(self.path, f"{name}.col")
+
+    @property
+    def strings_path(self):
+        return os.path.join(self.path, "strings.jsonl")
+
+    @contextmanager
+    def locked(self):
+        """
+        Exclusive across threads and processes.
+        """
+        with self.lock:
+            with open(os.path.join(self.path, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_strings(self):
+        """
+        Read strings other processes appended since the last call.
+        """
+        if not os.path.exists(self.strings_path):
+            return
+        size = os.path.getsize(self.strings_path)
+        if size == self.strings_size:
+            return
+        with open(self.strings_path, "r", encoding="utf-8") as f:
+            f.seek(self.strings_size)
+            for line in f:
+                if not line.endswith("\n"):
+                    # Another process is still writing it
+                    break
+                value = json.loads(line)
+                self.codes[value] = len(self.strings)
+                self.strings.append(value)
+                self.strings_size += len(line.encode("utf-8"))
+
+    def code(self, value, strings_file):
+        """
+        Code of a string, adding it to the dictionary when new. Called
+        under the append lock.
+        """
+        if value not in self.codes:
+            line = json.dumps(value) + "\n"
+            strings_file.write(line)
+            self.codes[value] = len(self.strings)
+            self.strings.append(value)
+            self.strings_size += len(line.encode("utf-8"))
+        return self.codes[value]
+
+    def row_count(self):
+        counts = [
+            os.path.getsize(self.column_path(name)) // np.dtype(dtype).itemsize
+            if os.path.exists(self.column_path(name))
+            else 0
+            for name, dtype in COLUMNS
+        ]
+        return min(counts)
+
+    def append(self, rows):
+        """
+        Append rows, given as dicts with the column names; exam, student
+        and question are strings, missing numbers are NaN. Returns the
+        number of rows written.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self.locked():
+            self.load_strings()
+            # Cut off a partial append left by a crash
+            complete = self.row_count()
+            for name, dtype in COLUMNS:
+                column_path = self.column_path(name)
+                if os.path.exists(column_path) and os.path.getsize(column_path) > complete * np.dtype(dtype).itemsize:
+                    os.truncate(column_path, complete * np.dtype(dtype).itemsize)
+
+            with open(self.strings_path, "a", encoding="utf-8") as strings_file:
+                columns = {
+                    name: np.array(
+                        [self.code(row[name], strings_file) if name in CODED else row.get(name, np.nan) for row in rows],
+                        dtype=dtype,
+                    )
+                    for name, dtype in COLUMNS
+                }
+                strings_file.flush()
+                os.fsync(strings_file.fileno())
+            for name, _ in COLUMNS:
+                with open(self.column_path(name), "ab") as f:
+                    columns[name].tofile(f)
+        return len(rows)
+
+    def append_script(self, exam, student_id, grade, answers=None, ocr_seconds=None, grade_seconds=None):
+        """
+        Append one graded script: a grades.ScriptGrade, with the answers it
+        graded ({question_id: text}, see questions.split_student_response)
+        for the OCR confidence.
+        """
+        now = time.time()
+        answers = answers or {}
+        return self.append(
+            {
+                "exam": exam,
+                "student": student_id,
+                "question": result.question_id,
+                "score": result.awarded_marks,
+                "max_marks": np.nan if result.max_marks is None else result.max_marks,
+                "ocr_confidence": ocr_confidence(answer_for(answers, result.question_id)),
+                "ocr_seconds": np.nan if ocr_seconds is None else ocr_seconds,
+                "grade_seconds": np.nan if grade_seconds is None else grade_seconds,
+                "graded_at": now,
+            }
+            for result in question_results(student_id, grade, grade_seconds)
+        )
+
+    def append_job(self, job_store, job_id, exam=None):
+        """
+        Append every graded question of a JobStore job.
+        """
+        from results import export_job
+
+        _, questions = export_job(job_store, job_id)
+        answers = {}
+        for row in job_store.connection().execute(
+            "SELECT student_id, ocr_text FROM pages WHERE job_id = ? ORDER BY student_id, page_number", (job_id,)
+        ):
+            answers.setdefault(row["student_id"], []).append(row["ocr_text"] or "")
+        answers = {student_id: split_student_response("\n".join(texts)) for student_id, texts in answers.items()}
+        now = time.time()
+        return self.append(
+            {
+                "exam": exam or job_id,
+                "student": result.student_id,
+                "question": result.question_id,
+                "score": result.awarded_marks,
+                "max_marks": np.nan if result.max_marks is None else result.max_marks,
+                "ocr_confidence": ocr_confidence(answer_for(answers.get(result.student_id, {}), result.question_id)),
+                "graded_at": now,
+            }
+            for result in questions
+            if result.awarded_marks is not None
+        )
+
+    def columns(self):
+        """
+        Every complete row, as {column: array}. Reloaded only when the
+        store changed since the last call.
+        """
+        sizes = tuple(
+            os.path.getsize(self.column_path(name)) if os.path.exists(self.column_path(name)) else 0
+            for name, _ in COLUMNS
+        )
+        if self.cached is not None and self.cached[0] == sizes:
+            return self.cached[1]
+        with self.lock:
+            self.load_strings()
+        count = min(size // np.dtype(dtype).itemsize for size, (_, dtype) in zip(sizes, COLUMNS))
+        columns = {
+            name: np.fromfile(self.column_path(name), dtype=dtype, count=count)
+            if count
+            else np.empty(0, dtype=dtype)
+            for name, dtype in COLUMNS
+        }
+        self.cached = (sizes, columns)
+        return columns
+
+    def exams(self):
+        """
+        Exam names, most recently graded first.
+        """
+        columns = self.columns()
+        if not len(columns["exam"]):
+            return []
+        codes, last = np.unique(columns["exam"][::-1], return_index=True)
+        order = np.argsort(last)
+        return [self.strings[code] for code in codes[order]]
+
+    def view(self, exam=None):
+        """
+        A GradebookView of the latest grade of every (student, question),
+        for one exam or all of them.
+        """
+        columns = self.columns()
+        mask = np.ones(len(columns["exam"]), dtype=bool)
+        if exam is not None:
+            if exam not in self.codes:
+                mask[:] = False
+            else:
+                mask = columns["exam"] == self.codes[exam]
+        rows = {name: values[mask] for name, values in columns.items()}
+
+        # Last row of every (exam, student, question): appends are in time order
+        keys = np.stack([rows["exam"], rows["student"], rows["question"]], axis=1)
+        _, reversed_index = np.unique(keys[::-1], axis=0, return_index=True)
+        latest = np.sort(len(keys) - 1 - reversed_index)
+        return GradebookView({name: values[latest] for name, values in rows.items()}, self.strings)
+
+
+class GradebookView:
+    """
+    Vectorized queries over one row per graded (student, question).
+    """
+
+    def __init__(self, rows, strings):
+        self.rows = rows
+        self.strings = strings
+        self.questions, self.question_index = np.unique(rows["question"], return_inverse=True)
+        self.students, self.student_index = np.unique(rows["student"], return_inverse=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.fraction = rows["score"] / rows["max_marks"]
+
+    def __len__(self):
+        return len(self.rows["score"])
+
+    def per_question(self, values):
+        """
+        Sum and count of the non-NaN values of each question.
+        """
+        valid = ~np.isnan(values)
+        sums = np.bincount(self.question_index[valid], weights=values[valid], minlength=len(self.questions))
+        counts = np.bincount(self.question_index[valid], minlength=len(self.questions))
+        return sums, counts
+
+    def student_totals(self):
+        """
+        (score, max marks) summed over each student's graded questions.
+        """
+        scores = np.bincount(self.student_index, weights=self.rows["score"], minlength=len(self.students))
+        max_marks = np.bincount(
+            self.student_index, weights=np.nan_to_num(self.rows["max_marks"]), minlength=len(self.students)
+        )
+        return scores, max_marks
+
+    def question_stats(self):
+        """
+        Per question: students graded, mean score and max, difficulty (mean
+        share of the marks; higher is easier), its spread, mean OCR
+        confidence and discrimination. Discrimination is the correlation
+        between a student's share on the question and on the rest of the
+        exam; low or negative values flag questions that do not separate
+        strong from weak students.
+        """
+        if not len(self):
+            return []
+        score_sums, counts = self.per_question(self.rows["score"])
+        max_sums, max_counts = self.per_question(self.rows["max_marks"])
+        fraction_sums, fraction_counts = self.per_question(self.fraction)
+        square_sums, _ = self.per_question(self.fraction**2)
+        confidence_sums, confidence_counts = self.per_question(self.rows["ocr_confidence"].astype(np.float64))
+
+        # Share of the marks each student got on the rest of the exam
+        totals, total_max = self.student_totals()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rest = (totals[self.student_index] - self.rows["score"]) / (
+                total_max[self.student_index] - np.nan_to_num(self.rows["max_marks"])
+            )
+        paired = ~np.isnan(self.fraction) & np.isfinite(rest)
+        x, y, index = self.fraction[paired], rest[paired], self.question_index[paired]
+        n = np.bincount(index, minlength=len(self.questions)).astype(np.float64)
+        sx, sy = np.bincount(index, x, len(self.questions)), np.bincount(index, y, len(self.questions))
+        sxx, syy = np.bincount(index, x * x, len(self.questions)), np.bincount(index, y * y, len(self.questions))
+        sxy = np.bincount(index, x * y, len(self.questions))
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            difficulty = fraction_sums / fraction_counts
+            spread = np.sqrt(np.maximum(square_sums / fraction_counts - difficulty**2, 0))
+            discrimination = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx**2) * (n * syy - sy**2))
+            mean_score = score_sums / counts
+            mean_max = max_sums / max_counts
+            confidence = confidence_sums / confidence_counts
+
+        def value(array, position, digits=3):
+            return None if not np.isfinite(array[position]) else round(float(array[position]), digits)
+
+        return [
+            {
+                "question": self.strings[code],
+                "students": int(counts[position]),
+                "mean_score": value(mean_score, position, 2),
+                "max_marks": value(mean_max, position, 2),
+                "difficulty": value(difficulty, position),
+                "spread": value(spread, position),
+                "discrimination": value(discrimination, position),
+                "ocr_confidence": value(confidence, position),
+            }
+            for position, code in enumerate(self.questions)
+        ]
+
+    def distribution(self, question, bins=10):
+        """
+        (counts, edges): histogram of the share of the marks students got
+        on a question.
+        """
+        positions = np.nonzero(np.array([self.strings[code] for code in self.questions]) == question)[0]
+        if not len(positions):
+            return np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1)
+        fractions = self.fraction[self.question_index == positions[0]]
+        return np.histogram(fractions[~np.isnan(fractions)], bins=bins, range=(0, 1))
+
+    def outlier_students(self, threshold=OUTLIER_THRESHOLD):
+        """
+        Students whose share of the total marks is far from the cohort's,
+        by robust z-score (median and median absolute deviation), most
+        extreme first.
+        """
+        if not len(self):
+            return []
+        totals, total_max = self.student_totals()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shares = totals / total_max
+        valid = np.isfinite(shares)
+        if valid.sum() < 3:
+            return []
+        median = np.median(shares[valid])
+        deviation = np.median(np.abs(shares[valid] - median))
+        if deviation == 0:
+            deviation = np.mean(np.abs(shares[valid] - median)) * 1.2533 or 1.0
+        z = np.where(valid, 0.6745 * (shares - median) / deviation, 0)
+        flagged = np.nonzero(np.abs(z) > threshold)[0]
+        flagged = flagged[np.argsort(-np.abs(z[flagged]))]
+        return [
+            {
+                "student": self.strings[self.students[position]],
+                "score": round(float(totals[position]), 2),
+                "max_marks": round(float(total_max[position]), 2),
+                "share": round(float(shares[position]), 3),
+                "z": round(float(z[position]), 2),
+            }
+            for position in flagged
+        ]
+
+    def summary(self):
+        totals, total_max = self.student_totals()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shares = totals / total_max
+        shares = shares[np.isfinite(shares)]
+        return {
+            "students": int(len(self.students)),
+            "questions": int(len(self.questions)),
+            "rows": len(self),
+            "mean_share": round(float(shares.mean()), 3) if len(shares) else None,
+            "median_share": round(float(np.median(shares)), 3) if len(shares) else None,
+        }
+
+
+def run_benchmark(gradebook, rows, questions=8, seed=0):
+    """
+    Fill a gradebook with synthetic grades and time loading and querying.
+    """
+    rng = np.random.default_rng(seed)
+    students = rows // questions
+    ability = rng.beta(5, 2, size=students)
+    max_marks = rng.choice([2, 5, 10], size=questions)
+    difficulty = rng.uniform(-0.2, 0.2, size=questions)
+    generated = []
+    for student in range(students):
+        for question in range(questions):
+            share = np.clip(ability[student] + difficulty[question] + rng.normal(0, 0.1), 0, 1)
+            generated.append(
+                {
+                    "exam": "benchmark",
+                    "student": f"s{student:06d}",
+                    "question": f"{question + 1}",
+                    "score": round(share * max_marks[question]),
+                    "max_marks": float(max_marks[question]),
+                    "ocr_confidence": rng.uniform(0.8, 1.0),
+                    "ocr_seconds": rng.uniform(1, 3),
+                    "grade_seconds": rng.uniform(0.5, 2),
+                    "graded_at": time.time(),
+                }
+            )
+    start = time.perf_counter()
+    gradebook.append(generated)
+    append_seconds = time.perf_counter() - start
+
+    gradebook.cached = None
+    timings = {}
+    start = time.perf_counter()
+    view = gradebook.view("benchmark")
+    timings["load_and_latest_seconds"] = time.perf_counter() - start
+    for name, query in (
+        ("question_stats_seconds", view.question_stats),
+        ("distribution_seconds", lambda: view.distribution("1")),
+        ("outliers_seconds", view.outlier_students),
+    ):
+        start = time.perf_counter()
+        query()
+        timings[name] = time.perf_counter() - start
+    return {
+        "rows": len(generated),
+        "append_seconds": round(append_seconds, 3),
+        **{name: round(seconds, 4) for name, seconds in timings.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gradebook analytics")
+    parser.add_argument("path", help="gradebook directory")
+    parser.add_argument("command", choices=["stats", "distribution", "outliers", "import", "benchmark"])
+    parser.add_argument("--exam", help="exam to query; all exams when omitted")
+    parser.add_argument("--question", help="question for distribution")
+    parser.add_argument("--threshold", type=float, default=OUTLIER_THRESHOLD)
+    parser.add_argument("--db", help="job store for import")
+    parser.add_argument("--job", help="job to import")
+    parser.add_argument("--rows", type=int, default=50000, help="benchmark rows")
+    args = parser.parse_args()
+
+    gradebook = Gradebook(args.path)
+    if args.command == "import":
+        from job_store import JobStore
+
+        count = gradebook.append_job(JobStore(args.db), args.job, exam=args.exam)
+        print(f"Appended {count} graded questions of job {args.job}")
+    elif args.command == "benchmark":
+        print(json.dumps(run_benchmark(gradebook, args.rows), indent=2))
+    else:
+        view = gradebook.view(args.exam)
+        if args.command == "stats":
+            print(json.dumps({"summary": view.summary(), "questions": view.question_stats()}, indent=2))
+        elif args.command == "distribution":
+            counts, edges = view.distribution(args.question)
+            for count, low, high in zip(counts, edges, edges[1:]):
+                print(f"{low:4.0%}-{high:4.0%} {count:6d} {'#' * int(60 * count / max(counts.max(), 1))}")
+        else:
+            print(json.dumps(view.outlier_students(args.threshold), indent=2))
@@ -0,0 +1,344 @@
+"""
+Structured grading results and a validating parser for them.
+
+Whole-script grading (grade_script@2) asks the model for a strict JSON
+object:
+
+    {"questions": [{"question": "1a", "verdict": "Correct",
+                    "awarded_marks": 4, "max_marks": 5}, ...],
+     "total_marks": 14, "max_total_marks": 20}
+
+parse_script_grade turns a reply into a ScriptGrade and validates it
+against the marking scheme. Every question must be graded exactly once,
+either by itself or by all of its parts, with 0 <= awarded <= max. The
+question's max is taken from the rubric heading when the rubric states
+it. The parser repairs what it safely can:
+- code fences and prose around the object;
+- trailing commas and curly quotes;
+- "4/5" written as a string;
+- a missing or unknown verdict;
+- totals that disagree with the questions (totals are recomputed).
+When the object as a whole is unreadable, it falls back to salvaging
+single question objects and then legacy "Awarded Marks" lines. Whatever
+is still missing or invalid is reported in ScriptGrade.failed, so the
+caller re-requests only those questions instead of the whole grade.
+"""
+import json
+import re
+
+from keypoints import compile_rubric
+from questions import AWARDED_MARKS_RE, UNKNOWN_QUESTION, normalize_question_id
+
+CORRECT = "Correct"
+PARTIALLY_CORRECT = "Partially Correct"
+INCORRECT = "Incorrect"
+VERDICTS = {"correct": CORRECT, "partially correct": PARTIALLY_CORRECT, "partial": PARTIALLY_CORRECT, "incorrect": INCORRECT}
+
+# Innermost {...} objects, for salvaging question entries from broken JSON
+OBJECT_RE = re.compile(r"\{[^{}]*\}")
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+FRACTION_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*(?:/\s*(\d+(?:\.\d+)?))?\s*$")
+CURLY_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+class GradeParseError(Exception):
+    pass
+
+
+class QuestionGrade:
+    """
+    The grade of one question (or question part) of a script.
+    """
+
+    __slots__ = ("question_id", "awarded_marks", "max_marks", "verdict")
+
+    def __init__(self, question_id, awarded_marks, max_marks=None, verdict=None):
+        self.question_id = question_id
+        self.awarded_marks = awarded_marks
+        self.max_marks = max_marks
+        self.verdict = verdict or derive_verdict(awarded_marks, max_marks)
+
+    def to_dict(self):
+        return {
+            "question": self.question_id,
+            "verdict": self.verdict,
+            "awarded_marks": self.awarded_marks,
+            "max_marks": self.max_marks,
+        }
+
+    @property
+    def line(self):
+        """
+        The grade in the plain-text layout of the earlier prompts, which
+        questions.parse_awarded_marks reads.
+        """
+        return f"Question {self.question_id}: {self.verdict} - Awarded Marks: {format_marks(self.awarded_marks)}"
+
+    def __repr__(self):
+        return f"QuestionGrade({self.question_id}, {self.awarded_marks}/{self.max_marks})"
+
+
+class ScriptGrade:
+    """
+    The validated grade of a whole script. failed maps the question ids
+    that could not be graded from the reply to the reason.
+    """
+
+    __slots__ = ("questions", "failed", "repaired")
+
+    def __init__(self, questions, failed=None, repaired=False):
+        self.questions = questions
+        self.failed = failed or {}
+        self.repaired = repaired
+
+    @property
+    def valid(self):
+        return not self.failed
+
+    @property
+    def marks(self):
+        return {grade.question_id: grade.awarded_marks for grade in self.questions}
+
+    @property
+    def total(self):
+        return sum(grade.awarded_marks for grade in self.questions)
+
+    @property
+    def out_of(self):
+        if any(grade.max_marks is None for grade in self.questions):
+            return None
+        return sum(grade.max_marks for grade in self.questions)
+
+    @property
+    def text(self):
+        """
+        The grade in the plain-text layout stored as assessment_result.
+        """
+        lines = [grade.line for grade in self.questions]
+        total = f"Total Marks: {format_marks(self.total)}"
+        if self.out_of is not None:
+            total += f"/{format_marks(self.out_of)}"
+        return "\n".join(lines + [total])
+
+    def merge(self, other):
+        """
+        Fill this grade's failed questions from a re-requested grade of them.
+        """
+        graded = {grade.question_id: grade for grade in self.questions}
+        failed = dict(self.failed)
+        for grade in other.questions:
+            if grade.question_id in failed:
+                graded[grade.question_id] = grade
+                del failed[grade.question_id]
+        return ScriptGrade(list(graded.values()), failed, repaired=True)
+
+    def to_dict(self):
+        return {
+            "questions": [grade.to_dict() for grade in self.questions],
+            "total_marks": self.total,
+            "max_total_marks": self.out_of,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            [
+                QuestionGrade(entry["question"], entry["awarded_marks"], entry.get("max_marks"), entry.get("verdict"))
+                for entry in data["questions"]
+            ]
+        )
+
+    def __repr__(self):
+        return f"ScriptGrade({self.total}/{self.out_of}, {len(self.questions)} questions, failed={sorted(self.failed)})"
+
+
+def format_marks(marks):
+    return str(int(marks)) if float(marks).is_integer() else str(marks)
+
+
+def derive_verdict(awarded_marks, max_marks):
+    if max_marks and awarded_marks >= max_marks:
+        return CORRECT
+    if awarded_marks <= 0:
+        return INCORRECT
+    return PARTIALLY_CORRECT
+
+
+def rubric_questions(marking_scheme):
+    """
+    {top-level question id: {part id: max marks or None}} of a marking
+    scheme. A question without parts is its own only part.
+    """
+    marks = compile_rubric(marking_scheme).marks
+    questions = {}
+    for question_id in marks:
+        parent = question_id.rstrip("abcdefghijklmnopqrstuvwxyz") or question_id
+        questions.setdefault(parent, {})
+        if question_id != parent:
+            questions[parent][question_id] = marks[question_id]
+    for parent, parts in questions.items():
+        if not parts:
+            parts[parent] = marks.get(parent)
+    return questions
+
+
+def rubric_total(marking_scheme):
+    """
+    Marks a whole marking scheme is out of: each question's stated marks,
+    or the sum of its parts'. None when some question's marks are not
+    stated.
+    """
+    marks = compile_rubric(marking_scheme).marks
+    total = 0.0
+    structure = rubric_questions(marking_scheme)
+    for parent, parts in structure.items():
+        if marks.get(parent) is not None:
+            total += marks[parent]
+        elif parts and all(value is not None for value in parts.values()):
+            total += sum(parts.values())
+        else:
+            return None
+    return total if structure else None
+
+
+def check_coverage(graded, failed, structure):
+    """
+    Make graded cover every rubric question exactly once, whole or by all
+    of its parts, and list the parts left ungraded in failed. Grades of
+    questions the rubric does not have are dropped. Does nothing when the
+    rubric has no recognizable questions.
+    """
+    if not structure:
+        return
+    for parent, parts in structure.items():
+        if set(parts) <= set(graded):
+            if parent not in parts:
+                graded.pop(parent, None)
+        elif parent in graded and parent not in parts:
+            for part in parts:
+                graded.pop(part, None)
+                failed.pop(part, None)
+        else:
+            for part in parts:
+                if part not in graded:
+                    failed.setdefault(part, "not graded")
+    parts = {part for question_parts in structure.values() for part in question_parts}
+    for question_id in list(graded):
+        if question_id not in parts and question_id not in structure:
+            del graded[question_id]
+    for question_id in list(failed):
+        if question_id not in parts:
+            del failed[question_id]
+
+
+def extract_object(text):
+    """
+    The outermost JSON object in a reply, with fences, surrounding prose,
+    trailing commas and curly quotes repaired. Returns (data, repaired),
+    or (None, True) when no object can be read.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None, True
+    candidate = text[start : end + 1]
+    repaired = candidate != text.strip()
+    try:
+        return json.loads(candidate), repaired
+    except ValueError:
+        pass
+    try:
+        return json.loads(TRAILING_COMMA_RE.sub(r"\1", candidate.translate(CURLY_QUOTES))), True
+    except ValueError:
+        return None, True
+
+
+def number(value):
+    """
+    (marks, max marks or None) from a number or a "4" / "4/5" string.
+    """
+    if isinstance(value, bool):
+        raise ValueError("not a number")
+    if isinstance(value, (int, float)):
+        return float(value), None
+    match = FRACTION_RE.match(str(value))
+    if not match:
+        raise ValueError(f"not a number: {value!r}")
+    return float(match.group(1)), float(match.group(2)) if match.group(2) else None
+
+
+def question_entry(entry, rubric_marks):
+    """
+    A QuestionGrade from one entry of the reply, validated against the
+    rubric's marks. Raises ValueError when it cannot be trusted.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError("not an object")
+    question_id = normalize_question_id(str(entry.get("question", entry.get("question_id", ""))))
+    if question_id == UNKNOWN_QUESTION:
+        raise ValueError("no question id")
+    awarded, stated_max = number(entry.get("awarded_marks", entry.get("awarded")))
+    if entry.get("max_marks") is not None:
+        stated_max = number(entry["max_marks"])[0]
+    # The rubric's heading is authoritative for what a question is out of
+    max_marks = rubric_marks.get(question_id) or stated_max
+    if awarded < 0 or (max_marks is not None and awarded > max_marks):
+        raise ValueError(f"{format_marks(awarded)} marks awarded out of {max_marks}")
+    verdict = VERDICTS.get(str(entry.get("verdict", "")).strip().lower())
+    return QuestionGrade(question_id, awarded, max_marks, verdict)
+
+
+def parse_script_grade(text, marking_scheme=None):
+    """
+    Parse and validate a grade_script@2 reply. Never raises on a bad
+    reply: what could not be graded is listed in the result's failed.
+    """
+    text = text or ""
+    structure = rubric_questions(marking_scheme) if marking_scheme else {}
+    rubric_marks = compile_rubric(marking_scheme).marks if marking_scheme else {}
+
+    data, repaired = extract_object(text)
+    entries = data.get("questions") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        # Salvage whatever question objects are readable on their own
+        repaired = True
+        entries = []
+        for match in OBJECT_RE.finditer(text):
+            try:
+                entries.append(json.loads(TRAILING_COMMA_RE.sub(r"\1", match.group(0).translate(CURLY_QUOTES))))
+            except ValueError:
+                continue
+        if not entries:
+            # The model ignored the format; read its plain-text grade lines
+            entries = [
+                {"question": match.group(1), "awarded_marks": match.group(2)}
+                for match in AWARDED_MARKS_RE.finditer(text)
+            ]
+
+    graded = {}
+    failed = {}
+    for entry in entries:
+        try:
+            grade = question_entry(entry, rubric_marks)
+        except ValueError as e:
+            question_id = normalize_question_id(str(entry.get("question", ""))) if isinstance(entry, dict) else None
+            if question_id and question_id != UNKNOWN_QUESTION:
+                failed[question_id] = str(e)
+            repaired = True
+            continue
+        if grade.question_id in graded:
+            # Two different grades for one question: neither can be trusted
+            failed[grade.question_id] = "graded twice"
+            repaired = True
+            continue
+        graded[grade.question_id] = grade
+    for question_id in failed:
+        graded.pop(question_id, None)
+
+    check_coverage(graded, failed, structure)
+    if not graded and not failed:
+        failed[UNKNOWN_QUESTION] = "no grades in reply"
+
+    return ScriptGrade(list(graded.values()), failed, repaired)
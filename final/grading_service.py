@@ -0,0 +1,262 @@
+"""
+Asynchronous HTTP grading service in front of AssessmentTool.
+
+Lets an LMS submit scripts programmatically instead of going through the
+Streamlit page. Submissions enter a bounded admission queue; when it is
+full the service answers 429 with Retry-After instead of accepting work it
+cannot finish. A fixed pool of workers drains the queue, running the
+blocking OCR and grading calls on a thread pool.
+
+Endpoints:
+    POST /jobs               {"pages": [base64 image, ...], "marking_scheme": "...",
+                              "student_id": "optional"}  -> 202 {"job_id": ...}
+    GET  /jobs/<id>          status, stage and per-page progress
+    GET  /jobs/<id>/result   grading result once done (409 while running)
+    GET  /health             queue depth, worker count, API limiter and grade cache metrics
+
+Usage:
+    python grading_service.py --port 8080 --workers 4 --queue-size 64
+    python grading_service.py --port 8080 --workers 16 --adaptive
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from assessment_tool import ImageOCRAnalyzer, AssessmentTool
+from concurrency import AdaptiveLimiter
+from grade_cache import GradeCache
+from job_runner import GradingJob, QUEUED, DONE, FAILED, grade_script, prune_finished
+
+MAX_BODY_BYTES = 50 * 1024 * 1024
+RETRY_AFTER_SECONDS = 5
+REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class GradingService:
+    def __init__(self, assessment_tool, workers=4, queue_size=64):
+        self.assessment_tool = assessment_tool
+        self.workers = workers
+        self.queue_size = queue_size
+        self.jobs = {}
+        self.queue = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="grading-service"
+        )
+        self.worker_tasks = []
+        self.lock = threading.Lock()
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    async def start(self, host="127.0.0.1", port=8080):
+        # The queue must be created inside the running event loop
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.worker_tasks = [
+            asyncio.create_task(self.worker()) for _ in range(self.workers)
+        ]
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                succeeded = await loop.run_in_executor(self.executor, job.run)
+                self.count("completed" if succeeded else "failed")
+            finally:
+                self.queue.task_done()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    # Request handling
+
+    def submit(self, payload):
+        pages = payload.get("pages")
+        marking_scheme = payload.get("marking_scheme")
+        if not pages or not isinstance(pages, list) or not marking_scheme:
+            raise HTTPError(400, "Both 'pages' (a list of base64 images) and 'marking_scheme' are required")
+        try:
+            page_images = [base64.b64decode(page, validate=True) for page in pages]
+        except (binascii.Error, TypeError, ValueError):
+            raise HTTPError(400, "Every entry of 'pages' must be a base64 encoded image")
+
+        # Finished jobs share JobRunner's time to live
+        prune_finished(self.jobs)
+        job = GradingJob(
+            payload.get("student_id", "anonymous"),
+            grade_script,
+            (self.assessment_tool, page_images, marking_scheme),
+            {},
+        )
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.count("rejected")
+            raise HTTPError(
+                429,
+                "Grading queue is full, retry later",
+                {"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+        self.jobs[job.job_id] = job
+        self.count("accepted")
+        return 202, {"job_id": job.job_id, "status": QUEUED}
+
+    def job_status(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, f"Unknown job {job_id}")
+        state = job.snapshot()
+        return 200, {
+            "job_id": job_id,
+            "status": state["status"],
+            "progress": state["progress"],
+            "error": state["error"],
+        }
+
+    def job_result(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, f"Unknown job {job_id}")
+        state = job.snapshot()
+        if state["status"] == FAILED:
+            return 200, {"job_id": job_id, "status": FAILED, "error": state["error"]}
+        if state["status"] != DONE:
+            raise HTTPError(409, f"Job {job_id} is still {state['status']}")
+        return 200, {"job_id": job_id, "status": DONE, "result": state["result"]}
+
+    def route(self, method, path, body):
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts == ["health"] and method == "GET":
+            health = {
+                "queued": self.queue.qsize(),
+                "queue_size": self.queue_size,
+                "workers": self.workers,
+            }
+            with self.lock:
+                health.update(self.stats)
+            limiter = getattr(self.assessment_tool.ocr_analyzer, "limiter", None)
+            if limiter is not None:
+                health["limiter"] = limiter.metrics()
+            if self.assessment_tool.grade_cache is not None:
+                health["grade_cache"] = self.assessment_tool.grade_cache.stats()
+            return 200, health
+        if parts == ["jobs"]:
+            if method != "POST":
+                raise HTTPError(405, "Use POST to submit a job")
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                raise HTTPError(400, "Request body is not valid JSON")
+            return self.submit(payload)
+        if len(parts) >= 2 and parts[0] == "jobs" and method == "GET":
+            if len(parts) == 2:
+                return self.job_status(parts[1])
+            if len(parts) == 3 and parts[2] == "result":
+                return self.job_result(parts[1])
+        raise HTTPError(404, f"Unknown path {path}")
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0) or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body exceeds {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path, body
+
+    async def handle_connection(self, reader, writer):
+        headers = {}
+        try:
+            request = await self.read_request(reader)
+            if request is None:
+                return
+            status, body = self.route(*request)
+        except HTTPError as e:
+            status, body, headers = e.status, {"error": e.message}, e.headers
+        except Exception as e:
+            status, body = 500, {"error": str(e)}
+
+        data = json.dumps(body).encode("utf-8")
+        head = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(data)}",
+            "Connection: close",
+        ]
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(service, host, port):
+    server = await service.start(host, port)
+    print(f"Grading service listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async HTTP grading service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4, help="concurrent grading jobs")
+    parser.add_argument("--queue-size", type=int, default=64, help="admission queue bound")
+    parser.add_argument("--base-url", help="Groq/OpenAI-compatible endpoint")
+    parser.add_argument("--adaptive", action="store_true", help="AIMD-limit API calls in flight")
+    parser.add_argument("--grade-cache", help="grade cache database")
+    args = parser.parse_args()
+
+    limiter = AdaptiveLimiter(max_limit=args.workers * 4) if args.adaptive else None
+    assessment_tool = AssessmentTool(
+        ImageOCRAnalyzer(base_url=args.base_url, limiter=limiter),
+        max_workers=4 if args.adaptive else 1,
+        grade_cache=GradeCache(args.grade_cache) if args.grade_cache else None,
+    )
+    service = GradingService(assessment_tool, workers=args.workers, queue_size=args.queue_size)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
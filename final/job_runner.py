@@ -0,0 +1,246 @@
+"""
+Background execution of grading jobs, shared across Streamlit sessions.
+
+Jobs are queued per session and worker threads take them round-robin
+across sessions, so one user submitting a large batch cannot starve the
+others. Each job exposes progress (its stage, pages OCR'd and the number
+of questions being graded) that the UI polls between reruns, and keeps its
+result until it is collected. A script is graded in one call, so there is
+no finer progress within the grading stage to report.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from gradebook import exam_id
+from questions import split_student_response
+from results import combined_text
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Finished jobs are kept this long for the UI to collect their results
+FINISHED_JOB_TTL = 60 * 60
+
+
+class GradingJob:
+    def __init__(self, session_id, fn, args, kwargs):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.progress = {
+            "stage": "queued",
+            "pages_done": 0,
+            "pages_total": 0,
+            "questions": 0,
+        }
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def update(self, **progress):
+        """
+        Called from the worker thread to report progress.
+        """
+        with self.lock:
+            self.progress.update(progress)
+
+    def snapshot(self):
+        """
+        Consistent copy of the job state for the UI thread.
+        """
+        with self.lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+            }
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def run(self):
+        """
+        Run the job on the calling thread and record its outcome. Returns
+        True when it succeeded.
+        """
+        with self.lock:
+            self.status = RUNNING
+        try:
+            result = self.fn(self, *self.args, **self.kwargs)
+        except Exception as e:
+            with self.lock:
+                self.error = str(e)
+                self.status = FAILED
+                self.progress["stage"] = "failed"
+                self.finished_at = time.time()
+            return False
+        with self.lock:
+            self.result = result
+            self.status = DONE
+            self.progress["stage"] = "done"
+            self.finished_at = time.time()
+        return True
+
+
+def prune_finished(jobs):
+    """
+    Drop from jobs (job_id -> GradingJob) the finished jobs whose results
+    were not collected within FINISHED_JOB_TTL. The caller holds whatever
+    lock guards jobs.
+    """
+    cutoff = time.time() - FINISHED_JOB_TTL
+    for job_id in [
+        job_id
+        for job_id, job in jobs.items()
+        if job.finished and job.finished_at and job.finished_at < cutoff
+    ]:
+        del jobs[job_id]
+
+
+class JobRunner:
+    def __init__(self, max_workers=4):
+        self.jobs = {}
+        # session_id -> deque of queued jobs, rotated for round-robin fairness
+        self.queues = OrderedDict()
+        self.condition = threading.Condition()
+        self.workers = []
+        for index in range(max_workers):
+            worker = threading.Thread(
+                target=self.work, name=f"grading-worker-{index}", daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, session_id, fn, *args, **kwargs):
+        """
+        Queue fn(job, *args, **kwargs) and return the job id. fn reports
+        progress through job.update() and returns the job result.
+        """
+        job = GradingJob(session_id, fn, args, kwargs)
+        with self.condition:
+            self.prune()
+            self.jobs[job.job_id] = job
+            self.queues.setdefault(session_id, deque()).append(job)
+            self.condition.notify()
+        return job.job_id
+
+    def get(self, job_id):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def active_job(self, session_id):
+        """
+        Return the session's queued or running job, if any.
+        """
+        with self.condition:
+            for job in self.jobs.values():
+                if job.session_id == session_id and not job.finished:
+                    return job
+        return None
+
+    def queue_depth(self):
+        with self.condition:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def next_job(self):
+        """
+        Take the next job from the least recently served session. Must be
+        called with the condition held.
+        """
+        if not self.queues:
+            return None
+        session_id, queue = next(iter(self.queues.items()))
+        job = queue.popleft()
+        del self.queues[session_id]
+        if queue:
+            # Move the session to the back of the rotation
+            self.queues[session_id] = queue
+        return job
+
+    def work(self):
+        while True:
+            with self.condition:
+                job = self.next_job()
+                while job is None:
+                    self.condition.wait()
+                    job = self.next_job()
+            job.run()
+
+    def prune(self):
+        """
+        Forget finished jobs whose results were never collected. Must be
+        called with the condition held.
+        """
+        prune_finished(self.jobs)
+
+
+def grade_script(
+    job, assessment_tool, student_image_paths, marking_scheme, workspace=None, gradebook=None, student_id=None, exam=None
+):
+    """
+    Background job: OCR every page, then grade the script against the
+    marking scheme, reporting progress as it goes. marking_scheme is the
+    scheme's text, or an uploaded .docx or image (file object or bytes)
+    that is compiled here first, so an image scheme's OCR call runs in the
+    job rather than in the caller. With a gradebook, the graded questions
+    are appended to it under exam (by default, one per marking scheme) and
+    student_id.
+    """
+    if not isinstance(marking_scheme, str):
+        job.update(stage="rubric")
+        try:
+            marking_scheme = assessment_tool.extract_marking_scheme(marking_scheme)
+        except Exception:
+            if workspace is not None:
+                workspace.clear()
+            raise
+
+    job.update(stage="ocr", pages_total=len(student_image_paths))
+    start = time.perf_counter()
+    try:
+        pages = assessment_tool.extract_pages(
+            student_image_paths,
+            on_page=lambda done, total: job.update(pages_done=done),
+            student_id=student_id,
+        )
+    finally:
+        # Rendered pages are only needed while the responses are extracted
+        if workspace is not None:
+            workspace.clear()
+    ocr_seconds = time.perf_counter() - start
+    student_response = combined_text(pages)
+
+    questions = split_student_response(student_response)
+    job.update(stage="grading", questions=len(questions))
+    start = time.perf_counter()
+    grade = assessment_tool.grade_student_response(student_response, marking_scheme)
+    grade_seconds = time.perf_counter() - start
+
+    if gradebook is not None:
+        gradebook.append_script(
+            exam or exam_id(marking_scheme),
+            student_id or job.job_id,
+            grade,
+            answers=questions,
+            ocr_seconds=ocr_seconds,
+            grade_seconds=grade_seconds,
+        )
+
+    return {
+        "student_response": student_response,
+        "marking_scheme": marking_scheme,
+        "assessment_result": grade.text,
+        "grade": grade.to_dict(),
+    }
@@ -0,0 +1,556 @@
+"""
+Persistent, resumable state for batch grading jobs, backed by SQLite.
+
+A job holds one marking scheme and many students. Each student has pages
+(OCR'd one at a time) and questions (split from the OCR text and filled in
+once the script is graded). Every completed API call is checkpointed, so a
+restarted run only repeats work that never finished.
+
+The database runs in WAL mode, so progress can be queried from another
+process or thread while a run is writing to it.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from grades import QuestionGrade, ScriptGrade, format_marks, rubric_total
+from keypoints import compile_rubric
+
+PENDING = "pending"
+OCR_DONE = "ocr_done"
+GRADED = "graded"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    marking_scheme TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rubric_versions (
+    job_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    marking_scheme TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, version)
+);
+CREATE TABLE IF NOT EXISTS students (
+    job_id TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    assessment_result TEXT,
+    total_marks REAL,
+    out_of REAL,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, student_id)
+);
+CREATE TABLE IF NOT EXISTS pages (
+    job_id TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    source_path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    ocr_text TEXT,
+    error TEXT,
+    ocr_seconds REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, student_id, page_number)
+);
+CREATE TABLE IF NOT EXISTS questions (
+    job_id TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    answer_text TEXT,
+    awarded_marks REAL,
+    grade_seconds REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, student_id, question_id)
+);
+CREATE TABLE IF NOT EXISTS grade_audit (
+    job_id TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    source_student_id TEXT NOT NULL,
+    method TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    awarded_marks REAL,
+    assessment_result TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, student_id, question_id)
+);
+CREATE INDEX IF NOT EXISTS pages_state ON pages (job_id, state);
+CREATE INDEX IF NOT EXISTS students_state ON students (job_id, state);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed store of per-student, per-page and per-question state.
+
+    Each thread gets its own connection; writes go through short
+    transactions so concurrent readers always see a consistent snapshot.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = os.path.abspath(db_path)
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    # Jobs and students
+
+    def create_job(self, job_id, marking_scheme):
+        """
+        Create a job, or return the stored marking scheme if it already exists.
+        """
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, marking_scheme, created_at) VALUES (?, ?, ?)",
+                (job_id, marking_scheme, time.time()),
+            )
+            if cursor.rowcount == 1:
+                conn.execute(
+                    "INSERT INTO rubric_versions (job_id, version, marking_scheme, created_at) VALUES (?, 1, ?, ?)",
+                    (job_id, marking_scheme, time.time()),
+                )
+            row = conn.execute(
+                "SELECT marking_scheme FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return row["marking_scheme"]
+
+    def marking_scheme(self, job_id):
+        row = self.connection().execute(
+            "SELECT marking_scheme FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return row["marking_scheme"] if row else None
+
+    def update_marking_scheme(self, job_id, marking_scheme):
+        """
+        Make marking_scheme the job's current scheme, keeping the previous
+        ones as numbered versions. Returns the new version number.
+        """
+        now = time.time()
+        with self.connection() as conn:
+            version = conn.execute(
+                "SELECT COALESCE(MAX(version), 0) FROM rubric_versions WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            if version == 0:
+                # Jobs created before versioning: keep the original as version 1
+                conn.execute(
+                    "INSERT INTO rubric_versions (job_id, version, marking_scheme, created_at) "
+                    "SELECT job_id, 1, marking_scheme, created_at FROM jobs WHERE job_id = ?",
+                    (job_id,),
+                )
+                version = 1
+            conn.execute(
+                "INSERT INTO rubric_versions (job_id, version, marking_scheme, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, version + 1, marking_scheme, now),
+            )
+            conn.execute("UPDATE jobs SET marking_scheme = ? WHERE job_id = ?", (marking_scheme, job_id))
+        return version + 1
+
+    def rubric_versions(self, job_id):
+        return self.connection().execute(
+            "SELECT version, marking_scheme, created_at FROM rubric_versions WHERE job_id = ? ORDER BY version",
+            (job_id,),
+        ).fetchall()
+
+    def has_student(self, job_id, student_id):
+        row = self.connection().execute(
+            "SELECT 1 FROM students WHERE job_id = ? AND student_id = ?", (job_id, student_id)
+        ).fetchone()
+        return row is not None
+
+    def add_student(self, job_id, student_id, page_paths):
+        """
+        Register a student's pages. Already registered students are left
+        untouched so a resumed run keeps its checkpoints.
+        """
+        now = time.time()
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO students (job_id, student_id, state, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, student_id, PENDING, now),
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.executemany(
+                "INSERT INTO pages (job_id, student_id, page_number, source_path, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, student_id, number, path, PENDING, now)
+                    for number, path in enumerate(page_paths, start=1)
+                ],
+            )
+        return True
+
+    def students(self, job_id, states=None):
+        """
+        List student ids of a job, optionally filtered by state.
+        """
+        query = "SELECT student_id FROM students WHERE job_id = ?"
+        params = [job_id]
+        if states:
+            query += f" AND state IN ({','.join('?' * len(states))})"
+            params.extend(states)
+        rows = self.connection().execute(query + " ORDER BY student_id", params).fetchall()
+        return [row["student_id"] for row in rows]
+
+    # Pages
+
+    def pages(self, job_id, student_id, states=None):
+        query = "SELECT * FROM pages WHERE job_id = ? AND student_id = ?"
+        params = [job_id, student_id]
+        if states:
+            query += f" AND state IN ({','.join('?' * len(states))})"
+            params.extend(states)
+        return self.connection().execute(query + " ORDER BY page_number", params).fetchall()
+
+    def record_ocr(self, job_id, student_id, page_number, ocr_text, seconds=None):
+        """
+        Store a page's OCR text and, when it had a call of its own, how
+        long the call took.
+        """
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE pages SET state = ?, ocr_text = ?, error = NULL, ocr_seconds = ?, updated_at = ? "
+                "WHERE job_id = ? AND student_id = ? AND page_number = ?",
+                (OCR_DONE, ocr_text, seconds, time.time(), job_id, student_id, page_number),
+            )
+
+    def record_page_failure(self, job_id, student_id, page_number, error):
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE pages SET state = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND student_id = ? AND page_number = ?",
+                (FAILED, str(error), time.time(), job_id, student_id, page_number),
+            )
+
+    def student_response(self, job_id, student_id):
+        """
+        Join the OCR text of a student's pages, in page order.
+        """
+        rows = self.pages(job_id, student_id, states=[OCR_DONE])
+        return "\n".join(row["ocr_text"] for row in rows)
+
+    # Questions and grades
+
+    def record_questions(self, job_id, student_id, answers):
+        """
+        Store the per-question answers split from a student's OCR text,
+        replacing any earlier split and grades, and mark the student as OCR
+        done.
+        """
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute(
+                "DELETE FROM questions WHERE job_id = ? AND student_id = ?", (job_id, student_id)
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO questions "
+                "(job_id, student_id, question_id, state, answer_text, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, student_id, question_id, OCR_DONE, answer, now)
+                    for question_id, answer in answers.items()
+                ],
+            )
+            conn.execute(
+                "UPDATE students SET state = ?, updated_at = ? WHERE job_id = ? AND student_id = ?",
+                (OCR_DONE, now, job_id, student_id),
+            )
+
+    def record_grade(self, job_id, student_id, assessment_result, question_marks, total, out_of):
+        """
+        Store a student's grade and the marks awarded per question.
+        """
+        now = time.time()
+        with self.connection() as conn:
+            for question_id, marks in question_marks.items():
+                conn.execute(
+                    "INSERT INTO questions (job_id, student_id, question_id, state, awarded_marks, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (job_id, student_id, question_id) DO UPDATE SET "
+                    "state = excluded.state, awarded_marks = excluded.awarded_marks, updated_at = excluded.updated_at",
+                    (job_id, student_id, question_id, GRADED, marks, now),
+                )
+            conn.execute(
+                "UPDATE questions SET state = ?, updated_at = ? "
+                "WHERE job_id = ? AND student_id = ? AND state != ?",
+                (GRADED, now, job_id, student_id, GRADED),
+            )
+            conn.execute(
+                "UPDATE students SET state = ?, assessment_result = ?, total_marks = ?, out_of = ?, "
+                "error = NULL, updated_at = ? WHERE job_id = ? AND student_id = ?",
+                (GRADED, assessment_result, total, out_of, now, job_id, student_id),
+            )
+
+    def claim_ocr_complete(self, job_id, student_id):
+        """
+        Atomically move a student from pending to ocr_done once every page
+        has OCR text. Exactly one caller gets True, so when several workers
+        finish a student's last pages at once only one schedules grading.
+        """
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "UPDATE students SET state = ?, updated_at = ? "
+                "WHERE job_id = ? AND student_id = ? AND state = ? AND NOT EXISTS ("
+                "SELECT 1 FROM pages WHERE job_id = ? AND student_id = ? AND state != ?)",
+                (OCR_DONE, time.time(), job_id, student_id, PENDING, job_id, student_id, OCR_DONE),
+            )
+        return cursor.rowcount == 1
+
+    def record_question_grade(self, job_id, student_id, question_id, awarded_marks, seconds=None):
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE questions SET state = ?, awarded_marks = ?, grade_seconds = ?, updated_at = ? "
+                "WHERE job_id = ? AND student_id = ? AND question_id = ?",
+                (GRADED, awarded_marks, seconds, time.time(), job_id, student_id, question_id),
+            )
+
+    def answers(self, job_id):
+        """
+        Return {question_id: {student_id: answer_text}} for every split answer of the job.
+        """
+        rows = self.connection().execute(
+            "SELECT student_id, question_id, answer_text FROM questions "
+            "WHERE job_id = ? AND answer_text IS NOT NULL ORDER BY question_id, student_id",
+            (job_id,),
+        ).fetchall()
+        answers = {}
+        for row in rows:
+            answers.setdefault(row["question_id"], {})[row["student_id"]] = row["answer_text"]
+        return answers
+
+    def ungraded_answers(self, job_id):
+        """
+        Return {question_id: {student_id: answer_text}} for every question
+        of an OCR'd student that has no grade yet.
+        """
+        rows = self.connection().execute(
+            "SELECT q.student_id, q.question_id, q.answer_text FROM questions q "
+            "JOIN students s ON s.job_id = q.job_id AND s.student_id = q.student_id "
+            "WHERE q.job_id = ? AND q.state = ? AND s.state = ? ORDER BY q.question_id, q.student_id",
+            (job_id, OCR_DONE, OCR_DONE),
+        ).fetchall()
+        answers = {}
+        for row in rows:
+            answers.setdefault(row["question_id"], {})[row["student_id"]] = row["answer_text"] or ""
+        return answers
+
+    def record_cluster_grade(
+        self, job_id, question_id, source_student_id, awarded_marks, assessment_result, members, seconds=None
+    ):
+        """
+        Grade every member of an answer cluster with the marks awarded to
+        the source student's answer, in one transaction, and record in the
+        audit trail which grade each answer inherited. members is
+        {student_id: (method, similarity)} and includes the source itself.
+        The grading call's time is recorded against the source only; the
+        other members cost nothing.
+        """
+        now = time.time()
+        with self.connection() as conn:
+            for student_id, (method, similarity) in members.items():
+                conn.execute(
+                    "UPDATE questions SET state = ?, awarded_marks = ?, grade_seconds = ?, updated_at = ? "
+                    "WHERE job_id = ? AND student_id = ? AND question_id = ?",
+                    (
+                        GRADED, awarded_marks, seconds if student_id == source_student_id else None, now,
+                        job_id, student_id, question_id,
+                    ),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO grade_audit (job_id, student_id, question_id, source_student_id, "
+                    "method, similarity, awarded_marks, assessment_result, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job_id, student_id, question_id, source_student_id, method, similarity,
+                        awarded_marks, assessment_result if student_id == source_student_id else None, now,
+                    ),
+                )
+
+    def grade_audit(self, job_id, student_id=None):
+        """
+        Audit rows of clustered grading: for each graded answer, the student
+        whose answer was actually sent to the grader and how the two matched.
+        """
+        query = "SELECT * FROM grade_audit WHERE job_id = ?"
+        params = [job_id]
+        if student_id is not None:
+            query += " AND student_id = ?"
+            params.append(student_id)
+        return self.connection().execute(
+            query + " ORDER BY question_id, source_student_id, student_id", params
+        ).fetchall()
+
+    def question_ids(self, job_id):
+        rows = self.connection().execute(
+            "SELECT DISTINCT question_id FROM questions WHERE job_id = ? ORDER BY question_id", (job_id,)
+        ).fetchall()
+        return [row["question_id"] for row in rows]
+
+    def reopen_questions(self, job_id, question_ids):
+        """
+        Clear the grades of question_ids across the cohort so they are graded
+        again, keeping OCR text and every other question's marks. Students
+        with a reopened question go back to ocr_done.
+
+        Returns (reopened, unsplit): the students whose answers were reopened,
+        and the students graded as a whole script whose grader output named
+        an affected question that has no stored answer text of its own. The
+        latter need their whole script graded again.
+        """
+        if not question_ids:
+            return [], []
+        marks = ",".join("?" * len(question_ids))
+        now = time.time()
+        with self.connection() as conn:
+            unsplit = [
+                row["student_id"]
+                for row in conn.execute(
+                    f"SELECT DISTINCT student_id FROM questions WHERE job_id = ? AND question_id IN ({marks}) "
+                    "AND answer_text IS NULL ORDER BY student_id",
+                    (job_id, *question_ids),
+                )
+            ]
+            reopened = [
+                row["student_id"]
+                for row in conn.execute(
+                    f"SELECT DISTINCT student_id FROM questions WHERE job_id = ? AND question_id IN ({marks}) "
+                    "AND answer_text IS NOT NULL ORDER BY student_id",
+                    (job_id, *question_ids),
+                )
+                if row["student_id"] not in unsplit
+            ]
+            for student_id in reopened:
+                conn.execute(
+                    f"UPDATE questions SET state = ?, awarded_marks = NULL, grade_seconds = NULL, updated_at = ? "
+                    f"WHERE job_id = ? AND student_id = ? AND question_id IN ({marks})",
+                    (OCR_DONE, now, job_id, student_id, *question_ids),
+                )
+                conn.execute(
+                    f"DELETE FROM grade_audit WHERE job_id = ? AND student_id = ? AND question_id IN ({marks})",
+                    (job_id, student_id, *question_ids),
+                )
+            for student_id in reopened + unsplit:
+                conn.execute(
+                    "UPDATE students SET state = ?, updated_at = ? WHERE job_id = ? AND student_id = ?",
+                    (OCR_DONE, now, job_id, student_id),
+                )
+        return reopened, unsplit
+
+    def finalize_student(self, job_id, student_id, out_of=None):
+        """
+        Atomically mark a student graded once every question is graded,
+        totalling the per-question marks. The grade text is rebuilt from
+        the questions, so it agrees with the total after a regrade. out_of
+        is what the marking scheme is out of unless given; when neither is
+        known the stored out_of is kept. An error left by a failed attempt
+        is cleared. Returns True for the one caller that performed the
+        transition.
+        """
+        marking_scheme = self.marking_scheme(job_id)
+        if out_of is None and marking_scheme:
+            out_of = rubric_total(marking_scheme)
+        grade = self.question_grade(job_id, student_id, marking_scheme)
+        text = "\n".join(
+            [question.line for question in grade.questions]
+            + [f"Total Marks: {format_marks(grade.total)}" + (f"/{format_marks(out_of)}" if out_of is not None else "")]
+        )
+        with self.connection() as conn:
+            cursor = conn.execute(
+                "UPDATE students SET state = ?, assessment_result = ?, out_of = COALESCE(?, out_of), "
+                "error = NULL, updated_at = ?, total_marks = ("
+                "SELECT COALESCE(SUM(awarded_marks), 0) FROM questions WHERE job_id = ? AND student_id = ?) "
+                "WHERE job_id = ? AND student_id = ? AND state = ? AND NOT EXISTS ("
+                "SELECT 1 FROM questions WHERE job_id = ? AND student_id = ? AND state != ?)",
+                (
+                    GRADED, text, out_of, time.time(), job_id, student_id,
+                    job_id, student_id, OCR_DONE,
+                    job_id, student_id, GRADED,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def question_grade(self, job_id, student_id, marking_scheme=None):
+        """
+        A grades.ScriptGrade of the student's graded questions, with each
+        question's max marks from the marking scheme (by default the job's
+        current one).
+        """
+        marking_scheme = marking_scheme or self.marking_scheme(job_id)
+        max_marks = compile_rubric(marking_scheme).marks if marking_scheme else {}
+        return ScriptGrade(
+            [
+                QuestionGrade(row["question_id"], row["awarded_marks"], max_marks.get(row["question_id"]))
+                for row in self.questions(job_id, student_id)
+                if row["awarded_marks"] is not None
+            ]
+        )
+
+    def record_student_failure(self, job_id, student_id, error):
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE students SET error = ?, updated_at = ? WHERE job_id = ? AND student_id = ?",
+                (str(error), time.time(), job_id, student_id),
+            )
+
+    def questions(self, job_id, student_id):
+        return self.connection().execute(
+            "SELECT * FROM questions WHERE job_id = ? AND student_id = ? ORDER BY question_id",
+            (job_id, student_id),
+        ).fetchall()
+
+    def result(self, job_id, student_id):
+        return self.connection().execute(
+            "SELECT * FROM students WHERE job_id = ? AND student_id = ?", (job_id, student_id)
+        ).fetchone()
+
+    # Progress
+
+    def progress(self, job_id):
+        """
+        Count students, pages and questions of a job by state, read in a
+        single transaction so the counts are mutually consistent.
+        """
+        conn = self.connection()
+        counts = {}
+        with conn:
+            conn.execute("BEGIN")
+            for table in ("students", "pages", "questions"):
+                rows = conn.execute(
+                    f"SELECT state, COUNT(*) AS n FROM {table} WHERE job_id = ? GROUP BY state",
+                    (job_id,),
+                ).fetchall()
+                counts[table] = {row["state"]: row["n"] for row in rows}
+        return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show grading job progress")
+    parser.add_argument("db_path")
+    parser.add_argument("job_id")
+    args = parser.parse_args()
+    print(json.dumps(JobStore(args.db_path).progress(args.job_id), indent=2))
@@ -0,0 +1,280 @@
+"""
+Key-point matching of rubric terms in OCR'd answers.
+
+A rubric item's key points ("Faster Delivery", "Improved Collaboration",
+...) are compiled into a word-level Aho-Corasick automaton, so every key
+point present in an answer is found in a single pass over its words.
+OCR misspellings are tolerated before the automaton sees a word: a word
+that is not in the key-point vocabulary is mapped to the vocabulary word
+within a small edit distance ("mitochoondria" -> "mitochondria"), using
+the Levenshtein distance of text_match_algos (collusion.edit_distance).
+Those lookups are cached per distinct word, so the pass stays linear in
+the answer length.
+
+Objective coverage lets AssessmentTool(key_points=True) tell the grading
+model which key points are already present, so it only has to judge the
+missing ones and the quality of the rest.
+
+Usage:
+    python keypoints.py --marking-scheme ../mid2/solution.docx --question 1a --answer "..."
+    python keypoints.py --db ./uploads/grading.db --job mid2 --output coverage.json
+"""
+import argparse
+import json
+import re
+from collections import deque
+from functools import lru_cache
+
+from clustering import normalize_answer
+from collusion import edit_distance
+from questions import UNKNOWN_QUESTION, split_marking_scheme, RUBRIC_QUESTION_RE, RUBRIC_PART_RE
+
+# "Faster Delivery: Speeds up software release cycles." -> "Faster Delivery"
+KEY_POINT_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])?\s*([^:]{2,60}?)\s*:")
+MARKS_RE = re.compile(r"\((\d+(?:\.\d+)?)\s*marks?\)", re.IGNORECASE)
+MAX_KEY_POINT_WORDS = 6
+# Words shorter than this must match exactly; OCR noise on them is ambiguous
+MIN_FUZZY_LENGTH = 4
+
+
+def max_edits(word):
+    """
+    Edits tolerated for a vocabulary word: one for short words, two for long ones.
+    """
+    return 1 if len(word) < 9 else 2
+
+
+def extract_key_points(section):
+    """
+    Key points of a rubric section: the labels of "Label: explanation"
+    lines. Heading lines are skipped.
+    """
+    key_points = []
+    for line in section.splitlines():
+        if RUBRIC_QUESTION_RE.match(line) or RUBRIC_PART_RE.match(line):
+            continue
+        match = KEY_POINT_RE.match(line)
+        if match and len(match.group(1).split()) <= MAX_KEY_POINT_WORDS:
+            key_points.append(match.group(1).strip())
+    return key_points
+
+
+def section_marks(section):
+    """
+    Marks stated in a section's headings; a sub-part's own "(N Marks)"
+    wins over its question's.
+    """
+    marks = None
+    for line in section.splitlines():
+        if RUBRIC_QUESTION_RE.match(line) or RUBRIC_PART_RE.match(line):
+            stated = MARKS_RE.search(line)
+            if stated:
+                marks = float(stated.group(1))
+    return marks
+
+
+class KeyPointMatcher:
+    """
+    Aho-Corasick automaton over the words of a set of key points.
+    """
+
+    def __init__(self, key_points, fuzzy=True, cache_size=8192):
+        self.key_points = []
+        # Trie nodes: transitions, failure link and the key points ending here
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for key_point in key_points:
+            words = tuple(normalize_answer(key_point).split())
+            if words and key_point not in self.key_points:
+                self.add(len(self.key_points), words)
+                self.key_points.append(key_point)
+        self.build()
+
+        self.vocabulary = {word for node in self.goto for word in node}
+        self.fuzzy = fuzzy
+        self.canonical = lru_cache(maxsize=cache_size)(self._canonical)
+
+    def add(self, index, words):
+        node = 0
+        for word in words:
+            if word not in self.goto[node]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][word] = len(self.goto) - 1
+            node = self.goto[node][word]
+        self.output[node].append((index, len(words)))
+
+    def build(self):
+        """
+        Compute failure links breadth first, merging each node's output
+        with its failure target's.
+        """
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(word, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def _canonical(self, word):
+        """
+        Map an answer word to the vocabulary word it most likely is, as
+        (word, edits), or (word, 0) when nothing is close enough.
+        """
+        if word in self.vocabulary or not self.fuzzy or len(word) < MIN_FUZZY_LENGTH:
+            return word, 0
+        best, best_distance = word, None
+        for candidate in self.vocabulary:
+            limit = max_edits(candidate)
+            if len(candidate) < MIN_FUZZY_LENGTH or abs(len(candidate) - len(word)) > limit:
+                continue
+            distance = edit_distance(word, candidate)
+            if distance <= limit and (best_distance is None or distance < best_distance):
+                best, best_distance = candidate, distance
+        return best, best_distance or 0
+
+    def match(self, text):
+        """
+        Find the key points present in text. Returns {key_point: match}
+        where match holds the matched words as written and the number of
+        OCR corrections needed; each key point is reported once.
+        """
+        words = normalize_answer(text).split()
+        found = {}
+        node = 0
+        edits = []
+        for position, word in enumerate(words):
+            canonical, distance = self.canonical(word)
+            edits.append(distance)
+            while node and canonical not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(canonical, 0)
+            for index, length in self.output[node]:
+                key_point = self.key_points[index]
+                if key_point not in found:
+                    start = position - length + 1
+                    found[key_point] = {
+                        "matched": " ".join(words[start:position + 1]),
+                        "corrections": sum(edits[start:position + 1]),
+                    }
+        return found
+
+    def coverage(self, text, marks=None):
+        """
+        Score key-point coverage of an answer. With the rubric item's marks,
+        suggested_marks splits them evenly over the key points.
+        """
+        found = self.match(text)
+        result = {
+            "found": found,
+            "missing": [key_point for key_point in self.key_points if key_point not in found],
+            "coverage": round(len(found) / len(self.key_points), 4) if self.key_points else None,
+        }
+        if marks is not None and self.key_points:
+            result["suggested_marks"] = round(marks * len(found) / len(self.key_points), 2)
+        return result
+
+
+class RubricKeyPoints:
+    """
+    One KeyPointMatcher per question of a marking scheme, with the marks
+    stated in each question's heading.
+    """
+
+    def __init__(self, marking_scheme, fuzzy=True):
+        self.fuzzy = fuzzy
+        self.matchers = {}
+        self.marks = {}
+        for question_id, section in split_marking_scheme(marking_scheme).items():
+            if question_id == UNKNOWN_QUESTION:
+                continue
+            self.marks[question_id] = section_marks(section)
+            key_points = extract_key_points(section)
+            if key_points:
+                self.matchers[question_id] = KeyPointMatcher(key_points, fuzzy=fuzzy)
+
+    def matcher_for(self, question_id):
+        if question_id not in self.matchers:
+            # A student's "1" covers the key points of "1a", "1b", ...
+            key_points = [
+                key_point
+                for section_id, matcher in list(self.matchers.items())
+                if section_id.startswith(question_id) and section_id[len(question_id):].isalpha()
+                for key_point in matcher.key_points
+            ]
+            self.matchers[question_id] = KeyPointMatcher(key_points, fuzzy=self.fuzzy) if key_points else None
+        return self.matchers[question_id]
+
+    def score(self, question_id, answer):
+        matcher = self.matcher_for(question_id)
+        if matcher is None:
+            return None
+        return matcher.coverage(answer, self.marks.get(question_id))
+
+
+@lru_cache(maxsize=32)
+def compile_rubric(marking_scheme):
+    """
+    Compiled key points of a marking scheme, reused while the scheme is unchanged.
+    """
+    return RubricKeyPoints(marking_scheme)
+
+
+def key_point_summary(coverage):
+    """
+    Render a coverage result as lines for the grading prompt.
+    """
+    found = ", ".join(
+        f"{key_point} (as \"{match['matched']}\")" for key_point, match in coverage["found"].items()
+    )
+    missing = ", ".join(coverage["missing"])
+    return f"Present: {found or 'none'}\nNot found: {missing or 'none'}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rubric key-point coverage")
+    parser.add_argument("--marking-scheme", help="marking scheme .docx")
+    parser.add_argument("--question", help="question id for --answer")
+    parser.add_argument("--answer", help="answer text to score")
+    parser.add_argument("--db", help="JobStore database to score every stored answer")
+    parser.add_argument("--job", help="job id (with --db)")
+    parser.add_argument("--output", help="write per-answer coverage to this JSON file")
+    args = parser.parse_args()
+
+    if args.db and args.job:
+        from job_store import JobStore
+
+        job_store = JobStore(args.db)
+        marking_scheme = job_store.marking_scheme(args.job)
+        answers = job_store.answers(args.job)
+    elif args.marking_scheme and args.question and args.answer:
+        import docx
+
+        marking_scheme = "\n".join(
+            para.text.strip() for para in docx.Document(args.marking_scheme).paragraphs if para.text.strip()
+        )
+        answers = {args.question: {"answer": args.answer}}
+    else:
+        parser.error("use --db and --job, or --marking-scheme, --question and --answer")
+
+    rubric = compile_rubric(marking_scheme)
+    report = {
+        question_id: {student_id: rubric.score(question_id, answer) for student_id, answer in by_student.items()}
+        for question_id, by_student in answers.items()
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
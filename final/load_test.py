@@ -0,0 +1,186 @@
+"""
+Load test for grading_service.py.
+
+By default the grading service and a stub OCR backend (stub_server.py) are
+both started in-process, so the test exercises admission control, the
+worker pool and HTTP handling without spending API quota.
+
+Usage:
+    python load_test.py --clients 16 --jobs 200 --workers 4 --queue-size 32 --latency uniform:0.2,0.6
+    python load_test.py --url http://127.0.0.1:8080 --clients 16 --jobs 200
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from assessment_tool import ImageOCRAnalyzer, AssessmentTool
+from benchmark import REPO_ROOT, percentile
+from grading_service import GradingService
+from stub_server import StubServer
+
+SAMPLE_PAGE = os.path.join(REPO_ROOT, "test_files", "sample.jpeg")
+POLL_INTERVAL = 0.1
+
+
+def request_json(url, payload=None):
+    """
+    Send a GET (or POST when payload is given) and return (status, body, headers).
+    """
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(
+        url, data=data, headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, json.load(response), response.headers
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e), e.headers
+
+
+def start_local_service(workers, queue_size, stub_kwargs):
+    """
+    Start the stub backend and the grading service on background threads
+    and return the service URL.
+    """
+    stub = StubServer(**stub_kwargs).start()
+    assessment_tool = AssessmentTool(ImageOCRAnalyzer(base_url=stub.base_url))
+    service = GradingService(assessment_tool, workers=workers, queue_size=queue_size)
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    address = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(service.start("127.0.0.1", 0))
+        address["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{address['port']}"
+
+
+def client(url, payload, take_job, results, lock):
+    """
+    Submit jobs while take_job() hands them out, honouring 429 backpressure,
+    and wait for each job to finish.
+    """
+    while take_job():
+        started = time.perf_counter()
+        while True:
+            submit_started = time.perf_counter()
+            status, body, headers = request_json(f"{url}/jobs", payload)
+            with lock:
+                results["submit_latencies"].append(time.perf_counter() - submit_started)
+            if status != 429:
+                break
+            with lock:
+                results["rejected"] += 1
+            time.sleep(float(headers.get("Retry-After", 1)))
+
+        if status != 202:
+            with lock:
+                results["errors"] += 1
+            continue
+
+        job_id = body["job_id"]
+        while True:
+            status, body, _ = request_json(f"{url}/jobs/{job_id}")
+            if body.get("status") in ("done", "failed"):
+                break
+            time.sleep(POLL_INTERVAL)
+        with lock:
+            results["completed" if body["status"] == "done" else "failed"] += 1
+            results["job_latencies"].append(time.perf_counter() - started)
+
+
+def run_load_test(url, clients, jobs, payload):
+    results = {
+        "completed": 0,
+        "failed": 0,
+        "rejected": 0,
+        "errors": 0,
+        "submit_latencies": [],
+        "job_latencies": [],
+    }
+    lock = threading.Lock()
+    remaining = {"jobs": jobs}
+
+    def take_job():
+        with lock:
+            if remaining["jobs"] == 0:
+                return False
+            remaining["jobs"] -= 1
+            return True
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=client, args=(url, payload, take_job, results, lock))
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "jobs": jobs,
+        "completed": results["completed"],
+        "failed": results["failed"],
+        "rejected_429": results["rejected"],
+        "errors": results["errors"],
+        "elapsed_sec": round(elapsed, 3),
+        "jobs_per_sec": round(results["completed"] / elapsed, 3) if elapsed else 0.0,
+        "submit_latency_p50": round(percentile(results["submit_latencies"], 50), 4),
+        "submit_latency_p95": round(percentile(results["submit_latencies"], 95), 4),
+        "job_latency_p50": round(percentile(results["job_latencies"], 50), 4),
+        "job_latency_p95": round(percentile(results["job_latencies"], 95), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grading service load test")
+    parser.add_argument("--url", help="existing grading service; omit to start one locally")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=2, help="pages per submitted script")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--latency", default="uniform:0.2,0.6", help="stub latency distribution")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="stub 429 injection rate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    url = args.url
+    if not url:
+        url = start_local_service(
+            args.workers,
+            args.queue_size,
+            {"latency": args.latency, "rate_429": args.rate_429, "seed": args.seed},
+        )
+
+    with open(SAMPLE_PAGE, "rb") as f:
+        page = base64.b64encode(f.read()).decode("utf-8")
+    payload = {
+        "pages": list(itertools.repeat(page, args.pages)),
+        "marking_scheme": "Q1a: DevOps definition and benefits - 10 marks",
+    }
+
+    print(f"Load testing {url} with {args.clients} clients and {args.jobs} jobs...")
+    print(json.dumps(run_load_test(url, args.clients, args.jobs, payload), indent=2))
+    _, health, _ = request_json(f"{url}/health")
+    print("Service stats:", json.dumps(health))
+
+
+if __name__ == "__main__":
+    main()
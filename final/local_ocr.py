@@ -0,0 +1,382 @@
+"""
+Local Tesseract OCR with engines kept warm between pages.
+
+The legacy path (m.extract_handwritten_text) calls pytesseract, which
+writes every page to a temporary image file and starts a new tesseract
+process for it. That process loads the engine and the language model
+again for every page, and this load takes longer than recognizing a
+short page.
+
+LocalOCR instead keeps a bounded pool of tesserocr engines (the
+Tesseract C++ API, in-process). A thread checks an idle engine out for
+one page and returns it. A new engine is loaded only when every engine is
+busy and the pool is below max_engines. Otherwise the thread waits for
+one. A process therefore never holds more than max_engines warm engines,
+however many short-lived threads (e.g. a ThreadPoolExecutor per script)
+read pages through it. Pages go from the preprocessing stage to the
+engine as numpy arrays, through SetImageBytes, with no encoding and no
+temporary files.
+
+Both backends return Tesseract's word TSV (the image_to_data layout), so
+their output is turned into page text the same way:
+- words below min_confidence become [unclear], as the OCR prompts ask;
+- lines starting with a question label ("Q1a", "2)", "Question 3") open a
+  "Question Number:" block that questions.split_student_response reads.
+
+Usage:
+    python local_ocr.py ../test_files/*.jpeg ../mid2/*.jpeg
+    python local_ocr.py ../test_files/*.jpeg --compare --repeat 3
+"""
+import argparse
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from preprocessing import AdaptivePreprocessor, to_gray
+
+TESSEROCR = "tesserocr"
+PYTESSERACT = "pytesseract"
+DEFAULT_LANG = "eng"
+# Word confidence (0-100) below which a word is reported as [unclear]
+MIN_WORD_CONFIDENCE = 30
+# "Q1a", "Q 2:", "1a)", "3.", "Question 4" at the start of a line
+QUESTION_LABEL_RE = re.compile(r"^\s*(?:Q(?:uestion)?\s*)?(\d{1,2}\s*[a-z]?)\s*[.):\-]?(?:\s+|$)(.*)$", re.IGNORECASE)
+QUESTION_PREFIX_RE = re.compile(r"^\s*(?:Q(?:uestion)?\s*\d|\d{1,2}\s*[a-z]?\s*[.):])", re.IGNORECASE)
+
+
+def parse_tsv(tsv):
+    """
+    Lines of (word, confidence) from Tesseract's TSV output, with or
+    without its header row, in reading order.
+    """
+    lines = {}
+    for row in tsv.splitlines():
+        fields = row.split("\t")
+        if len(fields) < 12 or fields[0] != "5":
+            # Header, or a page/block/paragraph/line row
+            continue
+        word = fields[11].strip()
+        if not word:
+            continue
+        key = (int(fields[2]), int(fields[3]), int(fields[4]))
+        lines.setdefault(key, []).append((word, float(fields[10])))
+    return [lines[key] for key in sorted(lines)]
+
+
+def format_page(lines, min_confidence=MIN_WORD_CONFIDENCE):
+    """
+    Page text from recognized lines, in the layout the OCR prompts produce.
+    """
+    output = []
+    for line in lines:
+        text = " ".join(word if confidence >= min_confidence else "[unclear]" for word, confidence in line)
+        match = QUESTION_LABEL_RE.match(text) if QUESTION_PREFIX_RE.match(text) else None
+        if match:
+            output.append(f"Question Number: Q{match.group(1).replace(' ', '')}")
+            output.append(f"Answer: {match.group(2)}".rstrip())
+        else:
+            output.append(text)
+    return "\n".join(output)
+
+
+class TesseractEngine:
+    """
+    One in-process Tesseract engine. It is not thread-safe, so one page
+    is read at a time (see LocalOCR's pool).
+    """
+
+    def __init__(self, lang=DEFAULT_LANG, tessdata=None):
+        tesserocr = self.load_module()
+        start = time.perf_counter()
+        if tessdata:
+            self.api = tesserocr.PyTessBaseAPI(path=tessdata, lang=lang)
+        else:
+            self.api = tesserocr.PyTessBaseAPI(lang=lang)
+        self.load_seconds = time.perf_counter() - start
+
+    @staticmethod
+    def load_module():
+        """
+        Import tesserocr. Its first import installs signal handlers, which
+        only works on the main thread, so LocalOCR calls this up front.
+        """
+        try:
+            import tesserocr
+        except ImportError:
+            raise Exception("The tesserocr package is required for the local OCR engine (pip install tesserocr)")
+        return tesserocr
+
+    def recognize(self, gray):
+        """
+        Word TSV of a grayscale page array.
+        """
+        gray = np.ascontiguousarray(gray, dtype=np.uint8)
+        height, width = gray.shape
+        self.api.SetImageBytes(gray.tobytes(), width, height, 1, width)
+        try:
+            return self.api.GetTSVText(0)
+        finally:
+            # Drop this page's results; the engine and model stay loaded
+            self.api.Clear()
+
+    def close(self):
+        self.api.End()
+
+
+class PytesseractEngine:
+    """
+    The legacy path: a new tesseract process per page, via pytesseract.
+    Kept as the benchmark baseline.
+    """
+
+    def __init__(self, lang=DEFAULT_LANG, tessdata=None):
+        self.pytesseract = self.load_module()
+        self.lang = lang
+        self.config = f'--tessdata-dir "{tessdata}"' if tessdata else ""
+        self.load_seconds = 0.0
+
+    @staticmethod
+    def load_module():
+        try:
+            import pytesseract
+        except ImportError:
+            raise Exception("The pytesseract package is required for the baseline (pip install pytesseract)")
+        return pytesseract
+
+    def recognize(self, gray):
+        return self.pytesseract.image_to_data(gray, lang=self.lang, config=self.config)
+
+    def close(self):
+        pass
+
+
+ENGINES = {TESSEROCR: TesseractEngine, PYTESSERACT: PytesseractEngine}
+
+
+class LocalOCR:
+    """
+    Page OCR on a pool of at most max_engines local Tesseract engines
+    (default: one per CPU). preprocessor
+    (see preprocessing.AdaptivePreprocessor) runs in memory before
+    recognition, and geometry (see geometry.GeometryNormalizer), when
+    given, straightens photographed pages first.
+    """
+
+    def __init__(
+        self,
+        backend=TESSEROCR,
+        lang=DEFAULT_LANG,
+        tessdata=None,
+        preprocessor=None,
+        geometry=None,
+        min_confidence=MIN_WORD_CONFIDENCE,
+        max_engines=None,
+    ):
+        if backend not in ENGINES:
+            raise ValueError(f"Unknown OCR backend '{backend}'")
+        ENGINES[backend].load_module()
+        self.backend = backend
+        self.lang = lang
+        self.tessdata = tessdata
+        self.preprocessor = preprocessor or AdaptivePreprocessor()
+        self.geometry = geometry
+        self.min_confidence = min_confidence
+        self.max_engines = max_engines or os.cpu_count() or 1
+        # Engines not reading a page right now
+        self.idle = queue.LifoQueue()
+        self.engines = []
+        self.lock = threading.Lock()
+        self.stats = {"pages": 0, "engines": 0, "engine_load_seconds": 0.0, "preprocess_seconds": 0.0, "ocr_seconds": 0.0}
+
+    @contextmanager
+    def engine(self):
+        """
+        Check an engine out of the pool for one page: an idle one, a new
+        one while the pool has room, or else the next one returned.
+        """
+        try:
+            engine = self.idle.get_nowait()
+        except queue.Empty:
+            engine = None
+            with self.lock:
+                load = len(self.engines) < self.max_engines
+                if load:
+                    # Reserve the slot before the slow load
+                    self.engines.append(None)
+            if load:
+                try:
+                    engine = ENGINES[self.backend](self.lang, self.tessdata)
+                except Exception:
+                    with self.lock:
+                        self.engines.remove(None)
+                    raise
+                with self.lock:
+                    self.engines[self.engines.index(None)] = engine
+                    self.stats["engines"] += 1
+                    self.stats["engine_load_seconds"] += engine.load_seconds
+            else:
+                engine = self.idle.get()
+        try:
+            yield engine
+        finally:
+            self.idle.put(engine)
+
+    def prepare(self, image, label=None):
+        """
+        The grayscale array the engine reads, from a decoded page image.
+        """
+        if self.geometry is not None:
+            image, _ = self.geometry.normalize(image)
+        if self.preprocessor is not None:
+            image, _ = self.preprocessor.process(image, label=label)
+        return to_gray(image)
+
+    def read_lines(self, image, label=None):
+        """
+        Recognized lines of (word, confidence) of a page image array.
+        """
+        start = time.perf_counter()
+        gray = self.prepare(image, label)
+        prepare_seconds = time.perf_counter() - start
+        with self.engine() as engine:
+            # Engine time only, not the wait for a free engine
+            start = time.perf_counter()
+            tsv = engine.recognize(gray)
+            ocr_seconds = time.perf_counter() - start
+        lines = parse_tsv(tsv)
+        with self.lock:
+            self.stats["pages"] += 1
+            self.stats["preprocess_seconds"] += prepare_seconds
+            self.stats["ocr_seconds"] += ocr_seconds
+        return lines
+
+    def recognize(self, image, label=None):
+        """
+        Page text of a page image array, in the OCR prompts' layout.
+        """
+        return format_page(self.read_lines(image, label), self.min_confidence)
+
+    def report(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["backend"] = self.backend
+        stats["pages_per_second"] = round(stats["pages"] / stats["ocr_seconds"], 2) if stats["ocr_seconds"] else None
+        for key in ("engine_load_seconds", "preprocess_seconds", "ocr_seconds"):
+            stats[key] = round(stats[key], 3)
+        return stats
+
+    def close(self):
+        """
+        Unload every engine. Call once no page is being read.
+        """
+        with self.lock:
+            engines, self.engines = [engine for engine in self.engines if engine is not None], []
+            self.idle = queue.LifoQueue()
+        for engine in engines:
+            engine.close()
+
+
+def time_backend(backend, pages, repeat=1, lang=DEFAULT_LANG, tessdata=None, cold=False):
+    """
+    Recognize already preprocessed pages with a backend. The first page
+    is timed on its own: it includes loading the engine. With cold, a new
+    engine is loaded for every page, which is the model load a tesseract
+    process per page pays, without the process and file overhead.
+    """
+    texts = []
+    load_seconds = 0.0
+    first_page_seconds = None
+    start = time.perf_counter()
+    engine = None
+    try:
+        for _ in range(repeat):
+            for gray in pages:
+                if engine is None or cold:
+                    if engine is not None:
+                        engine.close()
+                    engine = ENGINES[backend](lang, tessdata)
+                    load_seconds += engine.load_seconds
+                texts.append(format_page(parse_tsv(engine.recognize(gray))))
+                if first_page_seconds is None:
+                    first_page_seconds = time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+    finally:
+        if engine is not None:
+            engine.close()
+    count = len(pages) * repeat
+    return {
+        "backend": backend + (" (engine per page)" if cold else ""),
+        "pages": count,
+        "engine_load_seconds": round(load_seconds, 3),
+        "first_page_seconds": round(first_page_seconds or 0.0, 3),
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(count / elapsed, 2) if elapsed else None,
+    }, texts[: len(pages)]
+
+
+def run_comparison(paths, repeat=1, lang=DEFAULT_LANG, tessdata=None):
+    """
+    Pages per second of the warm tesserocr engine against a pytesseract
+    process per page, and against tesserocr loading an engine per page,
+    on the same preprocessed page arrays.
+    """
+    import cv2
+
+    preprocessor = AdaptivePreprocessor()
+    pages = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            raise Exception(f"File not found: {path}")
+        pages.append(to_gray(preprocessor.process(image, label=path)[0]))
+
+    results = {}
+    texts = {}
+    for name, backend, cold in (
+        (PYTESSERACT, PYTESSERACT, False),
+        ("tesserocr_cold", TESSEROCR, True),
+        (TESSEROCR, TESSEROCR, False),
+    ):
+        try:
+            results[name], texts[name] = time_backend(backend, pages, repeat, lang, tessdata, cold)
+        except Exception as e:
+            results[name] = {"backend": backend, "error": str(e)}
+    warm = results[TESSEROCR].get("pages_per_second")
+    for name in (PYTESSERACT, "tesserocr_cold"):
+        if warm and results[name].get("pages_per_second"):
+            results[name]["warm_speedup"] = round(warm / results[name]["pages_per_second"], 2)
+            # The same engine reads the same arrays; the texts should agree
+            results[name]["identical_pages"] = sum(a == b for a, b in zip(texts[name], texts[TESSEROCR]))
+    return results
+
+
+if __name__ == "__main__":
+    import json
+
+    import cv2
+
+    parser = argparse.ArgumentParser(description="Local Tesseract OCR with warm engines")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--backend", choices=sorted(ENGINES), default=TESSEROCR)
+    parser.add_argument("--lang", default=DEFAULT_LANG)
+    parser.add_argument("--tessdata", help="tessdata directory, when not the system default")
+    parser.add_argument("--compare", action="store_true", help="benchmark tesserocr against pytesseract")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the pages (--compare)")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(json.dumps(run_comparison(args.images, args.repeat, args.lang, args.tessdata), indent=2))
+    else:
+        ocr = LocalOCR(args.backend, lang=args.lang, tessdata=args.tessdata)
+        for path in args.images:
+            image = cv2.imread(path)
+            if image is None:
+                raise Exception(f"File not found: {path}")
+            print(f"--- {path}\n{ocr.recognize(image, label=path)}")
+        print(json.dumps(ocr.report(), indent=2))
+        ocr.close()
@@ -0,0 +1,277 @@
+"""
+Cached, batched text normalization shared by the similarity scorers.
+
+Produces the same output as preprocess_text in grading_semantics_sbert.ipynb
+(lowercase, keep letters only, tokenize, drop stopwords, lemmatize) but:
+- the regex is compiled once, and since only letters and whitespace survive
+  it, a whitespace split gives the same tokens as word_tokenize (apart from
+  the few contractions it splits, handled in WORD_TOKENIZE_SPLITS);
+- lemmas are memoized per token in an LRU cache, and whole answers in
+  another, since a cohort repeats the same vocabulary and often the same
+  answers;
+- normalize_batch processes a list of answers in one call, normalizing
+  each distinct answer once.
+
+Each answer becomes a NormalizedText that the scorers below consume
+directly: TF-IDF gets the token lists, Jaccard the token set, BLEU the
+token list and ROUGE the space-joined tokens. No scorer tokenizes again.
+
+Usage:
+    python normalization.py --benchmark --answers 20000
+"""
+import argparse
+import random
+import re
+import time
+from functools import lru_cache
+
+NON_LETTERS_RE = re.compile(r"[^a-z\s]")
+# Words word_tokenize splits even without punctuation (MacIntyre contractions)
+WORD_TOKENIZE_SPLITS = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+    "whaddya": ("whad", "dd", "ya"),
+    "whatcha": ("wha", "t", "cha"),
+}
+DEFAULT_TOKEN_CACHE = 65536
+DEFAULT_TEXT_CACHE = 16384
+
+
+def load_nltk_resources():
+    """
+    Return (stopwords, lemmatizer), downloading the NLTK data on first use.
+    """
+    import nltk
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+
+    try:
+        stop_words = set(stopwords.words("english"))
+    except LookupError:
+        nltk.download("stopwords", quiet=True)
+        stop_words = set(stopwords.words("english"))
+    lemmatizer = WordNetLemmatizer()
+    try:
+        lemmatizer.lemmatize("tests")
+    except LookupError:
+        nltk.download("wordnet", quiet=True)
+    return stop_words, lemmatizer
+
+
+class NormalizedText:
+    """
+    One normalized answer: the token tuple plus the derived forms the
+    scorers need, computed on first use.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self._text = None
+        self._token_set = None
+
+    @property
+    def text(self):
+        """
+        Space-joined tokens, identical to the notebook's preprocess_text output.
+        """
+        if self._text is None:
+            self._text = " ".join(self.tokens)
+        return self._text
+
+    @property
+    def token_set(self):
+        if self._token_set is None:
+            self._token_set = frozenset(self.tokens)
+        return self._token_set
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __repr__(self):
+        return f"NormalizedText({self.text[:40]!r})"
+
+
+class TextNormalizer:
+    def __init__(
+        self,
+        remove_stopwords=True,
+        lemmatize=True,
+        token_cache_size=DEFAULT_TOKEN_CACHE,
+        text_cache_size=DEFAULT_TEXT_CACHE,
+        stop_words=None,
+        lemmatizer=None,
+    ):
+        """
+        stop_words and lemmatizer default to NLTK's English stopwords and
+        WordNetLemmatizer; pass them in to share one set between normalizers
+        or to substitute another lemmatizer.
+        """
+        if (remove_stopwords and stop_words is None) or (lemmatize and lemmatizer is None):
+            default_stop_words, default_lemmatizer = load_nltk_resources()
+            stop_words = default_stop_words if stop_words is None else stop_words
+            lemmatizer = default_lemmatizer if lemmatizer is None else lemmatizer
+        self.stop_words = frozenset(stop_words) if remove_stopwords else frozenset()
+        self.lemmatizer = lemmatizer if lemmatize else None
+        self.lemma = lru_cache(maxsize=token_cache_size)(self._lemma)
+        self.normalize = lru_cache(maxsize=text_cache_size)(self._normalize)
+
+    def _lemma(self, token):
+        return self.lemmatizer.lemmatize(token)
+
+    def _normalize(self, text):
+        """
+        Normalize one answer into a NormalizedText (memoized per text).
+        """
+        tokens = NON_LETTERS_RE.sub("", text.lower()).split()
+        if not WORD_TOKENIZE_SPLITS.keys().isdisjoint(tokens):
+            tokens = [part for token in tokens for part in WORD_TOKENIZE_SPLITS.get(token, (token,))]
+        stop_words = self.stop_words
+        if self.lemmatizer is None:
+            return NormalizedText(tuple(token for token in tokens if token not in stop_words))
+        lemma = self.lemma
+        return NormalizedText(tuple(lemma(token) for token in tokens if token not in stop_words))
+
+    def normalize_batch(self, texts):
+        """
+        Normalize a list of answers, returning NormalizedTexts in the same
+        order. Duplicate answers share one NormalizedText.
+        """
+        seen = {}
+        results = []
+        for text in texts:
+            normalized = seen.get(text)
+            if normalized is None:
+                normalized = seen[text] = self.normalize(text)
+            results.append(normalized)
+        return results
+
+    def cache_info(self):
+        return {"tokens": self.lemma.cache_info()._asdict(), "texts": self.normalize.cache_info()._asdict()}
+
+
+# Scorers over normalized text
+
+def jaccard_similarity(first, second):
+    union = first.token_set | second.token_set
+    return len(first.token_set & second.token_set) / len(union) if union else 1.0
+
+
+def bleu_similarity(reference, candidate):
+    from nltk.translate.bleu_score import sentence_bleu
+
+    return sentence_bleu([list(reference.tokens)], list(candidate.tokens))
+
+
+class PretokenizedTokenizer:
+    """
+    rouge_score tokenizer for already normalized text: splits on the
+    spaces NormalizedText.text joins tokens with.
+    """
+
+    def tokenize(self, text):
+        return text.split()
+
+
+def rouge_similarity(reference, candidate, rouge_types=("rouge1", "rouge2", "rougeL")):
+    from rouge_score import rouge_scorer
+
+    scorer = rouge_scorer.RougeScorer(list(rouge_types), tokenizer=PretokenizedTokenizer())
+    return scorer.score(reference.text, candidate.text)
+
+
+def tfidf_similarities(references, candidates):
+    """
+    TF-IDF cosine similarity of each candidate with the reference at the
+    same position, fitting one vectorizer over the whole batch.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.preprocessing import normalize
+
+    vectorizer = TfidfVectorizer(analyzer=lambda tokens: tokens)
+    matrix = vectorizer.fit_transform([item.tokens for item in references] + [item.tokens for item in candidates])
+    matrix = normalize(matrix)
+    count = len(references)
+    return matrix[:count].multiply(matrix[count:]).sum(axis=1).A1.tolist()
+
+
+# Benchmark
+
+def preprocess_text(text, stop_words, lemmatizer):
+    """
+    The notebook's per-string preprocess_text, kept as the benchmark baseline.
+    """
+    from nltk.tokenize import word_tokenize
+
+    text = text.lower()
+    text = re.sub(r"[^a-zA-Z\s]", "", text)
+    tokens = word_tokenize(text)
+    tokens = [token for token in tokens if token not in stop_words]
+    return " ".join([lemmatizer.lemmatize(token) for token in tokens])
+
+
+def synthetic_cohort(answers, distinct=0.3, seed=0):
+    """
+    Generate answers in which only a fraction are distinct, as in a cohort
+    copying lecture notes.
+    """
+    rng = random.Random(seed)
+    sentences = [
+        "DevOps refers to a mindset of software teams delivering products through integration and collaboration.",
+        "Continuous testing and deployment of features helps identify and resolve problems early.",
+        "Automated testing at each step ensures the quality of code is reliable.",
+        "Manual tasks of building and deployment are automated, increasing team efficiency.",
+        "Monitoring team and user responses improves the experience through continuous feedback.",
+        "Development and operations teams work together, breaking the practice of silos.",
+    ]
+    pool = [
+        " ".join(rng.sample(sentences, rng.randint(2, len(sentences))))
+        for _ in range(max(1, int(answers * distinct)))
+    ]
+    return [rng.choice(pool) for _ in range(answers)]
+
+
+def run_benchmark(answers, distinct):
+    stop_words, lemmatizer = load_nltk_resources()
+    texts = synthetic_cohort(answers, distinct)
+
+    start = time.perf_counter()
+    baseline = [preprocess_text(text, stop_words, lemmatizer) for text in texts]
+    baseline_elapsed = time.perf_counter() - start
+
+    normalizer = TextNormalizer(stop_words=stop_words, lemmatizer=lemmatizer)
+    start = time.perf_counter()
+    batch = normalizer.normalize_batch(texts)
+    batch_elapsed = time.perf_counter() - start
+
+    mismatches = sum(1 for expected, item in zip(baseline, batch) if expected != item.text)
+    return {
+        "answers": answers,
+        "distinct_answers": len(set(texts)),
+        "baseline_answers_per_sec": round(answers / baseline_elapsed, 1),
+        "batch_answers_per_sec": round(answers / batch_elapsed, 1),
+        "speedup": round(baseline_elapsed / batch_elapsed, 1),
+        "mismatches": mismatches,
+        "cache": normalizer.cache_info(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Text normalization for similarity scoring")
+    parser.add_argument("--benchmark", action="store_true", help="compare with the notebook's preprocess_text")
+    parser.add_argument("--answers", type=int, default=20000)
+    parser.add_argument("--distinct", type=float, default=0.3, help="fraction of distinct answers")
+    parser.add_argument("text", nargs="*", help="text to normalize")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        import json
+
+        print(json.dumps(run_benchmark(args.answers, args.distinct), indent=2))
+    else:
+        normalizer = TextNormalizer()
+        for item in normalizer.normalize_batch(args.text):
+            print(item.text)
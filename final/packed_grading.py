@@ -0,0 +1,260 @@
+"""
+Grade many students' short answers to one question in a single request.
+
+For one-line definitional questions the per-call overhead (rubric text,
+instructions, round trip) dwarfs the answer itself. AnswerPacker puts up
+to batch_size answers to the same rubric question into one grade_packed
+request, each tagged [A1], [A2], ..., and reads one
+"A1: Correct - Awarded Marks: X" line per tag back out. The rubric is then
+paid for once per batch instead of once per student.
+
+Answers a reply left out are packed again. A reply that repeats tags,
+grades tags that were never sent or does not parse at all is discarded
+and its batch split in half and retried, down to single answers, which
+are graded with the regular AssessmentTool.assess_question call.
+
+Usage:
+    python packed_grading.py --db grading.db --job mid2 --question 2 --stub
+    python packed_grading.py --marking-scheme ../mid2/solution.docx --question 2 \\
+        --answers answers.json --base-url http://127.0.0.1:8765
+"""
+import argparse
+import json
+import re
+import threading
+
+from prompts import REGISTRY, estimate_tokens
+from questions import rubric_for_question
+
+DEFAULT_BATCH_SIZE = 10
+# Answers longer than this are graded on their own
+SHORT_ANSWER_TOKENS = 120
+# Answer text per request, so a batch leaves room for the reply
+MAX_BATCH_TOKENS = 1500
+
+# "A3: Correct - Awarded Marks: 2"
+PACKED_GRADE_RE = re.compile(
+    r"^\W*A(\d+)\W*:\s*(.*?Awarded Marks\s*\**\s*:\s*\**\s*(\d+(?:\.\d+)?).*?)\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def tag(number):
+    return f"A{number}"
+
+
+def format_answers(answers):
+    """
+    Tag each answer and keep it on one line, so a tag always starts a line.
+    """
+    return "\n".join(f"[{tag(number)}] {' '.join(answer.split())}" for number, answer in enumerate(answers, start=1))
+
+
+def parse_packed_grades(text, count):
+    """
+    Parse a packed reply into {answer number: (marks, verdict)}. A reply
+    that is cut short yields the grades it has. A reply that repeats a tag
+    or grades one that was never sent has lost track of the answers, so
+    none of its grades can be attributed and None is returned.
+    """
+    grades = {}
+    for match in PACKED_GRADE_RE.finditer(text or ""):
+        number = int(match.group(1))
+        if not 1 <= number <= count or number in grades:
+            return None
+        grades[number] = (float(match.group(3)), match.group(2))
+    return grades
+
+
+def grade_line(question_id, verdict):
+    """
+    Rewrite a packed verdict as the single-question grading output, so it
+    parses with questions.parse_awarded_marks like any other grade.
+    """
+    return f"Question {question_id}: {verdict}"
+
+
+class AnswerPacker:
+    """
+    Batch short answers to a question into grade_packed requests.
+    """
+
+    def __init__(
+        self,
+        assessment_tool,
+        batch_size=DEFAULT_BATCH_SIZE,
+        short_answer_tokens=SHORT_ANSWER_TOKENS,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        template="grade_packed",
+    ):
+        self.assessment_tool = assessment_tool
+        self.batch_size = batch_size
+        self.short_answer_tokens = short_answer_tokens
+        self.max_batch_tokens = max_batch_tokens
+        self.template = REGISTRY.get(template)
+        self.lock = threading.Lock()
+        self.stats = {"answers": 0, "packed_calls": 0, "single_calls": 0, "retries": 0, "cached": 0, "failed": 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def is_short(self, answer):
+        return estimate_tokens(answer) <= self.short_answer_tokens
+
+    def batches(self, indices, answers):
+        """
+        Group answer indices into batches within the size and token budgets.
+        """
+        batches, batch, tokens = [], [], 0
+        for index in indices:
+            needed = estimate_tokens(answers[index])
+            if batch and (len(batch) >= self.batch_size or tokens + needed > self.max_batch_tokens):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(index)
+            tokens += needed
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def grade(self, question_id, marking_scheme, answers):
+        """
+        Grade answers (a list of texts) to one question. Returns one entry
+        per answer, in order: its grading output, in the format
+        assess_question returns, or the exception grading it failed with.
+        """
+        results = [None] * len(answers)
+        self.count("answers", len(answers))
+        rubric_text = rubric_for_question(marking_scheme, question_id)
+        model_name = self.assessment_tool.ocr_analyzer.model_name
+        grade_cache = self.assessment_tool.grade_cache
+
+        pending = []
+        for index, answer in enumerate(answers):
+            if not self.is_short(answer):
+                results[index] = self.grade_single(question_id, marking_scheme, answer)
+                continue
+            if grade_cache is not None:
+                cached = grade_cache.get(question_id, rubric_text, answer, model_name, self.template.template_id)
+                if cached is not None:
+                    self.count("cached")
+                    results[index] = cached
+                    continue
+            pending.append(index)
+
+        for batch in self.batches(pending, answers):
+            self.grade_batch(question_id, marking_scheme, rubric_text, answers, batch, results)
+        return results
+
+    def grade_single(self, question_id, marking_scheme, answer):
+        self.count("single_calls")
+        try:
+            return self.assessment_tool.assess_question(question_id, marking_scheme, answer)
+        except Exception as e:
+            self.count("failed")
+            return e
+
+    def grade_batch(self, question_id, marking_scheme, rubric_text, answers, batch, results):
+        """
+        Grade one batch into results, splitting it and retrying the halves
+        for every answer the reply did not grade unambiguously.
+        """
+        if len(batch) == 1:
+            index = batch[0]
+            results[index] = self.grade_single(question_id, marking_scheme, answers[index])
+            return
+
+        prompt = self.template.render(
+            question_id=question_id,
+            marking_scheme=rubric_text,
+            answers=format_answers([answers[index] for index in batch]),
+        )
+        self.count("packed_calls")
+        try:
+            reply = self.assessment_tool.ocr_analyzer.perform_ocr(prompt=prompt, template=self.template.template_id)
+            grades = parse_packed_grades(reply.content, len(batch)) or {}
+        except Exception:
+            grades = {}
+
+        missing = []
+        for number, index in enumerate(batch, start=1):
+            if number not in grades:
+                missing.append(index)
+                continue
+            result = grade_line(question_id, grades[number][1])
+            results[index] = result
+            if self.assessment_tool.grade_cache is not None:
+                self.assessment_tool.grade_cache.put(
+                    question_id,
+                    rubric_text,
+                    answers[index],
+                    self.assessment_tool.ocr_analyzer.model_name,
+                    self.template.template_id,
+                    result,
+                )
+        if not missing:
+            return
+
+        self.count("retries")
+        if len(missing) == len(batch):
+            # Nothing usable came back: halve the batch
+            middle = len(missing) // 2
+            halves = [missing[:middle], missing[middle:]]
+        else:
+            halves = [missing]
+        for half in halves:
+            self.grade_batch(question_id, marking_scheme, rubric_text, answers, half, results)
+
+    def report(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["calls"] = stats["packed_calls"] + stats["single_calls"]
+        stats["calls_saved"] = stats["answers"] - stats["cached"] - stats["calls"]
+        return stats
+
+
+def main():
+    from assessment_tool import ImageOCRAnalyzer, AssessmentTool
+    from job_store import JobStore
+    from stub_server import StubServer
+
+    parser = argparse.ArgumentParser(description="Grade many answers to one question per request")
+    parser.add_argument("--question", required=True, help="question id, e.g. 2 or 1a")
+    parser.add_argument("--db", help="job store to read the answers and marking scheme from")
+    parser.add_argument("--job", help="job id in --db")
+    parser.add_argument("--marking-scheme", help="marking scheme .docx or image, when not using --db")
+    parser.add_argument("--answers", help="JSON file of {student_id: answer}, when not using --db")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--base-url", help="Groq/OpenAI-compatible endpoint")
+    parser.add_argument("--stub", action="store_true", help="start an in-process stand-in server")
+    args = parser.parse_args()
+
+    server = StubServer().start() if args.stub else None
+    try:
+        ocr_analyzer = ImageOCRAnalyzer(base_url=server.base_url if server else args.base_url)
+        assessment_tool = AssessmentTool(ocr_analyzer)
+        if args.db:
+            job_store = JobStore(args.db)
+            marking_scheme = job_store.marking_scheme(args.job)
+            answers = job_store.ungraded_answers(args.job).get(args.question, {})
+        else:
+            if not (args.marking_scheme and args.answers):
+                parser.error("pass --db and --job, or --marking-scheme and --answers")
+            marking_scheme = assessment_tool.extract_marking_scheme(args.marking_scheme)
+            with open(args.answers, "r", encoding="utf-8") as f:
+                answers = json.load(f)
+
+        packer = AnswerPacker(assessment_tool, batch_size=args.batch_size)
+        results = packer.grade(args.question, marking_scheme, list(answers.values()))
+        for student_id, result in zip(answers, results):
+            print(f"{student_id}: {result}")
+    finally:
+        if server:
+            server.stop()
+
+    print(json.dumps({"grading": packer.report(), "usage": ocr_analyzer.usage.report()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
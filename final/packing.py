@@ -0,0 +1,460 @@
+"""
+Pack small answer regions from several pages into one vision request.
+
+Short-answer pages often hold a few lines of writing, yet each one costs a
+full perform_ocr round trip carrying its own copy of the OCR prompt. The
+packer instead:
+1. finds each page's answer region (its ink, ignoring ruled lines and the
+   photo border) and estimates how many lines of text it holds;
+2. crops it and scales it down only as far as its handwriting stays
+   MIN_TEXT_HEIGHT pixels tall;
+3. tiles the regions that are small enough onto mosaics, framed and
+   labelled R1, R2, ..., within a size budget (the model's effective
+   resolution) and a completion-token budget;
+4. sends one ocr_packed request per mosaic and splits the reply back into
+   one transcription per page. Regions missing from the reply, and pages
+   too large to pack, are OCR'd on their own as before.
+
+Usage:
+    python packing.py --stub
+    python packing.py --base-url http://127.0.0.1:8765 --references refs.json --output packing.json
+    python packing.py --cassette packing.cassette.json --cassette-mode auto --mosaic-dir ./mosaics
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from page_store import is_page_ref
+from preprocessing import to_gray
+from prompts import REGISTRY
+
+# Llama 3.2 Vision sees at most 2x2 tiles of 560px, so larger mosaics are
+# only downscaled by the provider
+MAX_MOSAIC_SIDE = 1120
+MAX_REGIONS = 6
+MAX_COMPLETION_TOKENS = 1200
+# A region is packed only when its scaled crop stays below these
+MAX_REGION_PIXELS = 400_000
+MAX_REGION_LINES = 30
+# Height of a line of writing, in pixels, that the model still reads reliably
+MIN_TEXT_HEIGHT = 20
+TOKENS_PER_LINE = 14
+LABEL_HEIGHT = 32
+GUTTER = 16
+# Photo borders (shadows, desk edges) are not part of the answer
+BORDER_FRACTION = 0.02
+REGION_MARGIN = 12
+
+REGION_HEADER_RE = re.compile(r"^\W*R(\d+)\W*$", re.MULTILINE)
+
+
+def label(number):
+    return f"R{number}"
+
+
+def find_region(image):
+    """
+    Bounding box (x, y, w, h) of the writing on a page, the number of text
+    lines in it and their median height, or None for a blank page. Ruled
+    lines are removed before measuring so they neither widen the box nor
+    count as text.
+    """
+    gray = to_gray(image)
+    height, width = gray.shape
+    ink = cv2.adaptiveThreshold(
+        cv2.GaussianBlur(gray, (3, 3), 0), 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15
+    )
+    rules = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(width // 8, 1), 1)))
+    ink = cv2.morphologyEx(cv2.subtract(ink, rules), cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    border = int(BORDER_FRACTION * max(height, width))
+    if border:
+        ink[:border], ink[-border:], ink[:, :border], ink[:, -border:] = 0, 0, 0, 0
+
+    ys, xs = np.nonzero(ink)
+    if len(xs) == 0:
+        return None
+    # Percentiles rather than extremes, so a stray speck does not stretch the box
+    x0, x1 = np.percentile(xs, [0.5, 99.5]).astype(int)
+    y0, y1 = np.percentile(ys, [0.5, 99.5]).astype(int)
+    x0, y0 = max(x0 - REGION_MARGIN, 0), max(y0 - REGION_MARGIN, 0)
+    x1, y1 = min(x1 + REGION_MARGIN, width - 1), min(y1 + REGION_MARGIN, height - 1)
+
+    # Text lines are runs of rows with ink across a meaningful share of the width
+    rows = (ink[y0 : y1 + 1, x0 : x1 + 1] > 0).sum(axis=1) > max(3, 0.02 * (x1 - x0))
+    edges = np.diff(np.concatenate([[0], rows.astype(np.int8), [0]]))
+    heights = np.nonzero(edges == -1)[0] - np.nonzero(edges == 1)[0]
+    heights = heights[heights >= 3]
+    if len(heights) == 0:
+        return None
+    return {
+        "box": (int(x0), int(y0), int(x1 - x0 + 1), int(y1 - y0 + 1)),
+        "lines": int(len(heights)),
+        "text_height": float(np.median(heights)),
+    }
+
+
+def make_tile(image, region):
+    """
+    Crop a page to its region, scaled down while its text stays at least
+    MIN_TEXT_HEIGHT pixels tall.
+    """
+    x, y, w, h = region["box"]
+    crop = image[y : y + h, x : x + w]
+    scale = min(1.0, MIN_TEXT_HEIGHT / region["text_height"])
+    if scale < 1.0:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(crop)
+
+
+def shelf_pack(sizes, max_side=MAX_MOSAIC_SIDE):
+    """
+    Place (w, h) cells left to right on shelves, tallest first, on a canvas
+    at most max_side wide and high. Returns (placements, leftover) where
+    placements maps each placed index to its (x, y) and leftover lists the
+    indices that did not fit, in their original order.
+    """
+    placements = {}
+    leftover = []
+    x = y = shelf_height = 0
+    for index in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[index]
+        if w > max_side or h > max_side:
+            leftover.append(index)
+            continue
+        if x + w > max_side:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + h > max_side:
+            leftover.append(index)
+            continue
+        placements[index] = (x, y)
+        x += w
+        shelf_height = max(shelf_height, h)
+    return placements, sorted(leftover)
+
+
+def render_mosaic(tiles, placements):
+    """
+    Draw the placed tiles on a white canvas, each framed and labelled with
+    its position in placement order. Returns (mosaic, labels) where labels
+    lists the tile index of R1, R2, ...
+    """
+    order = sorted(placements, key=lambda i: (placements[i][1], placements[i][0]))
+    width = max(placements[i][0] + tiles[i].shape[1] + 2 * GUTTER for i in order)
+    height = max(placements[i][1] + tiles[i].shape[0] + LABEL_HEIGHT + 2 * GUTTER for i in order)
+    mosaic = np.full((height, width, 3), 255, dtype=np.uint8)
+    for number, index in enumerate(order, start=1):
+        tile = tiles[index]
+        if tile.ndim == 2:
+            tile = cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR)
+        x, y = placements[index]
+        left, top = x + GUTTER, y + GUTTER + LABEL_HEIGHT
+        mosaic[top : top + tile.shape[0], left : left + tile.shape[1]] = tile
+        cv2.rectangle(mosaic, (left - 2, top - 2), (left + tile.shape[1] + 1, top + tile.shape[0] + 1), (0, 0, 0), 2)
+        cv2.putText(
+            mosaic, label(number), (left, top - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2, cv2.LINE_AA
+        )
+    return mosaic, order
+
+
+def split_response(text, count):
+    """
+    Split a packed reply into {region number: transcription}. Regions the
+    model skipped or left empty are absent.
+    """
+    headers = list(REGION_HEADER_RE.finditer(text))
+    parts = {}
+    for position, header in enumerate(headers):
+        number = int(header.group(1))
+        end = headers[position + 1].start() if position + 1 < len(headers) else len(text)
+        body = text[header.end() : end].strip()
+        if 1 <= number <= count and body and number not in parts:
+            parts[number] = body
+    return parts
+
+
+class RegionPacker:
+    """
+    OCR a list of pages with as few vision calls as the budgets allow.
+    Pass one to AssessmentTool(packer=...) to use it for every script.
+    """
+
+    def __init__(
+        self,
+        max_side=MAX_MOSAIC_SIDE,
+        max_regions=MAX_REGIONS,
+        max_completion_tokens=MAX_COMPLETION_TOKENS,
+        max_region_pixels=MAX_REGION_PIXELS,
+        template="ocr_packed",
+        mosaic_dir=None,
+    ):
+        """
+        mosaic_dir, when set, receives every mosaic sent, for inspection.
+        """
+        self.max_side = max_side
+        self.max_regions = max_regions
+        self.max_completion_tokens = max_completion_tokens
+        self.max_region_pixels = max_region_pixels
+        self.template = REGISTRY.get(template)
+        self.mosaic_dir = mosaic_dir
+        self.lock = threading.Lock()
+        self.metrics = {"pages": 0, "packed_pages": 0, "mosaics": 0, "single_calls": 0, "fallbacks": 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.metrics[name] += amount
+
+    def report(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        metrics["calls"] = metrics["mosaics"] + metrics["single_calls"] + metrics["fallbacks"]
+        metrics["calls_saved"] = metrics["pages"] - metrics["calls"]
+        return metrics
+
+    def packable(self, tile, region):
+        return (
+            tile.shape[0] * tile.shape[1] <= self.max_region_pixels
+            and region["lines"] <= MAX_REGION_LINES
+            and max(tile.shape[:2]) + LABEL_HEIGHT + 2 * GUTTER <= self.max_side
+        )
+
+    def plan(self, tiles, regions):
+        """
+        Group packable tiles into mosaics within the size, region and token
+        budgets. Returns a list of tile index lists.
+        """
+        cells = {i: (tile.shape[1] + 2 * GUTTER, tile.shape[0] + LABEL_HEIGHT + 2 * GUTTER) for i, tile in tiles.items()}
+        remaining = sorted(tiles)
+        groups = []
+        while remaining:
+            group, tokens = [], 0
+            for index in remaining:
+                needed = regions[index]["lines"] * TOKENS_PER_LINE
+                if len(group) < self.max_regions and tokens + needed <= self.max_completion_tokens:
+                    group.append(index)
+                    tokens += needed
+            placements, leftover = shelf_pack([cells[i] for i in group], self.max_side)
+            # Shrink the group until every cell fits on the canvas
+            while leftover and len(group) > 1:
+                group = [index for position, index in enumerate(group) if position not in leftover] or group[:1]
+                placements, leftover = shelf_pack([cells[i] for i in group], self.max_side)
+            groups.append(group)
+            remaining = [index for index in remaining if index not in group]
+        return groups
+
+    def extract(self, assessment_tool, pages, on_page=None):
+        """
+        Transcribe pages (paths, page store references, encoded bytes or
+        arrays). Returns one entry per page, in order: its OCR text, or the
+        exception that page failed with.
+        """
+        analyzer = assessment_tool.ocr_analyzer
+        results = [None] * len(pages)
+        pages_done = 0
+
+        def done(index, result):
+            nonlocal pages_done
+            results[index] = result
+            pages_done += 1
+            if on_page:
+                on_page(pages_done, len(pages))
+
+        def single(index):
+            try:
+                done(index, assessment_tool.extract_page_response(pages[index]))
+            except Exception as e:
+                done(index, e)
+
+        tiles, regions = {}, {}
+        for index, page in enumerate(pages):
+            self.count("pages")
+            try:
+                image = page if isinstance(page, np.ndarray) else analyzer.load_image(page)
+                # Stored pages were normalized when they were added
+                geometry = getattr(analyzer, "geometry", None)
+                if geometry is not None and not is_page_ref(page):
+                    image, _ = geometry.normalize(image)
+                region = find_region(image)
+            except Exception:
+                region = None
+            if region is None:
+                continue
+            tile = make_tile(image, region)
+            if self.packable(tile, region):
+                tiles[index], regions[index] = tile, region
+
+        groups = self.plan(tiles, regions) if len(tiles) > 1 else []
+        packed = set()
+        for group in groups:
+            if len(group) < 2:
+                continue
+            packed.update(group)
+            self.count("mosaics")
+            self.count("packed_pages", len(group))
+            for index, text in self.ocr_group(analyzer, group, tiles).items():
+                if text is None:
+                    self.count("fallbacks")
+                    single(index)
+                else:
+                    done(index, text)
+
+        for index in range(len(pages)):
+            if index not in packed:
+                self.count("single_calls")
+                single(index)
+        return results
+
+    def ocr_group(self, analyzer, group, tiles):
+        """
+        Send one mosaic of the group's tiles. Returns {page index: text, or
+        None when the reply has no transcription for it}.
+        """
+        placements, _ = shelf_pack(
+            [(tiles[i].shape[1] + 2 * GUTTER, tiles[i].shape[0] + LABEL_HEIGHT + 2 * GUTTER) for i in group],
+            self.max_side,
+        )
+        mosaic, order = render_mosaic([tiles[i] for i in group], placements)
+        labels = [group[position] for position in order]
+        if self.mosaic_dir:
+            os.makedirs(self.mosaic_dir, exist_ok=True)
+            name = "mosaic_" + "_".join(str(index + 1) for index in labels) + ".jpg"
+            cv2.imwrite(os.path.join(self.mosaic_dir, name), mosaic)
+
+        ok, encoded = cv2.imencode(".jpg", mosaic, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not ok:
+            return {index: None for index in group}
+        prompt = self.template.render(labels=", ".join(label(n) for n in range(1, len(labels) + 1)))
+        try:
+            result = analyzer.perform_ocr(
+                image_base64=base64.b64encode(encoded.tobytes()).decode("utf-8"),
+                prompt=prompt,
+                template=self.template.template_id,
+            )
+            parts = split_response(result.content or "", len(labels))
+        except Exception:
+            parts = {}
+        return {index: parts.get(number) for number, index in enumerate(labels, start=1)}
+
+
+def run_comparison(ocr_analyzer, samples, packer, references=None):
+    """
+    OCR the samples one page per call and then packed, and compare calls,
+    tokens, latency and how closely the packed transcripts match the
+    references (by default, the one-per-page transcripts).
+    """
+    from assessment_tool import AssessmentTool
+    from prompt_eval import similarity
+
+    assessment_tool = AssessmentTool(ocr_analyzer, ocr_template="ocr@2")
+    names = [os.path.basename(path) for path in samples]
+
+    start = time.perf_counter()
+    single = {}
+    for name, path in zip(names, samples):
+        try:
+            single[name] = assessment_tool.extract_page_response(path)
+        except Exception as e:
+            print(f"one-per-page OCR failed on {name}: {e}")
+    single_seconds = time.perf_counter() - start
+    single_usage = ocr_analyzer.usage.report()
+
+    start = time.perf_counter()
+    results = packer.extract(assessment_tool, samples)
+    packed_seconds = time.perf_counter() - start
+    packed = {name: result for name, result in zip(names, results) if isinstance(result, str)}
+    usage = ocr_analyzer.usage.report()
+
+    reference_source = "references file" if references else "one-per-page"
+    references = references or single
+    scores = [similarity(packed[name], references[name]) for name in packed if name in references]
+    single_scores = [similarity(single[name], references[name]) for name in single if name in references]
+
+    def prompt_tokens(report):
+        return sum(totals["prompt_tokens"] for totals in report.values())
+
+    single_tokens = prompt_tokens(single_usage)
+    return {
+        "pages": len(samples),
+        "reference": reference_source,
+        "one_per_page": {
+            "calls": len(samples),
+            "prompt_tokens": single_tokens,
+            "seconds": round(single_seconds, 3),
+            "similarity_mean": round(sum(single_scores) / len(single_scores), 4) if single_scores else None,
+        },
+        "packed": {
+            **packer.report(),
+            "prompt_tokens": prompt_tokens(usage) - single_tokens,
+            "seconds": round(packed_seconds, 3),
+            "similarity_mean": round(sum(scores) / len(scores), 4) if scores else None,
+            "similarity_min": round(min(scores), 4) if scores else None,
+        },
+        "transcripts": {"one_per_page": single, "packed": packed},
+    }
+
+
+def main():
+    from assessment_tool import ImageOCRAnalyzer
+    from benchmark import IMAGE_EXTENSIONS, collect_samples
+    from cassette import CASSETTE_MODES, CassetteOCRAnalyzer
+    from stub_server import StubServer
+
+    parser = argparse.ArgumentParser(description="Compare packed and one-per-page OCR on the sample pages")
+    parser.add_argument("images", nargs="*", help="pages to use instead of the bundled samples")
+    parser.add_argument("--base-url", help="Groq/OpenAI-compatible endpoint")
+    parser.add_argument("--stub", action="store_true", help="start an in-process stand-in server")
+    parser.add_argument("--latency", default="fixed:0", help="stub latency distribution")
+    parser.add_argument("--cassette", help="record/replay OCR calls with this cassette")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default="replay")
+    parser.add_argument("--model", default="llama-3.2-90b-vision-preview")
+    parser.add_argument("--references", help="JSON file mapping sample file names to expected text")
+    parser.add_argument("--max-side", type=int, default=MAX_MOSAIC_SIDE)
+    parser.add_argument("--max-regions", type=int, default=MAX_REGIONS)
+    parser.add_argument("--max-completion-tokens", type=int, default=MAX_COMPLETION_TOKENS)
+    parser.add_argument("--mosaic-dir", help="write the mosaics sent here")
+    parser.add_argument("--output", help="write the report, including transcripts, to this JSON file")
+    args = parser.parse_args()
+
+    samples = args.images or [path for path in collect_samples() if path.lower().endswith(IMAGE_EXTENSIONS)]
+    references = None
+    if args.references:
+        with open(args.references, "r", encoding="utf-8") as f:
+            references = json.load(f)
+    packer = RegionPacker(
+        max_side=args.max_side,
+        max_regions=args.max_regions,
+        max_completion_tokens=args.max_completion_tokens,
+        mosaic_dir=args.mosaic_dir,
+    )
+
+    server = None
+    base_url = args.base_url
+    if args.stub:
+        server = StubServer(latency=args.latency).start()
+        base_url = server.base_url
+    try:
+        ocr_analyzer = ImageOCRAnalyzer(model_name=args.model, base_url=base_url)
+        if args.cassette:
+            ocr_analyzer = CassetteOCRAnalyzer(ocr_analyzer, args.cassette, mode=args.cassette_mode)
+        print(f"OCR'ing {len(samples)} pages one per call, then packed...")
+        report = run_comparison(ocr_analyzer, samples, packer, references)
+        if args.cassette:
+            ocr_analyzer.save()
+    finally:
+        if server:
+            server.stop()
+
+    print(json.dumps({key: value for key, value in report.items() if key != "transcripts"}, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
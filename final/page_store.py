@@ -0,0 +1,373 @@
+"""
+Memory-mapped store of page images for large batch runs.
+
+process_pdf writes one page_N.png per page, and every later stage decodes
+that file again (cv2.imread, encode_image). On a cohort that is thousands
+of small files, a PNG decode per access and no random access. A PageStore
+keeps a job's pages in a few large chunk files instead:
+
+    <store>/index.db          key -> chunk, offset, shape, dtype, payload
+    <store>/chunk-00000.bin   raw page arrays and their encoded payloads
+
+Each page is stored twice, both regions aligned to 4 KiB: the decoded
+array, which stages read zero-copy as a read-only numpy.memmap view, and
+the encoded image (PNG by default) that is sent to the vision model, so
+it is never re-encoded. Chunks are append-only; appends take SQLite's
+write lock (BEGIN IMMEDIATE), so several processes can add pages to the
+same store.
+
+Pages are referred to by "pagestore:<store path>#<key>" strings, which fit
+wherever a page path is stored (JobStore.pages.source_path) and which
+ImageOCRAnalyzer.load_image / encode_image resolve.
+
+Usage:
+    python page_store.py ./uploads/pages/mid2.pages stats
+    python page_store.py ./uploads/pages/bench.pages benchmark --pdf ./uploads/21K-4522.pdf --copies 200
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+PAGE_REF_PREFIX = "pagestore:"
+DEFAULT_CHUNK_BYTES = 256 * 1024 * 1024
+ALIGNMENT = 4096
+DEFAULT_PAYLOAD_FORMAT = ".png"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    chunk INTEGER NOT NULL,
+    array_offset INTEGER NOT NULL,
+    array_bytes INTEGER NOT NULL,
+    shape TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    payload_offset INTEGER NOT NULL,
+    payload_bytes INTEGER NOT NULL,
+    payload_format TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_chunk ON pages (chunk);
+"""
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def is_page_ref(path):
+    return isinstance(path, str) and path.startswith(PAGE_REF_PREFIX)
+
+
+_open_stores = {}
+_open_stores_lock = threading.Lock()
+
+
+def open_store(path):
+    """
+    The PageStore at path, shared by every caller in this process.
+    """
+    path = os.path.abspath(path)
+    with _open_stores_lock:
+        store = _open_stores.get(path)
+        if store is None:
+            store = _open_stores[path] = PageStore(path)
+        return store
+
+
+def resolve(ref):
+    """
+    (PageStore, key) of a "pagestore:<path>#<key>" reference.
+    """
+    path, _, key = ref[len(PAGE_REF_PREFIX):].rpartition("#")
+    if not path or not key:
+        raise ValueError(f"Malformed page reference: {ref}")
+    return open_store(path), key
+
+
+def encode_payload(image, payload_format=DEFAULT_PAYLOAD_FORMAT):
+    import cv2
+
+    ok, encoded = cv2.imencode(payload_format, image)
+    if not ok:
+        raise Exception(f"Failed to encode page as {payload_format}")
+    return encoded.tobytes()
+
+
+class PageStore:
+    """
+    Chunked, memory-mappable page container with an SQLite index. Each
+    thread gets its own index connection; chunk maps are shared.
+    """
+
+    def __init__(self, path, chunk_bytes=DEFAULT_CHUNK_BYTES, payload_format=DEFAULT_PAYLOAD_FORMAT):
+        self.path = os.path.abspath(path)
+        self.chunk_bytes = chunk_bytes
+        self.payload_format = payload_format
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # chunk number -> read-only np.memmap of the whole chunk file
+        self.maps = {}
+        os.makedirs(self.path, exist_ok=True)
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit mode so put() can take an explicit write lock
+            conn = sqlite3.connect(os.path.join(self.path, "index.db"), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def chunk_path(self, chunk):
+        return os.path.join(self.path, f"chunk-{chunk:05d}.bin")
+
+    def ref(self, key):
+        return f"{PAGE_REF_PREFIX}{self.path}#{key}"
+
+    def put(self, key, image, payload=None):
+        """
+        Store a page array and its encoded payload (encoded from the array
+        when not given) under key, replacing any earlier page with that
+        key. Returns the page reference.
+        """
+        image = np.ascontiguousarray(image)
+        if payload is None:
+            payload = encode_payload(image, self.payload_format)
+        payload_format = self.payload_format
+
+        conn = self.connection()
+        # Serializes appends across threads and processes: the end of the
+        # last chunk is read and extended under the same lock
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT chunk, MAX(payload_offset + payload_bytes) AS end_offset FROM pages "
+                "WHERE chunk = (SELECT MAX(chunk) FROM pages)"
+            ).fetchone()
+            chunk = row["chunk"] if row["chunk"] is not None else 0
+            array_offset = align(row["end_offset"] or 0)
+            payload_offset = align(array_offset + image.nbytes)
+            if array_offset and payload_offset + len(payload) > self.chunk_bytes:
+                chunk, array_offset = chunk + 1, 0
+                payload_offset = align(image.nbytes)
+
+            mode = "r+b" if os.path.exists(self.chunk_path(chunk)) else "w+b"
+            with open(self.chunk_path(chunk), mode) as f:
+                f.seek(array_offset)
+                f.write(image.data)
+                f.seek(payload_offset)
+                f.write(payload)
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (key, chunk, array_offset, array_bytes, shape, dtype, "
+                "payload_offset, payload_bytes, payload_format, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key, chunk, array_offset, image.nbytes, json.dumps(image.shape), image.dtype.str,
+                    payload_offset, len(payload), payload_format, time.time(),
+                ),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.ref(key)
+
+    def entry(self, key):
+        row = self.connection().execute("SELECT * FROM pages WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(f"No page '{key}' in {self.path}")
+        return row
+
+    def chunk_map(self, chunk, end):
+        """
+        Read-only map of a chunk covering at least `end` bytes. Chunks grow
+        as pages are appended, so a map that is too short is replaced.
+        """
+        with self.lock:
+            mapped = self.maps.get(chunk)
+            if mapped is None or len(mapped) < end:
+                mapped = self.maps[chunk] = np.memmap(self.chunk_path(chunk), dtype=np.uint8, mode="r")
+            return mapped
+
+    def array(self, key):
+        """
+        The page as a read-only array view of the chunk file (no copy).
+        """
+        row = self.entry(key)
+        start, end = row["array_offset"], row["array_offset"] + row["array_bytes"]
+        mapped = self.chunk_map(row["chunk"], end)
+        return mapped[start:end].view(np.dtype(row["dtype"])).reshape(json.loads(row["shape"]))
+
+    def payload(self, key):
+        """
+        The page's encoded image bytes, ready to send to the model.
+        """
+        row = self.entry(key)
+        start, end = row["payload_offset"], row["payload_offset"] + row["payload_bytes"]
+        return self.chunk_map(row["chunk"], end)[start:end].tobytes()
+
+    def keys(self, prefix=""):
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        rows = self.connection().execute(
+            "SELECT key FROM pages WHERE key LIKE ? ESCAPE '\\' ORDER BY key", (pattern,)
+        )
+        return [row["key"] for row in rows]
+
+    def put_image_file(self, key, image_path, transform=None):
+        """
+        Store a page image file. Its own bytes become the payload unless
+        transform (image -> image) changes the page.
+        """
+        import cv2
+
+        with open(image_path, "rb") as f:
+            data = f.read()
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Failed to decode page image: {image_path}")
+        if transform is None:
+            return self.put(key, image, payload=data)
+        return self.put(key, transform(image))
+
+    def put_pdf(self, prefix, pdf_path, transform=None):
+        """
+        Render every page of a PDF straight into the store as
+        "<prefix>/page_<n>", without writing image files. Returns the page
+        references in page order.
+        """
+        import cv2
+        import fitz  # PyMuPDF
+
+        refs = []
+        try:
+            doc = fitz.open(pdf_path)
+        except Exception as e:
+            raise Exception(f"Error processing PDF '{pdf_path}': {e}")
+        try:
+            for page_number in range(len(doc)):
+                pix = doc.load_page(page_number).get_pixmap()
+                image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+                image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR if pix.n == 4 else cv2.COLOR_RGB2BGR)
+                if transform is not None:
+                    image = transform(image)
+                refs.append(self.put(f"{prefix}/page_{page_number + 1}", image))
+        finally:
+            doc.close()
+        return refs
+
+    def stats(self):
+        row = self.connection().execute(
+            "SELECT COUNT(*) AS pages, COALESCE(SUM(array_bytes), 0) AS array_bytes, "
+            "COALESCE(SUM(payload_bytes), 0) AS payload_bytes, COUNT(DISTINCT chunk) AS chunks FROM pages"
+        ).fetchone()
+        return dict(row)
+
+
+def drop_page_cache(paths):
+    """
+    Ask the kernel to evict paths from the page cache, so the next read
+    comes from disk. Returns False where posix_fadvise is unavailable.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            # Dirty pages are not evicted; write them out first
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def run_benchmark(store, pdf_path, copies, work_dir):
+    """
+    Render a PDF `copies` times both ways and time reading every page back
+    from a cold page cache: page_N.png files with cv2.imread and file
+    reads, against store views. Both sides touch every pixel of the page
+    array and copy out the payload bytes.
+    """
+    import cv2
+    import fitz  # PyMuPDF
+
+    paths = []
+    started = time.perf_counter()
+    for copy in range(copies):
+        doc = fitz.open(pdf_path)
+        for page_number in range(len(doc)):
+            path = os.path.join(work_dir, f"{copy}", f"page_{page_number + 1}.png")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            doc.load_page(page_number).get_pixmap().save(path)
+            paths.append(path)
+        doc.close()
+    files_write = time.perf_counter() - started
+
+    started = time.perf_counter()
+    refs = []
+    for copy in range(copies):
+        refs.extend(store.put_pdf(f"bench/{copy}", pdf_path))
+    store_write = time.perf_counter() - started
+
+    cold = drop_page_cache(paths)
+    started = time.perf_counter()
+    for path in paths:
+        int(cv2.imread(path).sum())
+        with open(path, "rb") as f:
+            f.read()
+    files_read = time.perf_counter() - started
+
+    # Unmap the chunks too: the kernel keeps mapped pages resident
+    for page_store in {store, open_store(store.path)}:
+        with page_store.lock:
+            page_store.maps.clear()
+    chunks = sorted(
+        os.path.join(store.path, name) for name in os.listdir(store.path) if name.startswith("chunk-")
+    )
+    cold = drop_page_cache(chunks) and cold
+    started = time.perf_counter()
+    for ref in refs:
+        page_store, key = resolve(ref)
+        int(page_store.array(key).sum())
+        page_store.payload(key)
+    store_read = time.perf_counter() - started
+
+    return {
+        "pages": len(refs),
+        "cold_cache": cold,
+        "files_write_sec": round(files_write, 3),
+        "store_write_sec": round(store_write, 3),
+        "files_read_sec": round(files_read, 3),
+        "store_read_sec": round(store_read, 3),
+        "read_speedup": round(files_read / store_read, 1) if store_read else None,
+        "store": store.stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or benchmark a page store")
+    parser.add_argument("path", help="page store directory")
+    parser.add_argument("command", choices=["stats", "keys", "benchmark"])
+    parser.add_argument("--prefix", default="", help="key prefix for 'keys'")
+    parser.add_argument("--pdf", help="PDF to render for 'benchmark'")
+    parser.add_argument("--copies", type=int, default=100, help="times the PDF is rendered for 'benchmark'")
+    args = parser.parse_args()
+
+    store = open_store(args.path)
+    if args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    elif args.command == "keys":
+        print("\n".join(store.keys(args.prefix)))
+    else:
+        import tempfile
+
+        if not args.pdf:
+            parser.error("benchmark needs --pdf")
+        with tempfile.TemporaryDirectory(prefix="page-store-bench-") as work_dir:
+            print(json.dumps(run_benchmark(store, args.pdf, args.copies, work_dir), indent=2))
@@ -0,0 +1,319 @@
+"""
+Quality-aware preprocessing of page images for OCR.
+
+The legacy CPU paths always run the most expensive filters:
+mergecode1.preprocess_image denoises every page with
+cv2.fastNlMeansDenoising before Otsu, and m.preprocess_image_for_handwriting
+denoises with h=30 before adaptive thresholding. Denoising takes one to
+three seconds per phone photo and does nothing useful on a clean render.
+
+Here every page is first probed on a downsampled copy (tens of milliseconds):
+- sharpness: variance of the Laplacian (low means out of focus);
+- noise: Immerkaer's estimate, restricted to flat regions so text edges
+  do not count as noise;
+- contrast: intensity spread around the strongest edges (ink vs paper);
+- illumination: unevenness of the background (shadows, vignetting);
+- skew: angle maximizing the row-profile variance of the binarized page.
+
+plan_stages turns the probe into the stages to run, so phone photos take
+the heavy path (denoise, adaptive threshold, deskew) and clean renders the
+light one (grayscale only, or Otsu when contrast is low). Each page's
+decision, stage timings and the estimated time saved by skipped stages
+are recorded in a PreprocessLog.
+
+Usage:
+    python preprocessing.py ../test_files/*.jpeg --compare
+"""
+import argparse
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+PROBE_SIZE = 512
+# Laplacian variance below which a page is treated as out of focus; denoising
+# would only remove what detail is left
+BLUR_THRESHOLD = 150.0
+# Noise sigma (grey levels) in flat regions above which denoising pays off
+NOISE_THRESHOLD = 1.0
+# Noise sigma above which the strong (h=30) denoising of m.py is used
+HEAVY_NOISE_THRESHOLD = 2.5
+# Percentile spread below which a clean page still gets Otsu binarization
+CONTRAST_THRESHOLD = 100
+# Background standard deviation above which lighting is uneven and a global
+# threshold would blank out shadowed regions
+ILLUMINATION_THRESHOLD = 12.0
+# Skew (degrees) worth rotating for, and the largest skew searched
+SKEW_THRESHOLD = 1.0
+MAX_SKEW = 15.0
+
+DENOISE = "denoise"
+ADAPTIVE_THRESHOLD = "adaptive_threshold"
+OTSU_THRESHOLD = "otsu_threshold"
+DESKEW = "deskew"
+# Starting cost estimates (ms per megapixel) until a stage has been timed;
+# measured on the bundled samples
+DEFAULT_STAGE_COST = {DENOISE: 1900.0, DESKEW: 25.0, ADAPTIVE_THRESHOLD: 6.0, OTSU_THRESHOLD: 2.0}
+# The stages the legacy paths always run: denoise plus a threshold
+FULL_PATH = (DENOISE, ADAPTIVE_THRESHOLD)
+
+IMMERKAER_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+
+def to_gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def downsample(gray, size=PROBE_SIZE):
+    scale = size / max(gray.shape)
+    if scale >= 1:
+        return gray, 1.0
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+
+def estimate_noise(gray):
+    """
+    Immerkaer's fast noise estimate over the flatter half of the image.
+    """
+    response = np.abs(cv2.filter2D(gray.astype(np.float32), -1, IMMERKAER_KERNEL))[1:-1, 1:-1]
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8))[1:-1, 1:-1]
+    flat = gradient <= np.percentile(gradient, 50)
+    return float(np.sqrt(np.pi / 2) * response[flat].mean() / 6)
+
+
+def estimate_skew(gray, max_angle=MAX_SKEW):
+    """
+    Skew in degrees (positive is counter-clockwise): the rotation that
+    makes text rows and ruled lines horizontal maximizes the variance of the
+    row sums. Searched coarsely in 1 degree steps, then refined to 0.1.
+    Binarized locally, as a global threshold loses the text of shadowed
+    photos to the background.
+    """
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    height, width = binary.shape
+    center = (width / 2, height / 2)
+
+    def profile_score(angle):
+        matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+        rotated = cv2.warpAffine(binary, matrix, (width, height), flags=cv2.INTER_NEAREST)
+        return float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+
+    best = max(np.arange(-max_angle, max_angle + 0.5, 1.0), key=profile_score)
+    best = max(np.round(np.arange(best - 1.0, best + 1.05, 0.1), 1), key=profile_score)
+    return round(float(best), 1)
+
+
+def estimate_contrast(gray):
+    """
+    Ink-to-paper contrast: the intensity spread (2nd to 98th percentile)
+    around the strongest edges. A page-wide percentile would be all paper
+    on a sparsely written page.
+    """
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8))
+    edges = gray[gradient >= max(np.percentile(gradient, 95), 1)]
+    if edges.size == 0:
+        # Blank page: nothing to enhance
+        return 255
+    low, high = np.percentile(edges, (2, 98))
+    return int(high - low)
+
+
+def probe_quality(image, size=PROBE_SIZE):
+    """
+    Cheap quality metrics of a page, computed on a copy at most `size`
+    pixels on its longer side.
+    """
+    small, _ = downsample(to_gray(image), size)
+    return {
+        "sharpness": round(float(cv2.Laplacian(small, cv2.CV_32F).var()), 1),
+        "noise": round(estimate_noise(small), 3),
+        "contrast": estimate_contrast(small),
+        "illumination": round(float(np.std(cv2.blur(small, (61, 61)))), 2),
+        "skew": estimate_skew(small),
+    }
+
+
+def plan_stages(quality):
+    """
+    Stages to run for a page with the given quality metrics, in order.
+    """
+    stages = []
+    blurry = quality["sharpness"] < BLUR_THRESHOLD
+    if quality["noise"] > NOISE_THRESHOLD and not blurry:
+        stages.append(DENOISE)
+    if abs(quality["skew"]) >= SKEW_THRESHOLD:
+        stages.append(DESKEW)
+    if quality["illumination"] > ILLUMINATION_THRESHOLD:
+        stages.append(ADAPTIVE_THRESHOLD)
+    elif quality["contrast"] < CONTRAST_THRESHOLD:
+        stages.append(OTSU_THRESHOLD)
+    return stages
+
+
+def denoise(gray, noise):
+    # m.py's strong settings for noisy photos, OpenCV's default strength otherwise
+    strength = 30 if noise > HEAVY_NOISE_THRESHOLD else 10
+    return cv2.fastNlMeansDenoising(gray, None, strength, 7, 21)
+
+
+def deskew(gray, angle):
+    height, width = gray.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(
+        gray, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE
+    )
+
+
+def adaptive_threshold(gray):
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+
+
+def otsu_threshold(gray):
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+
+class PreprocessLog:
+    """
+    Per-page preprocessing decisions and timings. Keeps the most recent
+    pages and running totals, and learns each stage's cost per megapixel
+    to estimate the time skipped stages saved.
+    """
+
+    def __init__(self, max_records=1000):
+        self.records = deque(maxlen=max_records)
+        self.stage_cost = dict(DEFAULT_STAGE_COST)
+        self.totals = {"pages": 0, "elapsed_ms": 0.0, "probe_ms": 0.0, "saved_ms": 0.0, "stages": {}}
+        self.lock = threading.Lock()
+
+    def record(self, label, megapixels, quality, stage_ms, probe_ms, skipped):
+        with self.lock:
+            for stage, elapsed in stage_ms.items():
+                if stage in self.stage_cost and megapixels:
+                    # Exponential moving average of the measured cost
+                    self.stage_cost[stage] = 0.8 * self.stage_cost[stage] + 0.2 * elapsed / megapixels
+            saved_ms = sum(self.stage_cost[stage] * megapixels for stage in skipped)
+            entry = {
+                "page": label,
+                "megapixels": round(megapixels, 3),
+                "quality": quality,
+                "stages": list(stage_ms),
+                "skipped": list(skipped),
+                "stage_ms": {stage: round(elapsed, 1) for stage, elapsed in stage_ms.items()},
+                "probe_ms": round(probe_ms, 1),
+                "elapsed_ms": round(probe_ms + sum(stage_ms.values()), 1),
+                "saved_ms": round(saved_ms, 1),
+            }
+            self.records.append(entry)
+            self.totals["pages"] += 1
+            self.totals["elapsed_ms"] += entry["elapsed_ms"]
+            self.totals["probe_ms"] += probe_ms
+            self.totals["saved_ms"] += saved_ms
+            for stage in stage_ms:
+                self.totals["stages"][stage] = self.totals["stages"].get(stage, 0) + 1
+        return entry
+
+    def report(self):
+        with self.lock:
+            totals = dict(self.totals, stages=dict(self.totals["stages"]))
+        for key in ("elapsed_ms", "probe_ms", "saved_ms"):
+            totals[key] = round(totals[key], 1)
+        return totals
+
+
+class AdaptivePreprocessor:
+    """
+    Probe a page, run only the stages it needs and log the decision.
+    on_page(entry), if given, is called with each page's log entry.
+    """
+
+    def __init__(self, log=None, on_page=None, probe_size=PROBE_SIZE):
+        self.log = log or PreprocessLog()
+        self.on_page = on_page
+        self.probe_size = probe_size
+
+    def process(self, image, label=None):
+        """
+        Return (processed grayscale image, log entry).
+        """
+        started = time.perf_counter()
+        gray = to_gray(image)
+        quality = probe_quality(gray, self.probe_size)
+        stages = plan_stages(quality)
+        probe_ms = (time.perf_counter() - started) * 1000
+
+        stage_ms = {}
+        for stage in stages:
+            started = time.perf_counter()
+            if stage == DENOISE:
+                gray = denoise(gray, quality["noise"])
+            elif stage == DESKEW:
+                gray = deskew(gray, quality["skew"])
+            elif stage == ADAPTIVE_THRESHOLD:
+                gray = adaptive_threshold(gray)
+            elif stage == OTSU_THRESHOLD:
+                gray = otsu_threshold(gray)
+            stage_ms[stage] = (time.perf_counter() - started) * 1000
+
+        skipped = [stage for stage in FULL_PATH if stage not in stages]
+        if ADAPTIVE_THRESHOLD in skipped and OTSU_THRESHOLD in stages:
+            # Otsu replaced the adaptive threshold rather than skipping it
+            skipped.remove(ADAPTIVE_THRESHOLD)
+        megapixels = gray.shape[0] * gray.shape[1] / 1e6
+        entry = self.log.record(label, megapixels, quality, stage_ms, probe_ms, skipped)
+        if self.on_page:
+            self.on_page(entry)
+        return gray, entry
+
+
+def full_preprocess(image):
+    """
+    The legacy full path (m.preprocess_image_for_handwriting), as the
+    comparison baseline.
+    """
+    gray = cv2.fastNlMeansDenoising(to_gray(image), None, 30, 7, 21)
+    return adaptive_threshold(gray)
+
+
+def print_entry(entry):
+    quality = entry["quality"]
+    print(
+        f"{entry['page']}: {', '.join(entry['stages']) or 'grayscale only'} "
+        f"(sharpness {quality['sharpness']}, noise {quality['noise']}, contrast {quality['contrast']}, "
+        f"illumination {quality['illumination']}, skew {quality['skew']}) "
+        f"{entry['elapsed_ms']} ms, saved ~{entry['saved_ms']} ms"
+    )
+
+
+if __name__ == "__main__":
+    import json
+
+    parser = argparse.ArgumentParser(description="Quality-aware preprocessing of page images")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--compare", action="store_true", help="also time the legacy full path")
+    parser.add_argument("--output-dir", help="write the preprocessed pages here")
+    args = parser.parse_args()
+
+    preprocessor = AdaptivePreprocessor(on_page=print_entry)
+    full_ms = 0.0
+    for path in args.images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"{path}: could not be read")
+            continue
+        processed, _ = preprocessor.process(image, label=path)
+        if args.output_dir:
+            import os
+
+            os.makedirs(args.output_dir, exist_ok=True)
+            cv2.imwrite(os.path.join(args.output_dir, os.path.basename(path) + ".png"), processed)
+        if args.compare:
+            started = time.perf_counter()
+            full_preprocess(image)
+            full_ms += (time.perf_counter() - started) * 1000
+
+    report = preprocessor.log.report()
+    if args.compare:
+        report["full_path_ms"] = round(full_ms, 1)
+    print(json.dumps(report, indent=2))
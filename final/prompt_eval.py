@@ -0,0 +1,154 @@
+"""
+Compare OCR prompt templates on the bundled sample images.
+
+Every sample page is OCR'd once per template. For each template the report
+gives prompt/completion tokens per page (as reported by the API), latency
+and how closely the transcriptions match the references. References come
+from a JSON file mapping sample file names to their expected text; without
+one the first template's output is used as the reference, which measures
+how much a cheaper template drifts from the current one.
+
+Usage:
+    python prompt_eval.py --stub
+    python prompt_eval.py --templates ocr@1 ocr@2 --references refs.json --output eval.json
+    # Record once against the real API, then re-score offline
+    python prompt_eval.py --cassette eval.cassette.json --cassette-mode auto
+"""
+import argparse
+import difflib
+import json
+import os
+import time
+
+from assessment_tool import ImageOCRAnalyzer, AssessmentTool
+from benchmark import IMAGE_EXTENSIONS, collect_samples, percentile
+from cassette import CASSETTE_MODES, CassetteOCRAnalyzer
+from prompts import REGISTRY
+from stub_server import StubServer
+
+
+def normalize_transcript(text):
+    return " ".join(text.split()).lower()
+
+
+def similarity(text, reference):
+    """
+    Character-level similarity of two transcriptions in [0, 1], ignoring
+    case and whitespace differences.
+    """
+    return difflib.SequenceMatcher(
+        None, normalize_transcript(text), normalize_transcript(reference), autojunk=False
+    ).ratio()
+
+
+def evaluate_template(ocr_analyzer, template_id, samples, repeat=1):
+    """
+    OCR every sample with one template and return (transcripts, latencies, errors).
+    """
+    assessment_tool = AssessmentTool(ocr_analyzer, ocr_template=template_id)
+    transcripts = {}
+    latencies = []
+    errors = 0
+    for _ in range(repeat):
+        for sample_path in samples:
+            start = time.perf_counter()
+            try:
+                transcripts[os.path.basename(sample_path)] = assessment_tool.extract_page_response(sample_path)
+            except Exception as e:
+                errors += 1
+                print(f"{template_id} failed on {sample_path}: {e}")
+            latencies.append(time.perf_counter() - start)
+    return transcripts, latencies, errors
+
+
+def run_eval(ocr_analyzer, template_ids, samples, references=None, repeat=1):
+    results = {}
+    all_transcripts = {}
+    for template_id in template_ids:
+        transcripts, latencies, errors = evaluate_template(ocr_analyzer, template_id, samples, repeat)
+        all_transcripts[template_id] = transcripts
+        results[template_id] = {
+            "prompt_tokens_estimate": REGISTRY.get(template_id).estimate_tokens(images=1),
+            "pages": len(latencies),
+            "errors": errors,
+            "latency_p50": round(percentile(latencies, 50), 4),
+            "latency_p95": round(percentile(latencies, 95), 4),
+        }
+
+    if references is None:
+        references = all_transcripts[template_ids[0]]
+        reference_source = template_ids[0]
+    else:
+        reference_source = "references file"
+
+    for template_id in template_ids:
+        scores = [
+            similarity(text, references[name])
+            for name, text in all_transcripts[template_id].items()
+            if name in references
+        ]
+        results[template_id]["similarity_mean"] = round(sum(scores) / len(scores), 4) if scores else None
+        results[template_id]["similarity_min"] = round(min(scores), 4) if scores else None
+
+    # Token counts reported by the API for each call made above
+    usage = ocr_analyzer.usage.report()
+    for template_id in template_ids:
+        results[template_id]["usage"] = usage.get(template_id)
+
+    return {"reference": reference_source, "templates": results, "transcripts": all_transcripts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR prompt template evaluation")
+    parser.add_argument(
+        "--templates",
+        nargs="+",
+        default=[f"ocr@{version}" for version in REGISTRY.versions("ocr")],
+        help="template ids to compare; the first is the baseline",
+    )
+    parser.add_argument("--references", help="JSON file mapping sample file names to expected text")
+    parser.add_argument("--base-url", help="Groq/OpenAI-compatible endpoint")
+    parser.add_argument("--stub", action="store_true", help="start an in-process stand-in server")
+    parser.add_argument("--latency", default="fixed:0", help="stub latency distribution")
+    parser.add_argument("--cassette", help="record/replay OCR calls with this cassette")
+    parser.add_argument("--cassette-mode", choices=CASSETTE_MODES, default="replay")
+    parser.add_argument("--model", default="llama-3.2-90b-vision-preview")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="write the report, including transcripts, to this JSON file")
+    args = parser.parse_args()
+
+    for template_id in args.templates:
+        REGISTRY.get(template_id)
+
+    references = None
+    if args.references:
+        with open(args.references, "r", encoding="utf-8") as f:
+            references = json.load(f)
+
+    samples = [path for path in collect_samples() if path.lower().endswith(IMAGE_EXTENSIONS)]
+
+    server = None
+    base_url = args.base_url
+    if args.stub:
+        server = StubServer(latency=args.latency).start()
+        base_url = server.base_url
+    try:
+        ocr_analyzer = ImageOCRAnalyzer(model_name=args.model, base_url=base_url)
+        if args.cassette:
+            ocr_analyzer = CassetteOCRAnalyzer(ocr_analyzer, args.cassette, mode=args.cassette_mode)
+        print(f"Evaluating {', '.join(args.templates)} on {len(samples)} sample pages...")
+        report = run_eval(ocr_analyzer, args.templates, samples, references, args.repeat)
+        if args.cassette:
+            ocr_analyzer.save()
+    finally:
+        if server:
+            server.stop()
+
+    print(json.dumps({"reference": report["reference"], "templates": report["templates"]}, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Versioned prompt templates and token accounting for the OCR/grading calls.
+
+Every prompt sent to the model is a registered PromptTemplate, identified as
+name@version (e.g. ocr@2). Templates are never edited in place: a changed
+prompt is registered as a new version, so recorded results, cassettes and
+cached grades can always be traced back to the exact prompt text. Each name
+has a default version, which is what the pipeline uses unless told
+otherwise.
+
+UsageLog collects per-call prompt and completion token counts, as reported
+by the API (or estimated when it reports none), per template.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+# Vision models bill a roughly fixed number of prompt tokens per image
+IMAGE_TOKEN_ESTIMATE = 1600
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text, images=0):
+    """
+    Rough prompt token count: about four characters per token for English
+    text, plus a fixed cost per attached image. Good enough to compare
+    templates; the API's own usage figures are authoritative.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) + images * IMAGE_TOKEN_ESTIMATE
+
+
+class PromptTemplate:
+    def __init__(self, name, version, text, description=""):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.description = description
+
+    @property
+    def template_id(self):
+        return f"{self.name}@{self.version}"
+
+    def render(self, **fields):
+        """
+        Fill in the template's {placeholders}. Templates without
+        placeholders are returned unchanged.
+        """
+        return self.text.format(**fields) if fields else self.text
+
+    def estimate_tokens(self, images=0, **fields):
+        return estimate_tokens(self.render(**fields), images=images)
+
+    def __repr__(self):
+        return f"PromptTemplate({self.template_id}, ~{estimate_tokens(self.text)} tokens)"
+
+
+class PromptRegistry:
+    def __init__(self):
+        self.templates = {}
+        self.defaults = {}
+
+    def register(self, template, default=False):
+        key = (template.name, template.version)
+        if key in self.templates:
+            raise ValueError(f"Prompt template {template.template_id} is already registered")
+        self.templates[key] = template
+        if default or template.name not in self.defaults:
+            self.defaults[template.name] = template.version
+        return template
+
+    def get(self, name, version=None):
+        """
+        Look up a template by name and version, or by a "name@version" id.
+        Without a version the name's default version is returned.
+        """
+        if version is None and "@" in name:
+            name, version = name.split("@", 1)
+        if version is None:
+            if name not in self.defaults:
+                raise KeyError(f"Unknown prompt template '{name}'")
+            version = self.defaults[name]
+        try:
+            return self.templates[(name, int(version))]
+        except (KeyError, ValueError):
+            raise KeyError(f"Unknown prompt template '{name}@{version}'")
+
+    def versions(self, name):
+        return sorted(version for template_name, version in self.templates if template_name == name)
+
+
+class UsageLog:
+    """
+    Per-call token usage, aggregated by template. Keeps the most recent
+    calls for inspection and running totals for everything.
+    """
+
+    def __init__(self, max_records=1000):
+        self.records = deque(maxlen=max_records)
+        self.totals = {}
+        self.lock = threading.Lock()
+        # Each thread's most recent entry, see last()
+        self.local = threading.local()
+
+    def record(self, template_id, usage, estimated_prompt_tokens, latency):
+        """
+        Record one completion. usage is the completion's usage object (or
+        None when the endpoint does not report it).
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        entry = {
+            "time": time.time(),
+            "template": template_id or "adhoc",
+            "prompt_tokens": prompt_tokens if prompt_tokens is not None else estimated_prompt_tokens,
+            "completion_tokens": completion_tokens or 0,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "reported": prompt_tokens is not None,
+            "latency": round(latency, 4),
+        }
+        with self.lock:
+            self.records.append(entry)
+            totals = self.totals.setdefault(
+                entry["template"],
+                {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency": 0.0},
+            )
+            totals["calls"] += 1
+            totals["prompt_tokens"] += entry["prompt_tokens"]
+            totals["completion_tokens"] += entry["completion_tokens"]
+            totals["latency"] += latency
+        self.local.last = entry
+        return entry
+
+    def last(self):
+        """
+        The entry this thread recorded most recently, or None. Lets a
+        wrapper (see cassette.CassetteOCRAnalyzer) pick up the usage of the
+        call it just made while other threads record theirs.
+        """
+        return getattr(self.local, "last", None)
+
+    def report(self):
+        """
+        Totals and per-call averages for each template.
+        """
+        with self.lock:
+            return {
+                template_id: {
+                    "calls": totals["calls"],
+                    "prompt_tokens": totals["prompt_tokens"],
+                    "completion_tokens": totals["completion_tokens"],
+                    "prompt_tokens_per_call": round(totals["prompt_tokens"] / totals["calls"], 1),
+                    "completion_tokens_per_call": round(totals["completion_tokens"] / totals["calls"], 1),
+                    "latency_per_call": round(totals["latency"] / totals["calls"], 4),
+                }
+                for template_id, totals in self.totals.items()
+            }
+
+
+FEW_SHOT_OCR_PROMPT = (
+    "You are a highly accurate OCR assistant specialized in analyzing text from both handwritten and printed content in images. "
+    "Your task is to extract all visible text from the provided image, including detailed formatting, and organize it into a structured format as follows:"
+    "1. Clearly identify the **Question Number** (if present) in the image (e.g., Q1a)."
+    "2. Extract and structure the **Answer** text verbatim, maintaining its logical order. If the image includes lists, bullet points, or numbered items, ensure they are preserved in the response."
+    "3. If the content is unclear or illegible, mark it as [unclear] in the relevant section, and do not attempt to guess the text."
+    "If some parts are unclear, mark them as [unclear]. Provide the extracted text verbatim.\n\n"
+    "Here are examples to guide you:\n\n"
+    "Example 1:\n"
+    "Input Image Content:\n"
+    "DevOps refers to a mindset of software teams to deliver a product through integration, collaboration, "
+    "and communication between development and operations teams.\n"
+    "Benefits:\n"
+    "1. Fast Time to Market: Due to rapid and frequent merging of code and features, the product is delivered at a faster rate through 'continuous/incremental improvement'.\n"
+    "2. Automated Testing Improves Reliability: Automated testing at each step ensures the quality of code is reliable and increases the chance of 'early bug detection'.\n\n"
+    "Extracted Response:\n"
+    "Question Number: Q1a\n"
+    "Answer: DevOps refers to a mindset of software teams to deliver a product through integration, collaboration, and communication between development and operations teams.\n"
+    "Benefits:\n"
+    "1. Fast Time to Market: Due to rapid and frequent merging of code and features, the product is delivered at a faster rate through 'continuous/incremental improvement'.\n"
+    "2. Automated Testing Improves Reliability: Automated testing at each step ensures the quality of code is reliable and increases the chance of 'early bug detection'.\n\n"
+    "Input Image Content:\n"
+    "3. End-to-End Product Responsibility/Ownership: Due to the DevOps cycle, both the development and operations teams are tightly integrated and have a higher level of ownership towards the product.\n"
+    "4. Eliminating Manual Tasks: Manual tasks of building and deployment are automated, increasing team efficiency by eliminating 'repetitive tasks'.\n"
+    "5. Prevent Large Scale Issues at Production: Continuous testing and deployment of features help identify and resolve potential problems early.\n"
+    "6. Feedback Loops: Monitoring team and user responses improve the UX through continuous feedback.\n\n"
+    "Extracted Response:\n"
+    "Question Number: Q1a (continued)\n"
+    "Answer:\n"
+    "3. End-to-End Product Responsibility/Ownership: Due to the DevOps cycle, both the development and operations teams are tightly integrated and have a higher level of ownership towards the product.\n"
+    "4. Eliminating Manual Tasks: Manual tasks of building and deployment are automated, increasing team efficiency by eliminating 'repetitive tasks'.\n"
+    "5. Prevent Large Scale Issues at Production: Continuous testing and deployment of features help identify and resolve potential problems early.\n"
+    "6. Feedback Loops: Monitoring team and user responses improve the UX through continuous feedback.\n\n"
+    "Now, analyze the provided image and ensure maximum accuracy."
+    "Example 2:\n"
+    "Input Image Content:\n"
+    "1. FAST Delivery"
+    "Since development & ops team work continuously all collaboratively, it allows for faster development of features through continuous integration and deployment."
+    "2. Quality Product"
+    "Test is carried out in each stage of DevOps resulting in a quality product free of any bugs."
+    "3. Customer Trust"
+    "Customers are involved throughout the lifecycle with giving continuous feedback of the software & viewing changes which creates a sense of satisfaction."
+    "4. Mean Value Product"
+    "The product produced is of value and to the point of what was required."
+    "5. Collaboration"
+    "The developers and operations team work together throughout, communicating back and forth, breaking the practices of silos. Work of each team is visible to others."
+    "6. Seamless Integration"
+    "Since there is clear communication & each work of each team is visible to each other, the product is delivered without any conflicts."
+    "Extracted Response:"
+    "Question Number: Q1a"
+    "Answer:"
+    "1. FAST Delivery"
+    "Since development & ops team work continuously all collaboratively, it allows for faster development of features through continuous integration and deployment."
+    "2. Quality Product"
+    "Test is carried out in each stage of DevOps resulting in a quality product free of any bugs."
+    "3. Customer Trust"
+    "Customers are involved throughout the lifecycle with giving continuous feedback of the software & viewing changes which creates a sense of satisfaction."
+    "4. Mean Value Product"
+    "The product produced is of value and to the point of what was required."
+    "5. Collaboration"
+    "The developers and operations team work together throughout, communicating back and forth, breaking the practices of silos. Work of each team is visible to others."
+    "6. Seamless Integration"
+    "Since there is clear communication & each work of each team is visible to each other, the product is delivered without any conflicts."
+    ### Instructions for New Input:
+    "Now, analyze the provided image and:  "
+    "- Identify the **Question Number** if available.  "
+    "- Extract the **Answer** text verbatim, preserving structure and formatting.  "
+    "- Use [unclear] where content is illegible or ambiguous. "
+    "- Ensure the output is clear, logical, and follows the examples above."
+)
+
+# Same instructions as the few-shot prompt, with the worked examples reduced
+# to a sketch of the expected output format
+COMPACT_OCR_PROMPT = (
+    "You are an OCR assistant for handwritten and printed exam answers. "
+    "Extract all visible text from the image verbatim, keeping its order, lists and numbering. "
+    "Mark illegible or ambiguous parts as [unclear]; do not guess.\n"
+    "Reply in this format:\n"
+    "Question Number: <e.g. Q1a, or Q1a (continued) if the page continues an earlier answer>\n"
+    "Answer:\n<the extracted text>"
+)
+
+GRADE_SCRIPT_PROMPT = (
+    "You are an evaluator tasked with assessing a student's answers using a provided marking scheme. Evaluate each question by comparing the student's response to the correct answer in the marking scheme. Follow these guidelines for grading:"
+    "Evaluate each question, comparing the student's response to the correct answer in the marking scheme. Be lenient with evaluation"
+    "Award marks for correct answers and provide a total score. Structure your response as:\n"
+    "Question 1: Correct/Incorrect - Awarded Marks: X\n"
+    "...\nTotal Marks: Y\n\n"
+    "Marking Scheme:\n{marking_scheme}\n\nStudent Response:\n{student_response}"
+)
+
+# Whole-script grading as a strict JSON object, validated by grades.py
+GRADE_SCRIPT_JSON_PROMPT = (
+    "You are an evaluator tasked with assessing a student's answers using a provided marking scheme. "
+    "Evaluate each question of the marking scheme by comparing the student's response to the correct answer. Be lenient with evaluation. "
+    "When a question has parts (a, b, ...), grade every part separately.\n"
+    "Reply with only a JSON object, with no other text, in exactly this form:\n"
+    '{{"questions": [{{"question": "1a", "verdict": "Correct|Partially Correct|Incorrect", '
+    '"awarded_marks": 0, "max_marks": 0}}], "total_marks": 0, "max_total_marks": 0}}\n'
+    "All marks are numbers; max_marks is what the marking scheme gives that question or part.\n\n"
+    "Marking Scheme:\n{marking_scheme}\n\nStudent Response:\n{student_response}"
+)
+
+# Re-request of the questions a grade_script@2 reply left out or got wrong
+GRADE_QUESTIONS_JSON_PROMPT = (
+    "You are an evaluator tasked with assessing a student's answers using a provided marking scheme. "
+    "Grade only Questions {question_ids}, comparing the student's response to the correct answers in the marking scheme. Be lenient with evaluation.\n"
+    "Reply with only a JSON object, with no other text, in exactly this form:\n"
+    '{{"questions": [{{"question": "1a", "verdict": "Correct|Partially Correct|Incorrect", '
+    '"awarded_marks": 0, "max_marks": 0}}]}}\n'
+    "All marks are numbers; max_marks is what the marking scheme gives that question or part.\n\n"
+    "Marking Scheme:\n{marking_scheme}\n\nStudent Response:\n{student_response}"
+)
+
+GRADE_QUESTION_PROMPT = (
+    "You are an evaluator tasked with assessing one answer of a student using a provided marking scheme. "
+    "Grade only Question {question_id}, comparing the student's answer to the correct answer for that question in the marking scheme. Be lenient with evaluation. "
+    "Structure your response as:\n"
+    "Question {question_id}: Correct/Incorrect - Awarded Marks: X\n\n"
+    "Marking Scheme:\n{marking_scheme}\n\nStudent Answer to Question {question_id}:\n{answer}"
+)
+
+# Single-question grading with the key points keypoints.py already found
+GRADE_QUESTION_KEY_POINTS_PROMPT = (
+    "You are an evaluator tasked with assessing one answer of a student using a provided marking scheme. "
+    "Grade only Question {question_id}, comparing the student's answer to the correct answer for that question in the marking scheme. Be lenient with evaluation. "
+    "The key points of the marking scheme were already checked automatically, accepting OCR spelling mistakes. "
+    "Treat the present key points as covered and judge only the ones not found and the quality of the explanations.\n"
+    "{key_points}\n"
+    "Structure your response as:\n"
+    "Question {question_id}: Correct/Incorrect - Awarded Marks: X\n\n"
+    "Marking Scheme:\n{marking_scheme}\n\nStudent Answer to Question {question_id}:\n{answer}"
+)
+
+# Several answer regions tiled into one image by packing.py; the reply is
+# split back into one ocr@2-style transcription per region
+PACKED_OCR_PROMPT = (
+    "You are an OCR assistant for handwritten and printed exam answers. "
+    "The image is a mosaic of separate answer regions, each framed and labelled above its top-left corner. "
+    "Transcribe every region on its own and never carry text from one region into another. "
+    "Extract the text verbatim, keeping its order, lists and numbering. "
+    "Mark illegible or ambiguous parts as [unclear]; do not guess.\n"
+    "Regions: {labels}\n"
+    "Reply with one block per region, in the order listed, in this format:\n"
+    "=== R1 ===\n"
+    "Question Number: <e.g. Q1a, or Q1a (continued) if the region continues an earlier answer>\n"
+    "Answer:\n<the extracted text>"
+)
+
+# Many students' short answers to one question in a single request (see
+# packed_grading.py); answers are tagged [A1], [A2], ... and graded one
+# line per tag
+GRADE_PACKED_PROMPT = (
+    "You are an evaluator grading several students' answers to the same question using a provided marking scheme. "
+    "Grade only Question {question_id}. Grade every answer on its own, never comparing it with the others. Be lenient with evaluation.\n"
+    "Each answer starts with its tag in square brackets. Reply with exactly one line per tag, in the order given, and nothing else:\n"
+    "A1: Correct/Incorrect - Awarded Marks: X\n\n"
+    "Marking Scheme:\n{marking_scheme}\n\nAnswers to Question {question_id}:\n{answers}"
+)
+
+# Image marking schemes, transcribed into the layout of the DOCX schemes so
+# both compile the same way (see rubrics.py)
+RUBRIC_OCR_PROMPT = (
+    "You are an OCR assistant analyzing a marking scheme image. Extract all text verbatim and format it as follows, "
+    "one item per line:\n"
+    "Question X: <title> (<marks> Marks)\n"
+    "a. <subpart> (<marks> Marks)\n"
+    "<Key point>: <correct answer or explanation>\n\n"
+    "Group subparts under their main questions and key points under their subparts. "
+    "Leave out any heading or line that is not part of the scheme. Indicate [unclear] for illegible parts."
+)
+
+REGISTRY = PromptRegistry()
+REGISTRY.register(
+    PromptTemplate("ocr", 1, FEW_SHOT_OCR_PROMPT, "original prompt with two DevOps few-shot examples"),
+    default=True,
+)
+REGISTRY.register(PromptTemplate("ocr", 2, COMPACT_OCR_PROMPT, "compact instructions, output format only"))
+REGISTRY.register(PromptTemplate("ocr_packed", 1, PACKED_OCR_PROMPT, "several labelled regions in one image"))
+REGISTRY.register(PromptTemplate("rubric_ocr", 1, RUBRIC_OCR_PROMPT, "image marking scheme transcription"))
+REGISTRY.register(PromptTemplate("grade_script", 1, GRADE_SCRIPT_PROMPT, "whole-script grading"))
+REGISTRY.register(
+    PromptTemplate("grade_script", 2, GRADE_SCRIPT_JSON_PROMPT, "whole-script grading as strict JSON"), default=True
+)
+REGISTRY.register(
+    PromptTemplate("grade_questions", 1, GRADE_QUESTIONS_JSON_PROMPT, "JSON re-grade of selected questions")
+)
+REGISTRY.register(PromptTemplate("grade_question", 1, GRADE_QUESTION_PROMPT, "single-question grading"))
+REGISTRY.register(PromptTemplate("grade_packed", 1, GRADE_PACKED_PROMPT, "one question, many tagged answers"))
+REGISTRY.register(
+    PromptTemplate("grade_question", 2, GRADE_QUESTION_KEY_POINTS_PROMPT, "single-question grading with key-point coverage")
+)
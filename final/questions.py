@@ -0,0 +1,155 @@
+"""
+Helpers for splitting OCR output and grading results by question.
+"""
+import re
+
+# "Question Number: Q1a", "Question Number: Q1a (continued)"
+QUESTION_NUMBER_RE = re.compile(r"^\s*\**\s*Question Number\s*\**\s*:\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+# "Question 1: Correct - Awarded Marks: 8"
+AWARDED_MARKS_RE = re.compile(
+    r"^\s*\**\s*(Q(?:uestion)?\s*[\w().]+?)\s*\**\s*:.*?Awarded Marks\s*\**\s*:\s*\**\s*(\d+(?:\.\d+)?)",
+    re.IGNORECASE | re.MULTILINE,
+)
+# "Total Marks: 14" or "Total Marks: 14/20"
+TOTAL_MARKS_RE = re.compile(
+    r"Total Marks\s*:\s*(\d+(?:\.\d+)?)(?:\s*/\s*(\d+(?:\.\d+)?))?", re.IGNORECASE
+)
+# Marking scheme headings: "Question 1: ...", "Q2 ...", "Q1a: ..."
+RUBRIC_QUESTION_RE = re.compile(r"^\s*\**\s*(?:Question|Q)\s*(\d+[a-z]?)\b", re.IGNORECASE)
+# Sub-part headings inside a question: "a. ...", "(b) ...", "c) ..."
+RUBRIC_PART_RE = re.compile(r"^\s*\(?([a-z])[.)]\s", re.IGNORECASE)
+UNKNOWN_QUESTION = "unknown"
+
+
+def normalize_question_id(label):
+    """
+    Normalize a question label so OCR and grading output agree, e.g.
+    "Q1a (continued)", "Question 1a" and "q1A" all become "1a".
+    """
+    label = re.sub(r"\(.*?\)", "", label)
+    label = re.sub(r"^\W*(question|q)\b\.?", "", label.strip(), flags=re.IGNORECASE)
+    label = re.sub(r"^q(?=\d)", "", label.strip(), flags=re.IGNORECASE)
+    label = re.sub(r"[^0-9a-zA-Z]", "", label).lower()
+    return label or UNKNOWN_QUESTION
+
+
+def split_student_response(student_response):
+    """
+    Split OCR'd text into {question_id: answer_text}, in order of first
+    appearance. Continuation pages are appended to the same question and
+    text before the first question marker is kept under "unknown".
+    """
+    answers = {}
+    matches = list(QUESTION_NUMBER_RE.finditer(student_response))
+    if not matches:
+        text = student_response.strip()
+        return {UNKNOWN_QUESTION: text} if text else {}
+
+    preamble = student_response[: matches[0].start()].strip()
+    if preamble:
+        answers[UNKNOWN_QUESTION] = preamble
+
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(student_response)
+        body = student_response[match.end():end].strip()
+        body = re.sub(r"^\s*Answer\s*:\s*", "", body, flags=re.IGNORECASE)
+        question_id = normalize_question_id(match.group(1))
+        if question_id in answers:
+            answers[question_id] = f"{answers[question_id]}\n{body}"
+        else:
+            answers[question_id] = body
+    return answers
+
+
+def split_marking_scheme(marking_scheme):
+    """
+    Split a marking scheme into {question_id: section_text}. A sub-part
+    section ("1a") starts with its question's heading line, so each
+    section reads on its own. Text before the first heading is kept under
+    "unknown".
+    """
+    sections = {}
+    question = None
+    heading = None
+    current = UNKNOWN_QUESTION
+    for line in marking_scheme.splitlines():
+        question_match = RUBRIC_QUESTION_RE.match(line)
+        part_match = RUBRIC_PART_RE.match(line) if question else None
+        if question_match:
+            current = normalize_question_id(question_match.group(1))
+            question = current.rstrip("abcdefghijklmnopqrstuvwxyz")
+            heading = line
+            sections[current] = [line]
+            continue
+        if part_match:
+            current = f"{question}{part_match.group(1).lower()}"
+            sections[current] = [heading, line]
+            continue
+        sections.setdefault(current, []).append(line)
+    return {question_id: "\n".join(lines).strip() for question_id, lines in sections.items()}
+
+
+def rubric_for_question(marking_scheme, question_id):
+    """
+    The part of the marking scheme that grades question_id: its own
+    section, all of its sub-parts when the student answered "1" for a
+    scheme split into "1a" and "1b", or the whole question when the scheme
+    has no sub-parts. Falls back to the whole scheme when the question
+    cannot be located.
+    """
+    sections = split_marking_scheme(marking_scheme)
+    if question_id == UNKNOWN_QUESTION:
+        return marking_scheme
+    parts = [
+        text
+        for section_id, text in sections.items()
+        if section_id.startswith(question_id) and section_id[len(question_id):].isalpha()
+    ]
+    if parts:
+        return "\n".join(parts)
+    for section_id in (question_id, question_id.rstrip("abcdefghijklmnopqrstuvwxyz")):
+        if section_id in sections:
+            return sections[section_id]
+    return marking_scheme
+
+
+def parse_awarded_marks(assessment_result):
+    """
+    Parse "Question X: ... Awarded Marks: N" lines into {question_id: marks}.
+    """
+    marks = {}
+    for match in AWARDED_MARKS_RE.finditer(assessment_result):
+        marks[normalize_question_id(match.group(1))] = float(match.group(2))
+    return marks
+
+
+def question_marks(assessment_result, question_id):
+    """
+    Marks a per-question grading output awards question_id: its own line,
+    the only line of a reply that gave one, or the sum of the lines for
+    its parts (Q1a and Q1b for question 1). None otherwise: a refusal with
+    no "Awarded Marks" line is a failed grade, not a grade of zero, and a
+    reply grading other questions is not this question's grade.
+    """
+    marks = parse_awarded_marks(assessment_result or "")
+    if question_id in marks:
+        return marks[question_id]
+    if len(marks) == 1:
+        return next(iter(marks.values()))
+    if marks and all(
+        marked_id.startswith(question_id) and marked_id[len(question_id):].isalpha() for marked_id in marks
+    ):
+        return sum(marks.values())
+    return None
+
+
+def parse_total_marks(assessment_result):
+    """
+    Return (total, out_of) from the "Total Marks" line, or (None, None).
+    out_of is None when the grader did not state it.
+    """
+    matches = TOTAL_MARKS_RE.findall(assessment_result)
+    if not matches:
+        return None, None
+    total, out_of = matches[-1]
+    return float(total), float(out_of) if out_of else None
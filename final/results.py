@@ -0,0 +1,325 @@
+"""
+Typed, compact results of OCR and grading.
+
+PageResult (page -> OCR text, timing) and QuestionResult (question ->
+score) are __slots__ records, so holding many of them costs no per-object
+__dict__. ResultTable stores records of one type column by column: text
+columns as lists, numbers as array.array. 100k pages of results are then
+a handful of flat buffers rather than 100k dicts. A table streams to
+JSONL one row at a time, or to Parquet through pyarrow, where the numeric
+buffers are handed over without copying.
+
+Usage:
+    python results.py --db grading.db --job mid2 --output mid2.parquet
+    python results.py --db grading.db --job mid2 --output mid2.jsonl
+    python results.py --benchmark 100000
+"""
+import argparse
+import json
+import math
+import os
+import time
+from array import array
+
+from grades import derive_verdict
+from keypoints import compile_rubric
+
+# Column types: "str" columns are lists, the rest array.array typecodes
+TEXT = "str"
+INTEGER = "q"
+REAL = "d"
+
+
+class PageResult:
+    __slots__ = ("student_id", "page_number", "source", "text", "error", "ocr_seconds")
+    COLUMNS = (
+        ("student_id", TEXT),
+        ("page_number", INTEGER),
+        ("source", TEXT),
+        ("text", TEXT),
+        ("error", TEXT),
+        ("ocr_seconds", REAL),
+    )
+
+    def __init__(self, student_id, page_number, source=None, text=None, error=None, ocr_seconds=None):
+        self.student_id = student_id
+        self.page_number = page_number
+        self.source = source
+        self.text = text
+        self.error = error
+        self.ocr_seconds = ocr_seconds
+
+    @property
+    def content(self):
+        """
+        The page's text, or an error marker in its place, as it appears in
+        the script's combined response.
+        """
+        if self.error is not None:
+            return f"[Error processing {self.source}: {self.error}]"
+        return self.text or ""
+
+    def __repr__(self):
+        return f"PageResult({self.student_id}, page {self.page_number}, {len(self.text or '')} chars)"
+
+
+class QuestionResult:
+    __slots__ = ("student_id", "question_id", "awarded_marks", "max_marks", "verdict", "grade_seconds")
+    COLUMNS = (
+        ("student_id", TEXT),
+        ("question_id", TEXT),
+        ("awarded_marks", REAL),
+        ("max_marks", REAL),
+        ("verdict", TEXT),
+        ("grade_seconds", REAL),
+    )
+
+    def __init__(self, student_id, question_id, awarded_marks=None, max_marks=None, verdict=None, grade_seconds=None):
+        self.student_id = student_id
+        self.question_id = question_id
+        self.awarded_marks = awarded_marks
+        self.max_marks = max_marks
+        self.verdict = verdict
+        self.grade_seconds = grade_seconds
+
+    def __repr__(self):
+        return f"QuestionResult({self.student_id}, {self.question_id}, {self.awarded_marks}/{self.max_marks})"
+
+
+def question_results(student_id, grade, grade_seconds=None):
+    """
+    QuestionResults of a grades.ScriptGrade.
+    """
+    return [
+        QuestionResult(student_id, question.question_id, question.awarded_marks, question.max_marks, question.verdict, grade_seconds)
+        for question in grade.questions
+    ]
+
+
+def combined_text(pages):
+    """
+    The script's response as the grader sees it: page texts in order, one
+    per line, built with a single join.
+    """
+    return "\n".join(page.content for page in pages)
+
+
+class ResultTable:
+    """
+    Column-oriented records of one type (PageResult or QuestionResult).
+    Missing numbers are kept as NaN in the numeric columns and come back
+    as None.
+    """
+
+    def __init__(self, record_type):
+        self.record_type = record_type
+        self.columns = {
+            name: [] if kind == TEXT else array(kind)
+            for name, kind in record_type.COLUMNS
+        }
+
+    def append(self, record):
+        for name, kind in self.record_type.COLUMNS:
+            value = getattr(record, name)
+            if kind == REAL:
+                value = math.nan if value is None else value
+            self.columns[name].append(value)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return len(self.columns[self.record_type.COLUMNS[0][0]])
+
+    def row(self, index):
+        values = {}
+        for name, kind in self.record_type.COLUMNS:
+            value = self.columns[name][index]
+            if kind == REAL and math.isnan(value):
+                value = None
+            values[name] = value
+        return values
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.record_type(**self.row(index))
+
+    def column(self, name):
+        return self.columns[name]
+
+    def to_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for index in range(len(self)):
+                f.write(json.dumps(self.row(index), ensure_ascii=False))
+                f.write("\n")
+
+    @classmethod
+    def from_jsonl(cls, record_type, path):
+        table = cls(record_type)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    table.append(record_type(**json.loads(line)))
+        return table
+
+    def to_arrow(self):
+        try:
+            import numpy as np
+            import pyarrow as pa
+        except ImportError:
+            raise Exception("pyarrow is required for Arrow and Parquet output (pip install pyarrow)")
+
+        arrays = {}
+        for name, kind in self.record_type.COLUMNS:
+            values = self.columns[name]
+            if kind == TEXT:
+                arrays[name] = pa.array(values, type=pa.string())
+            else:
+                # Wraps the array's buffer; NaN becomes null
+                arrays[name] = pa.array(np.frombuffer(values, dtype=np.dtype(kind)), from_pandas=kind == REAL)
+        return pa.table(arrays)
+
+    def to_parquet(self, path):
+        table = self.to_arrow()
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, path)
+
+    @classmethod
+    def from_parquet(cls, record_type, path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("pyarrow is required for Arrow and Parquet output (pip install pyarrow)")
+
+        table = cls(record_type)
+        for row in pq.read_table(path).to_pylist():
+            table.append(record_type(**row))
+        return table
+
+    def write(self, path):
+        """
+        Write as Parquet or JSONL, by the path's extension.
+        """
+        if path.endswith(".parquet"):
+            self.to_parquet(path)
+        else:
+            self.to_jsonl(path)
+
+
+def export_job(job_store, job_id):
+    """
+    (pages, questions) ResultTables of a job in a JobStore. Max marks and
+    verdicts are derived from the job's current marking scheme. Timings are
+    null where no call was made for that page or answer alone: packed
+    pages and answers, whole-script grades and cluster members.
+    """
+    marking_scheme = job_store.marking_scheme(job_id)
+    if marking_scheme is None:
+        raise ValueError(f"Unknown job '{job_id}'")
+    max_marks = compile_rubric(marking_scheme).marks
+
+    conn = job_store.connection()
+    pages = ResultTable(PageResult)
+    for row in conn.execute(
+        "SELECT student_id, page_number, source_path, ocr_text, error, ocr_seconds FROM pages WHERE job_id = ? "
+        "ORDER BY student_id, page_number",
+        (job_id,),
+    ):
+        pages.append(
+            PageResult(
+                row["student_id"], row["page_number"], row["source_path"], row["ocr_text"], row["error"],
+                row["ocr_seconds"],
+            )
+        )
+
+    questions = ResultTable(QuestionResult)
+    for row in conn.execute(
+        "SELECT student_id, question_id, awarded_marks, grade_seconds FROM questions WHERE job_id = ? "
+        "ORDER BY student_id, question_id",
+        (job_id,),
+    ):
+        marks = max_marks.get(row["question_id"])
+        verdict = derive_verdict(row["awarded_marks"], marks) if row["awarded_marks"] is not None else None
+        questions.append(
+            QuestionResult(
+                row["student_id"], row["question_id"], row["awarded_marks"], marks, verdict, row["grade_seconds"]
+            )
+        )
+    return pages, questions
+
+
+def output_paths(output):
+    """
+    <stem>.pages<ext> and <stem>.questions<ext> for an output path.
+    """
+    stem, extension = os.path.splitext(output)
+    return f"{stem}.pages{extension or '.jsonl'}", f"{stem}.questions{extension or '.jsonl'}"
+
+
+def run_benchmark(count, work_dir):
+    """
+    Memory and JSONL write time of count page results held as dicts
+    versus a ResultTable.
+    """
+    import tracemalloc
+
+    text = "Question Number: Q1a\nAnswer: DevOps bridges development and operations teams."
+
+    tracemalloc.start()
+    dicts = [
+        {"student_id": f"s{index // 4}", "page_number": index % 4 + 1, "source": None, "text": text,
+         "error": None, "ocr_seconds": 0.5}
+        for index in range(count)
+    ]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    table = ResultTable(PageResult)
+    for index in range(count):
+        table.append(PageResult(f"s{index // 4}", index % 4 + 1, None, text, None, 0.5))
+    table_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    os.makedirs(work_dir, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(work_dir, "dicts.json"), "w", encoding="utf-8") as f:
+        json.dump(dicts, f)
+    dict_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    table.to_jsonl(os.path.join(work_dir, "table.jsonl"))
+    table_seconds = time.perf_counter() - start
+    return {
+        "pages": count,
+        "dicts_mb": round(dict_bytes / 2**20, 1),
+        "table_mb": round(table_bytes / 2**20, 1),
+        "dicts_json_seconds": round(dict_seconds, 3),
+        "table_jsonl_seconds": round(table_seconds, 3),
+    }
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from job_store import JobStore
+
+    parser = argparse.ArgumentParser(description="Export OCR and grading results")
+    parser.add_argument("--db", default="./uploads/grading.db")
+    parser.add_argument("--job", help="job to export")
+    parser.add_argument("--output", help=".parquet or .jsonl; pages and questions go to <stem>.pages/.questions")
+    parser.add_argument("--benchmark", type=int, metavar="PAGES", help="compare dicts and a ResultTable")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        with tempfile.TemporaryDirectory() as work_dir:
+            print(json.dumps(run_benchmark(args.benchmark, work_dir), indent=2))
+    elif args.job and args.output:
+        pages, questions = export_job(JobStore(args.db), args.job)
+        pages_path, questions_path = output_paths(args.output)
+        pages.write(pages_path)
+        questions.write(questions_path)
+        print(f"{len(pages)} pages -> {pages_path}\n{len(questions)} questions -> {questions_path}")
+    else:
+        parser.error("pass --job and --output, or --benchmark")
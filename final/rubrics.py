@@ -0,0 +1,239 @@
+"""
+Marking schemes compiled once per exam, from a .docx or from an image.
+
+A DOCX rubric is read with python-docx; an image rubric (a photographed
+or scanned solution sheet) is transcribed by the vision model. Either way
+the text is normalized the same way (one stripped, non-empty line per
+paragraph) and compiled into a CompiledRubric: the marking scheme text
+the graders consume plus its per-question sections, marks and key points.
+
+Compiled image rubrics are persisted as JSON keyed by the SHA-256 of the
+source file, in DEFAULT_CACHE_DIR unless told otherwise, so an image
+rubric costs one vision call per exam instead of one per grading run, and
+every later student loads it from disk. A DOCX is cheap to read again and
+is only kept in memory.
+
+Usage:
+    python rubrics.py ../test_files/sol3.png
+    python rubrics.py ../test_files/sol3.png --cache-dir /tmp/rubrics
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+
+from keypoints import extract_key_points, section_marks
+from questions import UNKNOWN_QUESTION, split_marking_scheme
+
+DOCX = "docx"
+IMAGE = "image"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
+# Bump when the compiled form changes, so older cache files are rebuilt
+COMPILED_VERSION = 1
+DEFAULT_CACHE_DIR = "./uploads/rubrics"
+
+
+def normalize_lines(lines):
+    return "\n".join(line.strip() for line in lines if line.strip())
+
+
+def docx_text(source):
+    """
+    Text of a .docx given as a path, bytes or file-like object.
+    """
+    import docx
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        return normalize_lines(para.text for para in docx.Document(source).paragraphs)
+    except Exception as e:
+        raise Exception(f"Failed to extract marking scheme from DOCX: {e}")
+
+
+def source_kind(name, data):
+    """
+    DOCX or IMAGE, from the file name or, failing that, the file contents
+    (a .docx is a zip archive).
+    """
+    extension = os.path.splitext(name or "")[1].lower()
+    if extension == ".docx":
+        return DOCX
+    if extension in IMAGE_EXTENSIONS:
+        return IMAGE
+    return DOCX if data[:2] == b"PK" else IMAGE
+
+
+class CompiledRubric:
+    """
+    A marking scheme with the structure derived from it. text is what the
+    graders, the job store and the grade cache use; it is identical for
+    the same scheme whichever source produced it.
+    """
+
+    def __init__(self, text, source=None, source_hash=None, kind=None):
+        self.text = text
+        self.source = source
+        self.source_hash = source_hash
+        self.kind = kind
+        self.sections = {
+            question_id: section
+            for question_id, section in split_marking_scheme(text).items()
+            if question_id != UNKNOWN_QUESTION
+        }
+        self.marks = {question_id: section_marks(section) for question_id, section in self.sections.items()}
+        self.key_points = {
+            question_id: extract_key_points(section) for question_id, section in self.sections.items()
+        }
+
+    def to_dict(self):
+        return {
+            "version": COMPILED_VERSION,
+            "source": self.source,
+            "source_hash": self.source_hash,
+            "kind": self.kind,
+            "text": self.text,
+            "sections": self.sections,
+            "marks": self.marks,
+            "key_points": self.key_points,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # Structure is re-derived from the text, so it always matches this code
+        return cls(data["text"], data.get("source"), data.get("source_hash"), data.get("kind"))
+
+    def __repr__(self):
+        return f"CompiledRubric({self.source or self.kind}, {len(self.sections)} sections)"
+
+
+class RubricStore:
+    """
+    Compile marking schemes once, keyed by content hash. Image rubrics are
+    also kept on disk in cache_dir; nothing is ever written next to the
+    source file.
+    """
+
+    def __init__(self, ocr_analyzer=None, cache_dir=DEFAULT_CACHE_DIR, template=None):
+        from prompts import REGISTRY
+
+        self.ocr_analyzer = ocr_analyzer
+        self.cache_dir = cache_dir
+        self.template = REGISTRY.get(template or "rubric_ocr")
+        self.lock = threading.Lock()
+        # source hash -> lock, so concurrent first loads OCR an image once
+        self.pending = {}
+        # source hash -> CompiledRubric of every source loaded so far
+        self.compiled = {}
+        self.metrics = {"compiled": 0, "loaded": 0, "ocr_calls": 0}
+
+    def read_source(self, source):
+        """
+        Return (name, bytes) of a path, bytes or uploaded file object.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                return os.fspath(source), f.read()
+        if isinstance(source, (bytes, bytearray)):
+            return None, bytes(source)
+        data = source.getvalue() if hasattr(source, "getvalue") else source.read()
+        return getattr(source, "name", None), data
+
+    def cache_path(self, kind, source_hash):
+        """
+        Cache file of an image rubric, or None: a DOCX is not worth a file
+        and a store without a cache_dir keeps everything in memory.
+        """
+        if kind != IMAGE or not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{source_hash}.json")
+
+    def load(self, source):
+        """
+        Return the CompiledRubric of source, compiling it on first use.
+        """
+        name, data = self.read_source(source)
+        source_hash = hashlib.sha256(data).hexdigest()
+        path = self.cache_path(source_kind(name, data), source_hash)
+
+        with self.lock:
+            key_lock = self.pending.setdefault(source_hash, threading.Lock())
+        with key_lock:
+            if source_hash in self.compiled:
+                return self.compiled[source_hash]
+            rubric = self.read_cached(path)
+            if rubric is not None:
+                self.count("loaded")
+            else:
+                rubric = self.compile(name, data, source_hash)
+                if path:
+                    self.write_cached(path, rubric)
+            self.compiled[source_hash] = rubric
+            return rubric
+
+    def read_cached(self, path):
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != COMPILED_VERSION:
+            return None
+        return CompiledRubric.from_dict(data)
+
+    def write_cached(self, path, rubric):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(rubric.to_dict(), f, indent=2)
+        # Readers never see a partially written file
+        os.replace(temp_path, path)
+
+    def compile(self, name, data, source_hash):
+        kind = source_kind(name, data)
+        if kind == DOCX:
+            text = docx_text(data)
+        else:
+            text = normalize_lines(self.transcribe_image(data).splitlines())
+        self.count("compiled")
+        return CompiledRubric(text, source=os.path.basename(name) if name else None, source_hash=source_hash, kind=kind)
+
+    def transcribe_image(self, data):
+        if self.ocr_analyzer is None:
+            raise Exception("An OCR analyzer is required to read an image marking scheme")
+        self.count("ocr_calls")
+        try:
+            result = self.ocr_analyzer.perform_ocr(
+                image_base64=self.ocr_analyzer.encode_image(data),
+                prompt=self.template.render(),
+                template=self.template.template_id,
+            )
+        except Exception as e:
+            raise Exception(f"Failed to extract marking scheme from image: {e}")
+        return result.content
+
+    def count(self, name):
+        with self.lock:
+            self.metrics[name] += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a marking scheme (.docx or image) once and cache it")
+    parser.add_argument("source", help="marking scheme .docx or image")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="where compiled image rubrics are kept")
+    parser.add_argument("--base-url", help="Groq/OpenAI-compatible endpoint")
+    args = parser.parse_args()
+
+    ocr_analyzer = None
+    if source_kind(args.source, b"") == IMAGE:
+        from assessment_tool import ImageOCRAnalyzer
+
+        ocr_analyzer = ImageOCRAnalyzer(base_url=args.base_url)
+    store = RubricStore(ocr_analyzer, cache_dir=args.cache_dir)
+    rubric = store.load(args.source)
+    print(json.dumps({key: value for key, value in rubric.to_dict().items() if key != "text"}, indent=2))
+    print(json.dumps(store.metrics))
@@ -0,0 +1,396 @@
+"""
+Local Groq/OpenAI-compatible stand-in for the chat completions API.
+
+Lets the grading pipeline be exercised and benchmarked without spending API
+quota. Point ImageOCRAnalyzer at it with
+ImageOCRAnalyzer(base_url="http://127.0.0.1:8765") or GROQ_BASE_URL.
+
+Usage:
+    python stub_server.py --port 8765 --latency lognormal:-0.7,0.4 --rate-429 0.05
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from grades import rubric_questions
+from prompts import estimate_tokens
+
+# Paths the Groq and OpenAI clients post chat completions to
+COMPLETION_PATHS = ("/openai/v1/chat/completions", "/v1/chat/completions")
+
+DEFAULT_OCR_RESPONSE = (
+    "Question Number: Q1a\n"
+    "Answer: DevOps refers to a mindset of software teams to deliver a product through "
+    "integration, collaboration, and communication between development and operations teams."
+)
+DEFAULT_GRADE_RESPONSE = (
+    "Question 1: Correct - Awarded Marks: 8\n"
+    "Question 2: Incorrect - Awarded Marks: 2\n"
+    "Total Marks: 10/20"
+)
+
+
+# Packed OCR prompts (see packing.py) list the regions in the mosaic
+REGIONS_RE = re.compile(r"^Regions: (.+)$", re.MULTILINE)
+# Packed grading prompts (see packed_grading.py) tag every answer
+ANSWER_TAG_RE = re.compile(r"^\[(A\d+)\]", re.MULTILINE)
+MARKING_SCHEME_RE = re.compile(r"Marking Scheme:\n(.*?)\n\nStudent Response:", re.DOTALL)
+
+
+def request_key(model, messages, params=None):
+    """
+    Hash a chat completion request so identical requests map to the same
+    recorded response.
+    """
+    payload = {"model": model, "messages": messages, "params": params or {}}
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def has_image(messages):
+    """
+    Return True if any message carries an image part.
+    """
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            if any(part.get("type") == "image_url" for part in content):
+                return True
+    return False
+
+
+def message_text(messages):
+    """
+    Concatenate the text parts of all messages.
+    """
+    texts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(texts)
+
+
+class LatencyModel:
+    """
+    Response latency distribution, parsed from specs such as:
+        fixed:0.5           always 0.5s
+        uniform:0.2,1.0     uniform between 0.2s and 1.0s
+        normal:0.8,0.2      normal with mean 0.8s and stddev 0.2s (clamped at 0)
+        lognormal:-0.7,0.4  lognormal with mu/sigma of the underlying normal
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec="fixed:0"):
+        kind, _, params = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}' in '{spec}'")
+        try:
+            self.params = [float(p) for p in params.split(",")] if params else [0.0]
+        except ValueError:
+            raise ValueError(f"Invalid latency parameters in '{spec}'")
+        expected = 1 if kind == "fixed" else 2
+        if len(self.params) != expected:
+            raise ValueError(f"Latency '{kind}' expects {expected} parameter(s), got '{spec}'")
+        self.kind = kind
+        self.spec = spec
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(*self.params))
+        return rng.lognormvariate(*self.params)
+
+
+class StubBackend:
+    """
+    Decides what the stand-in returns for each request: an injected error,
+    a recorded response matched by request hash, a canned rule match, or a
+    default response.
+    """
+
+    def __init__(
+        self, latency="fixed:0", rate_429=0.0, rate_5xx=0.0, responses_path=None, seed=None
+    ):
+        self.latency = LatencyModel(latency)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rng = random.Random(seed)
+        self.responses = {}
+        self.rules = []
+        self.default_ocr = DEFAULT_OCR_RESPONSE
+        self.default_text = DEFAULT_GRADE_RESPONSE
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "recorded": 0, "canned": 0}
+        if responses_path:
+            self.load_responses(responses_path)
+
+    def load_responses(self, responses_path):
+        """
+        Load canned and recorded responses. The file is JSON with optional keys:
+            "responses": {request_key: content}   (e.g. a recorded cassette)
+            "rules": [{"contains": text, "content": content}]
+            "default_ocr" / "default_text": fallback contents
+        """
+        try:
+            with open(responses_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise Exception(f"Failed to load stub responses '{responses_path}': {e}")
+
+        for key, entry in data.get("responses", {}).items():
+            # Cassette entries store the response under "content"
+            self.responses[key] = entry["content"] if isinstance(entry, dict) else entry
+        self.rules = data.get("rules", [])
+        self.default_ocr = data.get("default_ocr", self.default_ocr)
+        self.default_text = data.get("default_text", self.default_text)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def draw(self):
+        """
+        Draw the fault decision and latency for one request under the lock,
+        since random.Random is shared across handler threads.
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            roll = self.rng.random()
+            delay = self.latency.sample(self.rng)
+        if roll < self.rate_429:
+            return "429", delay
+        if roll < self.rate_429 + self.rate_5xx:
+            return "5xx", delay
+        return "ok", delay
+
+    def choose_content(self, payload):
+        messages = payload.get("messages", [])
+        params = {
+            k: v for k, v in payload.items() if k not in ("model", "messages", "stream")
+        }
+        key = request_key(payload.get("model"), messages, params)
+        if key in self.responses:
+            self.count("recorded")
+            return self.responses[key]
+
+        text = message_text(messages)
+        for rule in self.rules:
+            if rule.get("contains", "") in text:
+                self.count("canned")
+                return rule["content"]
+        if not has_image(messages):
+            if params.get("response_format", {}).get("type") == "json_object":
+                return self.json_grade(text)
+            tags = ANSWER_TAG_RE.findall(text)
+            if tags:
+                return "\n".join(f"{tag}: Correct - Awarded Marks: 1" for tag in tags)
+            return self.default_text
+        regions = REGIONS_RE.search(text)
+        if regions:
+            # One block per packed region, so replies split like real ones
+            return "\n".join(
+                f"=== {label.strip()} ===\n{self.default_ocr}" for label in regions.group(1).split(",")
+            )
+        return self.default_ocr
+
+    def json_grade(self, text):
+        """
+        A strict JSON grade (see grades.py) awarding half marks for every
+        question of the marking scheme in the prompt.
+        """
+        match = MARKING_SCHEME_RE.search(text)
+        structure = rubric_questions(match.group(1)) if match else {}
+        questions = [
+            {
+                "question": part,
+                "verdict": "Partially Correct",
+                "awarded_marks": (marks or 10) / 2,
+                "max_marks": marks or 10,
+            }
+            for parts in structure.values()
+            for part, marks in parts.items()
+        ] or [{"question": "1", "verdict": "Partially Correct", "awarded_marks": 5, "max_marks": 10}]
+        return json.dumps(
+            {
+                "questions": questions,
+                "total_marks": sum(question["awarded_marks"] for question in questions),
+                "max_total_marks": sum(question["max_marks"] for question in questions),
+            }
+        )
+
+    def handle(self, payload):
+        """
+        Return (status, body, headers) for a chat completion payload.
+        """
+        outcome, delay = self.draw()
+        if outcome == "429":
+            self.count("429")
+            # Rate limits are rejected quickly, before any generation happens
+            time.sleep(min(delay, 0.05))
+            body = {
+                "error": {
+                    "message": "Rate limit reached (injected by stub server)",
+                    "type": "tokens",
+                    "code": "rate_limit_exceeded",
+                }
+            }
+            return 429, body, {"retry-after": "1"}
+        if outcome == "5xx":
+            self.count("5xx")
+            time.sleep(delay)
+            body = {"error": {"message": "Internal server error (injected by stub server)", "type": "internal_server_error"}}
+            return 503, body, {}
+
+        content = self.choose_content(payload)
+        time.sleep(delay)
+        self.count("ok")
+
+        messages = payload.get("messages", [])
+        prompt_tokens = estimate_tokens(message_text(messages), images=1 if has_image(messages) else 0)
+        completion_tokens = estimate_tokens(content)
+        body = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        return 200, body, {}
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if self.path.rstrip("/") not in COMPLETION_PATHS:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            self.send_json(400, {"error": {"message": "Request body is not valid JSON"}})
+            return
+        status, body, headers = self.server.backend.handle(payload)
+        self.send_json(status, body, headers)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.backend.lock:
+                stats = dict(self.server.backend.stats)
+            self.send_json(200, stats)
+        elif self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+
+class StubServer:
+    """
+    Run the stand-in in a background thread, e.g. from a benchmark:
+
+        with StubServer(latency="uniform:0.2,0.6") as server:
+            analyzer = ImageOCRAnalyzer(base_url=server.base_url)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, **backend_kwargs):
+        self.httpd = ThreadingHTTPServer((host, port), StubRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.backend = StubBackend(**backend_kwargs)
+        self.thread = None
+
+    @property
+    def backend(self):
+        return self.httpd.backend
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Groq-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0", help="e.g. uniform:0.2,1.0")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--responses", help="JSON file of canned or recorded responses")
+    parser.add_argument("--seed", type=int, help="seed for latency and fault injection")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    server = StubServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        responses_path=args.responses,
+        seed=args.seed,
+    )
+    print(f"Stub server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
@@ -0,0 +1,80 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in final/ and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grades import parse_script_grade  # noqa: E402
+from job_store import JobStore  # noqa: E402
+from results import PageResult  # noqa: E402
+
+MARKING_SCHEME = """Question 1: DevOps (10 Marks)
+a. Benefits (6 Marks)
+Faster Delivery: Speeds up releases.
+Improved Collaboration: Bridges development and operations teams.
+b. Risks (4 Marks)
+Tool Sprawl: Too many tools to maintain.
+Question 2: Containers (5 Marks)
+Isolation: Each service runs in its own environment."""
+
+
+@pytest.fixture
+def marking_scheme():
+    return MARKING_SCHEME
+
+
+@pytest.fixture
+def job_store(tmp_path):
+    store = JobStore(str(tmp_path / "grading.db"))
+    yield store
+    store.close()
+
+
+class FakeAssessmentTool:
+    """
+    Stands in for AssessmentTool. pages maps a page path to its OCR text,
+    replies maps a question id to its grade and script is the whole-script
+    grade; any of them raises when it is an exception.
+    """
+
+    ocr_analyzer = None
+    grade_cache = None
+    packer = None
+
+    def __init__(self, pages=None, replies=None, script=None):
+        self.pages = pages or {}
+        self.replies = replies or {}
+        self.script = script
+        self.calls = []
+
+    def reply(self, value):
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def extract_page_response(self, source_path):
+        self.calls.append(source_path)
+        return self.reply(self.pages[source_path])
+
+    def extract_pages(self, student_image_paths, on_page=None, student_id=None):
+        pages = []
+        for index, path in enumerate(student_image_paths):
+            pages.append(PageResult(student_id, index + 1, f"page {index + 1}", self.extract_page_response(path)))
+            if on_page:
+                on_page(index + 1, len(student_image_paths))
+        return pages
+
+    def assess_question(self, question_id, marking_scheme, answer):
+        self.calls.append((question_id, answer))
+        return self.reply(self.replies[question_id])
+
+    def grade_student_response(self, student_response, marking_scheme):
+        self.calls.append("script")
+        return parse_script_grade(self.reply(self.script), marking_scheme)
+
+
+@pytest.fixture
+def fake_tool():
+    return FakeAssessmentTool
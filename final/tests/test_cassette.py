@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from cassette import CassetteMiss, CassetteOCRAnalyzer
+from prompts import UsageLog
+
+
+class Reply:
+    def __init__(self, content):
+        self.content = content
+
+
+class CountingAnalyzer:
+    """
+    Stands in for ImageOCRAnalyzer: echoes the prompt and counts calls.
+    """
+
+    model_name = "test-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    def perform_ocr(self, image_base64=None, prompt="", **kwargs):
+        self.calls += 1
+        return Reply(f"read: {prompt}")
+
+    def encode_image(self, data):
+        return "encoded"
+
+
+def test_record_then_replay(tmp_path):
+    path = str(tmp_path / "run.json")
+    analyzer = CountingAnalyzer()
+    with CassetteOCRAnalyzer(analyzer, path, mode="record") as recorder:
+        assert recorder.perform_ocr(image_base64="aGk=", prompt="page 1").content == "read: page 1"
+    assert recorder.stats["recorded"] == 1
+
+    replayer = CassetteOCRAnalyzer(CountingAnalyzer(), path, mode="replay")
+    assert replayer.perform_ocr(image_base64="aGk=", prompt="page 1").content == "read: page 1"
+    assert replayer.stats == {"hits": 1, "misses": 0, "recorded": 0}
+    assert replayer.ocr_analyzer.calls == 0
+
+
+def test_replay_fails_on_unknown_requests(tmp_path):
+    path = str(tmp_path / "run.json")
+    with CassetteOCRAnalyzer(CountingAnalyzer(), path, mode="record") as recorder:
+        recorder.perform_ocr(prompt="page 1")
+
+    replayer = CassetteOCRAnalyzer(CountingAnalyzer(), path, mode="replay")
+    with pytest.raises(CassetteMiss):
+        replayer.perform_ocr(prompt="page 2")
+    with pytest.raises(FileNotFoundError):
+        CassetteOCRAnalyzer(CountingAnalyzer(), str(tmp_path / "missing.json"), mode="replay")
+    with pytest.raises(ValueError):
+        CassetteOCRAnalyzer(CountingAnalyzer(), path, mode="rewind")
+
+
+def test_auto_records_only_new_requests(tmp_path):
+    path = str(tmp_path / "run.json")
+    analyzer = CountingAnalyzer()
+    with CassetteOCRAnalyzer(analyzer, path, mode="auto") as cassette:
+        cassette.perform_ocr(prompt="page 1")
+        cassette.perform_ocr(prompt="page 1")
+        cassette.perform_ocr(prompt="page 2")
+    assert analyzer.calls == 2
+    assert cassette.stats == {"hits": 1, "misses": 2, "recorded": 2}
+
+
+def test_delegates_other_analyzer_methods(tmp_path):
+    cassette = CassetteOCRAnalyzer(CountingAnalyzer(), str(tmp_path / "run.json"), mode="auto")
+    assert cassette.encode_image(b"") == "encoded"
+    assert cassette.model_name == "test-model"
+
+
+class MeteredAnalyzer(CountingAnalyzer):
+    """
+    Records usage in a UsageLog, as ImageOCRAnalyzer does, and returns a
+    message without it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.usage = UsageLog()
+
+    def perform_ocr(self, image_base64=None, prompt="", template=None, **kwargs):
+        self.usage.record(template, SimpleNamespace(prompt_tokens=120, completion_tokens=len(prompt)), 99, 0.1)
+        return super().perform_ocr(image_base64=image_base64, prompt=prompt, **kwargs)
+
+
+def test_replay_returns_and_reports_the_recorded_usage(tmp_path):
+    path = str(tmp_path / "run.json")
+    with CassetteOCRAnalyzer(MeteredAnalyzer(), path, mode="record") as recorder:
+        recorder.perform_ocr(prompt="page 1", template="ocr@1")
+        recorder.perform_ocr(prompt="page 22", template="ocr@1")
+
+    analyzer = MeteredAnalyzer()
+    replayer = CassetteOCRAnalyzer(analyzer, path, mode="replay")
+    usage = replayer.perform_ocr(prompt="page 22", template="ocr@1").usage
+    assert (usage.prompt_tokens, usage.completion_tokens) == (120, 7)
+    assert analyzer.usage.report()["ocr@1"]["completion_tokens"] == 7
+    assert analyzer.calls == 0
+
+
+def test_unreported_usage_is_not_invented(tmp_path):
+    path = str(tmp_path / "run.json")
+    with CassetteOCRAnalyzer(CountingAnalyzer(), path, mode="record") as recorder:
+        recorder.perform_ocr(prompt="page 1")
+    assert CassetteOCRAnalyzer(CountingAnalyzer(), path, mode="replay").perform_ocr(prompt="page 1").usage is None
+
+
+def test_stats_are_exact_under_concurrent_calls(tmp_path):
+    cassette = CassetteOCRAnalyzer(CountingAnalyzer(), str(tmp_path / "run.json"), mode="auto")
+    prompts = [f"page {index % 50}" for index in range(2000)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda prompt: cassette.perform_ocr(prompt=prompt), prompts))
+    stats = cassette.stats
+    assert stats["hits"] + stats["misses"] == 2000
+    assert stats["recorded"] == stats["misses"]
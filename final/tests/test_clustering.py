@@ -0,0 +1,94 @@
+from batch_grader import BatchGrader
+from clustering import EXACT, REPRESENTATIVE, SEMANTIC, answer_hash, cluster_answers
+from job_store import GRADED, OCR_DONE
+
+REPLIES = {
+    "1a": "Question 1a: Correct - Awarded Marks: 6",
+    "2": "Question 2: Correct - Awarded Marks: 5",
+}
+
+
+class FakeEmbedder:
+    """
+    Similarity 1.0 between texts sharing their first word, else 0.
+    """
+
+    def similarity_matrix(self, texts):
+        return [[float(a.split()[0] == b.split()[0]) for b in texts] for a in texts]
+
+
+def test_answer_hash_folds_case_and_whitespace():
+    assert answer_hash("Faster  Delivery\n") == answer_hash("faster delivery")
+
+
+def test_answer_hash_keeps_signs_and_operators():
+    assert answer_hash("x = -1") != answer_hash("x = 1")
+    assert answer_hash("a + b") != answer_hash("a - b")
+    assert answer_hash("3.14") != answer_hash("314")
+
+
+def test_cluster_answers_groups_exact_duplicates_only():
+    clusters = cluster_answers(
+        {"alice": "faster delivery", "bob": "Faster  Delivery", "carol": "isolation", "dave": "", "erin": ""}
+    )
+    groups = sorted(sorted(cluster.members) for cluster in clusters)
+    # Empty answers are never merged, not even with each other
+    assert groups == [["alice", "bob"], ["carol"], ["dave"], ["erin"]]
+    assert clusters[0].members == {"alice": (REPRESENTATIVE, 1.0), "bob": (EXACT, 1.0)}
+
+
+def test_embedder_merges_similar_buckets_into_the_representative():
+    clusters = cluster_answers(
+        {"alice": "faster delivery", "bob": "faster releases", "carol": "isolation"}, FakeEmbedder()
+    )
+    assert [sorted(cluster.members) for cluster in clusters] == [["alice", "bob"], ["carol"]]
+    assert clusters[0].members["bob"] == (SEMANTIC, 1.0)
+
+
+def test_clustered_run_grades_each_distinct_answer_once(job_store, marking_scheme, fake_tool):
+    scripts = {student_id: [f"{student_id}/1.png"] for student_id in ("alice", "bob", "carol")}
+    pages = {
+        "alice/1.png": "Question Number: Q1a\nAnswer: Faster delivery\nQuestion Number: Q2\nAnswer: isolation",
+        "bob/1.png": "Question Number: Q1a\nAnswer: faster  delivery\nQuestion Number: Q2\nAnswer: isolation",
+        "carol/1.png": "Question Number: Q2\nAnswer: isolation",
+    }
+    tool = fake_tool(pages=pages, replies=REPLIES)
+    grader = BatchGrader(tool, job_store, cluster=True)
+
+    progress = grader.run("mid2", scripts, marking_scheme)
+    assert progress["students"] == {GRADED: 3}
+    assert [call[0] for call in tool.calls if isinstance(call, tuple)] == ["1a", "2"]
+    assert grader.cluster_stats == {"answers": 5, "clusters": 2, "grading_calls": 2, "failed": 0}
+    assert job_store.result("mid2", "bob")["total_marks"] == 11
+
+    audit = {row["question_id"]: row for row in job_store.grade_audit("mid2", "bob")}
+    assert audit["1a"]["source_student_id"] == "alice"
+    assert audit["1a"]["method"] == EXACT
+    assert audit["1a"]["assessment_result"] is None
+
+
+def split_student(job_store, job_id, student_id, answers):
+    job_store.add_student(job_id, student_id, ["page_1.png"])
+    job_store.record_ocr(job_id, student_id, 1, "")
+    job_store.claim_ocr_complete(job_id, student_id)
+    job_store.record_questions(job_id, student_id, answers)
+
+
+def test_grade_clusters_records_failures_and_leaves_them_ungraded(job_store, marking_scheme, fake_tool):
+    job_store.create_job("mid2", marking_scheme)
+    split_student(job_store, "mid2", "alice", {"1a": "faster delivery", "2": "isolation"})
+    split_student(job_store, "mid2", "bob", {"1a": "Faster  Delivery", "2": "no idea"})
+    tool = fake_tool(replies={"1a": "I cannot grade this answer.", "2": "Question 2: Partially Correct - Awarded Marks: 2"})
+    grader = BatchGrader(tool, job_store, cluster=True)
+
+    grader.grade_clusters("mid2", marking_scheme)
+    # alice and bob share one 1a cluster: one call, one failure
+    assert [call[0] for call in tool.calls].count("1a") == 1
+    assert grader.cluster_stats["failed"] == 1
+    for student_id in ("alice", "bob"):
+        questions = {row["question_id"]: row for row in job_store.questions("mid2", student_id)}
+        assert questions["1a"]["state"] == OCR_DONE
+        assert questions["1a"]["awarded_marks"] is None
+        assert questions["2"]["awarded_marks"] == 2.0
+    # The failed cluster is left for the next run
+    assert set(job_store.ungraded_answers("mid2")) == {"1a"}
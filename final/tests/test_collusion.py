@@ -0,0 +1,103 @@
+import random
+
+import zlib
+
+import numpy as np
+import pytest
+
+import collusion
+from collusion import LSHIndex, MinHasher, find_copied_answers, group_students, word_shingles
+
+ANSWER = (
+    "continuous integration merges every change into the main branch several times a day "
+    "so that integration problems surface early and are cheap to fix"
+)
+
+
+def reference_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def test_bit_parallel_edit_distance_matches_the_textbook_one(monkeypatch):
+    monkeypatch.setattr(collusion, "levenshtein_distance", None)
+    rng = random.Random(0)
+    for _ in range(200):
+        a = "".join(rng.choices("abc ", k=rng.randint(0, 70)))
+        b = "".join(rng.choices("abc ", k=rng.randint(0, 70)))
+        assert collusion.edit_distance(a, b) == reference_distance(a, b)
+
+
+def test_word_shingles():
+    assert word_shingles("a b c d".split(), 3) == {"a b c", "b c d"}
+    assert word_shingles(["a"], 3) == {"a"}
+    assert word_shingles([], 3) == set()
+
+
+def test_identical_shingle_sets_share_every_band():
+    hasher = MinHasher()
+    first = hasher.signature(word_shingles(ANSWER.split()))
+    second = hasher.signature(word_shingles(ANSWER.split()))
+    assert (first == second).all()
+    index = LSHIndex()
+    index.add("alice", first)
+    index.add("bob", second)
+    assert index.candidate_pairs() == {("alice", "bob")}
+
+
+def test_batched_signatures_match_single_ones_and_stay_32_bit():
+    hasher = MinHasher()
+    rng = random.Random(1)
+    shingle_sets = [word_shingles(rng.choices(ANSWER.split(), k=rng.randint(3, 40))) for _ in range(50)]
+    hash_arrays = [
+        np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set], dtype=np.uint64)
+        for shingle_set in shingle_sets
+    ]
+    batched = hasher.signatures(hash_arrays)
+    assert batched.shape == (50, hasher.num_perm)
+    assert int(batched.max()) < 2**32
+    for shingle_set, row in zip(shingle_sets, batched):
+        assert (hasher.signature(shingle_set) == row).all()
+    # Exact (a * x + b) mod p in Python integers, which never overflow
+    a, b = (int(value) for value in (hasher.a[0], hasher.b[0]))
+    assert int(batched[0, 0]) == min((a * int(x) + b) % collusion.HASH_PRIME for x in hash_arrays[0])
+
+
+def test_lsh_rejects_uneven_bands():
+    with pytest.raises(ValueError):
+        LSHIndex(num_perm=128, bands=30)
+
+
+def test_flags_copied_answers_only():
+    answers = {
+        "1": {
+            "alice": ANSWER,
+            "bob": ANSWER.replace("cheap", "easy"),
+            "carol": "containers package an application with its dependencies so it runs the same "
+            "on a laptop in testing and in production without changes",
+            "dave": "ci",
+        },
+        "unknown": {"alice": ANSWER, "bob": ANSWER},
+    }
+    flagged, stats = find_copied_answers(answers)
+    assert [pair["students"] for pair in flagged] == [["alice", "bob"]]
+    assert flagged[0]["levenshtein"] > 0.9
+    assert stats["answers"] == 4
+    assert stats["skipped_short"] == 1
+
+
+def test_group_students_links_pairs_across_questions():
+    flagged = [
+        {"question_id": "1", "students": ["alice", "bob"]},
+        {"question_id": "2", "students": ["bob", "carol"]},
+        {"question_id": "2", "students": ["dave", "erin"]},
+    ]
+    assert group_students(flagged) == [
+        {"students": ["alice", "bob", "carol"], "questions": ["1", "2"]},
+        {"students": ["dave", "erin"], "questions": ["2"]},
+    ]
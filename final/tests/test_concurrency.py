@@ -0,0 +1,134 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import concurrency
+from concurrency import AdaptiveLimiter, is_rate_limited
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def fill_round(limiter, latency, kind=concurrency.DEFAULT_KIND):
+    """
+    Saturate the limiter and complete one round of requests.
+    """
+    for _ in range(limiter.limit):
+        limiter.acquire()
+    for _ in range(limiter.limit):
+        limiter.release()
+        limiter.record(latency, kind=kind)
+
+
+def test_is_rate_limited():
+    assert is_rate_limited(RateLimitError())
+    assert not is_rate_limited(ValueError("bad request"))
+
+
+def test_stable_latency_grows_the_limit_by_one_per_round():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=4)
+    for _ in range(5):
+        fill_round(limiter, 0.1)
+    assert limiter.limit == 4
+    assert limiter.counters["increases"] == 2
+
+
+def test_limit_only_grows_when_it_was_used():
+    limiter = AdaptiveLimiter(initial_limit=2)
+    for _ in range(10):
+        limiter.call(lambda: None)
+    assert limiter.limit == 2
+
+
+def test_latency_spike_halves_the_limit():
+    limiter = AdaptiveLimiter(initial_limit=8, cooldown=0)
+    fill_round(limiter, 0.1)
+    limit = limiter.limit
+    # The window p95 only moves once the slow calls dominate it
+    for _ in range(3):
+        fill_round(limiter, 1.0)
+    assert limiter.limit < limit
+    assert "decrease" in [decision["action"] for decision in limiter.decisions]
+
+
+def test_lasting_latency_shift_is_absorbed():
+    limiter = AdaptiveLimiter(initial_limit=8, max_limit=8, cooldown=0)
+    fill_round(limiter, 0.1)
+    for _ in range(20):
+        fill_round(limiter, 0.2)
+    # Re-baselined after a cut or two, the limit grows back
+    assert limiter.limit > limiter.min_limit
+    assert limiter.decisions[-1]["action"] == "increase"
+
+
+def test_latency_is_tracked_per_kind():
+    limiter = AdaptiveLimiter(initial_limit=4, cooldown=0)
+    for _ in range(5):
+        fill_round(limiter, 0.1, kind="text")
+        fill_round(limiter, 2.0, kind="image")
+    # Slow OCR calls are not spikes in text grading
+    assert limiter.counters["decreases"] == 0
+    assert set(limiter.metrics()["baseline_p95"]) == {"image", "text"}
+
+
+def test_429_cuts_the_limit_once_per_cooldown():
+    limiter = AdaptiveLimiter(initial_limit=8, cooldown=60, rate_limit_retries=0)
+
+    def rate_limited():
+        raise RateLimitError()
+
+    for _ in range(3):
+        with pytest.raises(RateLimitError):
+            limiter.call(rate_limited)
+    assert limiter.limit == 4
+    assert limiter.counters["rate_limited"] == 3
+    assert limiter.in_flight == 0
+
+
+def test_429_is_retried_after_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(concurrency.time, "sleep", sleeps.append)
+    limiter = AdaptiveLimiter(initial_limit=8, cooldown=60)
+    error = RateLimitError()
+    error.response = SimpleNamespace(headers={"retry-after": "2"})
+    replies = [error, RateLimitError(), "graded"]
+
+    def flaky():
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    assert limiter.call(flaky) == "graded"
+    assert sleeps == [2.0, concurrency.RETRY_BACKOFF * 2]
+    assert (limiter.counters["retries"], limiter.counters["rate_limited"], limiter.limit) == (2, 2, 4)
+    assert limiter.in_flight == 0
+
+
+def test_other_errors_leave_the_limit_alone():
+    limiter = AdaptiveLimiter(initial_limit=4)
+    with pytest.raises(ValueError):
+        limiter.call(lambda: int("x"))
+    assert limiter.limit == 4
+    assert limiter.counters["errors"] == 1
+
+
+def test_in_flight_never_exceeds_the_limit():
+    limiter = AdaptiveLimiter(initial_limit=3, max_limit=3)
+    peak = []
+    gate = threading.Event()
+
+    def request():
+        peak.append(limiter.in_flight)
+        gate.wait(1)
+
+    threads = [threading.Thread(target=limiter.call, args=(request,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 3
+    assert limiter.metrics()["requests"] == 8
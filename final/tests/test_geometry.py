@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+from geometry import GeometryNormalizer, build_pyramid, find_page_quad, hugs_frame, order_corners
+
+
+def sheet(width=600, height=800):
+    page = np.full((height, width, 3), 245, np.uint8)
+    for row in range(80, height - 60, 45):
+        cv2.putText(page, "continuous delivery", (40, row), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 2)
+    return page
+
+
+def photo_of(page, corners, size=(1200, 1000)):
+    """
+    The sheet seen in perspective on a dark desk.
+    """
+    height, width = page.shape[:2]
+    source = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    transform = cv2.getPerspectiveTransform(source, np.array(corners, dtype=np.float32))
+    return cv2.warpPerspective(page, transform, size, borderValue=(40, 60, 90))
+
+
+def test_order_corners():
+    corners = order_corners([[10, 90], [90, 10], [10, 10], [90, 90]])
+    assert corners.tolist() == [[10, 10], [90, 10], [90, 90], [10, 90]]
+
+
+def test_build_pyramid_stops_at_probe_size():
+    levels = build_pyramid(np.zeros((2000, 1500), np.uint8), size=512)
+    assert [level.shape for level in levels] == [(2000, 1500), (1000, 750), (500, 375)]
+
+
+def test_sheet_in_perspective_is_rectified_and_cropped():
+    photo = photo_of(sheet(), [[300, 120], [880, 180], [930, 900], [250, 860]])
+    assert find_page_quad(photo) is not None
+
+    normalized, info = GeometryNormalizer(budget_ms=10_000).normalize(photo)
+    assert info["warped"]
+    assert info["quad"] is not None
+    assert normalized.shape[0] * normalized.shape[1] < 0.6 * photo.shape[0] * photo.shape[1]
+    # The rectified sheet is mostly paper
+    assert np.median(normalized) > 200
+
+
+def test_level_page_filling_the_frame_is_left_alone():
+    page = sheet()
+    normalized, info = GeometryNormalizer(budget_ms=10_000).normalize(page)
+    assert normalized is page
+    assert not info["warped"]
+
+
+def test_spent_budget_skips_skew_detection():
+    photo = photo_of(sheet(), [[300, 120], [880, 180], [930, 900], [250, 860]])
+    _, info = GeometryNormalizer(budget_ms=0).normalize(photo)
+    assert info["budget_exceeded"]
+    assert info["skew"] == 0.0
+
+
+def test_quad_on_the_frame_corners_is_the_frame():
+    assert hugs_frame(order_corners([[2, 3], [597, 1], [598, 796], [1, 798]]), (600, 800))
+    assert not hugs_frame(order_corners([[100, 80], [597, 1], [598, 796], [1, 798]]), (600, 800))
+
+
+def test_rotated_sheet_is_cropped_back_to_its_size():
+    page = sheet()
+    matrix = cv2.getRotationMatrix2D((300, 400), 4.0, 1.0)
+    rotated = cv2.warpAffine(page, matrix, (600, 800), borderValue=(245, 245, 245))
+    normalized, info = GeometryNormalizer(budget_ms=10_000).normalize(rotated)
+    assert abs(info["skew"]) >= 1.0
+    assert info["warped"]
+    # Never larger than the sheet it came from
+    assert normalized.shape[0] <= page.shape[0] and normalized.shape[1] <= page.shape[1]
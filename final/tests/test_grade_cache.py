@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+from assessment_tool import AssessmentTool
+from grade_cache import GradeCache
+from questions import rubric_for_question, split_marking_scheme
+
+GRADE = "Question 1a: Correct - Awarded Marks: 6"
+
+
+class GradingAnalyzer:
+    """
+    Stands in for ImageOCRAnalyzer on grading calls and counts them.
+    """
+
+    model_name = "test-model"
+
+    def __init__(self, reply=GRADE):
+        self.reply = reply
+        self.prompts = []
+
+    def perform_ocr(self, image_base64=None, prompt="", template=None):
+        self.prompts.append(prompt)
+        return SimpleNamespace(content=self.reply)
+
+
+def test_split_marking_scheme_repeats_the_question_heading(marking_scheme):
+    sections = split_marking_scheme(marking_scheme)
+    assert sorted(sections) == ["1", "1a", "1b", "2"]
+    assert sections["1b"].splitlines()[:2] == ["Question 1: DevOps (10 Marks)", "b. Risks (4 Marks)"]
+
+
+def test_rubric_for_question(marking_scheme):
+    assert "Faster Delivery" in rubric_for_question(marking_scheme, "1a")
+    assert "Tool Sprawl" not in rubric_for_question(marking_scheme, "1a")
+    whole = rubric_for_question(marking_scheme, "1")
+    assert "Faster Delivery" in whole and "Tool Sprawl" in whole
+    assert rubric_for_question(marking_scheme, "7") == marking_scheme
+
+
+def test_key_changes_with_every_input_that_changes_the_grade():
+    parts = GradeCache.key_parts("1a", "rubric", "Faster Delivery", "model", "grade_question@1")
+    assert parts == GradeCache.key_parts("1a", "rubric", " faster   delivery ", "model", "grade_question@1")
+    for changed in (
+        GradeCache.key_parts("1b", "rubric", "Faster Delivery", "model", "grade_question@1"),
+        GradeCache.key_parts("1a", "rubric v2", "Faster Delivery", "model", "grade_question@1"),
+        GradeCache.key_parts("1a", "rubric", "Slower Delivery", "model", "grade_question@1"),
+        GradeCache.key_parts("1a", "rubric", "Faster Delivery!", "model", "grade_question@1"),
+        GradeCache.key_parts("1a", "rubric", "Faster Delivery", "other model", "grade_question@1"),
+        GradeCache.key_parts("1a", "rubric", "Faster Delivery", "model", "grade_question@2"),
+    ):
+        assert GradeCache.cache_key(changed) != GradeCache.cache_key(parts)
+
+
+def test_get_put_and_expiry(tmp_path):
+    cache = GradeCache(str(tmp_path / "cache.db"))
+    assert cache.get("1a", "rubric", "faster delivery", "model", "v1") is None
+    cache.put("1a", "rubric", "faster delivery", "model", "v1", GRADE)
+    assert cache.get("1a", "rubric", "Faster  delivery", "model", "v1") == GRADE
+
+    cache.ttl = -1
+    assert cache.get("1a", "rubric", "faster delivery", "model", "v1") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expired"], stats["entries"]) == (1, 2, 1, 0)
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    cache = GradeCache(str(tmp_path / "cache.db"), max_entries=2)
+    for answer in ("a", "b", "c"):
+        cache.put("1a", "rubric", answer, "model", "v1", GRADE)
+    cache.get("1a", "rubric", "a", "model", "v1")
+    assert cache.evict() == 1
+    assert cache.get("1a", "rubric", "b", "model", "v1") is None
+    assert cache.get("1a", "rubric", "a", "model", "v1") == GRADE
+
+
+def test_invalidate_stale_keeps_unchanged_rubric_items(tmp_path, marking_scheme):
+    cache = GradeCache(str(tmp_path / "cache.db"))
+    for question_id in ("1a", "1b"):
+        cache.put(question_id, rubric_for_question(marking_scheme, question_id), "answer", "model", "v1", GRADE)
+    edited = marking_scheme.replace("Tool Sprawl", "Vendor Lock-in")
+    assert cache.invalidate_stale(edited) == 1
+    assert cache.get("1a", rubric_for_question(edited, "1a"), "answer", "model", "v1") == GRADE
+
+
+def test_assessment_tool_grades_a_repeated_answer_once(tmp_path, marking_scheme):
+    analyzer = GradingAnalyzer()
+    tool = AssessmentTool(analyzer, grade_cache=GradeCache(str(tmp_path / "cache.db")))
+    assert tool.assess_question("1a", marking_scheme, "Faster delivery") == GRADE
+    assert tool.assess_question("1a", marking_scheme, "faster delivery") == GRADE
+    assert len(analyzer.prompts) == 1
+    # Editing another question's rubric keeps the cached grade
+    tool.assess_question("1a", marking_scheme.replace("Tool Sprawl", "Vendor Lock-in"), "faster delivery")
+    assert len(analyzer.prompts) == 1
+
+
+def test_cache_keeps_signs_apart(tmp_path):
+    cache = GradeCache(str(tmp_path / "cache.db"))
+    cache.put("1a", "rubric", "x = -1", "model", "v1", GRADE)
+    assert cache.get("1a", "rubric", "X  =  -1", "model", "v1") == GRADE
+    assert cache.get("1a", "rubric", "x = 1", "model", "v1") is None
+
+
+def test_assessment_tool_does_not_cache_a_reply_without_marks(tmp_path, marking_scheme):
+    analyzer = GradingAnalyzer(reply="I cannot grade this answer.")
+    tool = AssessmentTool(analyzer, grade_cache=GradeCache(str(tmp_path / "cache.db")))
+    tool.assess_question("1a", marking_scheme, "faster delivery")
+    analyzer.reply = GRADE
+    assert tool.assess_question("1a", marking_scheme, "faster delivery") == GRADE
+    assert len(analyzer.prompts) == 2
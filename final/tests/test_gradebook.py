@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pytest
+
+from gradebook import Gradebook, ocr_confidence
+from grades import parse_script_grade
+
+
+def row(exam, student, question, score, max_marks=5.0, confidence=1.0):
+    return {
+        "exam": exam,
+        "student": student,
+        "question": question,
+        "score": score,
+        "max_marks": max_marks,
+        "ocr_confidence": confidence,
+        "graded_at": 0.0,
+    }
+
+
+def test_ocr_confidence():
+    assert ocr_confidence("faster delivery [unclear] pipeline [unclear]") == pytest.approx(0.6, abs=0.1)
+    assert ocr_confidence("faster delivery") == 1.0
+
+
+def test_append_and_reopen(tmp_path):
+    path = str(tmp_path / "gradebook")
+    Gradebook(path).append([row("mid2", "alice", "1", 4), row("mid2", "bob", "1", 2)])
+    view = Gradebook(path).view("mid2")
+    assert len(view) == 2
+    assert view.summary()["students"] == 2
+    assert Gradebook(path).exams() == ["mid2"]
+
+
+def test_regrade_keeps_only_the_latest_row(tmp_path):
+    gradebook = Gradebook(str(tmp_path / "gradebook"))
+    gradebook.append([row("mid2", "alice", "1", 1), row("final", "alice", "1", 3)])
+    gradebook.append([row("mid2", "alice", "1", 4)])
+    view = gradebook.view("mid2")
+    assert view.rows["score"].tolist() == [4.0]
+    assert len(gradebook.view()) == 2
+    assert gradebook.exams() == ["mid2", "final"]
+    assert len(gradebook.view("unknown")) == 0
+
+
+def test_latest_rows_do_not_collide_for_large_codes(tmp_path, monkeypatch):
+    gradebook = Gradebook(str(tmp_path / "gradebook"))
+    gradebook.append([row("mid2", "alice", "1", 1), row("final", "bob", "2", 3)])
+    columns = gradebook.columns()
+    # Student codes past 2**21 once packed into the exam's bits
+    columns["exam"][:] = [1, 0]
+    columns["student"][:] = [0, 2**21]
+    columns["question"][:] = [0, 0]
+    monkeypatch.setattr(gradebook, "columns", lambda: columns)
+    assert sorted(gradebook.view().rows["score"].tolist()) == [1.0, 3.0]
+
+
+def test_partial_append_is_cut_back(tmp_path):
+    gradebook = Gradebook(str(tmp_path / "gradebook"))
+    gradebook.append([row("mid2", "alice", "1", 4)])
+    # A crash after writing only the score column of the next row
+    with open(gradebook.column_path("score"), "ab") as f:
+        np.array([9.0]).tofile(f)
+    assert len(gradebook.view()) == 1
+    gradebook.append([row("mid2", "bob", "1", 2)])
+    assert os.path.getsize(gradebook.column_path("score")) == 2 * 8
+    assert sorted(gradebook.view().rows["score"].tolist()) == [2.0, 4.0]
+
+
+def test_question_stats_and_distribution(tmp_path):
+    gradebook = Gradebook(str(tmp_path / "gradebook"))
+    rows = []
+    for student, (first, second) in enumerate([(5, 4), (4, 4), (1, 1), (0, 2)]):
+        rows += [row("mid2", f"s{student}", "1", first), row("mid2", f"s{student}", "2", second, confidence=0.5)]
+    gradebook.append(rows)
+    stats = {entry["question"]: entry for entry in gradebook.view("mid2").question_stats()}
+    assert stats["1"]["students"] == 4
+    assert stats["1"]["mean_score"] == 2.5
+    assert stats["1"]["difficulty"] == 0.5
+    assert stats["2"]["ocr_confidence"] == 0.5
+    # Strong students do well on both questions
+    assert stats["1"]["discrimination"] > 0.8
+    counts, _ = gradebook.view("mid2").distribution("1", bins=5)
+    assert counts.tolist() == [1, 1, 0, 0, 2]
+
+
+def test_outlier_students(tmp_path):
+    gradebook = Gradebook(str(tmp_path / "gradebook"))
+    scores = [3.0, 3.1, 2.9, 3.0, 3.2, 2.8, 0.0]
+    gradebook.append(row("mid2", f"s{index}", "1", score) for index, score in enumerate(scores))
+    outliers = gradebook.view("mid2").outlier_students()
+    assert [outlier["student"] for outlier in outliers] == ["s6"]
+
+
+def test_append_script(tmp_path, marking_scheme):
+    grade = parse_script_grade(
+        '{"questions": [{"question": "1a", "awarded_marks": 6}, {"question": "1b", "awarded_marks": 0}, '
+        '{"question": "2", "awarded_marks": 3}]}',
+        marking_scheme,
+    )
+    gradebook = Gradebook(str(tmp_path / "gradebook"))
+    assert gradebook.append_script("mid2", "alice", grade, answers={"2": "isolation [unclear]"}) == 3
+    view = gradebook.view("mid2")
+    assert view.student_totals()[0].tolist() == [9.0]
+    assert view.student_totals()[1].tolist() == [15.0]
@@ -0,0 +1,78 @@
+from grades import parse_script_grade, rubric_total
+
+
+def test_parse_script_grade_reads_clean_json(marking_scheme):
+    grade = parse_script_grade(
+        '{"questions": [{"question": "1a", "awarded_marks": 6, "verdict": "correct"}, '
+        '{"question": "1b", "awarded_marks": 2}, {"question": "2", "awarded_marks": 4}]}',
+        marking_scheme,
+    )
+    assert grade.valid
+    assert not grade.repaired
+    assert grade.marks == {"1a": 6.0, "1b": 2.0, "2": 4.0}
+    assert (grade.total, grade.out_of) == (12.0, 15.0)
+    assert grade.text.splitlines()[-1] == "Total Marks: 12/15"
+
+
+def test_parse_script_grade_repairs_fences_prose_and_trailing_commas(marking_scheme):
+    grade = parse_script_grade(
+        "Here is the grade:\n```json\n"
+        '{"questions": [{"question": "Q1a", "awarded_marks": 5,}, '
+        '{"question": "1b", "awarded_marks": "3/4"}, {“question”: “2”, "awarded_marks": 4},]}\n```',
+        marking_scheme,
+    )
+    assert grade.valid
+    assert grade.repaired
+    assert grade.marks == {"1a": 5.0, "1b": 3.0, "2": 4.0}
+
+
+def test_parse_script_grade_salvages_objects_from_broken_json(marking_scheme):
+    grade = parse_script_grade(
+        '{"questions": [{"question": "1a", "awarded_marks": 5}, {"question": "1b", "awarded_marks": 1}, '
+        '{"question": "2", "awarded_marks": 3}',
+        marking_scheme,
+    )
+    assert grade.valid
+    assert grade.marks == {"1a": 5.0, "1b": 1.0, "2": 3.0}
+
+
+def test_parse_script_grade_falls_back_to_text_lines(marking_scheme):
+    grade = parse_script_grade(
+        "Question 1a: Correct - Awarded Marks: 6\nQuestion 1b: Incorrect - Awarded Marks: 0", marking_scheme
+    )
+    assert grade.marks == {"1a": 6.0, "1b": 0.0}
+    assert grade.failed == {"2": "not graded"}
+
+
+def test_parse_script_grade_rejects_marks_over_the_rubric(marking_scheme):
+    grade = parse_script_grade(
+        '{"questions": [{"question": "1a", "awarded_marks": 9}, {"question": "1b", "awarded_marks": 4}, '
+        '{"question": "2", "awarded_marks": 4}]}',
+        marking_scheme,
+    )
+    assert not grade.valid
+    assert set(grade.failed) == {"1a"}
+    assert "1a" not in grade.marks
+
+
+def test_parse_script_grade_rejects_a_question_graded_twice(marking_scheme):
+    grade = parse_script_grade(
+        '{"questions": [{"question": "2", "awarded_marks": 4}, {"question": "2", "awarded_marks": 1}]}',
+        marking_scheme,
+    )
+    assert grade.failed["2"] == "graded twice"
+    assert "2" not in grade.marks
+
+
+def test_parse_script_grade_without_grades():
+    grade = parse_script_grade("Sorry, I can't help with that.")
+    assert not grade.valid
+    assert grade.marks == {}
+
+
+
+
+def test_rubric_total(marking_scheme):
+    assert rubric_total(marking_scheme) == 15.0
+    assert rubric_total("Question 1: DevOps\na. Benefits (6 Marks)\nb. Risks (4 Marks)") == 10.0
+    assert rubric_total("Question 1: DevOps\nFaster delivery.") is None
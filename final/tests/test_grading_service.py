@@ -0,0 +1,121 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from grading_service import GradingService, HTTPError
+import job_runner
+from job_runner import DONE, FAILED
+
+PAGE = b"page image"
+GRADE = "Question 2: Correct - Awarded Marks: 5\nTotal Marks: 5/5"
+
+
+def payload(*pages):
+    return {"pages": [base64.b64encode(page).decode() for page in pages], "marking_scheme": "Question 2 (5 Marks)"}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def started(service):
+    server = await service.start("127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def without_workers(service):
+    # No worker drains this queue, so submitted jobs stay queued
+    service.queue = asyncio.Queue(maxsize=service.queue_size)
+    return service
+
+
+def test_rejects_bad_submissions(fake_tool):
+    async def scenario():
+        service = without_workers(GradingService(fake_tool()))
+        for body in ({}, {"pages": "x", "marking_scheme": "m"}, {"pages": ["not base64!"], "marking_scheme": "m"}):
+            with pytest.raises(HTTPError) as error:
+                service.submit(body)
+            assert error.value.status == 400
+
+    run(scenario())
+
+
+def test_full_queue_answers_429(fake_tool):
+    async def scenario():
+        service = without_workers(GradingService(fake_tool(), queue_size=1))
+        status, body = service.submit(payload(PAGE))
+        assert status == 202
+        with pytest.raises(HTTPError) as error:
+            service.submit(payload(PAGE))
+        assert error.value.status == 429
+        assert "Retry-After" in error.value.headers
+        with pytest.raises(HTTPError) as error:
+            service.job_result(body["job_id"])
+        assert error.value.status == 409
+        assert service.stats["accepted"] == 1
+        assert service.stats["rejected"] == 1
+
+    run(scenario())
+
+
+def test_finished_jobs_expire_with_job_runners_ttl(fake_tool, monkeypatch):
+    async def scenario():
+        service = without_workers(GradingService(fake_tool()))
+        _, body = service.submit(payload(PAGE))
+        job = service.jobs[body["job_id"]]
+        job.fn, job.args = (lambda job: "graded"), ()
+        assert job.run()
+        monkeypatch.setattr(job_runner, "FINISHED_JOB_TTL", -1)
+        service.queue.get_nowait()
+        service.submit(payload(PAGE))
+        assert body["job_id"] not in service.jobs
+
+    run(scenario())
+
+
+def test_failed_jobs_are_counted(fake_tool):
+    async def scenario():
+        service = GradingService(fake_tool(pages={}), workers=2)
+        server = await service.start("127.0.0.1", 0)
+        _, body = service.submit(payload(PAGE))
+        await asyncio.wait_for(service.queue.join(), 5)
+        server.close()
+        assert service.job_result(body["job_id"])[1]["status"] == FAILED
+        assert (service.stats["completed"], service.stats["failed"]) == (0, 1)
+
+    run(scenario())
+
+
+def test_grades_a_submission_over_http(fake_tool):
+    async def request(port, method, path, body=None):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        data = json.dumps(body).encode() if body is not None else b""
+        writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, content = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(content)
+
+    async def scenario():
+        service = GradingService(fake_tool(pages={PAGE: "Question Number: Q2\nAnswer: isolation"}, script=GRADE))
+        server, port = await started(service)
+        status, body = await request(port, "POST", "/jobs", payload(PAGE))
+        assert status == 202
+        job_id = body["job_id"]
+        for _ in range(200):
+            status, body = await request(port, "GET", f"/jobs/{job_id}")
+            if body["status"] == DONE:
+                break
+            await asyncio.sleep(0.01)
+        status, body = await request(port, "GET", f"/jobs/{job_id}/result")
+        assert status == 200
+        assert body["result"]["assessment_result"] == GRADE
+        status, body = await request(port, "GET", "/health")
+        assert body["completed"] == 1
+        assert (await request(port, "GET", "/jobs/unknown"))[0] == 404
+        server.close()
+
+    run(scenario())
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import job_runner
+from job_runner import DONE, FAILED, JobRunner
+
+
+def wait(runner, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not runner.get(job_id).finished:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+    return runner.get(job_id).snapshot()
+
+
+def test_job_reports_progress_and_result():
+    runner = JobRunner(max_workers=1)
+
+    def work(job, pages):
+        for done in range(1, pages + 1):
+            job.update(stage="ocr", pages_done=done, pages_total=pages)
+        return "graded"
+
+    state = wait(runner, runner.submit("s1", work, 3))
+    assert state["status"] == DONE
+    assert state["result"] == "graded"
+    assert state["progress"]["pages_done"] == 3
+    assert state["progress"]["stage"] == "done"
+
+
+def test_failure_is_captured():
+    runner = JobRunner(max_workers=1)
+
+    def work(job):
+        raise ValueError("bad page")
+
+    state = wait(runner, runner.submit("s1", work))
+    assert (state["status"], state["error"]) == (FAILED, "bad page")
+    assert runner.active_job("s1") is None
+
+
+def test_sessions_take_turns():
+    runner = JobRunner(max_workers=1)
+    gate = threading.Event()
+    order = []
+
+    def work(job, name):
+        gate.wait(5)
+        order.append(name)
+
+    # The worker picks up the first job and blocks; the rest queue behind it
+    jobs = [runner.submit("busy", work, "busy-1")]
+    while runner.queue_depth():
+        time.sleep(0.01)
+    jobs += [runner.submit("busy", work, f"busy-{n}") for n in (2, 3)]
+    jobs.append(runner.submit("other", work, "other-1"))
+    assert runner.active_job("other") is not None
+    gate.set()
+    for job_id in jobs:
+        wait(runner, job_id)
+    # The other session does not wait behind the whole busy batch
+    assert order == ["busy-1", "busy-2", "other-1", "busy-3"]
+
+
+def test_finished_jobs_are_pruned(monkeypatch):
+    runner = JobRunner(max_workers=1)
+    job_id = runner.submit("s1", lambda job: None)
+    wait(runner, job_id)
+    monkeypatch.setattr(job_runner, "FINISHED_JOB_TTL", -1)
+    runner.submit("s1", lambda job: None)
+    assert runner.get(job_id) is None
+
+
+def test_grade_script_compiles_an_uploaded_scheme_in_the_job(marking_scheme, fake_tool):
+    class SchemeTool(fake_tool):
+        def extract_marking_scheme(self, upload):
+            self.calls.append("rubric")
+            return marking_scheme
+
+    tool = SchemeTool(
+        pages={"page_1.png": "Question Number: Q2\nAnswer: isolation"},
+        script='{"questions": [{"question": "2", "awarded_marks": 5}]}',
+    )
+    runner = JobRunner(max_workers=1)
+    state = wait(runner, runner.submit("s1", job_runner.grade_script, tool, ["page_1.png"], b"\x89PNG scheme"))
+    assert state["status"] == DONE
+    assert tool.calls == ["rubric", "page_1.png", "script"]
+    assert state["result"]["marking_scheme"] == marking_scheme
+    assert state["result"]["grade"]["total_marks"] == 5.0
+    # The script is graded in one call: the stage and question count only
+    assert (state["progress"]["questions"], state["progress"]["pages_done"]) == (1, 1)
+    assert "questions_done" not in state["progress"]
@@ -0,0 +1,64 @@
+from batch_grader import BatchGrader
+from job_store import PENDING, OCR_DONE, GRADED, FAILED
+
+SCRIPT_GRADE = "Question 1a: Correct - Awarded Marks: 6\nQuestion 2: Partially Correct - Awarded Marks: 3\nTotal Marks: 9/15"
+
+
+def test_student_moves_through_states(job_store, marking_scheme):
+    job_store.create_job("mid2", marking_scheme)
+    assert job_store.add_student("mid2", "alice", ["p1.png", "p2.png"])
+    assert job_store.result("mid2", "alice")["state"] == PENDING
+
+    job_store.record_ocr("mid2", "alice", 1, "Question Number: Q1a\nAnswer: faster delivery")
+    job_store.record_page_failure("mid2", "alice", 2, "timeout")
+    assert [page["state"] for page in job_store.pages("mid2", "alice")] == [OCR_DONE, FAILED]
+    job_store.record_ocr("mid2", "alice", 2, "Question Number: Q2\nAnswer: isolation")
+    assert job_store.student_response("mid2", "alice").splitlines()[-1] == "Answer: isolation"
+
+    job_store.record_questions("mid2", "alice", {"1a": "faster delivery", "2": "isolation"})
+    assert job_store.result("mid2", "alice")["state"] == OCR_DONE
+    job_store.record_grade("mid2", "alice", SCRIPT_GRADE, {"1a": 6.0, "2": 3.0}, 9.0, 15.0)
+
+    result = job_store.result("mid2", "alice")
+    assert (result["state"], result["total_marks"], result["out_of"]) == (GRADED, 9.0, 15.0)
+    assert {row["question_id"]: row["awarded_marks"] for row in job_store.questions("mid2", "alice")} == {
+        "1a": 6.0,
+        "2": 3.0,
+    }
+    assert job_store.progress("mid2")["students"] == {GRADED: 1}
+
+
+def test_batch_grader_resumes_failed_pages_only(job_store, marking_scheme, fake_tool):
+    scripts = {"alice": ["alice/1.png", "alice/2.png"], "bob": ["bob/1.png"]}
+    tool = fake_tool(
+        pages={
+            "alice/1.png": "Question Number: Q1a\nAnswer: faster delivery",
+            "alice/2.png": TimeoutError("rate limited"),
+            "bob/1.png": "Question Number: Q2\nAnswer: isolation",
+        },
+        script=SCRIPT_GRADE,
+    )
+    progress = BatchGrader(tool, job_store).run("mid2", scripts, marking_scheme)
+    assert progress["students"] == {PENDING: 1, GRADED: 1}
+    assert progress["pages"] == {OCR_DONE: 2, FAILED: 1}
+
+    # The rerun only repeats what never finished, under the stored scheme
+    tool.pages["alice/2.png"] = "Question Number: Q2\nAnswer: isolation"
+    tool.calls.clear()
+    progress = BatchGrader(tool, job_store).run("mid2", scripts, "a different scheme")
+    assert tool.calls == ["alice/2.png", "script"]
+    assert progress["students"] == {GRADED: 2}
+    assert job_store.create_job("mid2", "another scheme") == marking_scheme
+
+
+def test_grading_failure_keeps_the_ocr(job_store, marking_scheme, fake_tool):
+    tool = fake_tool(pages={"alice/1.png": "Question Number: Q2\nAnswer: isolation"}, script=ValueError("no reply"))
+    BatchGrader(tool, job_store).run("mid2", {"alice": ["alice/1.png"]}, marking_scheme)
+    result = job_store.result("mid2", "alice")
+    assert (result["state"], result["error"]) == (OCR_DONE, "no reply")
+
+    tool.script = SCRIPT_GRADE
+    tool.calls.clear()
+    BatchGrader(tool, job_store).run("mid2", {"alice": ["alice/1.png"]}, marking_scheme)
+    assert tool.calls == ["script"]
+    assert job_store.result("mid2", "alice")["state"] == GRADED
@@ -0,0 +1,45 @@
+from keypoints import KeyPointMatcher, RubricKeyPoints
+
+KEY_POINTS = ["Faster Delivery", "Improved Collaboration", "Delivery Pipeline", "Stability"]
+
+
+def test_matches_key_points_in_one_pass():
+    found = KeyPointMatcher(KEY_POINTS).match("It gives faster delivery, and a delivery pipeline.")
+    assert set(found) == {"Faster Delivery", "Delivery Pipeline"}
+    assert found["Faster Delivery"] == {"matched": "faster delivery", "corrections": 0}
+
+
+def test_overlapping_key_points_share_words():
+    # "delivery" ends one key point and starts the next
+    found = KeyPointMatcher(KEY_POINTS).match("faster delivery pipeline")
+    assert set(found) == {"Faster Delivery", "Delivery Pipeline"}
+
+
+def test_tolerates_ocr_misspellings():
+    matcher = KeyPointMatcher(KEY_POINTS)
+    found = matcher.match("Improoved colaboration and stabilty")
+    assert set(found) == {"Improved Collaboration", "Stability"}
+    assert found["Improved Collaboration"]["corrections"] == 2
+    assert not KeyPointMatcher(KEY_POINTS, fuzzy=False).match("Improoved colaboration")
+
+
+def test_short_words_must_match_exactly():
+    matcher = KeyPointMatcher(["CI CD"])
+    assert matcher.match("ci cd")
+    assert not matcher.match("co cd")
+
+
+def test_coverage_suggests_marks():
+    coverage = KeyPointMatcher(KEY_POINTS).coverage("faster delivery and stability", marks=8)
+    assert coverage["coverage"] == 0.5
+    assert coverage["suggested_marks"] == 4.0
+    assert coverage["missing"] == ["Improved Collaboration", "Delivery Pipeline"]
+
+
+def test_rubric_key_points_cover_sub_parts(marking_scheme):
+    rubric = RubricKeyPoints(marking_scheme)
+    assert rubric.matcher_for("1a").key_points == ["Faster Delivery", "Improved Collaboration"]
+    # A student's "1" is matched against every part of question 1
+    assert rubric.matcher_for("1").key_points == ["Faster Delivery", "Improved Collaboration", "Tool Sprawl"]
+    assert rubric.score("2", "Isolation of services")["coverage"] == 1.0
+    assert rubric.score("3", "anything") is None
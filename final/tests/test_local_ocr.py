@@ -0,0 +1,121 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+import local_ocr
+from local_ocr import LocalOCR, format_page, parse_tsv
+
+HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+
+
+def word(block, paragraph, line, number, confidence, text):
+    return "\t".join(["5", "1", str(block), str(paragraph), str(line), str(number), "0", "0", "10", "10", str(confidence), text])
+
+
+TSV = "\n".join(
+    [
+        HEADER,
+        "1\t1\t0\t0\t0\t0\t0\t0\t600\t800\t-1\t",
+        word(1, 1, 2, 1, 91, "Answer:"),
+        word(1, 1, 1, 1, 95, "Q1a"),
+        word(1, 1, 1, 2, 88, "faster"),
+        word(1, 1, 1, 3, 12, "delvry"),
+        word(1, 1, 1, 4, 90, " "),
+        word(2, 1, 1, 1, 96, "2)"),
+        word(2, 1, 1, 2, 93, "isolation"),
+    ]
+)
+
+
+def test_parse_tsv_groups_words_into_lines_in_reading_order():
+    assert parse_tsv(TSV) == [
+        [("Q1a", 95.0), ("faster", 88.0), ("delvry", 12.0)],
+        [("Answer:", 91.0)],
+        [("2)", 96.0), ("isolation", 93.0)],
+    ]
+    assert parse_tsv(TSV.split("\n", 1)[1]) == parse_tsv(TSV)
+    assert parse_tsv("") == []
+
+
+def test_format_page_marks_unclear_words_and_opens_question_blocks():
+    assert format_page(parse_tsv(TSV)).splitlines() == [
+        "Question Number: Q1a",
+        "Answer: faster [unclear]",
+        "Answer:",
+        "Question Number: Q2",
+        "Answer: isolation",
+    ]
+    assert format_page([[("Question", 90), ("3", 90)]]) == "Question Number: Q3\nAnswer:"
+    # Numbers inside a sentence are not question labels
+    assert format_page([[("12", 90), ("containers", 90), ("ran", 90)]]) == "12 containers ran"
+    assert format_page(parse_tsv(TSV), min_confidence=0).splitlines()[1] == "Answer: faster delvry"
+
+
+class FakeEngine:
+    created = []
+
+    def __init__(self, lang, tessdata):
+        self.load_seconds = 0.01
+        self.closed = False
+        self.pages = 0
+        FakeEngine.created.append(self)
+
+    @staticmethod
+    def load_module():
+        return None
+
+    def recognize(self, gray):
+        assert gray.dtype == np.uint8 and gray.ndim == 2
+        self.pages += 1
+        time.sleep(0.005)
+        return TSV
+
+    def close(self):
+        self.closed = True
+
+
+def test_engines_are_pooled_across_threads(monkeypatch):
+    FakeEngine.created = []
+    monkeypatch.setitem(local_ocr.ENGINES, "fake", FakeEngine)
+    ocr = LocalOCR(backend="fake", max_engines=2)
+    ocr.preprocessor = None
+    page = np.full((60, 80, 3), 255, np.uint8)
+
+    assert ocr.recognize(page).startswith("Question Number: Q1a")
+    # A new pool of threads per script, as extract_pages does
+    for _ in range(3):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(ocr.recognize, [page] * 8))
+
+    assert len(FakeEngine.created) <= 2
+    assert sum(engine.pages for engine in FakeEngine.created) == 25
+    report = ocr.report()
+    assert (report["pages"], report["engines"], report["backend"]) == (25, len(FakeEngine.created), "fake")
+    ocr.close()
+    assert all(engine.closed for engine in FakeEngine.created)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        LocalOCR(backend="cuneiform")
+
+
+def test_tesserocr_reads_a_rendered_page():
+    pytest.importorskip("tesserocr")
+    tessdata = os.environ.get("TESSDATA_PREFIX")
+    if not tessdata or not os.path.exists(os.path.join(tessdata, "eng.traineddata")):
+        pytest.skip("no English traineddata")
+    page = np.full((200, 900), 255, np.uint8)
+    cv2.putText(page, "Q1 continuous delivery", (20, 110), cv2.FONT_HERSHEY_SIMPLEX, 2.0, 0, 4)
+    ocr = LocalOCR(tessdata=tessdata, max_engines=1)
+    ocr.preprocessor = None
+    try:
+        text = ocr.recognize(page)
+    finally:
+        ocr.close()
+    assert text.splitlines()[0] == "Question Number: Q1"
+    assert "delivery" in text.lower()
@@ -0,0 +1,60 @@
+import pytest
+
+from normalization import TextNormalizer, jaccard_similarity, tfidf_similarities
+
+
+class SuffixLemmatizer:
+    """
+    Stands in for WordNetLemmatizer so no NLTK data is needed.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def lemmatize(self, token):
+        self.calls += 1
+        return token[:-1] if token.endswith("s") else token
+
+
+def normalizer(**kwargs):
+    return TextNormalizer(stop_words={"the", "a", "of", "can"}, lemmatizer=SuffixLemmatizer(), **kwargs)
+
+
+def test_normalize_keeps_letters_drops_stopwords_and_lemmatizes():
+    item = normalizer().normalize("The Teams deliver 3 features, a lot of them!")
+    assert item.tokens == ("team", "deliver", "feature", "lot", "them")
+    assert item.text == "team deliver feature lot them"
+
+
+def test_word_tokenize_contractions_are_split():
+    assert normalizer().normalize("You cannot stop").tokens == ("you", "not", "stop")
+
+
+def test_options_turn_steps_off():
+    plain = TextNormalizer(remove_stopwords=False, lemmatize=False)
+    assert plain.normalize("The Tests").tokens == ("the", "tests")
+
+
+def test_batch_normalizes_each_distinct_answer_once():
+    text_normalizer = normalizer()
+    batch = text_normalizer.normalize_batch(["the tests", "tests pass", "the tests"])
+    assert batch[0] is batch[2]
+    assert [item.text for item in batch] == ["test", "test pas", "test"]
+    # "tests" is lemmatized once thanks to the token cache
+    assert text_normalizer.lemmatizer.calls == 2
+    assert text_normalizer.cache_info()["texts"]["misses"] == 2
+
+
+def test_jaccard_over_token_sets():
+    first, second, empty = normalizer().normalize_batch(["teams deliver", "teams test", ""])
+    assert jaccard_similarity(first, second) == pytest.approx(1 / 3)
+    assert jaccard_similarity(empty, empty) == 1.0
+
+
+def test_tfidf_similarities_pair_by_position():
+    pytest.importorskip("sklearn")
+    references = normalizer().normalize_batch(["teams deliver features", "containers isolate services"])
+    candidates = normalizer().normalize_batch(["teams deliver features", "teams deliver features"])
+    same, different = tfidf_similarities(references, candidates)
+    assert same == pytest.approx(1.0)
+    assert different == pytest.approx(0.0)
@@ -0,0 +1,90 @@
+import re
+from types import SimpleNamespace
+
+from packed_grading import AnswerPacker, format_answers, parse_packed_grades
+
+
+class PackedAnalyzer:
+    """
+    Stands in for ImageOCRAnalyzer on grade_packed requests: grades every
+    tagged answer containing "isolation" 5, others 0. replies, when set,
+    are returned instead, one per call.
+    """
+
+    model_name = "test-model"
+
+    def __init__(self, replies=None):
+        self.replies = list(replies or [])
+        self.batches = []
+
+    def perform_ocr(self, image_base64=None, prompt="", template=None):
+        tagged = re.findall(r"^\[A(\d+)\] (.*)$", prompt, re.MULTILINE)
+        self.batches.append(len(tagged))
+        if self.replies:
+            return SimpleNamespace(content=self.replies.pop(0))
+        return SimpleNamespace(
+            content="\n".join(
+                f"A{number}: Correct - Awarded Marks: {5 if 'isolation' in answer else 0}" for number, answer in tagged
+            )
+        )
+
+
+class SingleGrader:
+    grade_cache = None
+
+    def __init__(self, analyzer):
+        self.ocr_analyzer = analyzer
+        self.single = []
+
+    def assess_question(self, question_id, marking_scheme, answer):
+        self.single.append(answer)
+        return f"Question {question_id}: Correct - Awarded Marks: 1"
+
+
+def test_format_answers_keeps_one_answer_per_line():
+    assert format_answers(["faster\ndelivery", "isolation"]) == "[A1] faster delivery\n[A2] isolation"
+
+
+def test_parse_packed_grades():
+    reply = "A1: Correct - Awarded Marks: 2\n**A2**: Incorrect - Awarded Marks: 0\nsome notes"
+    assert parse_packed_grades(reply, 3) == {
+        1: (2.0, "Correct - Awarded Marks: 2"),
+        2: (0.0, "Incorrect - Awarded Marks: 0"),
+    }
+    # Repeated or unknown tags mean the grades cannot be attributed
+    assert parse_packed_grades(reply + "\nA1: Correct - Awarded Marks: 2", 3) is None
+    assert parse_packed_grades("A4: Correct - Awarded Marks: 2", 3) is None
+
+
+def test_answers_are_graded_in_batches(marking_scheme):
+    analyzer = PackedAnalyzer()
+    tool = SingleGrader(analyzer)
+    answers = ["isolation"] * 3 + ["no idea"] * 2 + ["long answer " * 200]
+    results = AnswerPacker(tool, batch_size=3).grade("2", marking_scheme, answers)
+
+    assert results[:5] == ["Question 2: Correct - Awarded Marks: 5"] * 3 + ["Question 2: Correct - Awarded Marks: 0"] * 2
+    assert analyzer.batches == [3, 2]
+    # Long answers are graded on their own
+    assert tool.single == [answers[5]]
+
+
+def test_unusable_reply_splits_the_batch(marking_scheme):
+    analyzer = PackedAnalyzer(replies=["A1: Correct - Awarded Marks: 5\nA1: Correct - Awarded Marks: 5"])
+    tool = SingleGrader(analyzer)
+    packer = AnswerPacker(tool)
+    results = packer.grade("2", marking_scheme, ["isolation", "no idea", "isolation", "no idea"])
+
+    assert analyzer.batches == [4, 2, 2]
+    assert results[2] == "Question 2: Correct - Awarded Marks: 5"
+    assert packer.report()["retries"] == 1
+
+
+def test_left_out_answers_are_packed_again(marking_scheme):
+    analyzer = PackedAnalyzer(replies=["A1: Correct - Awarded Marks: 5\nA2: Correct - Awarded Marks: 0"])
+    tool = SingleGrader(analyzer)
+    results = AnswerPacker(tool).grade("2", marking_scheme, ["isolation", "no idea", "isolation"])
+
+    # The lone missing answer is graded with a regular call
+    assert analyzer.batches == [3]
+    assert tool.single == ["isolation"]
+    assert results[2] == "Question 2: Correct - Awarded Marks: 1"
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from packing import RegionPacker, find_region, make_tile, shelf_pack, split_response
+
+
+def short_answer(text, lines=2, size=(900, 700)):
+    page = np.full((size[0], size[1], 3), 250, np.uint8)
+    for line in range(lines):
+        cv2.putText(page, text, (80, 200 + 60 * line), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 3)
+    return page
+
+
+class PackingAnalyzer:
+    """
+    Stands in for ImageOCRAnalyzer: answers a packed request with one
+    section per region, leaving out the regions in `skip`.
+    """
+
+    def __init__(self, pages, skip=()):
+        self.pages = pages
+        self.skip = skip
+        self.prompts = []
+
+    def load_image(self, page):
+        return self.pages[page]
+
+    def perform_ocr(self, image_base64=None, prompt="", template=None):
+        self.prompts.append(template)
+        count = prompt.count(", ") + 1
+        return SimpleNamespace(
+            content="\n".join(f"R{n}\nanswer {n}" for n in range(1, count + 1) if n not in self.skip)
+        )
+
+
+class PackingTool:
+    def __init__(self, analyzer):
+        self.ocr_analyzer = analyzer
+        self.single_calls = []
+
+    def extract_page_response(self, page):
+        self.single_calls.append(page)
+        return f"single {page}"
+
+
+def test_find_region_ignores_ruled_lines_and_blank_pages():
+    page = short_answer("faster delivery")
+    for row in range(100, 900, 50):
+        cv2.line(page, (0, row), (699, row), (180, 180, 180), 1)
+    region = find_region(page)
+    x, y, w, h = region["box"]
+    assert region["lines"] == 2
+    assert 60 <= x <= 80 and 150 <= y <= 180 and h < 150
+    assert make_tile(page, region).shape[0] <= h
+    assert find_region(np.full((300, 300, 3), 250, np.uint8)) is None
+
+
+def test_shelf_pack_places_tallest_first_and_reports_leftovers():
+    placements, leftover = shelf_pack([(60, 20), (60, 40), (60, 30), (200, 10)], max_side=130)
+    assert placements == {1: (0, 0), 2: (60, 0), 0: (0, 40)}
+    assert leftover == [3]
+
+
+def test_split_response():
+    reply = "R1\nfaster delivery\n**R2:**\n\nR3\nisolation\nR9\nout of range"
+    assert split_response(reply, 3) == {1: "faster delivery", 3: "isolation"}
+
+
+def test_short_pages_share_one_request():
+    pages = {name: short_answer(name) for name in ("p1", "p2", "p3")}
+    analyzer = PackingAnalyzer(pages)
+    tool = PackingTool(analyzer)
+    packer = RegionPacker()
+    progress = []
+
+    results = packer.extract(tool, ["p1", "p2", "p3"], on_page=lambda done, total: progress.append(done))
+    assert sorted(results) == ["answer 1", "answer 2", "answer 3"]
+    assert analyzer.prompts == ["ocr_packed@1"]
+    assert tool.single_calls == []
+    assert progress == [1, 2, 3]
+    assert packer.report()["calls_saved"] == 2
+
+
+def test_regions_missing_from_the_reply_fall_back_to_single_calls():
+    pages = {"p1": short_answer("p1"), "p2": short_answer("p2"), "blank": np.full((400, 400, 3), 250, np.uint8)}
+    tool = PackingTool(PackingAnalyzer(pages, skip={2}))
+    packer = RegionPacker()
+
+    results = packer.extract(tool, ["p1", "p2", "blank"])
+    assert results[2] == "single blank"
+    assert len(tool.single_calls) == 2
+    assert packer.report()["fallbacks"] == 1
@@ -0,0 +1,83 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from page_store import ALIGNMENT, PageStore, drop_page_cache, is_page_ref, resolve, run_benchmark
+
+
+def page(value, shape=(40, 30, 3)):
+    return np.full(shape, value, np.uint8)
+
+
+def test_put_and_read_back_zero_copy(tmp_path):
+    store = PageStore(str(tmp_path / "mid2.pages"))
+    ref = store.put("alice/page_1", page(7))
+    assert is_page_ref(ref)
+    assert not is_page_ref(str(tmp_path / "page_1.png"))
+
+    same_store, key = resolve(ref)
+    array = same_store.array(key)
+    assert isinstance(array, np.memmap)
+    assert not array.flags.writeable
+    assert (array == 7).all()
+    decoded = cv2.imdecode(np.frombuffer(same_store.payload(key), np.uint8), cv2.IMREAD_COLOR)
+    assert (decoded == 7).all()
+
+
+def test_regions_are_aligned_and_chunks_roll_over(tmp_path):
+    store = PageStore(str(tmp_path / "mid2.pages"), chunk_bytes=3 * ALIGNMENT)
+    for index in range(3):
+        store.put(f"alice/page_{index + 1}", page(index), payload=b"payload")
+    rows = [store.entry(f"alice/page_{index + 1}") for index in range(3)]
+    assert all(row["array_offset"] % ALIGNMENT == 0 and row["payload_offset"] % ALIGNMENT == 0 for row in rows)
+    assert [row["chunk"] for row in rows] == [0, 1, 2]
+    # Earlier maps stay valid as later pages are appended
+    assert [int(store.array(f"alice/page_{index + 1}")[0, 0, 0]) for index in range(3)] == [0, 1, 2]
+    assert store.stats()["chunks"] == 3
+
+
+def test_keys_by_prefix_and_missing_pages(tmp_path):
+    store = PageStore(str(tmp_path / "mid2.pages"))
+    for key in ("alice/page_1", "alice/page_2", "al_x/page_1"):
+        store.put(key, page(0), payload=b"payload")
+    assert store.keys("alice/") == ["alice/page_1", "alice/page_2"]
+    # LIKE wildcards in the prefix are matched literally
+    assert store.keys("al_") == ["al_x/page_1"]
+    with pytest.raises(KeyError):
+        store.array("bob/page_1")
+    with pytest.raises(ValueError):
+        resolve("pagestore:no-key")
+
+
+def test_image_file_keeps_its_own_bytes_as_payload(tmp_path):
+    path = str(tmp_path / "page_1.png")
+    cv2.imwrite(path, page(9))
+    store = PageStore(str(tmp_path / "mid2.pages"))
+    store.put_image_file("alice/page_1", path)
+    with open(path, "rb") as f:
+        assert store.payload("alice/page_1") == f.read()
+    store.put_image_file("alice/page_2", path, transform=lambda image: image[:10])
+    assert store.array("alice/page_2").shape == (10, 30, 3)
+
+
+def test_drop_page_cache(tmp_path):
+    path = tmp_path / "page_1.png"
+    path.write_bytes(b"page")
+    assert drop_page_cache([str(path)]) == hasattr(os, "posix_fadvise")
+    assert path.read_bytes() == b"page"
+
+
+def test_benchmark_reads_both_sides_in_full(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    pdf_path = str(tmp_path / "script.pdf")
+    document = fitz.open()
+    for _ in range(2):
+        document.new_page(width=200, height=300).insert_text((20, 40), "continuous delivery")
+    document.save(pdf_path)
+    document.close()
+
+    result = run_benchmark(PageStore(str(tmp_path / "store")), pdf_path, 2, str(tmp_path / "files"))
+    assert result["pages"] == 4
+    assert result["cold_cache"] == hasattr(os, "posix_fadvise")
@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+
+from preprocessing import (
+    ADAPTIVE_THRESHOLD,
+    DENOISE,
+    DESKEW,
+    OTSU_THRESHOLD,
+    AdaptivePreprocessor,
+    estimate_skew,
+    plan_stages,
+    probe_quality,
+)
+
+CLEAN = {"sharpness": 900.0, "noise": 0.2, "contrast": 200, "illumination": 3.0, "skew": 0.0}
+
+
+def rendered_page(width=600, height=800):
+    page = np.full((height, width), 255, np.uint8)
+    for row in range(60, height - 40, 40):
+        cv2.putText(page, "continuous delivery pipeline", (30, row), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    return page
+
+
+def test_plan_stages():
+    assert plan_stages(CLEAN) == []
+    assert plan_stages(dict(CLEAN, contrast=60)) == [OTSU_THRESHOLD]
+    assert plan_stages(dict(CLEAN, noise=3.0, illumination=20.0, skew=-4.0)) == [
+        DENOISE,
+        DESKEW,
+        ADAPTIVE_THRESHOLD,
+    ]
+    # Denoising a blurry page only removes what detail is left
+    assert plan_stages(dict(CLEAN, noise=3.0, sharpness=50.0)) == []
+
+
+def test_clean_render_takes_the_light_path():
+    quality = probe_quality(rendered_page())
+    assert quality["noise"] < 1.0
+    assert abs(quality["skew"]) < 1.0
+    assert DENOISE not in plan_stages(quality)
+
+
+def test_skew_is_measured():
+    page = rendered_page()
+    matrix = cv2.getRotationMatrix2D((300, 400), 5, 1.0)
+    rotated = cv2.warpAffine(page, matrix, (600, 800), borderValue=255)
+    assert abs(estimate_skew(rotated) + 5) <= 0.5
+
+
+def test_photo_takes_the_heavy_path_and_is_logged():
+    rng = np.random.default_rng(0)
+    page = rendered_page().astype(np.float32)
+    # A shadow across the page plus sensor noise
+    page *= np.linspace(0.5, 1.0, page.shape[1], dtype=np.float32)[None, :]
+    page += rng.normal(0, 8, page.shape)
+    photo = np.clip(page, 0, 255).astype(np.uint8)
+
+    entries = []
+    preprocessor = AdaptivePreprocessor(on_page=entries.append)
+    processed, entry = preprocessor.process(photo, label="photo")
+    clean, clean_entry = preprocessor.process(rendered_page(), label="render")
+
+    assert processed.shape == photo.shape
+    assert entry["stages"] == [DENOISE, ADAPTIVE_THRESHOLD]
+    assert DENOISE in clean_entry["skipped"]
+    assert clean_entry["saved_ms"] > 0
+    assert entries == [entry, clean_entry]
+    assert preprocessor.log.report()["pages"] == 2
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+
+from prompts import REGISTRY, PromptRegistry, PromptTemplate, UsageLog, estimate_tokens
+
+
+def test_estimate_tokens_counts_text_and_images():
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("", images=2) == 3200
+
+
+def test_registry_lookup_by_name_version_and_id():
+    registry = PromptRegistry()
+    first = registry.register(PromptTemplate("ocr", 1, "read {page}"))
+    second = registry.register(PromptTemplate("ocr", 2, "read"))
+    assert registry.get("ocr") is first
+    assert registry.get("ocr", 2) is second
+    assert registry.get("ocr@2") is second
+    assert registry.versions("ocr") == [1, 2]
+    assert first.render(page="p1") == "read p1"
+
+
+def test_registry_rejects_redefinition_and_unknown_templates():
+    registry = PromptRegistry()
+    registry.register(PromptTemplate("ocr", 1, "read"))
+    with pytest.raises(ValueError):
+        registry.register(PromptTemplate("ocr", 1, "read differently"))
+    for template_id in ("ocr@3", "ocr@x", "grade"):
+        with pytest.raises(KeyError):
+            registry.get(template_id)
+
+
+def test_compact_ocr_prompt_is_shorter_than_the_default():
+    assert REGISTRY.get("ocr").template_id == "ocr@1"
+    assert REGISTRY.get("ocr@2").estimate_tokens() < REGISTRY.get("ocr@1").estimate_tokens() / 5
+
+
+def test_usage_log_prefers_reported_usage_over_estimates():
+    log = UsageLog()
+    log.record("ocr@2", SimpleNamespace(prompt_tokens=120, completion_tokens=30), 100, 0.5)
+    log.record("ocr@2", None, 100, 0.3)
+    entry = log.record(None, None, 10, 0.1)
+    assert entry["template"] == "adhoc"
+    assert not entry["reported"]
+
+    report = log.report()["ocr@2"]
+    assert report["calls"] == 2
+    assert report["prompt_tokens"] == 220
+    assert report["completion_tokens_per_call"] == 15
+    assert report["latency_per_call"] == 0.4
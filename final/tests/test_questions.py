@@ -0,0 +1,48 @@
+from questions import normalize_question_id, parse_awarded_marks, parse_total_marks, question_marks, split_student_response
+
+
+def test_normalize_question_id():
+    for label in ("Q1a (continued)", "Question 1a", "q1A"):
+        assert normalize_question_id(label) == "1a"
+    assert normalize_question_id("???") == "unknown"
+
+
+def test_split_student_response_joins_continuations():
+    answers = split_student_response(
+        "Name: Alice\nQuestion Number: Q1a\nAnswer: faster delivery\n"
+        "Question Number: Q2\nAnswer: isolation\nQuestion Number: Q1a (continued)\nand collaboration"
+    )
+    assert answers == {"unknown": "Name: Alice", "1a": "faster delivery\nand collaboration", "2": "isolation"}
+    assert split_student_response("no markers") == {"unknown": "no markers"}
+    assert split_student_response("  ") == {}
+
+
+def test_parse_marks():
+    result = "Question 1a: Correct - Awarded Marks: 6\n**Question 2**: Incorrect - Awarded Marks: 0.5\nTotal Marks: 6.5/15"
+    assert parse_awarded_marks(result) == {"1a": 6.0, "2": 0.5}
+    assert parse_total_marks(result) == (6.5, 15.0)
+    assert parse_total_marks("Total Marks: 7") == (7.0, None)
+    assert parse_total_marks("nothing") == (None, None)
+
+
+def test_question_marks():
+    assert question_marks("Question 1a: Correct - Awarded Marks: 6", "1a") == 6.0
+    # One line per part of a question graded as a whole
+    assert question_marks(
+        "Question 1a: Correct - Awarded Marks: 6\nQuestion 1b: Incorrect - Awarded Marks: 0", "1"
+    ) == 6.0
+    assert question_marks("Question 1a: Incorrect - Awarded Marks: 0", "1a") == 0.0
+    # A single line is the grade, however the grader labelled it
+    assert question_marks("Question 1: Correct - Awarded Marks: 6", "1a") == 6.0
+    # Lines for other questions are never summed into this one
+    assert question_marks(
+        "Question 1a: Correct - Awarded Marks: 6\nQuestion 2: Correct - Awarded Marks: 5", "1"
+    ) is None
+    assert question_marks(
+        "Question 1a: Correct - Awarded Marks: 6\nQuestion 1b: Correct - Awarded Marks: 4", "2"
+    ) is None
+    assert question_marks(
+        "Question 1a: Correct - Awarded Marks: 6\nQuestion 12: Correct - Awarded Marks: 4", "1"
+    ) is None
+    assert question_marks("I cannot grade this answer without more context.", "1a") is None
+    assert question_marks(None, "1a") is None
@@ -0,0 +1,45 @@
+from batch_grader import BatchGrader
+from job_store import GRADED
+
+PAGES = {
+    "alice/1.png": "Question Number: Q1a\nAnswer: faster delivery\nQuestion Number: Q1b\nAnswer: tool sprawl",
+    "bob/1.png": "Question Number: Q1a\nAnswer: collaboration\nQuestion Number: Q2\nAnswer: isolation",
+}
+REPLIES = {
+    "1a": "Question 1a: Correct - Awarded Marks: 6",
+    "1b": "Question 1b: Correct - Awarded Marks: 4",
+    "2": "Question 2: Correct - Awarded Marks: 5",
+}
+
+
+def graded_job(job_store, marking_scheme, fake_tool):
+    tool = fake_tool(pages=PAGES, replies=REPLIES)
+    grader = BatchGrader(tool, job_store, cluster=True)
+    grader.run("mid2", {"alice": ["alice/1.png"], "bob": ["bob/1.png"]}, marking_scheme)
+    tool.calls.clear()
+    return grader, tool
+
+
+def test_regrade_redoes_only_changed_questions(job_store, marking_scheme, fake_tool):
+    grader, tool = graded_job(job_store, marking_scheme, fake_tool)
+    tool.replies["1b"] = "Question 1b: Incorrect - Awarded Marks: 0"
+
+    edited = marking_scheme.replace("Tool Sprawl", "Vendor Lock-in")
+    summary = grader.regrade("mid2", edited)
+    assert summary == {"version": 2, "changed": ["1b"], "reopened": ["alice"], "rescripted": []}
+    assert tool.calls == [("1b", "tool sprawl")]
+    alice = job_store.result("mid2", "alice")
+    assert (alice["total_marks"], alice["out_of"]) == (6, 15)
+    assert "Total Marks: 6/15" in alice["assessment_result"]
+    assert "Question 1b: Incorrect - Awarded Marks: 0" in alice["assessment_result"]
+    assert job_store.result("mid2", "bob")["total_marks"] == 11
+    assert job_store.progress("mid2")["students"] == {GRADED: 2}
+    assert [row["version"] for row in job_store.rubric_versions("mid2")] == [1, 2]
+    assert job_store.marking_scheme("mid2") == edited
+
+
+def test_regrade_with_an_unchanged_scheme_grades_nothing(job_store, marking_scheme, fake_tool):
+    grader, tool = graded_job(job_store, marking_scheme, fake_tool)
+    summary = grader.regrade("mid2", marking_scheme)
+    assert summary == {"version": None, "changed": [], "reopened": [], "rescripted": []}
+    assert tool.calls == []
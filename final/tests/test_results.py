@@ -0,0 +1,98 @@
+from array import array
+
+import pytest
+
+from grades import parse_script_grade
+from results import (
+    PageResult,
+    QuestionResult,
+    ResultTable,
+    combined_text,
+    export_job,
+    output_paths,
+    question_results,
+)
+
+
+def pages():
+    return [
+        PageResult("alice", 1, "page_1.png", text="Question Number: Q2\nAnswer: isolation", ocr_seconds=0.5),
+        PageResult("alice", 2, "page_2.png", error="rate limited"),
+    ]
+
+
+def test_records_have_no_instance_dict():
+    with pytest.raises(AttributeError):
+        pages()[0].__dict__
+
+
+def test_combined_text_marks_failed_pages():
+    assert combined_text(pages()) == (
+        "Question Number: Q2\nAnswer: isolation\n[Error processing page_2.png: rate limited]"
+    )
+
+
+def test_table_stores_numbers_in_flat_arrays_and_missing_as_none():
+    table = ResultTable(PageResult)
+    table.extend(pages())
+    assert len(table) == 2
+    assert isinstance(table.column("ocr_seconds"), array)
+    assert table.row(1)["ocr_seconds"] is None
+    assert [page.error for page in table] == [None, "rate limited"]
+
+
+def test_jsonl_round_trip(tmp_path):
+    table = ResultTable(PageResult)
+    table.extend(pages())
+    path = str(tmp_path / "mid2.pages.jsonl")
+    table.write(path)
+    loaded = ResultTable.from_jsonl(PageResult, path)
+    assert [loaded.row(index) for index in range(2)] == [table.row(index) for index in range(2)]
+
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip("pyarrow")
+    table = ResultTable(PageResult)
+    table.extend(pages())
+    path = str(tmp_path / "mid2.pages.parquet")
+    table.write(path)
+    loaded = ResultTable.from_parquet(PageResult, path)
+    assert loaded.row(1) == table.row(1)
+
+
+def test_question_results_of_a_script_grade(marking_scheme):
+    grade = parse_script_grade(
+        '{"questions": [{"question": "1a", "awarded_marks": 6}, {"question": "1b", "awarded_marks": 0}, '
+        '{"question": "2", "awarded_marks": 3}]}',
+        marking_scheme,
+    )
+    results = question_results("alice", grade, grade_seconds=1.5)
+    assert [(result.question_id, result.awarded_marks, result.max_marks) for result in results] == [
+        ("1a", 6.0, 6.0),
+        ("1b", 0.0, 4.0),
+        ("2", 3.0, 5.0),
+    ]
+
+
+def test_export_job(job_store, marking_scheme):
+    job_store.create_job("mid2", marking_scheme)
+    job_store.add_student("mid2", "alice", ["page_1.png", "page_2.png"])
+    job_store.record_ocr("mid2", "alice", 1, "Question Number: Q2\nAnswer: isolation", seconds=1.5)
+    job_store.record_page_failure("mid2", "alice", 2, TimeoutError("rate limited"))
+    job_store.record_questions("mid2", "alice", {"2": "isolation"})
+    job_store.record_question_grade("mid2", "alice", "2", 5.0, seconds=0.25)
+
+    page_table, question_table = export_job(job_store, "mid2")
+    assert [page.error for page in page_table] == [None, "rate limited"]
+    assert [page.ocr_seconds for page in page_table] == [1.5, None]
+    question = next(iter(question_table))
+    assert (question.question_id, question.awarded_marks, question.max_marks) == ("2", 5.0, 5.0)
+    assert question.grade_seconds == 0.25
+    assert question.verdict is not None
+    with pytest.raises(ValueError):
+        export_job(job_store, "final")
+
+
+def test_output_paths():
+    assert output_paths("out/mid2.parquet") == ("out/mid2.pages.parquet", "out/mid2.questions.parquet")
+    assert output_paths("mid2") == ("mid2.pages.jsonl", "mid2.questions.jsonl")
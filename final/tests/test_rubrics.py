@@ -0,0 +1,105 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import docx
+import pytest
+
+from rubrics import DOCX, IMAGE, CompiledRubric, RubricStore, source_kind
+
+
+class TranscribingAnalyzer:
+    """
+    Stands in for ImageOCRAnalyzer: "reads" the marking scheme off an image.
+    """
+
+    def __init__(self, text, delay=0):
+        self.text = text
+        self.delay = delay
+        self.calls = 0
+
+    def encode_image(self, data):
+        return "encoded"
+
+    def perform_ocr(self, image_base64=None, prompt="", template=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        return SimpleNamespace(content=self.text)
+
+
+def write_image(tmp_path, name="sol3.png"):
+    path = tmp_path / name
+    path.write_bytes(b"\x89PNG fake image")
+    return str(path)
+
+
+def test_source_kind():
+    assert source_kind("solution.docx", b"") == DOCX
+    assert source_kind("sol3.PNG", b"") == IMAGE
+    assert source_kind(None, b"PK\x03\x04") == DOCX
+    assert source_kind(None, b"\x89PNG") == IMAGE
+
+
+def test_compiled_rubric_structure(marking_scheme):
+    rubric = CompiledRubric(marking_scheme)
+    assert sorted(rubric.sections) == ["1", "1a", "1b", "2"]
+    assert rubric.marks["1b"] == 4
+    assert CompiledRubric.from_dict(rubric.to_dict()).sections == rubric.sections
+
+
+def test_image_rubric_is_transcribed_once_per_file(tmp_path, marking_scheme):
+    path = write_image(tmp_path)
+    analyzer = TranscribingAnalyzer("  " + marking_scheme.replace("\n", "\n\n"))
+    cache_dir = str(tmp_path / "uploads" / "rubrics")
+    first = RubricStore(analyzer, cache_dir=cache_dir).load(path)
+    assert first.text == marking_scheme
+    assert (tmp_path / "uploads" / "rubrics" / f"{first.source_hash}.json").exists()
+    # Nothing is written next to the source
+    assert not (tmp_path / "rubrics").exists()
+
+    # A later run loads the compiled rubric from disk
+    store = RubricStore(TranscribingAnalyzer("unused"), cache_dir=cache_dir)
+    assert store.load(path).text == marking_scheme
+    assert store.metrics == {"compiled": 0, "loaded": 1, "ocr_calls": 0}
+    assert analyzer.calls == 1
+
+
+def test_docx_rubric(tmp_path, marking_scheme):
+    document = docx.Document()
+    for line in marking_scheme.splitlines():
+        document.add_paragraph(line)
+        document.add_paragraph("")
+    path = str(tmp_path / "solution.docx")
+    document.save(path)
+    store = RubricStore(cache_dir=str(tmp_path / "cache"))
+    rubric = store.load(path)
+    assert rubric.kind == DOCX
+    assert rubric.text == marking_scheme
+    # A DOCX is cheap to read again, so it is only kept in memory
+    assert store.load(path) is rubric
+    assert not (tmp_path / "cache").exists()
+
+
+def test_image_rubric_needs_an_analyzer(tmp_path):
+    with pytest.raises(Exception, match="OCR analyzer is required"):
+        RubricStore(cache_dir=str(tmp_path / "cache")).load(write_image(tmp_path))
+
+
+def test_uploaded_bytes_are_compiled_once_in_memory(marking_scheme):
+    analyzer = TranscribingAnalyzer(marking_scheme)
+    store = RubricStore(analyzer, cache_dir=None)
+    assert store.load(b"\x89PNG upload") is store.load(b"\x89PNG upload")
+    assert analyzer.calls == 1
+
+
+def test_concurrent_first_loads_transcribe_once(tmp_path, marking_scheme):
+    path = write_image(tmp_path)
+    analyzer = TranscribingAnalyzer(marking_scheme, delay=0.05)
+    store = RubricStore(analyzer, cache_dir=str(tmp_path / "cache"))
+    threads = [threading.Thread(target=store.load, args=(path,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert analyzer.calls == 1
+    assert store.metrics["compiled"] == 1
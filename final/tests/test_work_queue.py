@@ -0,0 +1,89 @@
+import pytest
+
+from work_queue import DEAD, LocalRedis, RedisWorkQueue, SQLiteWorkQueue
+
+MAX_ATTEMPTS = 2
+
+
+@pytest.fixture(params=["sqlite", "local", "fakeredis"])
+def work_queue(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteWorkQueue(str(tmp_path / "queue.db"), max_attempts=MAX_ATTEMPTS)
+    if request.param == "local":
+        return RedisWorkQueue(LocalRedis(), max_attempts=MAX_ATTEMPTS)
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisWorkQueue(fakeredis.FakeRedis(decode_responses=True), max_attempts=MAX_ATTEMPTS)
+
+
+def test_lease_and_ack(work_queue):
+    task_id = work_queue.put("ocr_page", {"page_number": 1})
+    task = work_queue.lease(visibility_timeout=60)
+    assert (task.task_id, task.kind, task.payload, task.attempts) == (task_id, "ocr_page", {"page_number": 1}, 1)
+    # A leased task is invisible to other workers
+    assert work_queue.lease(visibility_timeout=60) is None
+    assert work_queue.ack(task)
+    assert work_queue.lease(visibility_timeout=0) is None
+
+
+def test_tasks_are_leased_in_order(work_queue):
+    first = work_queue.put("ocr_page", {"page_number": 1})
+    second = work_queue.put("ocr_page", {"page_number": 2})
+    assert work_queue.lease(visibility_timeout=60).task_id == first
+    assert work_queue.lease(visibility_timeout=60).task_id == second
+
+
+def test_expired_lease_is_redelivered(work_queue):
+    task_id = work_queue.put("grade_question", {"question_id": "1a"})
+    stale = work_queue.lease(visibility_timeout=0)
+    task = work_queue.lease(visibility_timeout=60)
+    assert task.task_id == task_id
+    assert task.attempts == 2
+    # The worker whose lease expired can no longer ack or nack it
+    assert not work_queue.ack(stale)
+    assert not work_queue.nack(stale)
+    assert work_queue.ack(task)
+
+
+def test_nack_makes_the_task_visible_after_the_delay(work_queue):
+    work_queue.put("grade_question", {"question_id": "1a"})
+    task = work_queue.lease(visibility_timeout=60)
+    assert work_queue.nack(task, delay=60)
+    assert work_queue.lease(visibility_timeout=60) is None
+
+
+def test_task_is_dead_after_max_attempts(work_queue):
+    work_queue.put("grade_question", {"question_id": "1a"})
+    for _ in range(MAX_ATTEMPTS):
+        assert work_queue.lease(visibility_timeout=0) is not None
+    assert work_queue.lease(visibility_timeout=0) is None
+    assert work_queue.stats().get(DEAD) == 1
+
+
+class CommandLog:
+    """
+    Passes commands through to a client and logs the ones sent outside a
+    script.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def register_script(self, source):
+        return self.client.register_script(source)
+
+    def __getattr__(self, name):
+        self.commands.append(name)
+        return getattr(self.client, name)
+
+
+def test_redis_ack_and_nack_check_the_token_inside_their_script():
+    client = CommandLog(LocalRedis())
+    work_queue = RedisWorkQueue(client)
+    work_queue.put("grade_question", {"question_id": "1a"})
+    task = work_queue.lease(visibility_timeout=60)
+    client.commands.clear()
+    assert work_queue.nack(task, delay=60)
+    assert work_queue.ack(task)
+    assert client.commands == []
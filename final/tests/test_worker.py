@@ -0,0 +1,114 @@
+import pytest
+
+from job_store import FAILED, GRADED, OCR_DONE, PENDING
+from work_queue import LocalRedis, RedisWorkQueue
+from worker import GRADE_QUESTION, OCR_PAGE, GradingWorker
+
+PAGES = {
+    "alice/1.png": "Question Number: Q1a\nAnswer: faster delivery",
+    "alice/2.png": "Question Number: Q2\nAnswer: isolation",
+}
+REPLIES = {
+    "1a": "Question 1a: Correct - Awarded Marks: 6",
+    "2": "Question 2: Correct - Awarded Marks: 5",
+}
+
+
+def enqueue_pages(job_store, work_queue, marking_scheme):
+    job_store.create_job("mid2", marking_scheme)
+    job_store.add_student("mid2", "alice", list(PAGES))
+    for page in job_store.pages("mid2", "alice"):
+        work_queue.put(
+            OCR_PAGE,
+            {
+                "job_id": "mid2",
+                "student_id": "alice",
+                "page_number": page["page_number"],
+                "source_path": page["source_path"],
+            },
+        )
+
+
+def test_last_page_fans_out_question_tasks(job_store, marking_scheme, fake_tool):
+    work_queue = RedisWorkQueue(LocalRedis())
+    enqueue_pages(job_store, work_queue, marking_scheme)
+    worker = GradingWorker(fake_tool(pages=PAGES, replies=REPLIES), job_store, work_queue)
+
+    kinds = []
+    while (task := work_queue.lease(60)) is not None:
+        kinds.append(task.kind)
+        worker.handle(task)
+        assert work_queue.ack(task)
+
+    assert kinds == [OCR_PAGE, OCR_PAGE, GRADE_QUESTION, GRADE_QUESTION]
+    student = job_store.result("mid2", "alice")
+    assert student["state"] == GRADED
+    assert student["total_marks"] == 11
+    assert all(page["ocr_seconds"] is not None for page in job_store.pages("mid2", "alice"))
+    assert all(question["grade_seconds"] is not None for question in job_store.questions("mid2", "alice"))
+
+
+def test_failed_page_is_recorded_and_retried(job_store, marking_scheme, fake_tool):
+    work_queue = RedisWorkQueue(LocalRedis())
+    enqueue_pages(job_store, work_queue, marking_scheme)
+    pages = dict(PAGES, **{"alice/2.png": TimeoutError("rate limited")})
+    worker = GradingWorker(fake_tool(pages=pages, replies=REPLIES), job_store, work_queue)
+
+    worker.run(max_idle=0)
+    assert job_store.result("mid2", "alice")["state"] == PENDING
+    states = [page["state"] for page in job_store.pages("mid2", "alice")]
+    assert states == [OCR_DONE, FAILED]
+    # The failed page waits out its retry delay under a lease
+    assert work_queue.stats()["leased"] == 1
+
+
+def split_student(job_store, answers):
+    job_store.add_student("mid2", "alice", ["page_1.png"])
+    job_store.record_ocr("mid2", "alice", 1, "")
+    job_store.claim_ocr_complete("mid2", "alice")
+    job_store.record_questions("mid2", "alice", answers)
+
+
+def test_reply_without_marks_fails_the_task(job_store, marking_scheme, fake_tool):
+    job_store.create_job("mid2", marking_scheme)
+    split_student(job_store, {"2": "isolation"})
+    worker = GradingWorker(fake_tool(replies={"2": "I cannot grade this."}), job_store, RedisWorkQueue(LocalRedis()))
+
+    with pytest.raises(ValueError):
+        worker.grade_question("mid2", "alice", "2")
+    question = job_store.questions("mid2", "alice")[0]
+    assert (question["state"], question["awarded_marks"]) == (OCR_DONE, None)
+    assert job_store.result("mid2", "alice")["state"] == OCR_DONE
+
+
+def test_failed_grading_is_recorded_on_the_student_until_it_succeeds(job_store, marking_scheme, fake_tool):
+    work_queue = RedisWorkQueue(LocalRedis())
+    job_store.create_job("mid2", marking_scheme)
+    split_student(job_store, {"2": "isolation"})
+    work_queue.put(GRADE_QUESTION, {"job_id": "mid2", "student_id": "alice", "question_id": "2"})
+    tool = fake_tool(replies={"2": TimeoutError("rate limited")})
+    worker = GradingWorker(tool, job_store, work_queue)
+
+    worker.run(max_idle=0)
+    assert job_store.result("mid2", "alice")["error"] == "Question 2: rate limited"
+
+    tool.replies["2"] = REPLIES["2"]
+    worker.grade_question("mid2", "alice", "2")
+    result = job_store.result("mid2", "alice")
+    assert (result["state"], result["error"]) == (GRADED, None)
+
+
+def test_redelivered_page_finishes_an_interrupted_fan_out(job_store, marking_scheme, fake_tool):
+    work_queue = RedisWorkQueue(LocalRedis())
+    job_store.create_job("mid2", marking_scheme)
+    split_student(job_store, {"1a": "faster delivery", "2": "isolation"})
+    job_store.record_question_grade("mid2", "alice", "1a", 6.0)
+    tool = fake_tool(replies=REPLIES)
+    worker = GradingWorker(tool, job_store, work_queue)
+
+    # The first delivery died after recording the questions
+    worker.ocr_page("mid2", "alice", 1, "page_1.png")
+    assert tool.calls == []
+    task = work_queue.lease(60)
+    assert (task.kind, task.payload["question_id"]) == (GRADE_QUESTION, "2")
+    assert work_queue.lease(60) is None
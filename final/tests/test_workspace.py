@@ -0,0 +1,64 @@
+import io
+import os
+import time
+
+import numpy as np
+import pytest
+
+from workspace import QuotaExceeded, SessionWorkspace
+
+
+class Upload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def test_uploads_are_isolated_per_session(tmp_path):
+    first = SessionWorkspace("a", root=str(tmp_path))
+    second = SessionWorkspace("b", root=str(tmp_path))
+    path_a = first.save_upload(Upload("script.pdf", b"from a"))
+    path_b = second.save_upload(Upload("../../script.pdf", b"from b"))
+    assert os.path.dirname(path_b) == second.path
+    assert open(path_a, "rb").read() == b"from a"
+    assert open(path_b, "rb").read() == b"from b"
+
+
+def test_quota_counts_uploads_and_rendered_pages(tmp_path):
+    workspace = SessionWorkspace("a", root=str(tmp_path), quota_bytes=10)
+    workspace.save_upload(Upload("one.pdf", b"123456"), chunk_size=4)
+    assert workspace.used_bytes == 6
+    page = os.path.join(workspace.path, "page_1.png")
+    with open(page, "wb") as f:
+        f.write(b"12345")
+    with pytest.raises(QuotaExceeded):
+        workspace.account([page])
+
+    with pytest.raises(QuotaExceeded):
+        workspace.save_upload(Upload("two.pdf", b"12345"), chunk_size=4)
+    # A rejected upload leaves nothing behind
+    assert not os.path.exists(workspace.file_path("two.pdf"))
+
+    workspace.clear()
+    assert workspace.used_bytes == 0
+    assert os.listdir(workspace.path) == []
+
+
+def test_quota_counts_images_decoded_in_memory(tmp_path):
+    workspace = SessionWorkspace("a", root=str(tmp_path), quota_bytes=100 * 100 * 3 + 10)
+    workspace.account_image(np.zeros((100, 100, 3), np.uint8))
+    assert workspace.used_bytes == 30000
+    with pytest.raises(QuotaExceeded):
+        workspace.account_image(np.zeros((10, 10), np.uint8))
+    workspace.clear()
+    workspace.account_image(np.zeros((10, 10), np.uint8))
+
+
+def test_sweep_removes_only_stale_workspaces(tmp_path):
+    stale = SessionWorkspace("stale", root=str(tmp_path))
+    fresh = SessionWorkspace("fresh", root=str(tmp_path))
+    old = time.time() - 3600
+    os.utime(stale.path, (old, old))
+    assert SessionWorkspace.sweep_stale(root=str(tmp_path), max_age=60) == 1
+    assert not os.path.exists(stale.path)
+    assert os.path.exists(fresh.path)
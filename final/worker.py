@@ -0,0 +1,266 @@
+"""
+Grading workers that pull page- and question-level tasks from a shared queue.
+
+Run `enqueue` once per exam to register the cohort, then start `work` on as
+many machines as needed. Each worker leases a task, calls the OCR or
+grading API, writes the result to the shared JobStore and acks. Workers
+that die mid-task simply let the lease expire and another worker retries.
+
+Usage:
+    python worker.py enqueue --db /shared/grading.db --queue sqlite:/shared/queue.db \\
+        --job mid2 --marking-scheme ../mid2/solution.docx --scripts-dir /shared/scripts
+    python worker.py work --db /shared/grading.db --queue redis://queue-host:6379/0 --threads 4
+    python worker.py progress --db /shared/grading.db --queue sqlite:/shared/queue.db --job mid2
+
+Rendered PDF pages are written next to the database, so --db must live on
+storage every worker can read. Rerunning `enqueue` after the queue has
+drained requeues only pages that are still pending or failed, and the
+grading of students left OCR'd but ungraded. A worker that dies while
+fanning out a student's grading is covered too: the redelivered page task
+queues the questions that are still missing.
+
+Task kinds:
+    ocr_page        {job_id, student_id, page_number, source_path}
+    grade_question  {job_id, student_id, question_id}
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+from assessment_tool import ImageOCRAnalyzer, AssessmentTool
+from batch_grader import BatchGrader, discover_scripts
+from grade_cache import GradeCache
+from job_store import JobStore, PENDING, OCR_DONE, FAILED, GRADED
+from local_ocr import ENGINES, LocalOCR
+from questions import split_student_response, question_marks
+from work_queue import DEFAULT_VISIBILITY_TIMEOUT, open_queue
+
+OCR_PAGE = "ocr_page"
+GRADE_QUESTION = "grade_question"
+IDLE_SLEEP = 1.0
+RETRY_DELAY = 10
+
+logger = logging.getLogger(__name__)
+
+
+class GradingWorker:
+    def __init__(self, assessment_tool, job_store, work_queue, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        self.assessment_tool = assessment_tool
+        self.job_store = job_store
+        self.work_queue = work_queue
+        self.visibility_timeout = visibility_timeout
+        self.stopped = threading.Event()
+
+    def ocr_page(self, job_id, student_id, page_number, source_path):
+        done = {page["page_number"] for page in self.job_store.pages(job_id, student_id, states=[OCR_DONE])}
+        # A redelivered task whose page is already read skips the OCR call
+        redelivered = page_number in done
+        if not redelivered:
+            started = time.perf_counter()
+            text = self.assessment_tool.extract_page_response(source_path)
+            self.job_store.record_ocr(job_id, student_id, page_number, text, time.perf_counter() - started)
+
+        # Whoever completes the student's last page fans out the grading. A
+        # redelivery finishes a fan-out its first delivery may have died in.
+        if self.job_store.claim_ocr_complete(job_id, student_id):
+            self.fan_out(job_id, student_id)
+        elif redelivered and self.job_store.result(job_id, student_id)["state"] == OCR_DONE:
+            self.fan_out(job_id, student_id)
+
+    def fan_out(self, job_id, student_id):
+        """
+        Split an OCR'd student into questions, unless that was already
+        done, and queue a grading task for every question not graded yet.
+        Safe to repeat: it re-derives whatever an interrupted run left out,
+        and a question queued twice is just graded twice.
+        """
+        questions = self.job_store.questions(job_id, student_id)
+        if questions:
+            question_ids = [row["question_id"] for row in questions if row["state"] != GRADED]
+        else:
+            answers = split_student_response(self.job_store.student_response(job_id, student_id))
+            self.job_store.record_questions(job_id, student_id, answers)
+            question_ids = list(answers)
+        for question_id in question_ids:
+            self.work_queue.put(
+                GRADE_QUESTION,
+                {"job_id": job_id, "student_id": student_id, "question_id": question_id},
+            )
+        if not question_ids:
+            self.job_store.finalize_student(job_id, student_id)
+
+    def grade_question(self, job_id, student_id, question_id):
+        answer = next(
+            row["answer_text"]
+            for row in self.job_store.questions(job_id, student_id)
+            if row["question_id"] == question_id
+        )
+        started = time.perf_counter()
+        result = self.assessment_tool.assess_question(
+            question_id, self.job_store.marking_scheme(job_id), answer
+        )
+        seconds = time.perf_counter() - started
+        marks = question_marks(result, question_id)
+        if marks is None:
+            # Not a zero: fail the task so it is retried after the delay
+            raise ValueError(f"No marks for question {question_id} in the grader's reply: {result[:200]}")
+        self.job_store.record_question_grade(job_id, student_id, question_id, marks, seconds)
+        self.job_store.finalize_student(job_id, student_id)
+
+    def handle(self, task):
+        if task.kind == OCR_PAGE:
+            self.ocr_page(**task.payload)
+        elif task.kind == GRADE_QUESTION:
+            self.grade_question(**task.payload)
+        else:
+            raise ValueError(f"Unknown task kind '{task.kind}'")
+
+    def run(self, max_idle=None):
+        """
+        Lease and process tasks until stopped, or until the queue has been
+        empty for max_idle seconds.
+        """
+        idle_since = time.monotonic()
+        while not self.stopped.is_set():
+            task = self.work_queue.lease(self.visibility_timeout)
+            if task is None:
+                if max_idle is not None and time.monotonic() - idle_since > max_idle:
+                    return
+                time.sleep(IDLE_SLEEP)
+                continue
+            idle_since = time.monotonic()
+            try:
+                self.handle(task)
+            except Exception as e:
+                logger.warning("%s failed: %s", task, e)
+                self.record_failure(task, e)
+                self.work_queue.nack(task, delay=RETRY_DELAY)
+                continue
+            if not self.work_queue.ack(task):
+                logger.warning("%s finished after its lease expired; result kept, ack ignored", task)
+
+    def record_failure(self, task, error):
+        """
+        Keep a failed task's error in the JobStore, where progress is read:
+        on the page for an OCR task, on the student for a grading task. The
+        next successful attempt clears it.
+        """
+        payload = task.payload
+        if task.kind == OCR_PAGE:
+            self.job_store.record_page_failure(
+                payload["job_id"], payload["student_id"], payload["page_number"], error
+            )
+        elif task.kind == GRADE_QUESTION:
+            self.job_store.record_student_failure(
+                payload["job_id"], payload["student_id"], f"Question {payload['question_id']}: {error}"
+            )
+
+
+def enqueue(args, assessment_tool, job_store, work_queue):
+    """
+    Register the cohort and enqueue OCR tasks for every page not done yet,
+    and grading tasks for every OCR'd student's ungraded questions.
+    """
+    grader = BatchGrader(
+        assessment_tool, job_store, pages_dir=os.path.join(os.path.dirname(job_store.db_path), "pages")
+    )
+    marking_scheme = assessment_tool.extract_marking_scheme(args.marking_scheme)
+    job_store.create_job(args.job, marking_scheme)
+    grader.register_scripts(args.job, discover_scripts(args.scripts_dir))
+
+    queued = 0
+    for student_id in job_store.students(args.job, states=[PENDING]):
+        for page in job_store.pages(args.job, student_id, states=[PENDING, FAILED]):
+            work_queue.put(
+                OCR_PAGE,
+                {
+                    "job_id": args.job,
+                    "student_id": student_id,
+                    "page_number": page["page_number"],
+                    "source_path": page["source_path"],
+                },
+            )
+            queued += 1
+    print(f"Queued {queued} page tasks for job {args.job}")
+
+    # Students whose grading fan-out was cut short by a crash
+    worker = GradingWorker(assessment_tool, job_store, work_queue)
+    stranded = job_store.students(args.job, states=[OCR_DONE])
+    for student_id in stranded:
+        worker.fan_out(args.job, student_id)
+    if stranded:
+        print(f"Queued grading of {len(stranded)} OCR'd students not graded yet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed grading workers")
+    parser.add_argument("command", choices=["enqueue", "work", "progress"])
+    parser.add_argument("--db", required=True, help="shared JobStore database")
+    parser.add_argument("--queue", required=True, help="sqlite:<path>, redis://... or local (in-process only)")
+    parser.add_argument("--job", help="job id (enqueue, progress)")
+    parser.add_argument("--marking-scheme", help="marking scheme .docx or image (enqueue)")
+    parser.add_argument("--scripts-dir", help="one PDF or image folder per student (enqueue, or work to enqueue first)")
+    parser.add_argument("--threads", type=int, default=1, help="workers in this process (work)")
+    parser.add_argument("--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT)
+    parser.add_argument("--max-idle", type=float, help="exit after the queue is empty this long (work)")
+    parser.add_argument("--base-url", help="Groq/OpenAI-compatible endpoint")
+    parser.add_argument("--grade-cache", help="grade cache database shared by the workers")
+    parser.add_argument(
+        "--local-ocr",
+        nargs="?",
+        const="tesserocr",
+        choices=sorted(ENGINES),
+        help="OCR pages with local Tesseract engines, one per worker thread (work)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s %(message)s")
+    job_store = JobStore(args.db)
+    work_queue = open_queue(args.queue)
+
+    if args.command != "work" or args.scripts_dir:
+        if not args.job or (args.scripts_dir and not args.marking_scheme):
+            parser.error("--job is required, and --scripts-dir needs --marking-scheme")
+
+    if args.command == "progress":
+        print(json.dumps({"job": job_store.progress(args.job), "queue": work_queue.stats()}, indent=2))
+        return
+
+    assessment_tool = AssessmentTool(
+        ImageOCRAnalyzer(base_url=args.base_url),
+        grade_cache=GradeCache(args.grade_cache) if args.grade_cache else None,
+        local_ocr=LocalOCR(args.local_ocr) if args.local_ocr else None,
+    )
+    if args.command == "enqueue":
+        if not args.scripts_dir:
+            parser.error("enqueue needs --scripts-dir")
+        enqueue(args, assessment_tool, job_store, work_queue)
+        return
+
+    if args.scripts_dir:
+        # Single-process runs (e.g. with the in-process "local" queue) enqueue first
+        enqueue(args, assessment_tool, job_store, work_queue)
+
+    workers = [
+        GradingWorker(assessment_tool, job_store, work_queue, args.visibility_timeout)
+        for _ in range(args.threads)
+    ]
+    threads = [
+        threading.Thread(target=worker.run, kwargs={"max_idle": args.max_idle})
+        for worker in workers
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.stopped.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Per-session scratch workspaces for uploaded files.
+
+Each Streamlit session writes its uploads and rendered PDF pages into its
+own directory, so concurrent users never overwrite each other's files.
+Uploads are streamed to disk in chunks and counted against a size quota,
+as are rendered pages and images decoded in memory, and workspaces left
+behind by closed browser tabs are swept after a while.
+"""
+import os
+import shutil
+import time
+import uuid
+
+WORKSPACE_ROOT = "./uploads/sessions"
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+DEFAULT_QUOTA_BYTES = 200 * 1024 * 1024  # 200 MiB per session
+STALE_AFTER_SECONDS = 6 * 60 * 60
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class SessionWorkspace:
+    def __init__(
+        self, session_id=None, root=WORKSPACE_ROOT, quota_bytes=DEFAULT_QUOTA_BYTES
+    ):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, self.session_id)
+        self.quota_bytes = quota_bytes
+        self.used_bytes = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def touch(self):
+        """
+        Mark the workspace as in use so the stale sweep leaves it alone.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        os.utime(self.path)
+
+    def file_path(self, file_name):
+        # Never trust client-supplied names with directory components
+        return os.path.join(self.path, os.path.basename(file_name))
+
+    def pages_dir(self, file_name):
+        """
+        Directory for the rendered pages of one uploaded PDF.
+        """
+        stem = os.path.splitext(os.path.basename(file_name))[0]
+        return os.path.join(self.path, f"{stem}_pages")
+
+    def reserve(self, num_bytes):
+        if self.used_bytes + num_bytes > self.quota_bytes:
+            raise QuotaExceeded(
+                f"Upload quota of {self.quota_bytes // (1024 * 1024)} MB exceeded for this session"
+            )
+        self.used_bytes += num_bytes
+
+    def save_upload(self, uploaded_file, chunk_size=CHUNK_SIZE):
+        """
+        Stream an uploaded file-like object to disk in fixed-size chunks,
+        without materializing a second full copy of it in memory.
+        """
+        self.touch()
+        output_path = self.file_path(uploaded_file.name)
+        uploaded_file.seek(0)
+        try:
+            with open(output_path, "wb") as f:
+                while True:
+                    chunk = uploaded_file.read(chunk_size)
+                    if not chunk:
+                        break
+                    self.reserve(len(chunk))
+                    f.write(chunk)
+        except QuotaExceeded:
+            os.remove(output_path)
+            raise
+        return output_path
+
+    def account(self, paths):
+        """
+        Count files produced inside the workspace (e.g. rendered PDF pages)
+        against the quota.
+        """
+        for path in paths:
+            self.reserve(os.path.getsize(path))
+
+    def account_image(self, image):
+        """
+        Count a page image held in memory instead of written to the
+        workspace (an upload decoded straight from its buffer) against the
+        quota, by the size of its pixel array.
+        """
+        self.reserve(image.nbytes)
+
+    def clear(self):
+        """
+        Remove the files of the current run but keep the workspace.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self.used_bytes = 0
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.used_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+    @staticmethod
+    def sweep_stale(root=WORKSPACE_ROOT, max_age=STALE_AFTER_SECONDS):
+        """
+        Delete workspaces that have not been touched for max_age seconds.
+        """
+        root = os.path.abspath(root)
+        if not os.path.isdir(root):
+            return 0
+        removed = 0
+        cutoff = time.time() - max_age
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            try:
+                if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                # Another session may have removed it first
+                continue
+        return removed
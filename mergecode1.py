@@ -57,7 +57,7 @@ class PDFAssessmentTool:
 
         # PDF processing variables
         total_pages = 0
-        total_text = ""
+        page_texts = []
         page_results = []
 
         # Open PDF
@@ -96,7 +96,7 @@ class PDFAssessmentTool:
                 )
                 
                 page_text = ocr_result.content
-                total_text += page_text + "\n\n"
+                page_texts.append(page_text)
                 page_results.append({
                     'page_number': page_num + 1,
                     'text': page_text
@@ -113,7 +113,7 @@ class PDFAssessmentTool:
 
         return {
             'total_pages': total_pages,
-            'total_text': total_text,
+            'total_text': "\n\n".join(page_texts) + "\n\n" if page_texts else "",
             'page_results': page_results
         }
 